@@ -0,0 +1,208 @@
+"""
+Admission control for DeployFast.
+
+Nothing used to bound what a burst of /deploy calls could start: EC2
+run_instances limits, the CodeBuild concurrent build quota and Lambda
+concurrency were all hit at once, and the errors only showed up deep in
+the pipeline, after an instance had already been paid for.
+
+Three layers, from the request inward:
+
+1. Per-client token buckets (ClientLimiter): each client (IP) may start
+   ADMISSION_RATE deployments per minute, with bursts up to
+   ADMISSION_BURST. Over the limit → 429 + Retry-After, nothing created.
+2. Fair queueing (jobs.py): the deploy queue serves clients round robin
+   and caps how many deployments one client may have waiting, so one
+   busy user cannot push everybody else to the back.
+3. Resource budgets (ResourceBudget): how many EC2 launches, CodeBuild
+   builds and deploys run at once, set below the AWS quotas. A step that
+   would exceed its budget waits for a slot instead of failing.
+
+Usage:
+    retry_after = client_limiter.check(client)     # 0 = admitted
+    with codebuild_budget.hold(deployment_id):
+        run the build
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# ========================================
+# CONFIGURATION
+# ========================================
+ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE_PER_MINUTE', 6))   # Deployments per client per minute, 0 = no limit
+ADMISSION_BURST = int(os.environ.get('ADMISSION_BURST', 10))             # Deployments a client may start at once
+ADMISSION_MAX_WAITING = int(os.environ.get('ADMISSION_MAX_WAITING', 5))  # Queued deployments per client, 0 = no cap
+ADMISSION_TRUST_PROXY = os.environ.get('ADMISSION_TRUST_PROXY', 'false').lower() == 'true'  # Client = X-Forwarded-For
+
+EC2_LAUNCH_BUDGET = int(os.environ.get('EC2_LAUNCH_BUDGET', 20))  # Instances launching/booting at once
+CODEBUILD_BUDGET = int(os.environ.get('CODEBUILD_BUDGET', 10))    # Builds running at once (CodeBuild quota)
+DEPLOY_BUDGET = int(os.environ.get('DEPLOY_BUDGET', 10))          # Lambda/CodeDeploy deploys at once
+
+MAX_CLIENTS = 10000  # Token buckets kept in memory (least recently used go first)
+
+
+def client_key(remote_addr, forwarded_for=None):
+    """Who is asking: the peer address, or the first X-Forwarded-For hop behind a trusted proxy"""
+    if ADMISSION_TRUST_PROXY and forwarded_for:
+        return forwarded_for.split(',')[0].strip()
+    return remote_addr or 'unknown'
+
+
+class TokenBucket:
+    """rate tokens per second, at most burst saved up"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    def take(self, n=1):
+        """Take n tokens. Returns 0, or the seconds until n tokens are there (nothing taken)."""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0
+        return (n - self.tokens) / self.rate
+
+
+class ClientLimiter:
+    """
+    One token bucket per client, kept for the MAX_CLIENTS most recent.
+
+    A request for n deployments costs n tokens. More than a full bucket
+    can never be admitted: callers reject those up front (see burst).
+    """
+
+    def __init__(self, rate_per_minute=ADMISSION_RATE, burst=ADMISSION_BURST,
+                 max_clients=MAX_CLIENTS, clock=time.monotonic):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self.clock = clock
+        self.enabled = rate_per_minute > 0
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self._rejected = 0
+
+    def check(self, client, n=1):
+        """
+        Admit n deployments for client. Returns 0, or seconds to wait before retrying.
+        Raises ValueError if n is more than a full bucket.
+        """
+        if not self.enabled:
+            return 0
+        if n > self.burst:
+            raise ValueError(f"{n} deployments at once is more than the burst of {self.burst}")
+        with self._lock:
+            bucket = self._buckets.pop(client, None) or TokenBucket(self.rate, self.burst, self.clock)
+            self._buckets[client] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+            retry_after = bucket.take(n)
+            if retry_after:
+                self._rejected += 1
+        return retry_after
+
+    def refund(self, client, n=1):
+        """Give back tokens of an admitted request that was not carried out after all"""
+        if not self.enabled:
+            return
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is not None:
+                bucket.tokens = min(bucket.burst, bucket.tokens + n)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'rate_per_minute': self.rate * 60,
+                'burst': self.burst,
+                'clients': len(self._buckets),
+                'rejected': self._rejected
+            }
+
+
+class ResourceBudget:
+    """
+    Counting semaphore for one kind of AWS resource, with stats.
+
+    limit <= 0 means unlimited. Asking for more than the whole budget
+    (a batch launch) takes the whole budget.
+    """
+
+    def __init__(self, name, limit):
+        self.name = name
+        self.limit = limit
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._waiting = 0
+        self._waited_seconds = 0.0
+
+    def acquire(self, n=1, timeout=None):
+        """Wait for n slots. Returns the number taken (0 on timeout)."""
+        if self.limit <= 0:
+            return n
+        n = min(n, self.limit)
+        start = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self._in_use + n <= self.limit, timeout):
+                    return 0
+            finally:
+                self._waiting -= 1
+                self._waited_seconds += time.monotonic() - start
+            self._in_use += n
+        return n
+
+    def release(self, n=1):
+        if self.limit <= 0:
+            return
+        with self._cond:
+            self._in_use = max(0, self._in_use - n)
+            self._cond.notify_all()
+
+    def available(self):
+        if self.limit <= 0:
+            return None
+        with self._cond:
+            return self.limit - self._in_use
+
+    def hold(self, label=None, n=1):
+        """Context manager: acquire on enter, release on exit"""
+        return _Hold(self, label, n)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'limit': self.limit,
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'waited_seconds': round(self._waited_seconds, 3)
+            }
+
+
+class _Hold:
+    def __init__(self, budget, label, n):
+        self.budget = budget
+        self.label = label
+        self.n = n
+        self.taken = 0
+
+    def __enter__(self):
+        if self.label and self.budget.available() == 0:
+            print(f"[{self.label}] Waiting for a {self.budget.name} slot ({self.budget.limit} in use)")
+        self.taken = self.budget.acquire(self.n)
+        return self
+
+    def __exit__(self, *exc):
+        self.budget.release(self.taken)
+        return False
@@ -1,14 +1,65 @@
-from flask import Flask, render_template, request, jsonify
-import boto3
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 import re
 import os
-import tempfile
-import shutil
 import subprocess
 import secrets
-import time
+import hashlib
 import json
+import math
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from datetime import datetime
+from botocore.exceptions import ClientError
+
+from aws_clients import LazyClient, register_event_handler, S3_TRANSFER_CONFIG
+from metrics import (
+    registry as metrics_registry, Gauge, BOTOCORE_HANDLERS,
+    instrument, span, record_span, take_timings, add_timing, record_codebuild_phases,
+    deployments_finished, redeploys_finished
+)
+from jobs import JobQueue, QueueFullError
+from admission import (
+    ClientLimiter, ResourceBudget, client_key, ADMISSION_MAX_WAITING,
+    EC2_LAUNCH_BUDGET, CODEBUILD_BUDGET, DEPLOY_BUDGET
+)
+from store import make_store, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from events import EventBus, KEEPALIVE_SECONDS
+from readiness import ReadinessProbe
+from warm_pool import WarmPool
+from streaming_upload import stream_directory_to_s3
+from source_cache import SourceCache, source_key
+from build_cache import BuildCache, load_buildspec
+from build_tracker import BuildTracker, SqsBuildEvents, handle_build_event, CODEBUILD_EVENTS_QUEUE_URL
+from build_logs import BuildLogTailer, store_archive, read_lines, s3_range_reader, log_keys
+from batch import (
+    RateLimiter, launch_instances, tag_for_deployment,
+    BATCH_MAX_SIZE, BATCH_API_RATE, BATCH_API_RATE_MAX
+)
+from placement import (
+    HostScheduler, HOSTING_MODE, HOSTING_MODES, SITE_DISK_MB, SITE_MEMORY_MB,
+    site_url, remove_site_commands
+)
+from deploy_tracker import (
+    DeployTracker, DEPLOY_MODE, check_deploy_mode, start_codedeploy, delete_deployment_group,
+    handle_deploy_event
+)
+from reaper import Reaper, EXPIRED_STATUS
+from resume import PipelineResumer, Checkpoint
+from bundles import (
+    artifact_manifest, diff_manifests, read_manifest, write_manifest,
+    write_delta_bundle, write_site_bundle, site_paths, release_bundle_key
+)
+from static_hosting import (
+    publish_site, delete_site, site_prefix, site_url as static_site_url,
+    STATIC_SITE_BUCKET, STATIC_SITE_ENDPOINT_URL
+)
+from project_analysis import (
+    classify, stack_from_metadata, codebuild_project, skips_codebuild, STACK_METADATA
+)
 
 app = Flask(__name__)
 
@@ -25,18 +76,159 @@ CODEBUILD_PROJECT = 'DevOps-Deploy-CodeBuilder'  # Your CodeBuild project name
 LAUNCH_TEMPLATE_ID = 'lt-046e6e85369f05a3c'  # ← PUT YOUR LAUNCH TEMPLATE ID HERE!
 LAMBDA_FUNCTION_NAME = 'DeployFast-Deployer'  # Lambda we just created
 
+# Background deployments
+DEPLOY_MAX_WORKERS = int(os.environ.get('DEPLOY_MAX_WORKERS', 4))  # Deployments running at once
+DEPLOY_MAX_QUEUE = int(os.environ.get('DEPLOY_MAX_QUEUE', 20))     # Deployments waiting for a worker
+
+# POST /deploy with the same Idempotency-Key gets the same deployment for this long
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+# Shared secret for POST /webhooks/codebuild (empty = no check)
+CODEBUILD_WEBHOOK_TOKEN = os.environ.get('CODEBUILD_WEBHOOK_TOKEN', '')
+
+# Shared secret for POST /webhooks/codedeploy (empty = no check)
+DEPLOY_WEBHOOK_TOKEN = os.environ.get('DEPLOY_WEBHOOK_TOKEN', '')
+
 # ========================================
 # AWS CLIENTS
 # ========================================
-s3 = boto3.client('s3', region_name=AWS_REGION)
-ec2 = boto3.client('ec2', region_name=AWS_REGION)
-codebuild = boto3.client('codebuild', region_name=AWS_REGION)
-lambda_client = boto3.client('lambda', region_name=AWS_REGION)
+# Created on first use, shared by all threads, with a bigger connection
+# pool + adaptive retries (see aws_clients.py)
+for event_name, handler in BOTOCORE_HANDLERS:
+    register_event_handler(event_name, handler)  # AWS API call metrics
+
+s3 = LazyClient('s3', region_name=AWS_REGION)
+ec2 = LazyClient('ec2', region_name=AWS_REGION)
+codebuild = LazyClient('codebuild', region_name=AWS_REGION)
+lambda_client = LazyClient('lambda', region_name=AWS_REGION)
+ssm = LazyClient('ssm', region_name=AWS_REGION)
+sqs = LazyClient('sqs', region_name=AWS_REGION)
+codedeploy = LazyClient('codedeploy', region_name=AWS_REGION)
+logs = LazyClient('logs', region_name=AWS_REGION)
+
+# HOSTING_MODE=s3: sites are published here (see static_hosting.py)
+STATIC_BUCKET = STATIC_SITE_BUCKET or S3_BUCKET_NAME
+static_s3 = LazyClient('s3', region_name=AWS_REGION, endpoint_url=STATIC_SITE_ENDPOINT_URL) if STATIC_SITE_ENDPOINT_URL else s3
+
+# Polls EC2 until nginx + CodeDeploy agent are up (see readiness.py)
+readiness_probe = ReadinessProbe(ec2, ssm=ssm)
+
+# Sources keyed by commit SHA + local LRU of clones (see source_cache.py)
+source_cache = SourceCache(s3, S3_BUCKET_NAME)
+
+# Reuse build output for the same commit + buildspec (see build_cache.py)
+BUILDSPEC = load_buildspec()
+build_cache = BuildCache(s3, S3_BUCKET_NAME, BUILDSPEC)
+
+# Dependency cache used by buildspec.yml (node_modules / pip wheels)
+CODEBUILD_CACHE_LOCATION = os.environ.get('CODEBUILD_CACHE_LOCATION', f"{S3_BUCKET_NAME}/codebuild-cache")
+
+# One poller for all in-flight builds + optional pushed events (see build_tracker.py)
+build_tracker = BuildTracker(codebuild)
+build_events = SqsBuildEvents(sqs, CODEBUILD_EVENTS_QUEUE_URL, build_tracker)
+
+# Tails build logs from CloudWatch, archives them in S3 (see build_logs.py)
+build_log_tailer = BuildLogTailer(logs)
+BUILD_LOG_ERRORS_SHOWN = 20  # Error lines of a failed build copied to the pipeline log
+
+# Async deploy step: one poller for all in-flight CodeDeploy runs (see deploy_tracker.py)
+check_deploy_mode()
+deploy_tracker = DeployTracker(codedeploy)
+
+# ========================================
+# DEPLOYMENT STORAGE
+# ========================================
+# SQLite by default, DynamoDB with DEPLOYMENT_STORE=dynamodb (see store.py)
+store = make_store(region_name=AWS_REGION)
+
+# Live progress for /deployments/<id>/events (see events.py)
+event_bus = EventBus()
+
+# Pre-booted instances, claimed by create_ec2_instance (see warm_pool.py)
+warm_pool = WarmPool(ec2, LAUNCH_TEMPLATE_ID, readiness_probe, store)
+
+# Shared hosts for HOSTING_MODE=shared, rebuilt from the store (see placement.py)
+host_scheduler = HostScheduler(store=store)
+
+# Terminates orphaned / failed / expired instances, cleans S3 (see reaper.py)
+reaper = Reaper(
+    ec2, s3, S3_BUCKET_NAME, store,
+    release_site=lambda d: release_site(d),
+    delete_static_site=lambda d: delete_site(static_s3, STATIC_BUCKET, site_prefix(d['subdomain'])),
+    delete_deployment_group=lambda deployment_id: delete_deployment_group(codedeploy, deployment_id)
+)
 
 # ========================================
-# IN-MEMORY STORAGE (Database later)
+# BACKGROUND JOBS
 # ========================================
-deployments = {}
+deploy_queue = JobQueue(
+    max_workers=DEPLOY_MAX_WORKERS,
+    max_queue=DEPLOY_MAX_QUEUE,
+    name='deploy',
+    max_per_client=ADMISSION_MAX_WAITING  # fair share per client (see admission.py)
+)
+
+# Admission control: per-client rate limit + AWS resource budgets (see admission.py)
+client_limiter = ClientLimiter()
+ec2_budget = ResourceBudget('EC2 launch', EC2_LAUNCH_BUDGET)
+codebuild_budget = ResourceBudget('CodeBuild', CODEBUILD_BUDGET)
+deploy_budget = ResourceBudget('deploy', DEPLOY_BUDGET)
+RESOURCE_BUDGETS = {'ec2': ec2_budget, 'codebuild': codebuild_budget, 'deploy': deploy_budget}
+
+# EC2 boot runs next to the build branch of each deployment,
+# so one provisioning thread per deploy worker is enough.
+provision_pool = ThreadPoolExecutor(
+    max_workers=DEPLOY_MAX_WORKERS,
+    thread_name_prefix='provision'
+)
+
+# Recent /deploy/batch submissions: batch_id → deployment IDs (in this process)
+BATCH_HISTORY = 100
+recent_batches = OrderedDict()
+recent_batches_lock = threading.Lock()
+
+# GET /deployments bodies by query string, reused until the store version moves
+LISTING_CACHE_SIZE = 64
+listing_cache = OrderedDict()  # query → (store version, serialized body)
+listing_cache_lock = threading.Lock()
+FIELD_ALIASES = {'id': 'deployment_id'}  # ?fields=id,status,url
+
+# Scraped at /metrics
+metrics_registry.add(Gauge('deployfast_queue_waiting', 'Deployments waiting for a worker',
+                           lambda: deploy_queue.stats()['queued']))
+metrics_registry.add(Gauge('deployfast_queue_active', 'Deployments running right now',
+                           lambda: deploy_queue.stats()['active']))
+metrics_registry.add(Gauge('deployfast_builds_in_flight', 'CodeBuild runs being tracked',
+                           build_tracker.in_flight))
+metrics_registry.add(Gauge('deployfast_deploys_in_flight', 'Async deploy steps being tracked',
+                           deploy_tracker.in_flight))
+metrics_registry.add(Gauge('deployfast_budget_in_use', 'AWS resource budget slots in use',
+                           lambda: {name: b.stats()['in_use'] for name, b in RESOURCE_BUDGETS.items()},
+                           label='resource'))
+metrics_registry.add(Gauge('deployfast_budget_waiting', 'Pipeline steps waiting for a budget slot',
+                           lambda: {name: b.stats()['waiting'] for name, b in RESOURCE_BUDGETS.items()},
+                           label='resource'))
+metrics_registry.add(Gauge('deployfast_event_watchers', 'Open /events streams',
+                           event_bus.watcher_count))
+metrics_registry.add(Gauge('deployfast_shared_host_sites', 'Sites per shared host',
+                           lambda: {h['host_id']: h['sites'] for h in host_scheduler.stats()['hosts']},
+                           label='host_id'))
+
+# Pipeline steps, in order. Each deployment record tracks these.
+PIPELINE_STEPS = ['create_ec2', 'upload', 'build', 'deploy']
+
+# A deployment in one of these states is finished
+FINAL_STATUSES = ['live', 'failed', 'build_failed', 'deploy_failed', EXPIRED_STATUS]
+FAILED_STATUSES = ['failed', 'build_failed', 'deploy_failed']
+
+# Still running on some worker: resumed elsewhere if that process dies
+DEPLOY_STATUSES = ['queued', 'creating_ec2', 'uploading', 'building', 'waiting_for_ec2', 'deploying']
+REDEPLOY_STATUSES = ['redeploy_queued', 'redeploying']
+
+# Heartbeat of this process + takeover of deployments of dead ones (see resume.py)
+resumer = PipelineResumer(store, resume=lambda d: resume_pipeline(d), statuses=DEPLOY_STATUSES + REDEPLOY_STATUSES)
+WORKER_ID = resumer.worker_id
 
 
 # ========================================
@@ -90,11 +282,121 @@ def generate_subdomain(github_url):
     return f"{clean_name}-{suffix}"
 
 
+def set_step(deployment_id, step, status, **extra):
+    """
+    Record progress of one pipeline step on the deployment record.
+
+    Step status: pending → running → done / failed
+
+    Example record:
+    'steps': {
+        'create_ec2': {'status': 'done', 'started_at': ..., 'finished_at': ...},
+        'upload': {'status': 'running', 'started_at': ...},
+        ...
+    }
+    """
+    now = datetime.now().isoformat()
+    if status == 'running':
+        extra['started_at'] = now
+    elif status in ('done', 'failed'):
+        extra['finished_at'] = now
+    store.update_step(deployment_id, step, status=status, **extra)
+    event_bus.publish(deployment_id, 'step', dict(extra, step=step, status=status))
+
+
+def set_status(deployment_id, status, **fields):
+    """
+    Change the deployment status (and any other fields) and tell watchers.
+
+    Finished deployments also get an 'end' event carrying the final record,
+    which closes every open event stream.
+    """
+    deployment = store.update(deployment_id, status=status, **fields)
+    event_bus.publish(deployment_id, 'status', {'status': status})
+    if status in FINAL_STATUSES:
+        event_bus.publish(deployment_id, 'end', {'deployment': deployment})
+
+
+def log(deployment_id, message):
+    """Print a pipeline log line and stream it to watchers"""
+    print(f"[{deployment_id}] {message}")
+    event_bus.publish(deployment_id, 'log', {'message': message})
+
+
+def request_client():
+    """Who sent the current request, for rate limiting + fair queueing"""
+    return client_key(request.remote_addr, request.headers.get('X-Forwarded-For'))
+
+
+def too_many_requests(retry_after):
+    """429 response for a client over its deployment rate"""
+    seconds = math.ceil(retry_after)
+    return jsonify({
+        'success': False,
+        'error': f"Too many deployments, try again in {seconds}s",
+        'retry_after': seconds
+    }), 429, {'Retry-After': str(seconds)}
+
+
+def queue_full_response(error):
+    """503 response when the deploy queue (or the client's share) is full"""
+    headers = {'Retry-After': str(error.retry_after)} if error.retry_after else {}
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after
+    }), 503, headers
+
+
+def queue_place(place):
+    """Response fields telling the client when its deployment should start"""
+    if place is None:
+        return {}
+    return {
+        'queue_position': place['position'],
+        'estimated_start_seconds': place['estimated_start_seconds'],
+        'estimated_start_at': datetime.fromtimestamp(
+            time.time() + place['estimated_start_seconds']
+        ).isoformat(timespec='seconds')
+    }
+
+
+def idempotency_fingerprint(github_url, hosting_mode):
+    """What a /deploy request asked for, to spot an Idempotency-Key reused for something else"""
+    return hashlib.sha1(json.dumps([github_url, hosting_mode]).encode()).hexdigest()
+
+
+def idempotent_replay(claim, fingerprint):
+    """Response to a /deploy retried with an Idempotency-Key that was already used"""
+    if claim['fingerprint'] != fingerprint:
+        return jsonify({
+            'success': False,
+            'error': 'This Idempotency-Key was already used for a different request'
+        }), 422
+
+    deployment = store.get(claim['deployment_id'])
+    if deployment is None:
+        return jsonify({
+            'success': False,
+            'error': 'The request with this Idempotency-Key is still being processed, or its deployment was deleted'
+        }), 409
+
+    return jsonify({
+        'success': True,
+        'deployment_id': deployment['deployment_id'],
+        'subdomain': deployment['subdomain'],
+        'status': deployment['status'],
+        'status_url': f"/deployments/{deployment['deployment_id']}",
+        'idempotent_replay': True
+    }), 200, {'Idempotent-Replayed': 'true'}
+
+
 # ========================================
 # STEP 1: CREATE EC2 FROM LAUNCH TEMPLATE
 # ========================================
 
-def create_ec2_instance(deployment_id):
+@instrument('create_ec2_instance')
+def create_ec2_instance(deployment_id, attempt=0):
     """
     Create a new EC2 instance from Launch Template.
     
@@ -108,53 +410,72 @@ def create_ec2_instance(deployment_id):
     - Instance type (t2.micro)
     - Security group
     - User Data script (installs nginx + CodeDeploy agent)
+    
+    If the warm pool is enabled, a pre-booted instance is claimed instead
+    and we skip straight to CodeDeploy. Cold launch is the fallback.
+    
+    The cold launch is idempotent: ClientToken is the deployment ID plus
+    the attempt (POST /deployments/<id>/retry counts up), so a retried
+    run_instances (botocore retry, resumed pipeline) returns the instance
+    already launched instead of a second one, while a retry of a failed
+    deployment really launches a new one. EC2 keeps returning the first
+    instance for a token even after it is terminated.
+
+    The instance ID is saved on the record right after the launch, so
+    DELETE (and the reaper) can terminate an instance that never gets
+    ready.
     """
     
     print(f"[{deployment_id}] ========================================")
-    print(f"[{deployment_id}] STEP 1: Creating EC2 instance")
+    log(deployment_id, "STEP 1: Creating EC2 instance")
     print(f"[{deployment_id}] ========================================")
     
-    # Create EC2 from Launch Template
-    response = ec2.run_instances(
-        LaunchTemplate={
-            'LaunchTemplateId': LAUNCH_TEMPLATE_ID,
-            'Version': '$Latest'
-        },
-        MinCount=1,
-        MaxCount=1,
-        TagSpecifications=[{
-            'ResourceType': 'instance',
-            'Tags': [
-                {'Key': 'Name', 'Value': f'DeployFast-{deployment_id}'},
-                {'Key': 'DeploymentId', 'Value': deployment_id},  # CodeDeploy targets this!
-                {'Key': 'ManagedBy', 'Value': 'DeployFast'}
-            ]
-        }]
-    )
-    
-    instance_id = response['Instances'][0]['InstanceId']
-    print(f"[{deployment_id}] EC2 instance created: {instance_id}")
+    # Fast path: take an already-booted instance from the warm pool
+    claimed = warm_pool.claim(deployment_id)
+    if claimed:
+        return {
+            'instance_id': claimed['instance_id'],
+            'public_ip': claimed['public_ip'],
+            'ready_seconds': 0,
+            'warm': True
+        }
     
-    # Wait for instance to be in "running" state
-    print(f"[{deployment_id}] Waiting for EC2 to start...")
-    waiter = ec2.get_waiter('instance_running')
-    waiter.wait(InstanceIds=[instance_id])
-    print(f"[{deployment_id}] EC2 is running!")
+    # Create EC2 from Launch Template (at most EC2_LAUNCH_BUDGET booting at once)
+    with ec2_budget.hold(deployment_id):
+        response = ec2.run_instances(
+            LaunchTemplate={
+                'LaunchTemplateId': LAUNCH_TEMPLATE_ID,
+                'Version': '$Latest'
+            },
+            MinCount=1,
+            MaxCount=1,
+            ClientToken=f"{deployment_id}-{attempt}",
+            TagSpecifications=[{
+                'ResourceType': 'instance',
+                'Tags': [
+                    {'Key': 'Name', 'Value': f'DeployFast-{deployment_id}'},
+                    {'Key': 'DeploymentId', 'Value': deployment_id},  # CodeDeploy targets this!
+                    {'Key': 'ManagedBy', 'Value': 'DeployFast'}
+                ]
+            }]
+        )
     
-    # Get the public IP address
-    instance_info = ec2.describe_instances(InstanceIds=[instance_id])
-    public_ip = instance_info['Reservations'][0]['Instances'][0].get('PublicIpAddress')
-    print(f"[{deployment_id}] EC2 public IP: {public_ip}")
+        instance_id = response['Instances'][0]['InstanceId']
+        log(deployment_id, f"EC2 instance created: {instance_id}")
+        store.update(deployment_id, ec2_instance_id=instance_id)  # no record (shared host ID): no-op
     
-    # Wait for User Data script to complete
-    # The script installs nginx and CodeDeploy agent
-    print(f"[{deployment_id}] Waiting 90 seconds for nginx + CodeDeploy agent to install...")
-    time.sleep(90)
-    print(f"[{deployment_id}] EC2 should be ready now!")
+        # Wait until the instance is running AND its User Data script is done
+        # (nginx + CodeDeploy agent installed). Polls real signals with backoff
+        # instead of sleeping a fixed 90 seconds.
+        ready = readiness_probe.wait(deployment_id, instance_id)
+    public_ip = ready['public_ip']
+    log(deployment_id, f"EC2 public IP: {public_ip}")
     
     return {
         'instance_id': instance_id,
-        'public_ip': public_ip
+        'public_ip': public_ip,
+        'ready_seconds': ready['ready_seconds'],
+        'warm': False
     }
 
 
@@ -162,79 +483,93 @@ def create_ec2_instance(deployment_id):
 # STEP 2: UPLOAD CODE TO S3
 # ========================================
 
+@instrument('upload_to_s3')
 def upload_to_s3(github_url, deployment_id):
     """
     Clone GitHub repository and upload to S3.
     
     Process:
-    1. Create temp directory
-    2. Git clone the repo
-    3. Zip the repo
-    4. Upload to S3 at: deployments/{deployment_id}/source.zip
-    5. Clean up temp directory
+    1. Resolve the commit SHA of HEAD (git ls-remote, no clone)
+    2. If s3://.../sources/{sha}.zip exists → done (cache hit!)
+    3. Otherwise check out the commit (local clone cache), classify it
+       (static / node / python) and zip it straight into an S3 multipart
+       upload at sources/{sha}.zip, with the stack as object metadata
     
-    Each deployment gets its own S3 path!
+    Sources are content-addressed: every deployment of the same commit
+    shares one S3 object. See source_cache.py, streaming_upload.py and
+    project_analysis.py.
+    
+    Returns {'s3_key', 'commit_sha', 'cache_hit', 'stack'}
+    (stack is None for sources uploaded before they were classified)
     """
     
     print(f"[{deployment_id}] ========================================")
-    print(f"[{deployment_id}] STEP 2: Uploading code to S3")
+    log(deployment_id, "STEP 2: Uploading code to S3")
     print(f"[{deployment_id}] ========================================")
     
-    temp_dir = None
     try:
-        # Create temp directory
-        temp_dir = tempfile.mkdtemp()
-        repo_path = os.path.join(temp_dir, "repo")
-        zip_base_path = os.path.join(temp_dir, "source")
-
-        # Clone repository
-        print(f"[{deployment_id}] Cloning {github_url}...")
-        result = subprocess.run(
-            ["git", "clone", "--depth", "1", github_url, repo_path],
-            check=True,
-            capture_output=True,
-            timeout=300
-        )
-        print(f"[{deployment_id}] Clone successful!")
+        # Which commit are we deploying?
+        with span(deployment_id, 'resolve_head'):
+            commit_sha = source_cache.resolve_head(github_url)
+        s3_key = source_key(commit_sha)
+        log(deployment_id, f"HEAD of {github_url} is {commit_sha}")
 
-        # Create zip file
-        print(f"[{deployment_id}] Creating zip file...")
-        zip_file_path = shutil.make_archive(zip_base_path, 'zip', repo_path)
-        print(f"[{deployment_id}] Zip created: {zip_file_path}")
+        metadata = source_cache.lookup(commit_sha)
+        if metadata is not None:
+            stack = stack_from_metadata(metadata)
+            log(deployment_id, f"Source cache hit: s3://{S3_BUCKET_NAME}/{s3_key} ({stack or 'unknown'} site)")
+            return {'s3_key': s3_key, 'commit_sha': commit_sha, 'cache_hit': True, 'stack': stack}
 
-        # Upload to S3 with unique path
-        s3_key = f"deployments/{deployment_id}/source.zip"
-        print(f"[{deployment_id}] Uploading to s3://{S3_BUCKET_NAME}/{s3_key}")
-        
-        with open(zip_file_path, 'rb') as f:
-            s3.upload_fileobj(f, S3_BUCKET_NAME, s3_key)
+        # Clone (or fetch into a cached clone)
+        log(deployment_id, f"Source cache miss, checking out {github_url}...")
+        checkout_started = time.perf_counter()
+        with source_cache.checkout(github_url, commit_sha) as repo_path:
+            record_span(deployment_id, 'checkout', time.perf_counter() - checkout_started)
+            log(deployment_id, "Checkout successful!")
+
+            # What needs building (decides the build step)
+            with span(deployment_id, 'analyze'):
+                stack = classify(repo_path)
+            log(deployment_id, f"Project type: {stack}")
+
+            # Zip + upload in one pass
+            log(deployment_id, f"Streaming zip to s3://{S3_BUCKET_NAME}/{s3_key}")
+            with span(deployment_id, 'zip_upload'):
+                uploaded = stream_directory_to_s3(
+                    s3, repo_path, S3_BUCKET_NAME, s3_key, metadata={STACK_METADATA: stack}
+                )
         
-        print(f"[{deployment_id}] Upload complete!")
+        log(deployment_id, f"Upload complete! ({uploaded['files']} files, {uploaded['bytes']} bytes)")
         
-        return s3_key
+        return {'s3_key': s3_key, 'commit_sha': commit_sha, 'cache_hit': False, 'stack': stack}
 
     except subprocess.CalledProcessError as e:
-        print(f"[{deployment_id}] Git clone failed: {e.stderr.decode()}")
+        log(deployment_id, f"Git failed: {e.stderr.decode()}")
         raise Exception(f"Failed to clone repository: {e.stderr.decode()}")
-        
-    finally:
-        # Always clean up temp directory
-        if temp_dir and os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir, ignore_errors=True)
 
 
 # ========================================
 # STEP 3: RUN CODEBUILD
 # ========================================
 
-def run_codebuild(deployment_id, s3_source_key):
+@instrument('run_codebuild')
+def run_codebuild(deployment_id, s3_source_key, artifact_path=None, variables=None, project=None):
     """
     Start CodeBuild with the user's source code.
     
+    project: the CodeBuild project of the source's stack (see
+    project_analysis.py), CODEBUILD_PROJECT if None.
+    
     Overrides:
     - source: User's S3 path (not the default)
-    - artifacts: Output to user's S3 path
-    - environment variables: Pass DEPLOYMENT_ID to buildspec
+    - artifacts: Output to {artifact_path}/output
+      (builds/{build_key} when build caching is on, so the output
+      can be reused by later deployments of the same commit)
+    - buildspec: buildspec.yml from this repo (its hash is part of the
+      build cache key, so it must be exactly what runs)
+    - cache: S3 dependency cache (node_modules / pip wheels)
+    - environment variables: Pass DEPLOYMENT_ID (and the build
+      variables, e.g. HOSTING_MODE / SITE_NAME) to buildspec
     
     CodeBuild will:
     1. Download source from S3
@@ -245,96 +580,181 @@ def run_codebuild(deployment_id, s3_source_key):
     """
     
     print(f"[{deployment_id}] ========================================")
-    print(f"[{deployment_id}] STEP 3: Running CodeBuild")
+    log(deployment_id, "STEP 3: Running CodeBuild")
     print(f"[{deployment_id}] ========================================")
     
-    print(f"[{deployment_id}] Starting CodeBuild project: {CODEBUILD_PROJECT}")
-    print(f"[{deployment_id}] Source: s3://{S3_BUCKET_NAME}/{s3_source_key}")
+    project = project or CODEBUILD_PROJECT
+    log(deployment_id, f"Starting CodeBuild project: {project}")
+    log(deployment_id, f"Source: s3://{S3_BUCKET_NAME}/{s3_source_key}")
+    
+    if artifact_path is None:
+        artifact_path = f"deployments/{deployment_id}"
     
     response = codebuild.start_build(
-        projectName=CODEBUILD_PROJECT,
+        projectName=project,
         
         # Use THIS user's source code
         sourceTypeOverride='S3',
         sourceLocationOverride=f"{S3_BUCKET_NAME}/{s3_source_key}",
         
-        # Output to THIS user's path
+        # Output to THIS build's path
         artifactsOverride={
             'type': 'S3',
             'location': S3_BUCKET_NAME,
-            'path': f"deployments/{deployment_id}",
+            'path': artifact_path,
             'name': 'output',
             'packaging': 'ZIP'
         },
         
-        # Pass deployment_id to buildspec
+        # Our buildspec + dependency cache
+        buildspecOverride=BUILDSPEC,
+        cacheOverride={
+            'type': 'S3',
+            'location': CODEBUILD_CACHE_LOCATION
+        },
+        
+        # Pass deployment_id (+ build variables) to buildspec
         environmentVariablesOverride=[
             {
                 'name': 'DEPLOYMENT_ID',
                 'value': deployment_id,
                 'type': 'PLAINTEXT'
             }
+        ] + [
+            {'name': name, 'value': value, 'type': 'PLAINTEXT'}
+            for name, value in sorted((variables or {}).items())
         ]
     )
     
     build_id = response['build']['id']
-    print(f"[{deployment_id}] CodeBuild started: {build_id}")
+    log(deployment_id, f"CodeBuild started: {build_id}")
     
     return build_id
 
 
+@instrument('wait_for_codebuild')
 def wait_for_codebuild(deployment_id, build_id, timeout=600):
     """
     Wait for CodeBuild to complete.
     
-    Polls every 15 seconds until:
+    The build is handed to build_tracker, which polls all in-flight
+    builds in one batch_get_builds call and wakes up early on pushed
+    events. We just wait on the Future until:
     - SUCCEEDED: Build completed successfully
     - FAILED/FAULT/STOPPED/TIMED_OUT: Build failed
     - Timeout: We've waited too long
     """
     
-    print(f"[{deployment_id}] Waiting for CodeBuild to complete...")
+    log(deployment_id, "Waiting for CodeBuild to complete...")
+    
+    def on_phase(build):
+        event_bus.publish(deployment_id, 'build_phase', {
+            'build_id': build_id,
+            'status': build['buildStatus'],
+            'phase': build.get('currentPhase', 'UNKNOWN')
+        })
+        follow_build_log(deployment_id, build)
+
+    future = build_tracker.track(build_id, label=deployment_id, on_update=on_phase)
+    try:
+        build = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        build_tracker.untrack(build_id)
+        build_log_tailer.discard(deployment_id)
+        log(deployment_id, "CodeBuild timed out!")
+        return False
+
+    # Whole log → S3, with its error index
+    follow_build_log(deployment_id, build)
+    log_index = archive_build_log(deployment_id, build_id)
     
-    start_time = time.time()
+    # Where did the build time go? (QUEUED, PROVISIONING, BUILD, ...)
+    for phase, seconds in record_codebuild_phases(build).items():
+        add_timing(deployment_id, f"codebuild_{phase.lower()}", seconds)
     
-    while time.time() - start_time < timeout:
-        # Get build status
-        response = codebuild.batch_get_builds(ids=[build_id])
-        build = response['builds'][0]
-        status = build['buildStatus']
-        phase = build.get('currentPhase', 'UNKNOWN')
-        
-        print(f"[{deployment_id}] CodeBuild status: {status} (phase: {phase})")
-        
-        if status == 'SUCCEEDED':
-            print(f"[{deployment_id}] CodeBuild completed successfully!")
-            return True
-            
-        elif status in ['FAILED', 'FAULT', 'STOPPED', 'TIMED_OUT']:
-            # Get error details
-            phases = build.get('phases', [])
-            for p in phases:
-                if p.get('phaseStatus') == 'FAILED':
-                    contexts = p.get('contexts', [])
-                    for ctx in contexts:
-                        print(f"[{deployment_id}] Error: {ctx.get('message', 'Unknown error')}")
-            return False
-        
-        # Still in progress, wait and check again
-        time.sleep(15)
+    if build['buildStatus'] == 'SUCCEEDED':
+        log(deployment_id, "CodeBuild completed successfully!")
+        return True
     
-    print(f"[{deployment_id}] CodeBuild timed out!")
+    # Get error details
+    phases = build.get('phases', [])
+    for p in phases:
+        if p.get('phaseStatus') == 'FAILED':
+            contexts = p.get('contexts', [])
+            for ctx in contexts:
+                log(deployment_id, f"Error: {ctx.get('message', 'Unknown error')}")
+    if log_index and log_index['errors']:
+        log(deployment_id, f"Build log errors (full log: /deployments/{deployment_id}/logs):")
+        for line_number, text in log_index['errors'][-BUILD_LOG_ERRORS_SHOWN:]:
+            log(deployment_id, f"  {line_number + 1}: {text}")
     return False
 
 
+def follow_build_log(deployment_id, build):
+    """Tail a build's CloudWatch log stream once CodeBuild has created it"""
+    stream = build.get('logs') or {}
+    if not stream.get('groupName') or not stream.get('streamName'):
+        return
+
+    def on_lines(lines, offset):
+        event_bus.publish(deployment_id, 'build_log', {'offset': offset, 'lines': lines})
+
+    build_log_tailer.tail(deployment_id, stream['groupName'], stream['streamName'], on_lines=on_lines)
+
+
+def archive_build_log(deployment_id, build_id):
+    """
+    Read the rest of a finished build's log and store it in S3.
+    Returns the log index, or None (no log stream, or archiving failed:
+    the deployment goes on without it).
+    """
+    archive = build_log_tailer.finish(deployment_id)
+    if archive is None:
+        return None
+    try:
+        with span(deployment_id, 'archive_build_log'):
+            index = store_archive(s3, S3_BUCKET_NAME, deployment_id, build_id, archive)
+    except Exception as e:
+        log(deployment_id, f"Could not archive the build log: {str(e)}")
+        archive.discard()
+        return None
+    store.update(deployment_id, build_log={
+        'build_id': build_id,
+        'lines': index['lines'],
+        'errors': len(index['errors'])
+    })
+    return index
+
+
+@lru_cache(maxsize=128)
+def load_log_index(deployment_id, build_id):
+    """
+    Index of an archived build log (never changes once written), or None
+    if the archive is gone: the reaper deletes deployments/{id}/ of
+    failed deployments after REAPER_FAILED_TTL, logs included.
+    """
+    _, index_key = log_keys(deployment_id, build_id)
+    try:
+        response = s3.get_object(Bucket=S3_BUCKET_NAME, Key=index_key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return json.loads(response['Body'].read())
+
+
 # ========================================
 # STEP 4: INVOKE LAMBDA TO RUN CODEDEPLOY
 # ========================================
 
-def invoke_lambda(deployment_id):
+@instrument('invoke_lambda')
+def invoke_lambda(deployment_id, artifact_key=None):
     """
     Invoke Lambda function to run CodeDeploy.
     
+    artifact_key: S3 key of the CodeBuild output to deploy
+    (defaults to deployments/{deployment_id}/output)
+    
     Lambda will:
     1. Call CodeDeploy with specific tag filter
     2. Wait for CodeDeploy to complete
@@ -347,45 +767,69 @@ def invoke_lambda(deployment_id):
     """
     
     print(f"[{deployment_id}] ========================================")
-    print(f"[{deployment_id}] STEP 4: Invoking Lambda for CodeDeploy")
+    log(deployment_id, "STEP 4: Invoking Lambda for CodeDeploy")
     print(f"[{deployment_id}] ========================================")
     
+    if artifact_key is None:
+        artifact_key = f"deployments/{deployment_id}/output"
+    
     # Prepare payload for Lambda
     payload = {
         'deployment_id': deployment_id,
         's3_bucket': S3_BUCKET_NAME,
-        's3_key': f"deployments/{deployment_id}/output"
+        's3_key': artifact_key
     }
     
-    print(f"[{deployment_id}] Invoking Lambda: {LAMBDA_FUNCTION_NAME}")
-    print(f"[{deployment_id}] Payload: {json.dumps(payload)}")
+    log(deployment_id, f"Invoking Lambda: {LAMBDA_FUNCTION_NAME}")
+    log(deployment_id, f"Payload: {json.dumps(payload)}")
     
     # Invoke Lambda and wait for response
     response = lambda_client.invoke(
-        FunctionName="Lambdafr-ec2",
+        FunctionName=LAMBDA_FUNCTION_NAME,
         InvocationType='RequestResponse',  # Wait for response (synchronous)
         Payload=json.dumps(payload)
     )
     
     # Parse response
     response_payload = json.loads(response['Payload'].read().decode())
-    print(f"[{deployment_id}] Lambda response: {json.dumps(response_payload, indent=2)}")
+    log(deployment_id, f"Lambda response: {json.dumps(response_payload, indent=2)}")
     
     # Check if successful
     status_code = response_payload.get('statusCode', 500)
     
     if status_code == 200:
-        print(f"[{deployment_id}] Lambda completed successfully!")
+        log(deployment_id, "Lambda completed successfully!")
         return True
     else:
         body = response_payload.get('body', '{}')
         if isinstance(body, str):
             body = json.loads(body)
         error = body.get('error', 'Unknown error')
-        print(f"[{deployment_id}] Lambda failed: {error}")
+        log(deployment_id, f"Lambda failed: {error}")
         return False
 
 
+@instrument('start_deploy')
+def start_deploy(deployment_id, artifact_key, codedeploy_id=None):
+    """
+    Start the deploy step WITHOUT waiting for it (DEPLOY_MODE=codedeploy):
+    create the CodeDeploy deployment here, no Lambda.
+    Returns a Future from deploy_tracker.
+
+    codedeploy_id: a CodeDeploy deployment started before a restart
+    (resumed pipeline): poll that one instead of deploying again.
+    """
+    if codedeploy_id:
+        log(deployment_id, f"STEP 4: Re-attaching to CodeDeploy deployment {codedeploy_id}")
+        return deploy_tracker.track(deployment_id, codedeploy_id)
+
+    log(deployment_id, "STEP 4: Starting CodeDeploy deployment")
+    codedeploy_id = start_codedeploy(codedeploy, deployment_id, S3_BUCKET_NAME, artifact_key)
+    store.update(deployment_id, codedeploy_deployment_id=codedeploy_id, codedeploy_group=True)
+    log(deployment_id, f"CodeDeploy deployment started: {codedeploy_id}")
+    return deploy_tracker.track(deployment_id, codedeploy_id)
+
+
 # ========================================
 # TERMINATE EC2 (For delete deployment)
 # ========================================
@@ -404,196 +848,1674 @@ def terminate_ec2(instance_id):
 
 
 # ========================================
-# FLASK ROUTES
+# SHARED HOSTS (HOSTING_MODE=shared)
 # ========================================
 
-@app.route('/')
-def home():
-    """Serve the home page"""
-    return render_template('index.html')
+def load_shared_hosts():
+    """Rebuild shared host placement from the store (once per process)"""
+    if host_scheduler.loaded:
+        return
+    sites, cursor = [], None
+    while True:
+        page, cursor = store.list(limit=MAX_PAGE_SIZE, cursor=cursor)
+        sites.extend(
+            d for d in page
+            if d.get('host_id') and d['status'] not in FAILED_STATUSES + [EXPIRED_STATUS]
+        )
+        if not cursor:
+            break
+    for host_id in host_scheduler.load(sites):
+        print(f"[{host_id}] Shared host was still booting at restart, its sites will be placed again")
 
 
-@app.route('/deploy', methods=['POST'])
-def deploy():
+def release_site(deployment):
     """
-    Main deployment endpoint.
-    
-    Flow:
-    1. Validate GitHub URL
-    2. Generate deployment_id
-    3. Create EC2 from Launch Template
-    4. Upload code to S3
-    5. Run CodeBuild
-    6. Invoke Lambda → CodeDeploy
-    7. Return URL to user
+    Take a shared-mode site off its host.
+
+    The last site on a host terminates the host. Otherwise the site's
+    files and nginx config are removed over SSM (best effort).
+    Returns True if the host was terminated.
     """
-    
-    deployment_id = None
-    
+    deployment_id = deployment['deployment_id']
+    instance_id = deployment.get('ec2_instance_id')
+    host, empty = host_scheduler.release(deployment_id, deployment.get('host_id'), deployment.get('host_slot'))
+
+    if host is not None and empty:
+        if instance_id:
+            print(f"[{deployment_id}] Last site on {host.host_id}, terminating host")
+            terminate_ec2(instance_id)
+        return True
+
+    # Nothing was deployed to the host yet: nothing to clean up
+    if not instance_id or deployment['steps']['deploy']['status'] == 'pending':
+        return False
+
     try:
-        # Get GitHub URL from request
-        data = request.get_json()
-        github_url = data.get('github_url', '').strip()
-
-        # Validate URL
-        if not github_url:
-            return jsonify({'success': False, 'error': 'GitHub URL is required'}), 400
-            
-        if not validate_github_url(github_url):
-            return jsonify({'success': False, 'error': 'Invalid GitHub URL. Must be https://github.com/user/repo'}), 400
-
-        # Generate unique IDs
-        deployment_id = generate_deployment_id()
-        subdomain = generate_subdomain(github_url)
-        
-        print("")
-        print("=" * 70)
-        print(f"NEW DEPLOYMENT: {deployment_id}")
-        print(f"GitHub URL: {github_url}")
-        print(f"Subdomain: {subdomain}")
-        print("=" * 70)
-        print("")
-
-        # Initialize deployment record
-        deployments[deployment_id] = {
-            'deployment_id': deployment_id,
-            'subdomain': subdomain,
-            'github_url': github_url,
-            'status': 'starting',
-            'created_at': datetime.now().isoformat()
-        }
+        ssm.send_command(
+            InstanceIds=[instance_id],
+            DocumentName='AWS-RunShellScript',
+            Parameters={'commands': remove_site_commands(deployment['subdomain'])},
+            Comment=f"DeployFast: remove {deployment['subdomain']}"
+        )
+    except Exception as e:
+        print(f"[{deployment_id}] Could not remove site from {instance_id}: {e}")
+    return False
+
+
+# ========================================
+# DEPLOYMENT PIPELINE (runs in background)
+# ========================================
+
+def place_on_shared_host(deployment_id):
+    """
+    Find a shared host with room for this site, or launch a new one.
+
+    Sites placed on a host that is still booting wait for that same boot.
+    Returns the same dict as create_ec2_instance, plus 'host_id'.
+    """
+    host, is_new = host_scheduler.place(deployment_id, SITE_DISK_MB, SITE_MEMORY_MB)
+    store.update(
+        deployment_id,
+        host_id=host.host_id,
+        host_slot=host.sites[deployment_id]['slot'],
+        site_disk_mb=SITE_DISK_MB,
+        site_memory_mb=SITE_MEMORY_MB
+    )
+
+    if is_new:
+        log(deployment_id, f"No shared host has room, launching {host.host_id}")
+        try:
+            info = create_ec2_instance(host.host_id)
+            ec2.create_tags(
+                Resources=[info['instance_id']],
+                Tags=[
+                    {'Key': 'HostId', 'Value': host.host_id},
+                    {'Key': 'HostingMode', 'Value': 'shared'}
+                ]
+            )
+        except Exception as e:
+            host_scheduler.host_failed(host.host_id, e)
+            raise
+        finally:
+            # Launched under the host ID: the launch counts for the site that
+            # triggered it, nothing else ever reads the host's timings/events
+            for name, seconds in take_timings(host.host_id).items():
+                add_timing(deployment_id, name, seconds)
+            event_bus.reset(host.host_id)
+        if not host_scheduler.host_ready(host.host_id, info):
+            terminate_ec2(info['instance_id'])
+            raise Exception(f"Shared host {host.host_id} was released while booting")
+    else:
+        log(deployment_id, f"Placing site on shared host {host.host_id}")
+        if not host.ready.done():
+            log(deployment_id, f"Waiting for {host.host_id} to finish booting...")
+
+    info = host.ready.result()
+    return {
+        'instance_id': info['instance_id'],
+        'public_ip': info['public_ip'],
+        'ready_seconds': info.get('ready_seconds', 0) if is_new else 0,
+        'warm': info.get('warm', False) if is_new else True,
+        'host_id': host.host_id
+    }
+
+
+def provision_ec2(deployment_id, hosting_mode='dedicated', attempt=0):
+    """
+    Pipeline branch A: create the EC2 instance and wait until it is ready.
+    In shared mode, place the site on a shared host instead.
+
+    Runs on provision_pool, in parallel with branch B (upload + build).
+    The instance details are saved on the record as soon as they are
+    known, so DELETE can still terminate the instance if branch B fails.
+
+    attempt: how often the deployment was retried (see create_ec2_instance).
+    """
+    set_step(deployment_id, 'create_ec2', 'running')
+    try:
+        if hosting_mode == 'shared':
+            ec2_info = place_on_shared_host(deployment_id)
+        else:
+            ec2_info = create_ec2_instance(deployment_id, attempt)
+    except Exception:
+        set_step(deployment_id, 'create_ec2', 'failed')
+        raise
+
+    record_ec2(deployment_id, ec2_info)
+    return ec2_info
+
+
+def record_ec2(deployment_id, ec2_info):
+    """Save a ready instance on the deployment record"""
+    store.update(
+        deployment_id,
+        ec2_instance_id=ec2_info['instance_id'],
+        ec2_public_ip=ec2_info['public_ip'],
+        ec2_ready_seconds=ec2_info['ready_seconds'],
+        ec2_warm=ec2_info['warm']
+    )
+    set_step(deployment_id, 'create_ec2', 'done', ready_seconds=ec2_info['ready_seconds'])
+
+
+@instrument('provision_batch')
+def provision_batch(batch_id, ec2_futures, limiter):
+    """
+    Pipeline branch A for a whole batch of dedicated deployments.
+
+    Process:
+    1. Claim warm instances while the warm pool has any
+    2. Launch the rest with one run_instances call (see batch.py)
+    3. Tag each instance with its DeploymentId (rate limited)
+    4. Wait for all of them, one describe_instances per round
+
+    ec2_futures: deployment_id → Future. Each Future resolves as soon as
+    ITS instance is ready, so no deployment waits for the slowest boot.
+    """
+    deployment_ids = list(ec2_futures)
+    for deployment_id in deployment_ids:
+        set_step(deployment_id, 'create_ec2', 'running')
+
+    def finish(deployment_id, ec2_info):
+        record_ec2(deployment_id, ec2_info)
+        ec2_futures[deployment_id].set_result(ec2_info)
+
+    def fail(deployment_id, error):
+        set_step(deployment_id, 'create_ec2', 'failed')
+        ec2_futures[deployment_id].set_exception(error)
+
+    try:
+        # 1. Warm pool first
+        waiting = list(deployment_ids)
+        while waiting and warm_pool.enabled:
+            claimed = warm_pool.claim(waiting[0])
+            if not claimed:
+                break
+            finish(waiting.pop(0), {
+                'instance_id': claimed['instance_id'],
+                'public_ip': claimed['public_ip'],
+                'ready_seconds': 0,
+                'warm': True
+            })
+        if not waiting:
+            return
+
+        # 2-4 hold EC2 launch budget for the whole batch
+        with ec2_budget.hold(batch_id, len(waiting)):
+            # 2. One launch for everyone else
+            instance_ids = launch_instances(ec2, LAUNCH_TEMPLATE_ID, batch_id, len(waiting), limiter)
+            owners = dict(zip(instance_ids, waiting))
+            for deployment_id in waiting[len(instance_ids):]:
+                fail(deployment_id, Exception("EC2 could not launch an instance for this deployment"))
+
+            # 3. Tag each instance for CodeDeploy
+            for instance_id, deployment_id in owners.items():
+                tag_for_deployment(ec2, instance_id, deployment_id, limiter)
+                store.update(deployment_id, ec2_instance_id=instance_id)
+                log(deployment_id, f"EC2 instance created: {instance_id} (batch {batch_id})")
+
+            # 4. Wait for all of them together
+            def on_done(instance_id, result):
+                deployment_id = owners[instance_id]
+                if isinstance(result, Exception):
+                    fail(deployment_id, result)
+                else:
+                    log(deployment_id, f"EC2 public IP: {result['public_ip']}")
+                    finish(deployment_id, {
+                        'instance_id': instance_id,
+                        'public_ip': result['public_ip'],
+                        'ready_seconds': result['ready_seconds'],
+                        'warm': False
+                    })
+
+            readiness_probe.wait_many(batch_id, list(owners), on_done=on_done)
+
+    except Exception as e:
+        print(f"[{batch_id}] Batch provisioning failed: {e}")
+        for deployment_id, future in ec2_futures.items():
+            if not future.done():
+                fail(deployment_id, e)
+
+
+def run_deployment(deployment_id, github_url, ec2_future=None, limiter=None, resume=False):
+    """
+    Run the full deployment pipeline for one deployment.
+
+    Runs on a deploy_queue worker thread, never inside a request.
+    Progress and failures are written to the deployment record in store.
+
+    The build does not need the instance, so the pipeline is a small
+    dependency graph instead of a straight line:
+
+        A: create EC2 ──────────────────────────┐
+                                                ├──► invoke Lambda → CodeDeploy
+        B: clone → zip → S3 upload → CodeBuild ─┘
+
+    Branch A runs on provision_pool, branch B on this thread.
+    Both must finish before the deploy step.
+
+    In shared hosting mode, branch A places the site on a shared host
+    (see placement.py) and the build is told where the site lives.
+    In s3 hosting mode there is no branch A: the deploy step publishes
+    the build output to S3 (see static_hosting.py).
+
+    Batch deployments pass ec2_future (branch A is run once for the whole
+    batch by provision_batch) and a RateLimiter for the CodeBuild start.
 
+    Every step is timed (see metrics.py); the breakdown is saved on the
+    record as 'timings' when the deployment finishes.
+
+    With DEPLOY_MODE=codedeploy the worker only STARTS the
+    deploy step; deploy_async finishes the deployment when it completes.
+
+    Checkpoints: every step saves what it produced on the record (instance,
+    source key, build ID, artifact key, CodeDeploy ID) and is marked done.
+    A retried deployment, or one resumed after its worker died
+    (resume=True, see resume.py), skips the steps that are done and
+    re-attaches to a CodeBuild / CodeDeploy run that is still going.
+    """
+
+    # Claim the deployment: only one worker may run it
+    # (a resumed one was taken over from a dead worker by the resumer)
+    claim_from = DEPLOY_STATUSES if resume else ['queued']
+    deployment = store.transition(deployment_id, claim_from, 'creating_ec2', worker_id=WORKER_ID)
+    if not deployment:
+        print(f"[{deployment_id}] Not queued anymore (deleted or already running), skipping")
+        return
+    event_bus.publish(deployment_id, 'status', {'status': 'creating_ec2'})
+    started = time.perf_counter()
+    queued_seconds = (datetime.now() - datetime.fromisoformat(deployment['created_at'])).total_seconds()
+
+    hosting_mode = deployment.get('hosting_mode', 'dedicated')
+    build_variables = {}
+    if hosting_mode == 'shared':
+        build_variables = {'HOSTING_MODE': 'shared', 'SITE_NAME': deployment['subdomain']}
+
+    checkpoint = Checkpoint(deployment)
+    if resume or checkpoint.done_steps():
+        log(deployment_id, f"Resuming, already done: {', '.join(checkpoint.done_steps()) or 'nothing'}")
+
+    step = None
+    handed_off = False  # async deploy step: finished by deploy_async
+
+    try:
         # ============================================
-        # STEP 1: Create EC2 from Launch Template
+        # BRANCH A: Create EC2 / place on a shared host (in background)
         # ============================================
-        deployments[deployment_id]['status'] = 'creating_ec2'
-        ec2_info = create_ec2_instance(deployment_id)
-        deployments[deployment_id]['ec2_instance_id'] = ec2_info['instance_id']
-        deployments[deployment_id]['ec2_public_ip'] = ec2_info['public_ip']
+        if hosting_mode == 's3':
+            # Served straight from S3: no instance at all
+            if not checkpoint.done('create_ec2'):
+                set_step(deployment_id, 'create_ec2', 'done', skipped=True)
+        elif ec2_future is None and checkpoint.ec2_info():
+            ec2_future = Future()
+            ec2_future.set_result(checkpoint.ec2_info())
+            log(deployment_id, f"EC2 instance already ready: {deployment['ec2_instance_id']}")
+        elif ec2_future is None:
+            if resume and hosting_mode == 'shared':
+                # placed before the restart: place again
+                host_scheduler.release(deployment_id, deployment.get('host_id'), deployment.get('host_slot'))
+            ec2_future = provision_pool.submit(provision_ec2, deployment_id, hosting_mode,
+                                               deployment.get('retries', 0))
 
         # ============================================
-        # STEP 2: Upload code to S3
+        # BRANCH B, STEP 2: Upload code to S3
         # ============================================
-        deployments[deployment_id]['status'] = 'uploading'
-        s3_key = upload_to_s3(github_url, deployment_id)
-        deployments[deployment_id]['s3_key'] = s3_key
+        step = 'upload'
+        source = checkpoint.source()
+        if source:
+            log(deployment_id, f"Source already uploaded: s3://{S3_BUCKET_NAME}/{source['s3_key']}")
+        else:
+            set_status(deployment_id, 'uploading')
+            set_step(deployment_id, step, 'running')
+            source = upload_to_s3(github_url, deployment_id)
+            store.update(deployment_id, s3_key=source['s3_key'], commit_sha=source['commit_sha'], stack=source['stack'])
+            set_step(deployment_id, step, 'done', cache_hit=source['cache_hit'], stack=source['stack'])
 
         # ============================================
-        # STEP 3: Run CodeBuild
+        # BRANCH B, STEP 3: Run CodeBuild (or reuse a build)
         # ============================================
-        deployments[deployment_id]['status'] = 'building'
-        build_id = run_codebuild(deployment_id, s3_key)
-        deployments[deployment_id]['build_id'] = build_id
-        
-        if not wait_for_codebuild(deployment_id, build_id):
-            deployments[deployment_id]['status'] = 'build_failed'
-            return jsonify({
-                'success': False,
-                'error': 'CodeBuild failed. Check AWS Console for details.',
-                'deployment_id': deployment_id
-            }), 500
+        step = 'build'
+        artifact_key = checkpoint.artifact_key()
+        if artifact_key:
+            log(deployment_id, f"Build already done: s3://{S3_BUCKET_NAME}/{artifact_key}")
+        else:
+            set_status(deployment_id, 'building')
+            artifact_key = build_artifact(deployment_id, source, build_variables, limiter,
+                                          build_id=checkpoint.running('build', 'build_id'))
+            if not artifact_key:
+                set_status(
+                    deployment_id,
+                    'build_failed',
+                    error='CodeBuild failed. Check AWS Console for details.'
+                )
+                return
+            store.update(deployment_id, artifact_key=artifact_key)
 
         # ============================================
-        # STEP 4: Invoke Lambda → CodeDeploy
+        # JOIN: Wait for EC2 (branch A)
         # ============================================
-        deployments[deployment_id]['status'] = 'deploying'
-        
-        if not invoke_lambda(deployment_id):
-            deployments[deployment_id]['status'] = 'deploy_failed'
-            return jsonify({
-                'success': False,
-                'error': 'CodeDeploy failed. Check AWS Console for details.',
-                'deployment_id': deployment_id
-            }), 500
+        step = None
+        ec2_info = None
+        if ec2_future is not None:
+            if not ec2_future.done():
+                set_status(deployment_id, 'waiting_for_ec2')
+                log(deployment_id, "Build done, waiting for EC2...")
+            ec2_info = ec2_future.result()
 
         # ============================================
-        # SUCCESS!
+        # STEP 4: Invoke Lambda → CodeDeploy (or publish to S3)
         # ============================================
-        deployments[deployment_id]['status'] = 'live'
-        url = f"http://{ec2_info['public_ip']}"
-        deployments[deployment_id]['url'] = url
-        
-        print("")
-        print("=" * 70)
-        print(f"DEPLOYMENT SUCCESSFUL!")
-        print(f"Deployment ID: {deployment_id}")
-        print(f"URL: {url}")
-        print("=" * 70)
-        print("")
+        step = 'deploy'
+        set_status(deployment_id, 'deploying')
+        set_step(deployment_id, step, 'running')
 
-        return jsonify({
-            'success': True,
-            'deployment_id': deployment_id,
-            'subdomain': subdomain,
-            'url': url,
-            'ec2_instance_id': ec2_info['instance_id'],
-            'ec2_public_ip': ec2_info['public_ip']
-        })
+        if hosting_mode == 's3':
+            published = publish_static_site(deployment_id, deployment, artifact_key)
+            finish_deploy_step(deployment_id, deployment, None, True, uploaded=published['uploaded'],
+                               skipped=published['skipped'], deleted=published['deleted'])
+            return
+
+        if DEPLOY_MODE == 'codedeploy':
+            # Hand off: this worker is free as soon as the deploy has started
+            deploy_async(deployment_id, deployment, ec2_info, artifact_key, started, queued_seconds,
+                         codedeploy_id=checkpoint.running('deploy', 'codedeploy_deployment_id'))
+            handed_off = True
+            return
+
+        with deploy_budget.hold(deployment_id):
+            if hosting_mode == 'shared':
+                # The Lambda targets DeploymentId={deployment_id}: point the
+                # host's tag at us, one deployment per host at a time
+                with host_scheduler.deploy_lock(ec2_info['host_id']):
+                    tag_shared_host(deployment_id, ec2_info)
+                    deployed = invoke_lambda(deployment_id, artifact_key)
+            else:
+                deployed = invoke_lambda(deployment_id, artifact_key)
+
+        finish_deploy_step(deployment_id, deployment, ec2_info, deployed)
 
     except Exception as e:
-        print(f"[{deployment_id}] ERROR: {str(e)}")
-        
+        log(deployment_id, f"ERROR: {str(e)}")
+
         import traceback
         traceback.print_exc()
-        
-        if deployment_id and deployment_id in deployments:
-            deployments[deployment_id]['status'] = 'failed'
-            deployments[deployment_id]['error'] = str(e)
-            
-        return jsonify({
-            'success': False,
-            'error': str(e),
-            'deployment_id': deployment_id
-        }), 500
 
+        # EC2 failures are marked by provision_ec2 itself
+        if step:
+            set_step(deployment_id, step, 'failed')
+        set_status(deployment_id, 'failed', error=str(e))
 
-@app.route('/deployments', methods=['GET'])
-def list_deployments():
-    """List all deployments"""
-    return jsonify({
-        'success': True,
-        'count': len(deployments),
-        'deployments': list(deployments.values())
-    })
+    finally:
+        if not handed_off:
+            finish_deployment(deployment_id, hosting_mode, started, queued_seconds)
 
 
-@app.route('/deployments/<deployment_id>', methods=['GET'])
-def get_deployment(deployment_id):
-    """Get single deployment info"""
-    if deployment_id in deployments:
-        return jsonify({
-            'success': True,
-            'deployment': deployments[deployment_id]
-        })
-    return jsonify({
-        'success': False,
-        'error': 'Deployment not found'
-    }), 404
+def build_artifact(deployment_id, source, build_variables, limiter=None, build_id=None):
+    """
+    Pipeline step 3: build the uploaded source, or reuse a cached build.
 
+    Static sites are packaged here without CodeBuild; other stacks build
+    in their stack's CodeBuild project (see project_analysis.py).
 
-@app.route('/deployments/<deployment_id>', methods=['DELETE'])
+    build_id: a CodeBuild run this deployment started before a restart
+    (resumed pipeline). It builds to the same output key, so we wait for
+    it instead of starting another one.
+
+    Returns the S3 key of the build output, or None if CodeBuild failed.
+    The build step is marked on the record either way.
+    """
+    set_step(deployment_id, 'build', 'running')
+    build_key = build_cache.build_key(source['commit_sha'], build_variables)
+    artifact_key = build_cache.lookup(build_key)
+
+    if artifact_key:
+        log(deployment_id, f"Build cache hit: s3://{S3_BUCKET_NAME}/{artifact_key}")
+        set_step(deployment_id, 'build', 'done', cache_hit=True)
+        return artifact_key
+
+    if build_cache.enabled:
+        artifact_path = build_cache.artifact_path(build_key)
+        artifact_key = build_cache.artifact_key(build_key)
+    else:
+        artifact_path = f"deployments/{deployment_id}"
+        artifact_key = f"deployments/{deployment_id}/output"
+
+    stack = source.get('stack')
+    if skips_codebuild(stack):
+        package_static_site(deployment_id, source['s3_key'], artifact_key, build_variables)
+        if build_cache.enabled:
+            build_cache.record(build_key, None, deployment_id)
+        set_step(deployment_id, 'build', 'done', cache_hit=False, codebuild=False)
+        return artifact_key
+
+    with codebuild_budget.hold(deployment_id):
+        if build_id:
+            log(deployment_id, f"Re-attaching to CodeBuild run {build_id}")
+        else:
+            if limiter:
+                limiter.acquire()
+            build_id = run_codebuild(
+                deployment_id, source['s3_key'], artifact_path, build_variables,
+                project=codebuild_project(stack, CODEBUILD_PROJECT)
+            )
+            store.update(deployment_id, build_id=build_id)
+        built = wait_for_codebuild(deployment_id, build_id)
+
+    if not built:
+        set_step(deployment_id, 'build', 'failed')
+        return None
+
+    if build_cache.enabled:
+        build_cache.record(build_key, build_id, deployment_id)
+    set_step(deployment_id, 'build', 'done', cache_hit=False)
+    return artifact_key
+
+
+@instrument('package_static_site')
+def package_static_site(deployment_id, s3_source_key, artifact_key, variables=None):
+    """
+    Build step of a static site, without CodeBuild.
+
+    There is nothing to build, so the build output is the source plus
+    the appspec and scripts buildspec.yml would have added (see
+    bundles.write_site_bundle): seconds instead of a CodeBuild queue,
+    provisioning and download.
+    """
+    print(f"[{deployment_id}] ========================================")
+    log(deployment_id, "STEP 3: Packaging static site (no build needed)")
+    print(f"[{deployment_id}] ========================================")
+
+    with tempfile.TemporaryDirectory(prefix='deployfast-static-') as work_dir:
+        source_zip = os.path.join(work_dir, 'source.zip')
+        output_zip = os.path.join(work_dir, 'output.zip')
+        s3.download_file(S3_BUCKET_NAME, s3_source_key, source_zip, Config=S3_TRANSFER_CONFIG)
+        files = write_site_bundle(output_zip, source_zip, variables)
+        s3.upload_file(output_zip, S3_BUCKET_NAME, artifact_key, Config=S3_TRANSFER_CONFIG)
+        size = os.path.getsize(output_zip)
+
+    log(deployment_id, f"Build output: s3://{S3_BUCKET_NAME}/{artifact_key} ({files} files, {size} bytes)")
+
+
+@instrument('publish_static_site')
+def publish_static_site(deployment_id, deployment, artifact_key):
+    """
+    Deploy step of HOSTING_MODE=s3: publish the build output under the
+    site's S3 prefix. No instance, no Lambda, no CodeDeploy; files that
+    are already there unchanged are skipped (see static_hosting.py).
+    """
+    prefix = site_prefix(deployment['subdomain'])
+    print(f"[{deployment_id}] ========================================")
+    log(deployment_id, f"STEP 4: Publishing to s3://{STATIC_BUCKET}/{prefix}")
+    print(f"[{deployment_id}] ========================================")
+
+    with tempfile.TemporaryDirectory(prefix='deployfast-publish-') as work_dir:
+        artifact = os.path.join(work_dir, 'output.zip')
+        s3.download_file(S3_BUCKET_NAME, artifact_key, artifact, Config=S3_TRANSFER_CONFIG)
+        published = publish_site(static_s3, STATIC_BUCKET, prefix, artifact)
+
+    log(deployment_id, f"Published {published['files']} files: {published['uploaded']} uploaded "
+                       f"({published['bytes']} bytes), {published['skipped']} unchanged, "
+                       f"{published['deleted']} deleted")
+    return published
+
+
+def tag_shared_host(deployment_id, ec2_info):
+    """Point a shared host's DeploymentId tag (CodeDeploy's target) at this deployment"""
+    ec2.create_tags(
+        Resources=[ec2_info['instance_id']],
+        Tags=[{'Key': 'DeploymentId', 'Value': deployment_id}]
+    )
+
+
+def deploy_async(deployment_id, deployment, ec2_info, artifact_key, started, queued_seconds,
+                 codedeploy_id=None):
+    """
+    Start the deploy step and finish the deployment when it completes
+    (DEPLOY_MODE=codedeploy).
+
+    Nothing waits on a thread in between: deploy_tracker resolves the
+    Future from its poller (woken up by /webhooks/codedeploy), and the callback
+    below runs the end of the pipeline.
+
+    A shared host keeps its deploy lock until the deploy is over, so the
+    next site cannot retag the host mid-deploy. The deploy budget slot is
+    held until then too.
+
+    codedeploy_id: re-attach to a deploy already running (see start_deploy).
+    """
+    hosting_mode = deployment.get('hosting_mode', 'dedicated')
+    budget_taken = deploy_budget.acquire()
+    host_lock = None
+    if hosting_mode == 'shared':
+        host_lock = host_scheduler.deploy_lock(ec2_info['host_id'])
+        host_lock.acquire()
+
+    try:
+        if host_lock:
+            tag_shared_host(deployment_id, ec2_info)
+        future = start_deploy(deployment_id, artifact_key, codedeploy_id)
+    except Exception:
+        if host_lock:
+            host_lock.release()
+        deploy_budget.release(budget_taken)
+        raise
+    deploy_started = time.perf_counter()
+
+    def on_deploy_done(future):
+        try:
+            if host_lock:
+                host_lock.release()
+            deploy_budget.release(budget_taken)
+            record_span(deployment_id, 'codedeploy', time.perf_counter() - deploy_started)
+
+            if future.cancelled():
+                log(deployment_id, "Deploy no longer tracked (deployment deleted?)")
+                return
+            result = future.result()
+            if result['codedeploy_id']:
+                store.update(deployment_id, codedeploy_deployment_id=result['codedeploy_id'])
+            if not result['succeeded']:
+                log(deployment_id, f"Deploy {result['status']}: {result['error'] or 'no details'}")
+            finish_deploy_step(deployment_id, deployment, ec2_info, result['succeeded'])
+        except Exception as e:
+            log(deployment_id, f"ERROR: {str(e)}")
+            set_step(deployment_id, 'deploy', 'failed')
+            set_status(deployment_id, 'failed', error=str(e))
+        finally:
+            finish_deployment(deployment_id, hosting_mode, started, queued_seconds)
+
+    future.add_done_callback(on_deploy_done)
+
+
+def finish_deploy_step(deployment_id, deployment, ec2_info, deployed, **details):
+    """
+    Record the deploy result: the deployment is live or deploy_failed.
+
+    details: extra fields for the deploy step (s3 mode: what was published)
+    """
+    if not deployed:
+        set_step(deployment_id, 'deploy', 'failed')
+        set_status(
+            deployment_id,
+            'deploy_failed',
+            error='CodeDeploy failed. Check AWS Console for details.'
+        )
+        return
+    set_step(deployment_id, 'deploy', 'done', **details)
+
+    # ============================================
+    # SUCCESS!
+    # ============================================
+    if deployment.get('hosting_mode') == 's3':
+        url = static_site_url(deployment['subdomain'], STATIC_BUCKET, AWS_REGION)
+    elif deployment.get('hosting_mode') == 'shared':
+        url = site_url(deployment['subdomain'], ec2_info['public_ip'])
+    else:
+        url = f"http://{ec2_info['public_ip']}"
+    set_status(deployment_id, 'live', url=url)
+
+    print("")
+    print("=" * 70)
+    print(f"DEPLOYMENT SUCCESSFUL!")
+    print(f"Deployment ID: {deployment_id}")
+    print(f"URL: {url}")
+    print("=" * 70)
+    print("")
+
+
+def finish_deployment(deployment_id, hosting_mode, started, queued_seconds):
+    """Last thing a deployment does, whatever its outcome"""
+    # Timing breakdown for this deployment
+    timings = take_timings(deployment_id)
+    timings['queued'] = round(queued_seconds, 3)
+    timings['total'] = round(time.perf_counter() - started, 3)
+    deployment = store.update(deployment_id, timings=timings)
+    if deployment:
+        deployments_finished.inc(deployment['status'])
+
+    # A failed shared-mode site gives its room on the host back
+    if hosting_mode == 'shared' and deployment and deployment['status'] in FAILED_STATUSES:
+        try:
+            release_site(deployment)
+        except Exception as e:
+            print(f"[{deployment_id}] Could not release shared host capacity: {e}")
+
+
+# ========================================
+# INCREMENTAL REDEPLOY (see bundles.py)
+# ========================================
+
+def run_redeploy(deployment_id):
+    """
+    Ship a new commit to a live deployment's existing instance.
+
+    Flow:
+    1. Upload the repo's current HEAD (nothing to do if it is the live commit)
+    2. Manifest of the live release (stored, or computed from its artifact)
+    3. Build (or reuse a cached build) and diff its manifest against the live one
+    4. Deploy a bundle of only the changed files; the instance swaps
+       releases atomically
+    5. Store the new manifest, artifact and commit on the record
+
+    The live release keeps serving the whole time. If anything fails it
+    simply stays live, and the error is saved as 'redeploy_error'.
+
+    An s3-hosted site has no instance and no manifest: step 4 publishes
+    the new build output, which only uploads the files that changed
+    (see static_hosting.py).
+    """
+    deployment = store.transition(deployment_id, ['redeploy_queued'], 'redeploying', worker_id=WORKER_ID)
+    if not deployment:
+        print(f"[{deployment_id}] Not queued for redeploy anymore, skipping")
+        return
+    event_bus.publish(deployment_id, 'status', {'status': 'redeploying'})
+    started = time.perf_counter()
+
+    build_variables = {}
+    if deployment.get('hosting_mode') == 'shared':
+        build_variables = {'HOSTING_MODE': 'shared', 'SITE_NAME': deployment['subdomain']}
+
+    step = None
+    outcome = 'failed'
+    try:
+        with tempfile.TemporaryDirectory(prefix='deployfast-redeploy-') as work_dir:
+            step = 'upload'
+            set_step(deployment_id, step, 'running')
+            source = upload_to_s3(deployment['github_url'], deployment_id)
+            set_step(deployment_id, step, 'done', cache_hit=source['cache_hit'])
+            if source['commit_sha'] == deployment.get('commit_sha'):
+                log(deployment_id, f"{source['commit_sha']} is already live, nothing to redeploy")
+                set_step(deployment_id, 'build', 'done', skipped=True)
+                set_step(deployment_id, 'deploy', 'done', skipped=True)
+                set_status(deployment_id, 'live', redeploy_error=None)
+                outcome = 'unchanged'
+                return
+
+            s3_hosted = deployment.get('hosting_mode') == 's3'
+
+            # Before building: without the build cache the new build
+            # overwrites the live artifact (deployments/{id}/output)
+            step = None
+            if not s3_hosted:
+                with span(deployment_id, 'live_manifest'):
+                    old_manifest = live_manifest(deployment_id, deployment, work_dir)
+
+            step = 'build'
+            artifact_key = build_artifact(deployment_id, source, build_variables)
+            if not artifact_key:
+                raise Exception('CodeBuild failed. Check AWS Console for details.')
+
+            step = 'deploy'
+            set_step(deployment_id, step, 'running')
+            release_id = f"r{datetime.now().strftime('%Y%m%d%H%M%S')}-{source['commit_sha'][:8]}"
+            if s3_hosted:
+                published = publish_static_site(deployment_id, deployment, artifact_key)
+                set_step(deployment_id, step, 'done', changed=published['uploaded'], deleted=published['deleted'])
+                step = None
+                set_status(
+                    deployment_id,
+                    'live',
+                    s3_key=source['s3_key'],
+                    commit_sha=source['commit_sha'],
+                    stack=source['stack'],
+                    artifact_key=artifact_key,
+                    release_id=release_id,
+                    redeployed_at=datetime.now().isoformat(),
+                    redeploy_error=None
+                )
+                outcome = 'live'
+                log(deployment_id, f"Release {release_id} is live ({deployment.get('url')})")
+                return
+
+            new_artifact = os.path.join(work_dir, 'new.zip')
+            with span(deployment_id, 'diff'):
+                s3.download_file(S3_BUCKET_NAME, artifact_key, new_artifact, Config=S3_TRANSFER_CONFIG)
+                new_manifest = artifact_manifest(new_artifact, release_id)
+                changed, deleted = diff_manifests(old_manifest['files'], new_manifest['files'])
+            log(deployment_id, f"{len(changed)} file(s) changed, {len(deleted)} deleted "
+                               f"({len(new_manifest['files'])} in the site)")
+
+            if changed or deleted:
+                bundle = os.path.join(work_dir, 'bundle.zip')
+                site_name, live_path = site_paths(deployment)
+                with span(deployment_id, 'bundle'):
+                    write_delta_bundle(bundle, new_artifact, changed, deleted, site_name, live_path, release_id)
+                    bundle_key = release_bundle_key(deployment_id, release_id)
+                    s3.upload_file(bundle, S3_BUCKET_NAME, bundle_key, Config=S3_TRANSFER_CONFIG)
+                log(deployment_id, f"Delta bundle: s3://{S3_BUCKET_NAME}/{bundle_key} "
+                                   f"({os.path.getsize(bundle)} bytes)")
+                if not deploy_release(deployment_id, deployment, bundle_key):
+                    raise Exception('CodeDeploy failed. Check AWS Console for details.')
+            else:
+                log(deployment_id, "Build output is identical, nothing to ship")
+                release_id = new_manifest['release_id'] = old_manifest.get('release_id')
+            set_step(deployment_id, step, 'done', changed=len(changed), deleted=len(deleted))
+
+            write_manifest(s3, S3_BUCKET_NAME, deployment_id, new_manifest)
+            step = None
+            set_status(
+                deployment_id,
+                'live',
+                s3_key=source['s3_key'],
+                commit_sha=source['commit_sha'],
+                stack=source['stack'],
+                artifact_key=artifact_key,
+                release_id=release_id,
+                redeployed_at=datetime.now().isoformat(),
+                redeploy_error=None
+            )
+            outcome = 'live'
+            log(deployment_id, f"Release {release_id} is live ({deployment.get('url')})")
+
+    except Exception as e:
+        log(deployment_id, f"Redeploy failed, previous release still live: {str(e)}")
+
+        import traceback
+        traceback.print_exc()
+
+        if step:
+            set_step(deployment_id, step, 'failed')
+        set_status(deployment_id, 'live', redeploy_error=str(e))
+
+    finally:
+        timings = take_timings(deployment_id)
+        timings['total'] = round(time.perf_counter() - started, 3)
+        store.update(deployment_id, redeploy_timings=timings)
+        redeploys_finished.inc(outcome)
+
+
+def live_manifest(deployment_id, deployment, work_dir):
+    """Manifest of what the instance serves now"""
+    manifest = read_manifest(s3, S3_BUCKET_NAME, deployment_id)
+    if manifest:
+        return manifest
+    # First redeploy: compute it from the live artifact, and keep it (without
+    # the build cache, the next build overwrites that artifact)
+    log(deployment_id, "No stored manifest, computing it from the live build")
+    old_artifact = os.path.join(work_dir, 'live.zip')
+    s3.download_file(S3_BUCKET_NAME, deployment['artifact_key'], old_artifact, Config=S3_TRANSFER_CONFIG)
+    manifest = artifact_manifest(old_artifact, deployment.get('release_id'))
+    write_manifest(s3, S3_BUCKET_NAME, deployment_id, manifest)
+    return manifest
+
+
+@instrument('deploy_release')
+def deploy_release(deployment_id, deployment, bundle_key):
+    """
+    Deploy a delta bundle to the deployment's existing instance.
+
+    Uses the same deploy path as the first deploy (DEPLOY_MODE), but
+    waits for it: a delta deploy takes seconds. On a shared host the
+    host's deploy lock is held throughout, as for the first deploy.
+    """
+    ec2_info = {'instance_id': deployment['ec2_instance_id'], 'host_id': deployment.get('host_id')}
+    with deploy_budget.hold(deployment_id):
+        host_lock = host_scheduler.deploy_lock(ec2_info['host_id']) if ec2_info['host_id'] else None
+        if host_lock:
+            host_lock.acquire()
+        try:
+            if host_lock:
+                tag_shared_host(deployment_id, ec2_info)
+            if DEPLOY_MODE != 'codedeploy':
+                return invoke_lambda(deployment_id, bundle_key)
+            result = start_deploy(deployment_id, bundle_key).result()
+            if not result['succeeded']:
+                log(deployment_id, f"Deploy {result['status']}: {result['error'] or 'no details'}")
+            return result['succeeded']
+        finally:
+            if host_lock:
+                host_lock.release()
+
+
+# ========================================
+# RESUME AFTER A WORKER DIED (see resume.py)
+# ========================================
+
+def resume_pipeline(deployment):
+    """
+    Queue a deployment the resumer took over from a dead worker.
+
+    A first deployment goes on from its last checkpoint (run_deployment
+    with resume=True). A redeploy starts over: the previous release kept
+    serving, and its steps are cheap to redo.
+    Raises QueueFullError when there is no room (the resumer retries).
+    """
+    deployment_id = deployment['deployment_id']
+    if deployment['status'] in REDEPLOY_STATUSES:
+        store.transition(deployment_id, ['redeploying'], 'redeploy_queued')
+        deploy_queue.submit(deployment_id, run_redeploy, deployment_id)
+    else:
+        deploy_queue.submit(deployment_id, run_deployment, deployment_id, deployment['github_url'], resume=True)
+
+
+# ========================================
+# FLASK ROUTES
+# ========================================
+
+@app.before_request
+def start_background_services():
+    """Start per-process background threads on the first request"""
+    warm_pool.start()
+    build_events.start()
+    reaper.start()
+    load_shared_hosts()
+    resumer.start()  # after load_shared_hosts: resumed sites keep their host
+
+
+@app.route('/')
+def home():
+    """Serve the home page"""
+    return render_template('index.html')
+
+
+@app.route('/deploy', methods=['POST'])
+def deploy():
+    """
+    Main deployment endpoint.
+
+    Flow:
+    1. Validate GitHub URL (and optional hosting_mode: dedicated | shared | s3)
+    2. Idempotency-Key header (optional): a retry of a request that
+       already created a deployment gets that deployment back (200)
+    3. Admission: 429 + Retry-After if this client is over its rate
+    4. Generate deployment_id
+    5. Queue the pipeline on a background worker (in the client's line)
+    6. Return 202 right away, with the queue position and estimated start
+
+    The client follows progress with GET /deployments/<deployment_id>.
+    """
+
+    # Get GitHub URL from request
+    data = request.get_json(silent=True) or {}
+    github_url = data.get('github_url', '').strip()
+
+    # Validate URL
+    if not github_url:
+        return jsonify({'success': False, 'error': 'GitHub URL is required'}), 400
+
+    if not validate_github_url(github_url):
+        return jsonify({'success': False, 'error': 'Invalid GitHub URL. Must be https://github.com/user/repo'}), 400
+
+    # Own instance (dedicated) or a site on a shared host (shared)
+    hosting_mode = data.get('hosting_mode') or HOSTING_MODE
+    if hosting_mode not in HOSTING_MODES:
+        return jsonify({'success': False, 'error': f"hosting_mode must be one of: {', '.join(HOSTING_MODES)}"}), 400
+
+    client = request_client()
+    deployment_id = generate_deployment_id()
+
+    # Idempotency-Key (per client): claim it for this deployment, or replay
+    idempotency_key = request.headers.get('Idempotency-Key', '').strip()
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return jsonify({'success': False, 'error': f"Idempotency-Key is longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters"}), 400
+    key = f"{client}:{idempotency_key}" if idempotency_key else None
+    if key:
+        fingerprint = idempotency_fingerprint(github_url, hosting_mode)
+        claim = store.claim_key(key, deployment_id, fingerprint, IDEMPOTENCY_KEY_TTL)
+        if claim:
+            return idempotent_replay(claim, fingerprint)
+
+    # Admission: per-client rate limit, before anything is created
+    retry_after = client_limiter.check(client)
+    if retry_after:
+        if key:
+            store.release_key(key, deployment_id)
+        return too_many_requests(retry_after)
+
+    # Generate unique IDs
+    subdomain = generate_subdomain(github_url)
+
+    print("")
+    print("=" * 70)
+    print(f"NEW DEPLOYMENT: {deployment_id}")
+    print(f"GitHub URL: {github_url}")
+    print(f"Subdomain: {subdomain}")
+    print("=" * 70)
+    print("")
+
+    # Initialize deployment record
+    store.create({
+        'deployment_id': deployment_id,
+        'subdomain': subdomain,
+        'github_url': github_url,
+        'hosting_mode': hosting_mode,
+        'status': 'queued',
+        'worker_id': WORKER_ID,
+        'created_at': datetime.now().isoformat(),
+        'steps': {name: {'status': 'pending'} for name in PIPELINE_STEPS}
+    })
+
+    try:
+        place = deploy_queue.submit(deployment_id, run_deployment, deployment_id, github_url, client=client)
+    except QueueFullError as e:
+        store.delete(deployment_id)
+        client_limiter.refund(client)
+        if key:
+            store.release_key(key, deployment_id)
+        return queue_full_response(e)
+
+    return jsonify({
+        'success': True,
+        'deployment_id': deployment_id,
+        'subdomain': subdomain,
+        'status': 'queued',
+        'status_url': f"/deployments/{deployment_id}",
+        **queue_place(place)
+    }), 202
+
+
+@app.route('/deploy/batch', methods=['POST'])
+def deploy_batch():
+    """
+    Deploy many repos at once, coalescing the AWS work (see batch.py).
+
+    Body:
+    - github_urls:  list of GitHub URLs (up to BATCH_MAX_SIZE)
+    - hosting_mode: optional, as for /deploy
+    - rate_limit:   optional budget of EC2/CodeBuild API calls per second
+
+    Flow:
+    1. Validate every URL (bad ones are reported, the rest still deploy)
+    2. Admission: room in the queue for every repo, then the client's
+       rate limit (one token per repo). 413 if the batch could never fit
+    3. Create one deployment per valid URL, queue them all at once
+    4. Provision all dedicated instances together (provision_batch)
+    5. Return 202 with one result per URL, in order
+    """
+    data = request.get_json(silent=True) or {}
+    github_urls = data.get('github_urls')
+
+    if not isinstance(github_urls, list) or not github_urls:
+        return jsonify({'success': False, 'error': 'github_urls must be a non-empty list'}), 400
+
+    if len(github_urls) > BATCH_MAX_SIZE:
+        return jsonify({'success': False, 'error': f"At most {BATCH_MAX_SIZE} repos per batch"}), 400
+
+    hosting_mode = data.get('hosting_mode') or HOSTING_MODE
+    if hosting_mode not in HOSTING_MODES:
+        return jsonify({'success': False, 'error': f"hosting_mode must be one of: {', '.join(HOSTING_MODES)}"}), 400
+
+    try:
+        rate_limit = float(data.get('rate_limit', BATCH_API_RATE))
+    except (TypeError, ValueError):
+        rate_limit = 0
+    if not 0 < rate_limit <= BATCH_API_RATE_MAX:
+        return jsonify({'success': False, 'error': f"rate_limit must be between 0 and {BATCH_API_RATE_MAX}"}), 400
+
+    urls = []
+    results = []
+    for github_url in github_urls:
+        github_url = github_url.strip() if isinstance(github_url, str) else ''
+        if validate_github_url(github_url):
+            urls.append(github_url)
+            results.append(None)  # filled in once queued
+        else:
+            results.append({'github_url': github_url, 'success': False, 'error': 'Invalid GitHub URL'})
+    if not urls:
+        return jsonify({'success': False, 'results': results}), 400
+
+    # Admission: the batch is queued as one unit (all or nothing) and every
+    # repo counts, as if sent one by one. A batch no client could ever get
+    # admitted is too large; otherwise check there is room before taking
+    # the client's tokens, one per repo
+    client = request_client()
+    max_batch = deploy_queue.max_batch()
+    if client_limiter.enabled:
+        max_batch = min(max_batch, client_limiter.burst)
+    if len(urls) > max_batch:
+        return jsonify({
+            'success': False,
+            'error': f"At most {max_batch} repos per batch can be admitted at once, split the batch"
+        }), 413
+    try:
+        deploy_queue.check_room(client, len(urls))
+    except QueueFullError as e:
+        return queue_full_response(e)
+    retry_after = client_limiter.check(client, len(urls))
+    if retry_after:
+        return too_many_requests(retry_after)
+
+    batch_id = f"batch-{datetime.now().strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(4)}"
+    limiter = RateLimiter(rate_limit)
+
+    print("")
+    print("=" * 70)
+    print(f"NEW BATCH: {batch_id} ({len(urls)} repos, {rate_limit:g} AWS calls/s)")
+    print("=" * 70)
+    print("")
+
+    deployments = []
+    ec2_futures = {}
+    jobs = []
+    for github_url in urls:
+        deployment_id = generate_deployment_id()
+        subdomain = generate_subdomain(github_url)
+        store.create({
+            'deployment_id': deployment_id,
+            'subdomain': subdomain,
+            'github_url': github_url,
+            'hosting_mode': hosting_mode,
+            'batch_id': batch_id,
+            'status': 'queued',
+            'worker_id': WORKER_ID,
+            'created_at': datetime.now().isoformat(),
+            'steps': {name: {'status': 'pending'} for name in PIPELINE_STEPS}
+        })
+        deployments.append((deployment_id, subdomain, github_url))
+
+        # Dedicated instances come from the batch launch, shared hosts from placement
+        ec2_future = Future() if hosting_mode == 'dedicated' else None
+        if ec2_future is not None:
+            ec2_futures[deployment_id] = ec2_future
+        jobs.append((deployment_id, run_deployment, (deployment_id, github_url, ec2_future, limiter), {}))
+
+    try:
+        places = deploy_queue.submit_batch(jobs, client=client)
+    except QueueFullError as e:
+        # Lost the room to a concurrent request since check_room
+        for deployment_id, _, _ in deployments:
+            store.delete(deployment_id)
+        client_limiter.refund(client, len(urls))
+        return queue_full_response(e)
+
+    queued = iter(zip(deployments, places))
+    for i, result in enumerate(results):
+        if result is None:
+            (deployment_id, subdomain, github_url), place = next(queued)
+            results[i] = {
+                'github_url': github_url,
+                'success': True,
+                'deployment_id': deployment_id,
+                'subdomain': subdomain,
+                'status': 'queued',
+                'status_url': f"/deployments/{deployment_id}",
+                **queue_place(place)
+            }
+    accepted = [deployment_id for deployment_id, _, _ in deployments]
+
+    if ec2_futures:
+        provision_pool.submit(provision_batch, batch_id, ec2_futures, limiter)
+
+    with recent_batches_lock:
+        recent_batches[batch_id] = accepted
+        while len(recent_batches) > BATCH_HISTORY:
+            recent_batches.popitem(last=False)
+
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'accepted': len(accepted),
+        'rejected': len(results) - len(accepted),
+        'results': results,
+        'status_url': f"/deploy/batch/{batch_id}"
+    }), 202
+
+
+@app.route('/deploy/batch/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    """Per-deployment status of a batch, plus a count per status"""
+    with recent_batches_lock:
+        deployment_ids = recent_batches.get(batch_id)
+    if deployment_ids is None:
+        return jsonify({'success': False, 'error': 'Batch not found'}), 404
+
+    deployments = []
+    counts = {}
+    for deployment_id in deployment_ids:
+        deployment = store.get(deployment_id)
+        if deployment is None:
+            continue  # deleted since
+        counts[deployment['status']] = counts.get(deployment['status'], 0) + 1
+        deployments.append({
+            'deployment_id': deployment_id,
+            'github_url': deployment['github_url'],
+            'status': deployment['status'],
+            'url': deployment.get('url'),
+            'error': deployment.get('error')
+        })
+
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'done': all(d['status'] in FINAL_STATUSES for d in deployments),
+        'counts': counts,
+        'deployments': deployments
+    })
+
+
+@app.route('/webhooks/codebuild', methods=['POST'])
+def codebuild_webhook():
+    """
+    Receive a pushed "CodeBuild Build State Change" event.
+
+    Point an EventBridge API destination (or anything that forwards the
+    same JSON) here. Set CODEBUILD_WEBHOOK_TOKEN and send it in the
+    X-Webhook-Token header to keep strangers out.
+    """
+    if CODEBUILD_WEBHOOK_TOKEN and request.headers.get('X-Webhook-Token') != CODEBUILD_WEBHOOK_TOKEN:
+        return jsonify({'success': False, 'error': 'Invalid webhook token'}), 401
+
+    try:
+        build_id = handle_build_event(build_tracker, request.get_json(silent=True) or {})
+    except (KeyError, TypeError):
+        return jsonify({'success': False, 'error': 'Not a CodeBuild state change event'}), 400
+
+    return jsonify({'success': True, 'build_id': build_id})
+
+
+@app.route('/webhooks/codedeploy', methods=['POST'])
+def codedeploy_webhook():
+    """
+    Receive a CodeDeploy state change (DEPLOY_MODE=codedeploy).
+
+    Forward the EventBridge "CodeDeploy Deployment State-change
+    Notification" here so the tracker re-reads the deployment right away
+    instead of at its next poll.
+    Set DEPLOY_WEBHOOK_TOKEN and send it in the X-Webhook-Token header.
+    """
+    if DEPLOY_WEBHOOK_TOKEN and request.headers.get('X-Webhook-Token') != DEPLOY_WEBHOOK_TOKEN:
+        return jsonify({'success': False, 'error': 'Invalid webhook token'}), 401
+
+    event = request.get_json(silent=True) or {}
+    try:
+        tracked = handle_deploy_event(deploy_tracker, event)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Not a deploy event'}), 400
+
+    # tracked=False: not (or no longer) in flight in this process
+    return jsonify({'success': True, 'tracked': tracked})
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Source + build cache hit/miss counters"""
+    return jsonify({
+        'success': True,
+        'source_cache': source_cache.stats(),
+        'build_cache': build_cache.stats()
+    })
+
+
+@app.route('/reaper', methods=['GET'])
+def reaper_report():
+    """What the last reaper pass terminated and deleted (see reaper.py)"""
+    return jsonify({
+        'success': True,
+        'interval': reaper.interval,
+        'dry_run': reaper.dry_run,
+        'last_run': reaper.last_report
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics (see metrics.py)"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/deploy/queue', methods=['GET'])
+def deploy_queue_stats():
+    """Queue depth, worker usage and admission control"""
+    return jsonify({
+        'success': True,
+        'queue': deploy_queue.stats(),
+        'admission': {
+            'clients': client_limiter.stats(),
+            'budgets': {name: budget.stats() for name, budget in RESOURCE_BUDGETS.items()}
+        },
+        'warm_pool': warm_pool.stats(),
+        'shared_hosts': host_scheduler.stats(),
+        'resumer': {'worker_id': WORKER_ID, 'last_run': resumer.last_report}
+    })
+
+
+@app.route('/deployments', methods=['GET'])
+def list_deployments():
+    """
+    List deployments, newest first.
+
+    Query parameters:
+    - status:     only these statuses (comma separated), e.g. live,failed
+    - github_url: only deployments of this repo
+    - limit:      page size (default 50, max 500)
+    - cursor:     next_cursor from the previous page
+    - fields:     only these fields of each record, e.g. id,status,url
+                  (id = deployment_id)
+    - since:      'version' of an earlier response: only what changed after
+                  it. 'deployments' = changed records, 'deleted' = IDs to
+                  drop (deleted, or no longer matching status/github_url).
+                  more=true: ask again with the new version right away.
+                  reset=true: too old, list everything again.
+
+    Every response has the store 'version' and an ETag: with If-None-Match
+    the answer is 304 until something changes. Serialized bodies are
+    cached per query until the store version moves.
+    """
+    version = store.version()  # before reading: a body may be newer than its version, never older
+    query = repr(sorted(request.args.items(multi=True)))
+    etag = f"{version}-{hashlib.sha1(query.encode()).hexdigest()[:12]}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        with listing_cache_lock:
+            cached = listing_cache.get(query)
+        if cached and cached[0] == version:
+            body = cached[1]
+        else:
+            try:
+                body = app.json.dumps(listing(version))
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            with listing_cache_lock:
+                listing_cache[query] = (version, body)
+                listing_cache.move_to_end(query)
+                while len(listing_cache) > LISTING_CACHE_SIZE:
+                    listing_cache.popitem(last=False)
+        response = Response(body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # browsers revalidate with If-None-Match
+    return response
+
+
+def listing(version):
+    """Body of GET /deployments for the current request's query"""
+    status = [s for s in request.args.get('status', '').split(',') if s] or None
+    github_url = request.args.get('github_url') or None
+    fields = [(f, FIELD_ALIASES.get(f, f)) for f in request.args.get('fields', '').split(',') if f]
+    since = request.args.get('since')
+    limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE if since is None else MAX_PAGE_SIZE))
+
+    def project(record):
+        if not fields:
+            return record
+        projected = {name: record[field] for name, field in fields if field in record}
+        if 'deployment_id' not in (field for _, field in fields):
+            projected['deployment_id'] = record['deployment_id']
+        return projected
+
+    if since is None:
+        items, next_cursor = store.list(
+            status=status,
+            github_url=github_url,
+            limit=limit,
+            cursor=request.args.get('cursor') or None
+        )
+        return {
+            'success': True,
+            'version': version,
+            'count': len(items),
+            'deployments': [project(d) for d in items],
+            'next_cursor': next_cursor
+        }
+
+    if not since.isdigit():
+        raise ValueError("since must be a version number")
+    delta = store.changes(int(since), limit=limit)
+    changed, deleted = [], list(delta['deleted'])
+    for record in delta['changed']:
+        if (status and record['status'] not in status) or (github_url and record['github_url'] != github_url):
+            deleted.append(record['deployment_id'])
+        else:
+            changed.append(project(record))
+    return {
+        'success': True,
+        'version': delta['version'],
+        'since': int(since),
+        'count': len(changed),
+        'deployments': changed,
+        'deleted': deleted,
+        'more': delta['more'],
+        'reset': delta['reset']
+    }
+
+
+@app.route('/deployments/<deployment_id>', methods=['GET'])
+def get_deployment(deployment_id):
+    """Get single deployment info (+ estimated start while it is queued)"""
+    deployment = store.get(deployment_id)
+    if deployment is not None:
+        return jsonify({
+            'success': True,
+            'deployment': deployment,
+            **queue_place(deploy_queue.estimate(deployment_id))
+        })
+    return jsonify({
+        'success': False,
+        'error': 'Deployment not found'
+    }), 404
+
+
+@app.route('/deployments/<deployment_id>/events', methods=['GET'])
+def deployment_events(deployment_id):
+    """
+    Server-sent events stream of a deployment's progress.
+
+    Events:
+    - snapshot:    the full record, sent first
+    - status:      {'status': ...}
+    - step:        {'step': ..., 'status': ..., ...}
+    - build_phase: {'build_id', 'status', 'phase'} from CodeBuild
+    - build_log:   {'offset', 'lines'} new build log lines (see /logs)
+    - log:         {'message': ...} pipeline log lines
+    - end:         {'deployment': final record}, then the stream closes
+
+    Reconnecting clients send Last-Event-ID and get what they missed.
+    """
+    deployment = store.get(deployment_id)
+    if deployment is None:
+        return jsonify({
+            'success': False,
+            'error': 'Deployment not found'
+        }), 404
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+
+    def format_event(event_type, data, event_id=None):
+        lines = []
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        lines.append(f"event: {event_type}")
+        lines.append(f"data: {json.dumps(data)}")
+        return '\n'.join(lines) + '\n\n'
+
+    def stream():
+        sub = event_bus.subscribe(deployment_id, last_event_id)
+        try:
+            yield format_event('snapshot', {'deployment': deployment})
+            if deployment['status'] in FINAL_STATUSES:
+                yield format_event('end', {'deployment': deployment})
+                return
+
+            status = deployment['status']
+            while True:
+                event = sub.get(timeout=KEEPALIVE_SECONDS)
+                if event is None:
+                    # Nothing published here: the deployment may be running in
+                    # another worker process, so the store has the last word
+                    current = store.get(deployment_id)
+                    if current is None:
+                        return  # deleted
+                    if current['status'] != status:
+                        status = current['status']
+                        yield format_event('status', {'status': status})
+                    if status in FINAL_STATUSES:
+                        yield format_event('end', {'deployment': current})
+                        return
+                    yield ': keep-alive\n\n'
+                    continue
+                if event['type'] == 'status':
+                    status = event['data'].get('status', status)
+                yield format_event(event['type'], event['data'], event['id'])
+                if event['type'] == 'end':
+                    return
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # don't let nginx buffer the stream
+        }
+    )
+
+
+@app.route('/deployments/<deployment_id>/logs', methods=['GET'])
+def deployment_logs(deployment_id):
+    """
+    Build log of a deployment (see build_logs.py).
+
+    Query parameters:
+    - offset: first line (default 0; negative counts from the end, -100 = last 100 lines)
+    - limit:  lines to return (default 1000, max 10000)
+    - errors: 1 = only the error index ([line number, text], 0-based), no log
+    - format: json (default) | text
+
+    While the build runs the log is served live from this process;
+    afterwards from the archive in S3, fetching only the chunks needed.
+    """
+    deployment = store.get(deployment_id)
+    if deployment is None:
+        return jsonify({
+            'success': False,
+            'error': 'Deployment not found'
+        }), 404
+
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 1000))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'offset and limit must be integers'}), 400
+    if not 0 < limit <= 10000:
+        return jsonify({'success': False, 'error': 'limit must be between 1 and 10000'}), 400
+    errors_only = request.args.get('errors', '').lower() in ('1', 'true')
+
+    page = build_log_tailer.read(deployment_id, offset, limit)
+    if page is not None:
+        # Build still running
+        page['complete'] = False
+        errors = build_log_tailer.errors(deployment_id)
+    else:
+        build_log = deployment.get('build_log')
+        if not build_log:
+            return jsonify({
+                'success': False,
+                'error': 'No build log (not built yet, or the build was reused from the build cache)'
+            }), 404
+        index = load_log_index(deployment_id, build_log['build_id'])
+        if index is None:
+            return jsonify({
+                'success': False,
+                'error': "The build log was deleted together with the deployment's other S3 objects",
+                'reaped_at': deployment.get('reaped_at')
+            }), 410
+        errors = index['errors']
+        if errors_only:
+            page = {'offset': 0, 'lines': [], 'next_offset': None, 'total_lines': index['lines']}
+        else:
+            log_key, _ = log_keys(deployment_id, build_log['build_id'])
+            page = read_lines(s3_range_reader(s3, S3_BUCKET_NAME, log_key), index, offset, limit)
+        page['complete'] = True
+        page['build_id'] = build_log['build_id']
+
+    if errors_only:
+        return jsonify({'success': True, 'errors': errors or [], **{k: v for k, v in page.items() if k != 'lines'}})
+
+    if request.args.get('format') == 'text':
+        return Response(
+            ''.join(f"{line}\n" for line in page['lines']),
+            mimetype='text/plain',
+            headers={
+                'X-Log-Offset': str(page['offset']),
+                'X-Log-Next-Offset': '' if page['next_offset'] is None else str(page['next_offset']),
+                'X-Log-Total-Lines': str(page['total_lines'])
+            }
+        )
+    return jsonify({'success': True, **page})
+
+
+@app.route('/deployments/<deployment_id>/redeploy', methods=['POST'])
+def redeploy(deployment_id):
+    """
+    Deploy the repo's latest commit to a live deployment, in place.
+
+    Reuses the deployment's instance (or S3 prefix) and only ships the
+    files that changed (see run_redeploy). The site stays up on its previous
+    release until the new one is swapped in.
+
+    Returns 202; follow progress with GET /deployments/<deployment_id>.
+    """
+    deployment = store.get(deployment_id)
+    if deployment is None:
+        return jsonify({
+            'success': False,
+            'error': 'Deployment not found'
+        }), 404
+
+    if deployment['status'] != 'live' or not (deployment.get('ec2_instance_id') or deployment.get('hosting_mode') == 's3'):
+        return jsonify({
+            'success': False,
+            'error': f"Only live deployments can be redeployed (status: {deployment['status']})"
+        }), 409
+
+    client = request_client()
+    retry_after = client_limiter.check(client)
+    if retry_after:
+        return too_many_requests(retry_after)
+
+    # Claim it: one redeploy at a time
+    steps = dict(deployment['steps'], **{name: {'status': 'pending'} for name in ('upload', 'build', 'deploy')})
+    if not store.transition(deployment_id, ['live'], 'redeploy_queued', steps=steps, worker_id=WORKER_ID):
+        return jsonify({
+            'success': False,
+            'error': 'Deployment is already being redeployed'
+        }), 409
+    event_bus.reset(deployment_id)  # the last run's 'end' must not close new streams
+    event_bus.publish(deployment_id, 'status', {'status': 'redeploy_queued'})
+
+    try:
+        place = deploy_queue.submit(deployment_id, run_redeploy, deployment_id, client=client)
+    except QueueFullError as e:
+        store.transition(deployment_id, ['redeploy_queued'], 'live')
+        return queue_full_response(e)
+
+    return jsonify({
+        'success': True,
+        'deployment_id': deployment_id,
+        'status': 'redeploy_queued',
+        'status_url': f"/deployments/{deployment_id}",
+        **queue_place(place)
+    }), 202
+
+
+@app.route('/deployments/<deployment_id>/retry', methods=['POST'])
+def retry_deployment(deployment_id):
+    """
+    Run a failed deployment again from its last completed step.
+
+    Finished steps (instance, upload, build) are kept; the step that
+    failed and everything after it run again (see run_deployment). A
+    shared-mode site gave its room back when it failed, so it is placed
+    again. A dedicated instance that never got ready is terminated, the
+    retry launches a new one.
+
+    Returns 202; follow progress with GET /deployments/<deployment_id>.
+    """
+    deployment = store.get(deployment_id)
+    if deployment is None:
+        return jsonify({
+            'success': False,
+            'error': 'Deployment not found'
+        }), 404
+
+    if deployment['status'] not in FAILED_STATUSES:
+        return jsonify({
+            'success': False,
+            'error': f"Only failed deployments can be retried (status: {deployment['status']})"
+        }), 409
+
+    if deployment.get('reaped_at'):
+        return jsonify({
+            'success': False,
+            'error': 'The instance of this deployment was already reaped, deploy it again'
+        }), 409
+
+    client = request_client()
+    retry_after = client_limiter.check(client)
+    if retry_after:
+        return too_many_requests(retry_after)
+
+    # Keep what is done, redo the rest
+    placed_again = deployment.get('hosting_mode') == 'shared'
+    steps = {
+        name: step if step['status'] == 'done' and not (placed_again and name == 'create_ec2')
+        else {'status': 'pending'}
+        for name, step in deployment['steps'].items()
+    }
+    stale_instance = None
+    if deployment.get('hosting_mode', 'dedicated') == 'dedicated' and steps['create_ec2']['status'] != 'done':
+        stale_instance = deployment.get('ec2_instance_id')
+    if not store.transition(deployment_id, FAILED_STATUSES, 'queued', steps=steps, error=None,
+                            worker_id=WORKER_ID, retries=deployment.get('retries', 0) + 1,
+                            **({'ec2_instance_id': None, 'ec2_public_ip': None} if stale_instance else {})):
+        return jsonify({
+            'success': False,
+            'error': 'Deployment is already being retried'
+        }), 409
+    event_bus.reset(deployment_id)  # the last run's 'end' must not close new streams
+    event_bus.publish(deployment_id, 'status', {'status': 'queued'})
+
+    if stale_instance:
+        try:
+            terminate_ec2(stale_instance)  # never got ready
+        except Exception as e:
+            print(f"[{deployment_id}] Could not terminate {stale_instance}: {e}")  # the reaper's orphan sweep gets it
+
+    try:
+        place = deploy_queue.submit(deployment_id, run_deployment, deployment_id, deployment['github_url'],
+                                    client=client)
+    except QueueFullError as e:
+        store.transition(deployment_id, ['queued'], deployment['status'],
+                         steps=deployment['steps'], error=deployment.get('error'))
+        return queue_full_response(e)
+
+    return jsonify({
+        'success': True,
+        'deployment_id': deployment_id,
+        'status': 'queued',
+        'status_url': f"/deployments/{deployment_id}",
+        **queue_place(place)
+    }), 202
+
+
+@app.route('/deployments/<deployment_id>', methods=['DELETE'])
 def delete_deployment(deployment_id):
-    """Delete deployment and terminate EC2"""
+    """
+    Delete deployment and terminate EC2.
+
+    A site on a shared host only gives its room back; the host is
+    terminated together with its last site.
+    """
     
-    if deployment_id not in deployments:
+    deployment = store.get(deployment_id)
+    if deployment is None:
         return jsonify({
             'success': False,
             'error': 'Deployment not found'
         }), 404
     
     try:
-        deployment = deployments[deployment_id]
-        
-        # Terminate EC2 (stops billing!)
-        if 'ec2_instance_id' in deployment:
+        if deployment.get('hosting_mode') == 's3':
+            # Take the site down
+            delete_site(static_s3, STATIC_BUCKET, site_prefix(deployment['subdomain']))
+            terminated = False
+        elif deployment.get('host_id'):
+            terminated = release_site(deployment)
+        elif deployment.get('ec2_instance_id'):
+            # Terminate EC2 (stops billing!)
             terminate_ec2(deployment['ec2_instance_id'])
+            terminated = True
+        else:
+            terminated = False
+
+        # DEPLOY_MODE=codedeploy leaves a deployment group per deployment
+        deploy_tracker.untrack(deployment_id)
+        if deployment.get('codedeploy_group'):
+            try:
+                delete_deployment_group(codedeploy, deployment_id)
+            except Exception as e:
+                print(f"[{deployment_id}] Could not delete CodeDeploy deployment group: {e}")
         
-        # Remove from memory
-        del deployments[deployment_id]
+        # Remove from the store
+        store.delete(deployment_id)
         
         return jsonify({
             'success': True,
-            'message': 'Deployment deleted and EC2 terminated!'
+            'message': 'Deployment deleted and EC2 terminated!' if terminated else 'Deployment deleted!'
         })
         
     except Exception as e:
@@ -615,6 +2537,7 @@ if __name__ == '__main__':
     print(f"S3 Bucket:       {S3_BUCKET_NAME}")
     print(f"CodeBuild:       {CODEBUILD_PROJECT}")
     print(f"Lambda:          {LAMBDA_FUNCTION_NAME}")
+    print(f"Deploy mode:     {DEPLOY_MODE}")
     print(f"Launch Template: {LAUNCH_TEMPLATE_ID}")
     print("=" * 70)
     print("Open in browser: http://localhost:5000")
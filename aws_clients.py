@@ -0,0 +1,143 @@
+"""
+Shared, tuned boto3 clients for DeployFast.
+
+Clients used to be created at import time with the default botocore
+config:
+- every import paid for creating them, even if a client was never used
+- only 10 pooled HTTP connections per client. With several deploy workers
+  uploading parts in parallel, extra connections are opened and thrown
+  away on every call ("Connection pool is full, discarding connection")
+- legacy retries (5 attempts, no client-side rate limiting)
+
+Here each client is created on first use and then shared by every
+thread of the process (boto3 clients are thread-safe, sessions are not).
+Clients are keyed by process ID, so a process forked by gunicorn builds
+its own clients instead of sharing sockets with its parent.
+
+    s3 = LazyClient('s3', region_name='us-east-1')   # nothing created yet
+    s3.head_object(...)                              # created here, once
+"""
+
+import os
+import threading
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+from streaming_upload import S3_UPLOAD_PART_SIZE, S3_UPLOAD_CONCURRENCY
+
+# ========================================
+# CONFIGURATION
+# ========================================
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50))  # Per client
+AWS_RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')                   # legacy | standard | adaptive
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', 8))                   # Including the first try
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', 5))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', 60))
+
+# Calls that legitimately block for a long time
+READ_TIMEOUT_OVERRIDES = {
+    'lambda': 900  # RequestResponse invoke waits for the whole CodeDeploy run
+}
+
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', 8)) * 1024 * 1024
+
+# For s3.upload_fileobj / download_fileobj; same part size and concurrency
+# as the streaming zip upload (streaming_upload.py)
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=S3_UPLOAD_PART_SIZE,
+    max_concurrency=S3_UPLOAD_CONCURRENCY,
+    use_threads=True
+)
+
+_lock = threading.Lock()
+_pid = None
+_session = None
+_clients = {}
+_event_handlers = []  # (event name, handler) registered on every session
+
+
+def client_config(service_name):
+    """botocore Config for a service"""
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        retries={'mode': AWS_RETRY_MODE, 'total_max_attempts': AWS_MAX_ATTEMPTS},
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT_OVERRIDES.get(service_name, AWS_READ_TIMEOUT),
+        tcp_keepalive=True
+    )
+
+
+def get_session():
+    """The boto3 session of this process"""
+    global _pid, _session
+    with _lock:
+        if _pid != os.getpid():
+            # New process (or forked): drop the parent's session + clients
+            _pid = os.getpid()
+            _session = boto3.session.Session()
+            for event_name, handler in _event_handlers:
+                _session.events.register(event_name, handler)
+            _clients.clear()
+        return _session
+
+
+def register_event_handler(event_name, handler):
+    """
+    Hook into botocore events (e.g. 'after-call') of every client.
+    Must be called before the first client is created.
+    """
+    with _lock:
+        _event_handlers.append((event_name, handler))
+        if _session is not None and _pid == os.getpid():
+            _session.events.register(event_name, handler)
+
+
+def get_client(service_name, region_name=None, **kwargs):
+    """
+    The shared client for (service, region, kwargs), created on first use.
+
+    kwargs are passed to session.client(), e.g. endpoint_url.
+    """
+    key = (service_name, region_name, tuple(sorted(kwargs.items())))
+    session = get_session()
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = session.client(
+                service_name,
+                region_name=region_name,
+                config=client_config(service_name),
+                **kwargs
+            )
+            _clients[key] = client
+        return client
+
+
+def created_clients():
+    """Services with a client in this process (for monitoring)"""
+    with _lock:
+        return sorted({key[0] for key in _clients}) if _pid == os.getpid() else []
+
+
+class LazyClient:
+    """
+    Stands in for a boto3 client and creates it on first use.
+
+    Every attribute (API calls, .exceptions, .meta, ...) is looked up on
+    the shared client from get_client().
+    """
+
+    def __init__(self, service_name, region_name=None, **kwargs):
+        self._service_name = service_name
+        self._region_name = region_name
+        self._kwargs = kwargs
+
+    def __getattr__(self, name):
+        client = get_client(self._service_name, self._region_name, **self._kwargs)
+        return getattr(client, name)
+
+    def __repr__(self):
+        return f"<LazyClient {self._service_name} ({self._region_name or 'default region'})>"
@@ -0,0 +1,122 @@
+"""
+Batch deployments for DeployFast (POST /deploy/batch).
+
+Deploying N repos one by one costs N run_instances calls, N readiness
+polling loops and N build pollers. A batch coalesces the AWS work:
+
+- EC2:       ONE run_instances with MaxCount=N (repeated only for the
+             instances EC2 could not give us in the first call)
+- Readiness: ONE describe_instances per round for every instance
+             (ReadinessProbe.wait_many)
+- Builds:    already shared, build_tracker polls every in-flight build
+             with one batch_get_builds call
+- Uploads:   every deployment runs on its own deploy worker, so clones
+             and S3 uploads run in parallel
+
+Per-instance calls that cannot be coalesced (tagging each instance with
+its DeploymentId, starting each CodeBuild run) go through a RateLimiter.
+The caller's rate-limit budget keeps a big batch from tripping EC2 /
+CodeBuild API throttling.
+"""
+
+import os
+import threading
+import time
+
+# ========================================
+# CONFIGURATION
+# ========================================
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 50))            # Repos per /deploy/batch call
+BATCH_API_RATE = float(os.environ.get('BATCH_API_RATE', 5))           # Default budget: AWS calls per second
+BATCH_API_RATE_MAX = float(os.environ.get('BATCH_API_RATE_MAX', 20))  # Highest budget a caller may ask for
+
+
+class RateLimiter:
+    """
+    Token bucket: at most `rate` calls per second, bursts up to `burst`.
+
+    Usage:
+        limiter = RateLimiter(5)
+        limiter.acquire()   # blocks until a call is allowed
+        ec2.create_tags(...)
+    """
+
+    def __init__(self, rate, burst=None, sleep=time.sleep, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self.sleep = sleep
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self.waited_seconds = 0.0
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.waited_seconds += wait
+            self.sleep(wait)
+
+
+def launch_instances(ec2, launch_template_id, batch_id, count, limiter):
+    """
+    Launch `count` instances from the Launch Template in as few
+    run_instances calls as EC2 allows (MinCount=1, MaxCount=remaining).
+
+    Every instance is tagged BatchId={batch_id}. Returns the instance IDs,
+    possibly fewer than count when EC2 runs out of capacity.
+
+    Each call has its own ClientToken, so a retried call (botocore
+    retries on throttling / timeouts) cannot launch the chunk twice.
+    """
+    instance_ids = []
+    while len(instance_ids) < count:
+        limiter.acquire()
+        try:
+            response = ec2.run_instances(
+                LaunchTemplate={
+                    'LaunchTemplateId': launch_template_id,
+                    'Version': '$Latest'
+                },
+                MinCount=1,
+                MaxCount=count - len(instance_ids),
+                ClientToken=f"{batch_id}-{len(instance_ids)}",
+                TagSpecifications=[{
+                    'ResourceType': 'instance',
+                    'Tags': [
+                        {'Key': 'Name', 'Value': f'DeployFast-{batch_id}'},
+                        {'Key': 'BatchId', 'Value': batch_id},
+                        {'Key': 'ManagedBy', 'Value': 'DeployFast'}
+                    ]
+                }]
+            )
+        except Exception as e:
+            if not instance_ids:
+                raise
+            print(f"[{batch_id}] run_instances stopped at {len(instance_ids)}/{count}: {e}")
+            break
+        instance_ids.extend(i['InstanceId'] for i in response['Instances'])
+        print(f"[{batch_id}] Launched {len(instance_ids)}/{count} EC2 instances")
+    return instance_ids
+
+
+def tag_for_deployment(ec2, instance_id, deployment_id, limiter):
+    """Point CodeDeploy's DeploymentId tag at one batch member"""
+    limiter.acquire()
+    ec2.create_tags(
+        Resources=[instance_id],
+        Tags=[
+            {'Key': 'Name', 'Value': f'DeployFast-{deployment_id}'},
+            {'Key': 'DeploymentId', 'Value': deployment_id}  # CodeDeploy targets this!
+        ]
+    )
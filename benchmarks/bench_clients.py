@@ -0,0 +1,174 @@
+"""
+Benchmark: eager default boto3 clients vs lazy tuned clients (aws_clients.py).
+
+1. Startup: time for a fresh interpreter to get its AWS clients ready,
+   eagerly created (the old app.py) vs LazyClient (nothing created
+   until first use).
+2. Connection reuse: many threads calling head_object against a local
+   HTTP server that counts TCP connections, with a new client per call,
+   one shared default client (10 pooled connections) and one shared
+   client_config() client (AWS_MAX_POOL_CONNECTIONS).
+
+No AWS account needed.
+
+Usage:
+    python benchmarks/bench_clients.py --threads 16 --calls 50 --latency-ms 100
+"""
+
+import argparse
+import http.server
+import logging
+import os
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import boto3  # noqa: E402
+from botocore.config import Config  # noqa: E402
+
+from aws_clients import client_config  # noqa: E402
+
+SERVICES = ['s3', 'ec2', 'codebuild', 'lambda', 'ssm', 'sqs']
+
+EAGER = f"""
+import boto3
+for name in {SERVICES!r}:
+    boto3.client(name, region_name='us-east-1')
+"""
+
+LAZY = f"""
+from aws_clients import LazyClient
+for name in {SERVICES!r}:
+    LazyClient(name, region_name='us-east-1')
+"""
+
+
+def startup_seconds(code, runs):
+    """Best wall time of `python -c code` over runs (fresh interpreter each time)"""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+class CountingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    connections = 0
+    latency = 0.0
+    lock = threading.Lock()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_HEAD(self):
+        time.sleep(self.server.latency)  # network round trip to AWS
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.send_header('ETag', '"bench"')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class DiscardCounter(logging.Handler):
+    """Counts urllib3 "Connection pool is full, discarding connection" warnings"""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        if 'discarding connection' in record.getMessage():
+            self.count += 1
+
+
+def make_client(endpoint, config):
+    return boto3.client(
+        's3', region_name='us-east-1', endpoint_url=endpoint, config=config,
+        aws_access_key_id='bench', aws_secret_access_key='bench'
+    )
+
+
+def connection_run(endpoint, config, threads, calls, shared=True):
+    """
+    Return seconds for threads x calls head_object, on one shared client
+    or (shared=False) on a new client per call.
+    """
+    s3 = make_client(endpoint, config) if shared else None
+
+    def worker(_):
+        for i in range(calls):
+            client = s3 or make_client(endpoint, config)
+            client.head_object(Bucket='bench', Key=f"key-{i}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--calls', type=int, default=50, help='calls per thread')
+    parser.add_argument('--latency-ms', type=float, default=100, help='simulated AWS round trip')
+    parser.add_argument('--startup-runs', type=int, default=3)
+    args = parser.parse_args()
+
+    print("Startup (fresh interpreter, best of %d):" % args.startup_runs)
+    eager = startup_seconds(EAGER, args.startup_runs)
+    lazy = startup_seconds(LAZY, args.startup_runs)
+    print(f"  eager default clients  {eager:6.2f}s")
+    print(f"  lazy clients           {lazy:6.2f}s   ({eager - lazy:+.2f}s saved)")
+
+    # Count urllib3's "pool is full" warnings instead of printing them
+    discards = DiscardCounter()
+    urllib3_log = logging.getLogger('urllib3.connectionpool')
+    urllib3_log.addHandler(discards)
+    urllib3_log.propagate = False
+
+    requests = args.threads * args.calls
+    print(f"\nConnection reuse ({args.threads} threads x {args.calls} head_object, "
+          f"{args.latency_ms:g}ms simulated latency):")
+    runs = [
+        ('client per call', Config(), False),
+        ('shared, default', Config(), True),
+        ('shared, tuned', client_config('s3'), True)
+    ]
+    for name, config, shared in runs:
+        server = CountingServer(('127.0.0.1', 0), Handler)
+        server.latency = args.latency_ms / 1000
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        discards.count = 0
+        try:
+            endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+            seconds = connection_run(endpoint, config, args.threads, args.calls, shared)
+        finally:
+            server.shutdown()
+            server.server_close()
+        print(
+            f"  {name:<16} pool {config.max_pool_connections:3d}   "
+            f"{requests / seconds:8.0f} req/s   "
+            f"{server.connections:5d} TCP connections   "
+            f"{discards.count:4d} discarded"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+"""
+Benchmark: the whole deployment pipeline of app.py, end to end, without AWS.
+
+POST /deploy runs exactly as in production: queue, workers, EC2
+provisioning, source cache, streaming upload, build + deploy tracking.
+The AWS calls go to in-process fakes with configurable latencies and
+failure rates (fake_aws.py). GitHub is replaced by local git fixture
+repos of several sizes: https://github.com/bench/<name> is rewritten to
+the fixture with git's url.<base>.insteadOf.
+
+Reported:
+- upload_to_s3 per fixture size: time, peak Python memory and peak
+  extra disk, for a cold checkout and for an incremental fetch
+- N concurrent users, each deploying in a loop: p50 / p95 deployment
+  latency (POST /deploy → final status), deployments per minute,
+  failures, the per-step timing breakdown and AWS calls per operation
+
+The results are written as JSON together with the git commit and every
+setting, so runs on two commits can be compared:
+
+    python benchmarks/bench_pipeline.py --users 8 --output before.json
+    git checkout my-branch
+    python benchmarks/bench_pipeline.py --users 8 --output after.json --compare before.json
+
+Every deployment gets a fresh commit, so the source + build caches miss
+like they would for real pushes. Same --seed, same simulated outcomes.
+
+Usage:
+    python benchmarks/bench_pipeline.py --users 4 --deployments 3 --sizes 1,10,50 \\
+        --latency ec2_boot=3,build=4,deploy=2,api=0.02 --failure build=0.05
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_aws import FakeAWS, DEFAULT_LATENCY, DEFAULT_FAILURE  # noqa: E402
+
+GITHUB_BASE = 'https://github.com/bench/'
+FINAL_STATUSES = ['live', 'expired', 'failed', 'build_failed', 'deploy_failed']
+STATUS_POLL_INTERVAL = 0.05
+
+
+# ========================================
+# FIXTURES
+# ========================================
+
+def git(*args, cwd=None):
+    subprocess.run(
+        ['git', '-c', 'user.name=bench', '-c', 'user.email=bench@localhost'] + list(args),
+        cwd=cwd, check=True, capture_output=True
+    )
+
+
+def make_repo(path, size_mb, seed, file_kb=64, stack='static'):
+    """
+    A git repo of ~size_mb: a small static site plus half-compressible
+    asset files. Same size + seed → same content.
+
+    stack='node' adds a package.json, so the site goes through CodeBuild
+    instead of being packaged directly (see project_analysis.py).
+    """
+    rng = random.Random(f"{seed}-{size_mb}")
+    os.makedirs(os.path.join(path, 'assets'))
+    with open(os.path.join(path, 'index.html'), 'w') as f:
+        f.write(f"<html><body><h1>Fixture {size_mb} MB</h1></body></html>\n")
+    if stack == 'node':
+        with open(os.path.join(path, 'package.json'), 'w') as f:
+            json.dump({'name': 'fixture', 'scripts': {'build': 'true'}}, f)
+
+    chunk = file_kb * 1024
+    for i in range(max(1, int(size_mb * 1024 // file_kb))):
+        with open(os.path.join(path, 'assets', f"asset{i}.bin"), 'wb') as f:
+            f.write(rng.randbytes(chunk // 2) + b'a' * (chunk // 2))
+
+    git('init', '-q', '-b', 'main', path)
+    git('add', '.', cwd=path)
+    git('commit', '-q', '-m', 'fixture', cwd=path)
+
+
+class Fixtures:
+    """Fixture repos + a fresh commit per deployment (cache misses like real pushes)"""
+
+    def __init__(self, root, sizes, seed, stack='static'):
+        self.root = root
+        self.repos = {}
+        self._locks = {}
+        self._counter = 0
+        self._lock = threading.Lock()
+        for size in sizes:
+            name = f"site-{size:g}mb"
+            make_repo(os.path.join(root, name), size, seed, stack=stack)
+            self.repos[name] = size
+            self._locks[name] = threading.Lock()
+
+    def names(self):
+        return list(self.repos)
+
+    def url(self, name):
+        return GITHUB_BASE + name
+
+    def push(self, name):
+        """Commit one small change, return the repo's URL"""
+        with self._lock:
+            self._counter += 1
+            counter = self._counter
+        path = os.path.join(self.root, name)
+        with self._locks[name]:
+            with open(os.path.join(path, 'version.txt'), 'w') as f:
+                f.write(f"{counter}\n")
+            git('add', 'version.txt', cwd=path)
+            git('commit', '-q', '-m', f"push {counter}", cwd=path)
+        return self.url(name)
+
+    def git_environment(self):
+        """Environment that makes git fetch github.com/bench/* from the fixtures"""
+        return {
+            'GIT_CONFIG_COUNT': '1',
+            'GIT_CONFIG_KEY_0': f"url.file://{self.root}/.insteadOf",
+            'GIT_CONFIG_VALUE_0': GITHUB_BASE,
+            'GIT_TERMINAL_PROMPT': '0'
+        }
+
+
+# ========================================
+# MEASUREMENTS
+# ========================================
+
+def percentile(values, pct):
+    """Nearest-rank percentile (None for no values)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return round(ordered[rank - 1], 3)
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # removed while we walked
+    return total
+
+
+class DiskSampler:
+    """Peak size of a directory while a block runs (sampled every `interval`)"""
+
+    def __init__(self, path, interval=0.02):
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.baseline = dir_size(self.path)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, dir_size(self.path))
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, dir_size(self.path))
+
+    @property
+    def extra_bytes(self):
+        return max(0, self.peak - self.baseline)
+
+
+def measure_uploads(app, fixtures, state_dir):
+    """upload_to_s3 on every fixture: cold clone, then incremental fetch"""
+    from source_cache import SourceCache
+
+    results = {}
+    original = app.source_cache
+    for name in fixtures.names():
+        # Fresh local clone cache: the first checkout is a full clone
+        cache_dir = tempfile.mkdtemp(prefix='clones-', dir=state_dir)
+        app.source_cache = SourceCache(app.s3, app.S3_BUCKET_NAME, cache_dir=cache_dir)
+
+        results[name] = {'size_mb': fixtures.repos[name]}
+        for run in ('cold', 'incremental'):
+            url = fixtures.push(name)
+            tracemalloc.start()
+            start = time.perf_counter()
+            with DiskSampler(state_dir) as disk:
+                app.upload_to_s3(url, f"bench-upload-{name}-{run}")
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[name][run] = {
+                'seconds': round(seconds, 3),
+                'peak_memory_mb': round(peak / 1e6, 2),
+                'peak_extra_disk_mb': round(disk.extra_bytes / 1e6, 2)
+            }
+    app.source_cache = original
+    return results
+
+
+def measure_pipeline(app, fixtures, users, deployments, hosting_mode):
+    """
+    `users` threads, each deploying `deployments` times in a row and
+    waiting for every deployment to finish before the next one.
+    """
+    names = fixtures.names()
+    finished = []
+    rejected = [0]
+    throttled = [0]
+    lock = threading.Lock()
+
+    def user(index):
+        client = app.app.test_client()
+        client.environ_base['REMOTE_ADDR'] = f"10.0.{index // 250}.{index % 250 + 1}"  # one client per user
+        for i in range(deployments):
+            url = fixtures.push(names[(index + i) % len(names)])
+            body = {'github_url': url}
+            if hosting_mode:
+                body['hosting_mode'] = hosting_mode
+
+            submitted = time.perf_counter()
+            while True:
+                response = client.post('/deploy', json=body)
+                if response.status_code not in (429, 503):
+                    break
+                with lock:
+                    # queue full / over the client rate: back off like a client would
+                    (throttled if response.status_code == 429 else rejected)[0] += 1
+                time.sleep(min(float(response.headers.get('Retry-After', 0.5)), 5))
+            if response.status_code != 202:
+                raise RuntimeError(f"/deploy returned {response.status_code}: {response.get_json()}")
+
+            deployment_id = response.get_json()['deployment_id']
+            while True:
+                deployment = client.get(f"/deployments/{deployment_id}").get_json()['deployment']
+                if deployment['status'] in FINAL_STATUSES and 'timings' in deployment:
+                    break
+                time.sleep(STATUS_POLL_INTERVAL)
+
+            with lock:
+                finished.append({
+                    'latency': time.perf_counter() - submitted,
+                    'status': deployment['status'],
+                    'timings': deployment.get('timings', {})
+                })
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        list(pool.map(user, range(users)))
+    wall = time.perf_counter() - start
+
+    latencies = [d['latency'] for d in finished]
+    live = [d['latency'] for d in finished if d['status'] == 'live']
+    statuses = {}
+    for d in finished:
+        statuses[d['status']] = statuses.get(d['status'], 0) + 1
+
+    # Median of every timing recorded on the deployments
+    steps = {}
+    for d in finished:
+        for name, seconds in d['timings'].items():
+            steps.setdefault(name, []).append(seconds)
+
+    return {
+        'users': users,
+        'deployments': len(finished),
+        'wall_seconds': round(wall, 3),
+        'deployments_per_minute': round(len(finished) / wall * 60, 2),
+        'live_per_minute': round(len(live) / wall * 60, 2),
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'latency_max': percentile(latencies, 100),
+        'live_latency_p50': percentile(live, 50),
+        'live_latency_p95': percentile(live, 95),
+        'statuses': dict(sorted(statuses.items())),
+        'rejected_503': rejected[0],
+        'rejected_429': throttled[0],
+        'step_p50': {name: percentile(values, 50) for name, values in sorted(steps.items())}
+    }
+
+
+# ========================================
+# RESULTS
+# ========================================
+
+def git_commit():
+    def run(*args):
+        result = subprocess.run(['git', '-C', ROOT] + list(args), capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return {
+        'sha': run('rev-parse', 'HEAD'),
+        'subject': run('log', '-1', '--format=%s'),
+        'dirty': bool(run('status', '--porcelain', '--untracked-files=no'))
+    }
+
+
+COMPARED = [
+    ('pipeline', 'latency_p50', 'lower'),
+    ('pipeline', 'latency_p95', 'lower'),
+    ('pipeline', 'deployments_per_minute', 'higher'),
+    ('pipeline', 'live_per_minute', 'higher')
+]
+
+
+def compare(old, new):
+    print(f"\nCompared with {old['commit']['sha'][:10]} ({old['commit']['subject']}):")
+    if old['config'] != new['config']:
+        print("  WARNING: different settings, the numbers are not directly comparable")
+    for section, key, better in COMPARED:
+        a, b = old[section].get(key), new[section].get(key)
+        if a is None or b is None:
+            continue
+        change = (b - a) / a * 100 if a else 0.0
+        improved = (change < 0) if better == 'lower' else (change > 0)
+        print(f"  {key:<26} {a:10.2f} → {b:10.2f}   {change:+6.1f}% {'(better)' if improved and change else ''}")
+    for name, run in old.get('upload', {}).items():
+        if name in new.get('upload', {}):
+            for phase in ('cold', 'incremental'):
+                a, b = run[phase], new['upload'][name][phase]
+                print(f"  upload {name} {phase:<12} {a['seconds']:6.2f}s → {b['seconds']:6.2f}s   "
+                      f"mem {a['peak_memory_mb']:7.1f} → {b['peak_memory_mb']:7.1f} MB   "
+                      f"disk {a['peak_extra_disk_mb']:7.1f} → {b['peak_extra_disk_mb']:7.1f} MB")
+
+
+def parse_pairs(text, defaults, label):
+    values = dict(defaults)
+    for pair in filter(None, (text or '').split(',')):
+        key, _, value = pair.partition('=')
+        if key not in defaults:
+            raise SystemExit(f"Unknown {label} '{key}' (one of: {', '.join(defaults)})")
+        values[key] = float(value)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=4, help='concurrent users')
+    parser.add_argument('--deployments', type=int, default=3, help='deployments per user')
+    parser.add_argument('--workers', type=int, default=4, help='DEPLOY_MAX_WORKERS')
+    parser.add_argument('--sizes', default='1,10,50', help='fixture repo sizes in MB')
+    parser.add_argument('--latency', help='simulated seconds, e.g. ec2_boot=3,build=4,deploy=2,api=0.02')
+    parser.add_argument('--failure', help='failure rates, e.g. ec2=0.01,build=0.05,deploy=0.02')
+    parser.add_argument('--jitter', type=float, default=0.1, help='± fraction applied to latencies')
+    parser.add_argument('--poll-interval', type=float, default=0.25,
+                        help='build / deploy / EC2 readiness poll interval (scaled down with the latencies)')
+    parser.add_argument('--deploy-mode', default='sync', choices=['sync', 'codedeploy'])
+    parser.add_argument('--hosting-mode', choices=['dedicated', 'shared', 's3'])
+    parser.add_argument('--client-rate', type=float, default=0,
+                        help='ADMISSION_RATE_PER_MINUTE per user (default 0: no per-client limit)')
+    parser.add_argument('--stack', default='static', choices=['static', 'node'],
+                        help='fixture project type: static sites skip CodeBuild, node builds in it')
+    parser.add_argument('--skip-upload', action='store_true', help='skip the upload_to_s3 measurements')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON results file (default: bench-pipeline-<commit>.json)')
+    parser.add_argument('--compare', help='earlier JSON results to compare with')
+    parser.add_argument('--verbose', action='store_true', help='show the pipeline logs')
+    args = parser.parse_args()
+
+    sizes = [float(s) for s in args.sizes.split(',')]
+    latency = parse_pairs(args.latency, DEFAULT_LATENCY, 'latency')
+    failure = parse_pairs(args.failure, DEFAULT_FAILURE, 'failure')
+
+    work_dir = tempfile.mkdtemp(prefix='bench-pipeline-')
+    try:
+        fixtures_dir = os.path.join(work_dir, 'fixtures')
+        state_dir = os.path.join(work_dir, 'state')
+        os.makedirs(os.path.join(state_dir, 'tmp'))
+        print(f"Creating fixture repos ({args.sizes} MB)...")
+        fixtures = Fixtures(fixtures_dir, sizes, args.seed, args.stack)
+
+        # Configure app.py before importing it
+        os.environ.update(fixtures.git_environment())
+        os.environ.update({
+            'SQLITE_PATH': os.path.join(state_dir, 'deployments.db'),
+            'SOURCE_CACHE_DIR': os.path.join(state_dir, 'clones'),
+            'DEPLOY_MAX_WORKERS': str(args.workers),
+            'DEPLOY_MAX_QUEUE': str(max(20, args.users)),
+            'DEPLOY_MODE': args.deploy_mode,
+            'CODEDEPLOY_SERVICE_ROLE_ARN': 'arn:aws:iam::123456789012:role/bench-codedeploy',
+            'ADMISSION_RATE_PER_MINUTE': str(args.client_rate),
+            'DEPLOY_POLL_INTERVAL': str(args.poll_interval),
+            'EC2_READY_CHECKS': 'status',  # fake instances serve no HTTP
+            'EC2_READY_INITIAL_DELAY': str(args.poll_interval),
+            'EC2_READY_MAX_DELAY': str(args.poll_interval),
+            'WARM_POOL_SIZE': '0',
+            'REAPER_INTERVAL': '0',
+            'CODEBUILD_EVENTS_QUEUE_URL': ''
+        })
+        tempfile.tempdir = os.path.join(state_dir, 'tmp')  # throwaway clones count as disk use
+
+        aws = FakeAWS(latency=latency, failure=failure, jitter=args.jitter, seed=args.seed)
+        aws.install()
+
+        logs = io.StringIO()
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else logs):
+            import app
+            app.build_tracker.sleep_interval = args.poll_interval
+
+
+            upload = {} if args.skip_upload else measure_uploads(app, fixtures, state_dir)
+            pipeline = measure_pipeline(app, fixtures, args.users, args.deployments, args.hosting_mode)
+
+        results = {
+            'benchmark': 'pipeline',
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'config': {
+                'users': args.users,
+                'deployments_per_user': args.deployments,
+                'workers': args.workers,
+                'sizes_mb': sizes,
+                'latency': latency,
+                'failure': failure,
+                'jitter': args.jitter,
+                'poll_interval': args.poll_interval,
+                'deploy_mode': args.deploy_mode,
+                'hosting_mode': args.hosting_mode or 'dedicated',
+                'client_rate': args.client_rate,
+                'stack': args.stack,
+                'seed': args.seed
+            },
+            'upload': upload,
+            'pipeline': pipeline,
+            'aws_calls': aws.call_counts(),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    for name, runs in results['upload'].items():
+        for run in ('cold', 'incremental'):
+            r = runs[run]
+            print(f"upload {name:<12} {run:<12} {r['seconds']:6.2f}s   peak mem {r['peak_memory_mb']:7.1f} MB   "
+                  f"peak extra disk {r['peak_extra_disk_mb']:7.1f} MB")
+    p = results['pipeline']
+    print(f"\n{p['deployments']} deployments, {args.users} users, {args.workers} workers: "
+          f"{p['deployments_per_minute']:.1f}/min   p50 {p['latency_p50']}s   p95 {p['latency_p95']}s   "
+          f"{p['statuses']}   503s: {p['rejected_503']}   429s: {p.get('rejected_429', 0)}")
+
+    output = args.output or f"bench-pipeline-{(results['commit']['sha'] or 'unknown')[:10]}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results: {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
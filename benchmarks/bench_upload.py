@@ -0,0 +1,118 @@
+"""
+Benchmark: on-disk zip upload vs streaming zip → S3 multipart upload.
+
+Runs both upload paths of upload_to_s3 against moto (a local S3
+stand-in), on a generated git repo, and prints time, peak Python memory
+and extra disk used by each.
+
+Usage:
+    pip install moto
+    python benchmarks/bench_upload.py --size-mb 200 --part-size-mb 8 --concurrency 4
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import boto3
+
+try:
+    from moto import mock_aws
+except ImportError:
+    sys.exit("moto is required: pip install moto")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from streaming_upload import stream_directory_to_s3  # noqa: E402
+
+BUCKET = 'bench-deploy-artifacts'
+
+
+def make_repo(path, size_mb, file_kb=256):
+    """Create a git repo with ~size_mb of half-compressible files"""
+    os.makedirs(path)
+    chunk = file_kb * 1024
+    for i in range(max(1, size_mb * 1024 // file_kb)):
+        folder = os.path.join(path, f"dir{i % 20}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"file{i}.bin"), 'wb') as f:
+            f.write(os.urandom(chunk // 2) + b'a' * (chunk // 2))
+    subprocess.run(['git', 'init', '-q', path], check=True)
+    subprocess.run(['git', '-C', path, 'add', '.'], check=True)
+    subprocess.run(
+        ['git', '-C', path, '-c', 'user.name=bench', '-c', 'user.email=bench@localhost',
+         'commit', '-q', '-m', 'fixture'],
+        check=True
+    )
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def on_disk_upload(s3, repo_path, work_dir):
+    """The old path: shutil.make_archive, then upload_fileobj"""
+    zip_path = shutil.make_archive(os.path.join(work_dir, 'source'), 'zip', repo_path)
+    extra_disk = os.path.getsize(zip_path)
+    with open(zip_path, 'rb') as f:
+        s3.upload_fileobj(f, BUCKET, 'bench/on-disk.zip')
+    return extra_disk
+
+
+def streaming_upload(s3, repo_path, work_dir, part_size, concurrency):
+    stream_directory_to_s3(s3, repo_path, BUCKET, 'bench/streaming.zip', part_size, concurrency)
+    return 0
+
+
+def measure(name, func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    extra_disk = func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<12} {seconds:8.2f}s   peak mem {peak / 1e6:8.1f} MB   extra disk {extra_disk / 1e6:8.1f} MB")
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--part-size-mb', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench-upload-')
+    try:
+        origin = os.path.join(work_dir, 'origin')
+        make_repo(origin, args.size_mb)
+
+        clone = os.path.join(work_dir, 'clone')
+        start = time.perf_counter()
+        subprocess.run(['git', 'clone', '-q', '--depth', '1', f"file://{origin}", clone], check=True)
+        clone_seconds = time.perf_counter() - start
+        print(f"repo: {dir_size(clone) / 1e6:.1f} MB, clone: {clone_seconds:.2f}s")
+
+        with mock_aws():
+            s3 = boto3.client('s3', region_name='us-east-1')
+            s3.create_bucket(Bucket=BUCKET)
+
+            measure('on-disk', lambda: on_disk_upload(s3, clone, work_dir))
+            measure('streaming', lambda: streaming_upload(
+                s3, clone, work_dir, args.part_size_mb * 1024 * 1024, args.concurrency
+            ))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,601 @@
+"""
+In-process stand-ins for the AWS APIs DeployFast calls, for benchmarks.
+
+Only the calls the pipeline makes are implemented. Every call sleeps for
+a simulated round trip. Slow operations take simulated time: an EC2 boot,
+a CodeBuild run, a deploy. Each of these can fail at a configurable rate.
+
+    aws = FakeAWS(latency={'api': 0.02, 'ec2_boot': 3, 'build': 4, 'deploy': 2},
+                  failure={'build': 0.05}, seed=1)
+    aws.install()          # aws_clients.get_client now returns the fakes
+    import app             # every LazyClient in app.py talks to aws
+
+Builds write a CloudWatch Logs stream (a few lines per phase, error
+lines when they fail) that FakeLogs serves page by page with
+nextForwardToken, like get_log_events does.
+
+S3 spools object bodies to a temp directory (not memory), so objects
+can be read back (download_file, get_object) without the fake holding
+every upload in RAM. Single-part objects get an MD5 ETag and a
+LastModified, like real S3, so ETag comparisons (static_hosting.py) work. Random draws (failures,
+jitter, IPs) come from one seeded RNG, so two runs with the same seed see
+the same outcomes for the same sequence of calls.
+"""
+
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+# Simulated seconds
+DEFAULT_LATENCY = {
+    'api': 0.02,       # Every API call (network round trip)
+    'ec2_boot': 3.0,   # run_instances → running + status checks ok
+    'build': 4.0,      # start_build → SUCCEEDED
+    'deploy': 2.0      # Lambda / CodeDeploy run
+}
+
+# Probability that one EC2 boot / build / deploy fails
+DEFAULT_FAILURE = {
+    'ec2': 0.0,
+    'build': 0.0,
+    'deploy': 0.0
+}
+
+BUILD_PHASES = ['SUBMITTED', 'QUEUED', 'PROVISIONING', 'DOWNLOAD_SOURCE', 'INSTALL',
+                'PRE_BUILD', 'BUILD', 'POST_BUILD', 'UPLOAD_ARTIFACTS', 'FINALIZING']
+BUILD_LOG_GROUP = '/aws/codebuild/DeployFast'
+BUILD_LOG_LINES_PER_PHASE = 20
+
+
+def client_error(code, operation, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message or code}}, operation)
+
+
+class FakeAWS:
+    """Shared state + the fake clients, one per service"""
+
+    def __init__(self, latency=None, failure=None, jitter=0.1, seed=0, clock=time.monotonic):
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self.failure = dict(DEFAULT_FAILURE, **(failure or {}))
+        self.jitter = jitter
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._calls = {}  # 'service.Operation' → count
+
+        self.clients = {
+            's3': FakeS3(self),
+            'ec2': FakeEC2(self),
+            'ssm': FakeSSM(self),
+            'codebuild': FakeCodeBuild(self),
+            'lambda': FakeLambda(self),
+            'codedeploy': FakeCodeDeploy(self),
+            'sqs': FakeSQS(self),
+            'logs': FakeLogs(self)
+        }
+
+    def install(self):
+        """Make aws_clients hand out these fakes instead of boto3 clients"""
+        def get_client(service_name, region_name=None, **kwargs):
+            try:
+                return self.clients[service_name]
+            except KeyError:
+                raise NotImplementedError(f"No fake for {service_name}") from None
+        aws_clients.get_client = get_client
+
+    def call(self, service, operation):
+        """Count the call and wait one simulated round trip"""
+        with self._lock:
+            key = f"{service}.{operation}"
+            self._calls[key] = self._calls.get(key, 0) + 1
+        time.sleep(self.duration('api'))
+
+    def duration(self, name):
+        """Simulated seconds for `name`, with jitter"""
+        base = self.latency[name]
+        if not self.jitter:
+            return base
+        with self._lock:
+            return max(0.0, base * (1 + self._random.uniform(-self.jitter, self.jitter)))
+
+    def fails(self, name):
+        with self._lock:
+            return self._random.random() < self.failure.get(name, 0)
+
+    def random_ip(self):
+        with self._lock:
+            return f"10.{self._random.randint(0, 255)}.{self._random.randint(0, 255)}.{self._random.randint(1, 254)}"
+
+    def call_counts(self):
+        with self._lock:
+            return dict(sorted(self._calls.items()))
+
+
+class FakeClient:
+    service = None
+
+    class exceptions:
+        class DeploymentGroupAlreadyExistsException(Exception):
+            pass
+
+    def __init__(self, aws):
+        self.aws = aws
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        self.aws.call(self.service, operation)
+
+    def get_paginator(self, operation_name):
+        """Everything fits on one page"""
+        method = getattr(self, operation_name)
+        return FakePaginator(method)
+
+
+class FakePaginator:
+    def __init__(self, method):
+        self.method = method
+
+    def paginate(self, **kwargs):
+        yield self.method(**kwargs)
+
+
+class FakeS3(FakeClient):
+    service = 's3'
+
+    def __init__(self, aws):
+        super().__init__(aws)
+        self.objects = {}  # (bucket, key) → size
+        self.metadata = {}  # (bucket, key) → user metadata
+        self.stat = {}  # (bucket, key) → {'etag', 'modified', 'headers'}
+        self._uploads = {}  # upload ID → (bucket, key, {part number: size}, metadata)
+        self.root = tempfile.mkdtemp(prefix='fake-s3-')
+        weakref.finalize(self, shutil.rmtree, self.root, True)
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, hashlib.sha256(f"{bucket}/{key}".encode()).hexdigest())
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._call('HeadObject')
+        with self._lock:
+            size = self.objects.get((Bucket, Key))
+            metadata = self.metadata.get((Bucket, Key), {})
+            stat = self.stat.get((Bucket, Key), {})
+        if size is None:
+            raise client_error('404', 'HeadObject', 'Not Found')
+        return {'ContentLength': size, 'ETag': f'"{stat.get("etag", Key)}"', 'Metadata': dict(metadata),
+                **stat.get('headers', {})}
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        self._call('GetObject')
+        with self._lock:
+            size = self.objects.get((Bucket, Key))
+        if size is None:
+            raise client_error('NoSuchKey', 'GetObject', 'Not Found')
+        with open(self._path(Bucket, Key), 'rb') as f:
+            if Range:
+                start, end = Range.split('=')[1].split('-')
+                f.seek(int(start))
+                body = f.read(int(end) - int(start) + 1)
+            else:
+                body = f.read()
+        return {'Body': io.BytesIO(body), 'ContentLength': len(body)}
+
+    def put_object(self, Bucket, Key, Body=b'', Metadata=None, **kwargs):
+        self._call('PutObject')
+        body = _read(Body)
+        with open(self._path(Bucket, Key), 'wb') as f:
+            f.write(body)
+        etag = hashlib.md5(body).hexdigest()
+        with self._lock:
+            self.objects[(Bucket, Key)] = len(body)
+            self.metadata[(Bucket, Key)] = dict(Metadata or {})
+            self.stat[(Bucket, Key)] = _stat(etag, kwargs)
+        return {'ETag': f'"{etag}"'}
+
+    def download_file(self, Bucket, Key, Filename, **kwargs):
+        self._call('GetObject')
+        with self._lock:
+            size = self.objects.get((Bucket, Key))
+        if size is None:
+            raise client_error('404', 'HeadObject', 'Not Found')
+        shutil.copyfile(self._path(Bucket, Key), Filename)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, **kwargs):
+        self._call('PutObject')
+        shutil.copyfile(Filename, self._path(Bucket, Key))
+        with open(Filename, 'rb') as f:
+            etag = hashlib.md5(f.read()).hexdigest()
+        with self._lock:
+            self.objects[(Bucket, Key)] = os.path.getsize(Filename)
+            self.metadata[(Bucket, Key)] = dict((ExtraArgs or {}).get('Metadata', {}))
+            self.stat[(Bucket, Key)] = _stat(etag, ExtraArgs or {})
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None, **kwargs):
+        self._call('CreateMultipartUpload')
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = (Bucket, Key, {}, dict(Metadata or {}))
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+        self._call('UploadPart')
+        body = _read(Body)
+        with open(f"{self.root}/{UploadId}-{PartNumber}", 'wb') as f:
+            f.write(body)
+        with self._lock:
+            self._uploads[UploadId][2][PartNumber] = len(body)
+        return {'ETag': f'"{UploadId}-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call('CompleteMultipartUpload')
+        with self._lock:
+            _, _, parts, metadata = self._uploads.pop(UploadId)
+        with open(self._path(Bucket, Key), 'wb') as out:
+            for number in sorted(parts):
+                part = f"{self.root}/{UploadId}-{number}"
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out)
+                os.remove(part)
+        with self._lock:
+            self.objects[(Bucket, Key)] = sum(parts.values())
+            self.metadata[(Bucket, Key)] = metadata
+            self.stat[(Bucket, Key)] = _stat(f"{UploadId}-{len(parts)}", {})
+        return {'Bucket': Bucket, 'Key': Key}
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, **kwargs):
+        self._call('ListObjectsV2')
+        with self._lock:
+            keys = sorted(k for b, k in self.objects if b == Bucket and k.startswith(Prefix))
+            listed = {k: {
+                'Key': k,
+                'Size': self.objects[(Bucket, k)],
+                'ETag': f'"{self.stat[(Bucket, k)]["etag"]}"',
+                'LastModified': self.stat[(Bucket, k)]['modified']
+            } for k in keys}
+        if Delimiter:
+            prefixes = sorted({
+                Prefix + k[len(Prefix):].split(Delimiter)[0] + Delimiter
+                for k in keys if Delimiter in k[len(Prefix):]
+            })
+            keys = [k for k in keys if Delimiter not in k[len(Prefix):]]
+            return {'Contents': [listed[k] for k in keys],
+                    'CommonPrefixes': [{'Prefix': p} for p in prefixes]}
+        return {'Contents': [listed[k] for k in keys]}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._call('DeleteObjects')
+        with self._lock:
+            for obj in Delete['Objects']:
+                if self.objects.pop((Bucket, obj['Key']), None) is not None:
+                    self.metadata.pop((Bucket, obj['Key']), None)
+                    self.stat.pop((Bucket, obj['Key']), None)
+                    os.remove(self._path(Bucket, obj['Key']))
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+        self._call('AbortMultipartUpload')
+        with self._lock:
+            upload = self._uploads.pop(UploadId, None)
+        for number in (upload[2] if upload else ()):
+            part = f"{self.root}/{UploadId}-{number}"
+            if os.path.exists(part):
+                os.remove(part)
+        return {}
+
+
+class FakeEC2(FakeClient):
+    service = 'ec2'
+
+    def __init__(self, aws):
+        super().__init__(aws)
+        self.instances = {}  # instance ID → {'ready_at', 'fails', 'state', 'ip', 'tags'}
+
+    def run_instances(self, MinCount, MaxCount, TagSpecifications=(), **kwargs):
+        self._call('RunInstances')
+        tags = {}
+        for spec in TagSpecifications:
+            tags.update({t['Key']: t['Value'] for t in spec.get('Tags', [])})
+
+        launched = []
+        for _ in range(MaxCount):
+            instance_id = f"i-{uuid.uuid4().hex[:17]}"
+            instance = {
+                'ready_at': self.aws.clock() + self.aws.duration('ec2_boot'),
+                'fails': self.aws.fails('ec2'),
+                'state': 'pending',
+                'ip': self.aws.random_ip(),
+                'tags': dict(tags),
+                'launched': datetime.now(timezone.utc)
+            }
+            with self._lock:
+                self.instances[instance_id] = instance
+            launched.append({'InstanceId': instance_id, 'State': {'Name': 'pending'}})
+        return {'Instances': launched}
+
+    def describe_instances(self, InstanceIds=None, Filters=(), **kwargs):
+        self._call('DescribeInstances')
+        with self._lock:
+            ids = InstanceIds or list(self.instances)
+            missing = [i for i in ids if i not in self.instances]
+            if InstanceIds and missing:
+                raise client_error('InvalidInstanceID.NotFound', 'DescribeInstances', missing[0])
+            found = [(i, self._refresh(i)) for i in ids]
+
+        instances = []
+        for instance_id, instance in found:
+            if not _matches(instance, Filters):
+                continue
+            described = {
+                'InstanceId': instance_id,
+                'State': {'Name': instance['state']},
+                'LaunchTime': instance['launched'],
+                'Tags': [{'Key': k, 'Value': v} for k, v in sorted(instance['tags'].items())]
+            }
+            if instance['state'] == 'running':
+                described['PublicIpAddress'] = instance['ip']
+            instances.append(described)
+        return {'Reservations': [{'Instances': instances}] if instances else []}
+
+    def describe_instance_status(self, InstanceIds, **kwargs):
+        self._call('DescribeInstanceStatus')
+        statuses = []
+        with self._lock:
+            for instance_id in InstanceIds:
+                if instance_id in self.instances and self._refresh(instance_id)['state'] == 'running':
+                    statuses.append({
+                        'InstanceId': instance_id,
+                        'InstanceStatus': {'Status': 'ok'},
+                        'SystemStatus': {'Status': 'ok'}
+                    })
+        return {'InstanceStatuses': statuses}
+
+    def create_tags(self, Resources, Tags, **kwargs):
+        self._call('CreateTags')
+        with self._lock:
+            for instance_id in Resources:
+                if instance_id in self.instances:
+                    self.instances[instance_id]['tags'].update({t['Key']: t['Value'] for t in Tags})
+        return {}
+
+    def terminate_instances(self, InstanceIds, **kwargs):
+        self._call('TerminateInstances')
+        with self._lock:
+            for instance_id in InstanceIds:
+                if instance_id in self.instances:
+                    self.instances[instance_id]['state'] = 'terminated'
+        return {'TerminatingInstances': [{'InstanceId': i} for i in InstanceIds]}
+
+    def running(self):
+        """Instances not terminated (what a real account would bill)"""
+        with self._lock:
+            return [i for i in self.instances if self._refresh(i)['state'] != 'terminated']
+
+    def _refresh(self, instance_id):
+        instance = self.instances[instance_id]
+        if instance['state'] == 'pending' and self.aws.clock() >= instance['ready_at']:
+            instance['state'] = 'terminated' if instance['fails'] else 'running'
+        return instance
+
+
+class FakeSSM(FakeClient):
+    service = 'ssm'
+
+    def describe_instance_information(self, Filters=(), **kwargs):
+        self._call('DescribeInstanceInformation')
+        ec2 = self.aws.clients['ec2']
+        ids = [v for f in Filters if f['Key'] == 'InstanceIds' for v in f['Values']]
+        online = [i for i in ids if i in ec2.running()]
+        return {'InstanceInformationList': [{'InstanceId': i, 'PingStatus': 'Online'} for i in online]}
+
+    def send_command(self, InstanceIds, **kwargs):
+        self._call('SendCommand')
+        return {'Command': {'CommandId': uuid.uuid4().hex, 'InstanceIds': InstanceIds}}
+
+
+class FakeCodeBuild(FakeClient):
+    service = 'codebuild'
+
+    def __init__(self, aws):
+        super().__init__(aws)
+        self.builds = {}  # build ID → {'started', 'seconds', 'fails'}
+
+    def start_build(self, projectName, **kwargs):
+        self._call('StartBuild')
+        build_id = f"{projectName}:{uuid.uuid4()}"
+        with self._lock:
+            self.builds[build_id] = {
+                'started': self.aws.clock(),
+                'seconds': self.aws.duration('build'),
+                'fails': self.aws.fails('build'),
+                'stream': build_id.split(':')[1]
+            }
+        return {'build': {'id': build_id, 'buildStatus': 'IN_PROGRESS'}}
+
+    def batch_get_builds(self, ids):
+        self._call('BatchGetBuilds')
+        builds = []
+        with self._lock:
+            for build_id in ids:
+                build = self.builds.get(build_id)
+                if build:
+                    builds.append(self._describe(build_id, build))
+        return {'builds': builds}
+
+    def _describe(self, build_id, build):
+        elapsed = self.aws.clock() - build['started']
+        per_phase = build['seconds'] / len(BUILD_PHASES)
+        logs = {'groupName': BUILD_LOG_GROUP, 'streamName': build['stream']}
+
+        if elapsed < build['seconds']:
+            current = BUILD_PHASES[min(int(elapsed / per_phase), len(BUILD_PHASES) - 1)]
+            return {'id': build_id, 'buildStatus': 'IN_PROGRESS', 'currentPhase': current, 'logs': logs}
+
+        status = 'FAILED' if build['fails'] else 'SUCCEEDED'
+        phases = [
+            {'phaseType': phase, 'phaseStatus': 'SUCCEEDED', 'durationInSeconds': round(per_phase, 2)}
+            for phase in BUILD_PHASES
+        ]
+        if build['fails']:
+            phases[6].update(phaseStatus='FAILED', contexts=[{'message': 'Simulated build failure'}])
+        return {'id': build_id, 'buildStatus': status, 'currentPhase': 'COMPLETED', 'phases': phases, 'logs': logs}
+
+    def log_lines(self, stream):
+        """Every log line the build with this stream has written so far"""
+        with self._lock:
+            build = next((b for b in self.builds.values() if b['stream'] == stream), None)
+        if build is None:
+            return None
+        elapsed = self.aws.clock() - build['started']
+        per_phase = build['seconds'] / len(BUILD_PHASES)
+        done = len(BUILD_PHASES) if elapsed >= build['seconds'] else int(elapsed / per_phase)
+        lines = []
+        for phase in BUILD_PHASES[:done]:
+            lines.append(f"[Container] Entering phase {phase}")
+            lines.extend(f"{phase.lower()}: step {i} ok" for i in range(BUILD_LOG_LINES_PER_PHASE))
+            if phase == 'BUILD' and build['fails']:
+                lines.append("npm ERR! Simulated build failure")
+                lines.append(f"[Container] Phase complete: {phase} State: FAILED")
+                break
+            lines.append(f"[Container] Phase complete: {phase} State: SUCCEEDED")
+        return lines
+
+
+class FakeLambda(FakeClient):
+    """The deployer Lambda: runs a (simulated) CodeDeploy deployment"""
+    service = 'lambda'
+
+    def invoke(self, FunctionName, Payload, **kwargs):
+        self._call('Invoke')
+        payload = json.loads(Payload)
+        seconds = self.aws.duration('deploy')
+        succeeded = not self.aws.fails('deploy')
+
+        time.sleep(seconds)
+        if succeeded:
+            body = {'statusCode': 200, 'body': json.dumps({'deployment_id': payload['deployment_id']})}
+        else:
+            body = {'statusCode': 500, 'body': json.dumps({'error': 'Simulated CodeDeploy failure'})}
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(body).encode())}
+
+
+class FakeCodeDeploy(FakeClient):
+    service = 'codedeploy'
+
+    def __init__(self, aws):
+        super().__init__(aws)
+        self.groups = set()
+        self.deployments = {}  # deployment ID → {'done_at', 'fails'}
+
+    def create_deployment_group(self, applicationName, deploymentGroupName, **kwargs):
+        self._call('CreateDeploymentGroup')
+        with self._lock:
+            if deploymentGroupName in self.groups:
+                raise self.exceptions.DeploymentGroupAlreadyExistsException(deploymentGroupName)
+            self.groups.add(deploymentGroupName)
+        return {'deploymentGroupId': uuid.uuid4().hex}
+
+    def delete_deployment_group(self, applicationName, deploymentGroupName, **kwargs):
+        self._call('DeleteDeploymentGroup')
+        with self._lock:
+            self.groups.discard(deploymentGroupName)
+        return {}
+
+    def create_deployment(self, **kwargs):
+        self._call('CreateDeployment')
+        deployment_id = f"d-{uuid.uuid4().hex[:9].upper()}"
+        with self._lock:
+            self.deployments[deployment_id] = {
+                'done_at': self.aws.clock() + self.aws.duration('deploy'),
+                'fails': self.aws.fails('deploy')
+            }
+        return {'deploymentId': deployment_id}
+
+    def batch_get_deployments(self, deploymentIds):
+        self._call('BatchGetDeployments')
+        infos = []
+        with self._lock:
+            for deployment_id in deploymentIds:
+                deployment = self.deployments.get(deployment_id)
+                if deployment is None:
+                    continue
+                if self.aws.clock() < deployment['done_at']:
+                    infos.append({'deploymentId': deployment_id, 'status': 'InProgress'})
+                elif deployment['fails']:
+                    infos.append({'deploymentId': deployment_id, 'status': 'Failed',
+                                  'errorInformation': {'message': 'Simulated CodeDeploy failure'}})
+                else:
+                    infos.append({'deploymentId': deployment_id, 'status': 'Succeeded'})
+        return {'deploymentsInfo': infos}
+
+
+class FakeLogs(FakeClient):
+    """CloudWatch Logs: the build log streams written by FakeCodeBuild"""
+    service = 'logs'
+    PAGE_SIZE = 50
+
+    def get_log_events(self, logGroupName, logStreamName, startFromHead=False, nextToken=None, limit=None, **kwargs):
+        self._call('GetLogEvents')
+        lines = self.aws.clients['codebuild'].log_lines(logStreamName)
+        if lines is None or logGroupName != BUILD_LOG_GROUP:
+            raise client_error('ResourceNotFoundException', 'GetLogEvents', 'The specified log stream does not exist.')
+        start = int(nextToken.split('/')[1]) if nextToken else 0
+        end = min(start + (limit or self.PAGE_SIZE), len(lines))
+        now = int(time.time() * 1000)
+        return {
+            'events': [{'timestamp': now, 'message': line, 'ingestionTime': now} for line in lines[start:end]],
+            'nextForwardToken': f"f/{end:056d}",  # same token back = nothing new
+            'nextBackwardToken': f"b/{start:056d}"
+        }
+
+
+class FakeSQS(FakeClient):
+    service = 'sqs'
+
+    def receive_message(self, WaitTimeSeconds=0, **kwargs):
+        self._call('ReceiveMessage')
+        time.sleep(WaitTimeSeconds)
+        return {'Messages': []}
+
+    def delete_message(self, **kwargs):
+        self._call('DeleteMessage')
+        return {}
+
+
+def _read(body):
+    return body.read() if hasattr(body, 'read') else bytes(body)
+
+
+def _stat(etag, args):
+    """What S3 keeps about an object besides its body"""
+    headers = {name: args[name] for name in ('ContentType', 'CacheControl') if name in args}
+    return {'etag': etag, 'modified': datetime.now(timezone.utc), 'headers': headers}
+
+
+def _matches(instance, filters):
+    """EC2 Filters: tag:<key>, tag-key and instance-state-name"""
+    for f in filters or ():
+        name, values = f['Name'], f['Values']
+        if name.startswith('tag:'):
+            if instance['tags'].get(name[4:]) not in values:
+                return False
+        elif name == 'tag-key':
+            if not any(v in instance['tags'] for v in values):
+                return False
+        elif name == 'instance-state-name':
+            if instance['state'] not in values:
+                return False
+    return True
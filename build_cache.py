@@ -0,0 +1,119 @@
+"""
+Build artifact reuse for DeployFast.
+
+A build is fully determined by:
+- the commit being built (commit SHA)
+- the buildspec that builds it (buildspec.yml in this repo, sent to
+  CodeBuild as buildspecOverride)
+- any environment variables that change the output
+
+So we key build output on a hash of those and send CodeBuild's artifact
+to builds/{build_key}/output instead of a per-deployment path. After a
+successful build we drop a marker next to it:
+
+    builds/{build_key}/output            ← CodeBuild artifact (zip)
+    builds/{build_key}/SUCCEEDED.json    ← written by us, only on success
+
+If the marker exists, the build is skipped and invoke_lambda deploys
+the existing artifact.
+"""
+
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+# ========================================
+# CONFIGURATION
+# ========================================
+BUILDSPEC_PATH = os.environ.get(
+    'BUILDSPEC_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'buildspec.yml')
+)
+BUILD_CACHE_ENABLED = os.environ.get('BUILD_CACHE_ENABLED', 'true').lower() == 'true'
+
+
+def load_buildspec(path=BUILDSPEC_PATH):
+    with open(path) as f:
+        return f.read()
+
+
+class BuildCache:
+    """
+    Usage:
+        key = build_cache.build_key(commit_sha)
+        artifact = build_cache.lookup(key)      # S3 key or None
+        ... run CodeBuild with artifact path build_cache.artifact_path(key) ...
+        build_cache.record(key, build_id, deployment_id)
+    """
+
+    def __init__(self, s3, bucket, buildspec, enabled=BUILD_CACHE_ENABLED):
+        self.s3 = s3
+        self.bucket = bucket
+        self.buildspec = buildspec
+        self.buildspec_hash = hashlib.sha256(buildspec.encode()).hexdigest()[:16]
+        self.enabled = enabled
+
+        self.hits = 0
+        self.misses = 0
+
+    def build_key(self, commit_sha, variables=None):
+        """
+        Key for (commit, buildspec, build variables).
+
+        variables: dict of environment variables that change the build
+        output (DEPLOYMENT_ID does not, so it is not part of the key).
+        """
+        parts = [commit_sha, self.buildspec_hash]
+        for name in sorted(variables or {}):
+            parts.append(f"{name}={variables[name]}")
+        digest = hashlib.sha256('\n'.join(parts).encode()).hexdigest()[:16]
+        return f"{commit_sha}-{digest}"
+
+    @staticmethod
+    def artifact_path(build_key):
+        """S3 prefix CodeBuild writes the 'output' artifact under"""
+        return f"builds/{build_key}"
+
+    def artifact_key(self, build_key):
+        return f"{self.artifact_path(build_key)}/output"
+
+    def lookup(self, build_key):
+        """S3 key of a successful build for build_key, or None"""
+        if not self.enabled:
+            return None
+        try:
+            self.s3.head_object(
+                Bucket=self.bucket,
+                Key=f"{self.artifact_path(build_key)}/SUCCEEDED.json"
+            )
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                self.misses += 1
+                return None
+            raise
+        self.hits += 1
+        return self.artifact_key(build_key)
+
+    def record(self, build_key, build_id, deployment_id):
+        """Mark builds/{build_key}/output as a good build we can reuse"""
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.artifact_path(build_key)}/SUCCEEDED.json",
+            Body=json.dumps({
+                'build_id': build_id,
+                'deployment_id': deployment_id,
+                'buildspec_hash': self.buildspec_hash,
+                'created_at': datetime.now().isoformat()
+            }).encode(),
+            ContentType='application/json'
+        )
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'buildspec_hash': self.buildspec_hash
+        }
@@ -0,0 +1,365 @@
+"""
+Build logs for DeployFast: live tail, compressed archive, error index.
+
+wait_for_codebuild used to print the phase 'contexts' of a failed build
+and nothing else; the actual npm/pip output was only in the console.
+
+Live: one background thread tails the CloudWatch Logs stream of every
+in-flight build with get_log_events. Each stream remembers its
+nextForwardToken, so every poll only returns lines it has not seen yet
+(nothing is downloaded twice). New lines go to on_lines (app.py
+publishes them as 'build_log' events) and into a LogArchive.
+
+Archive: the log is stored as s3://{bucket}/deployments/{id}/logs/{build}.log.gz,
+one gzip member per CHUNK_LINES lines (still a valid .gz file), next to
+an index:
+
+    {'lines': 5230, 'bytes': 412345, 'chunk_lines': 1000,
+     'chunks': [[0, 8123], [8123, 7990], ...],   # byte offset, length
+     'errors': [[812, 'npm ERR! missing script: build'], ...]}
+
+Reading lines N..M fetches only the chunks that hold them (S3 Range
+requests), and the error index finds the interesting lines without
+reading the log at all.
+
+Usage:
+    build_log_tailer.tail(deployment_id, group, stream, on_lines=publish)
+    archive = build_log_tailer.finish(deployment_id)   # drains the rest
+    index = store_archive(s3, bucket, deployment_id, build_id, archive)
+    page = read_lines(fetch_range, index, offset=0, limit=1000)
+"""
+
+import gzip
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+# ========================================
+# CONFIGURATION
+# ========================================
+BUILD_LOG_POLL_INTERVAL = float(os.environ.get('BUILD_LOG_POLL_INTERVAL', 3))  # Seconds between tail polls
+BUILD_LOG_DRAIN_TIMEOUT = float(os.environ.get('BUILD_LOG_DRAIN_TIMEOUT', 10))  # CloudWatch ingestion lag at the end
+BUILD_LOG_MAX_ERRORS = 200  # Error lines kept in the index
+
+CHUNK_LINES = 1000   # Lines per gzip member
+MAX_PAGES = 50       # get_log_events pages per stream per poll (10000 events each)
+INDEX_VERSION = 1
+
+# Lines worth looking at first when a build fails
+ERROR_PATTERN = re.compile(
+    r'\b(error|errors|failed|failure|fatal|exception|traceback|command not found|'
+    r'no such file|permission denied|exit status [1-9])\b|npm err!',
+    re.IGNORECASE
+)
+# "0 errors", "0 failed" are good news
+NOT_ERROR_PATTERN = re.compile(r'\b0 (errors?|failed|failures?)\b', re.IGNORECASE)
+
+
+def log_keys(deployment_id, build_id):
+    """S3 keys of a build's archived log and its index"""
+    name = build_id.split(':')[-1]
+    prefix = f"deployments/{deployment_id}/logs/{name}"
+    return f"{prefix}.log.gz", f"{prefix}.json"
+
+
+def is_error_line(line):
+    return bool(ERROR_PATTERN.search(line)) and not NOT_ERROR_PATTERN.search(line)
+
+
+# ----------------------------------------
+# Archive
+# ----------------------------------------
+
+class LogArchive:
+    """
+    Append-only chunked gzip log in a temp file + its index.
+
+    Full chunks are compressed as soon as they fill up; the open chunk
+    stays in memory, so a running build's log can be read back at any time.
+    """
+
+    def __init__(self, chunk_lines=CHUNK_LINES):
+        self.chunk_lines = chunk_lines
+        self.file = tempfile.TemporaryFile(prefix='deployfast-build-log-')
+        self.lines = 0
+        self.bytes = 0
+        self.chunks = []   # [offset, length] of each gzip member
+        self.errors = []   # [line number, text]
+        self.errors_truncated = False
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, lines):
+        with self._lock:
+            for line in lines:
+                if is_error_line(line):
+                    if len(self.errors) < BUILD_LOG_MAX_ERRORS:
+                        self.errors.append([self.lines, line[:500]])
+                    else:
+                        self.errors_truncated = True
+                self._pending.append(line)
+                self.lines += 1
+                self.bytes += len(line.encode()) + 1
+                if len(self._pending) == self.chunk_lines:
+                    self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        member = gzip.compress(''.join(f"{line}\n" for line in self._pending).encode())
+        self.file.seek(0, os.SEEK_END)
+        self.chunks.append([self.file.tell(), len(member)])
+        self.file.write(member)
+        self._pending = []
+
+    def close(self):
+        """Compress the last chunk. Returns the index."""
+        with self._lock:
+            self._flush()
+            self.file.flush()
+            return self.index()
+
+    def index(self, complete=True):
+        return {
+            'version': INDEX_VERSION,
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'chunk_lines': self.chunk_lines,
+            'chunks': list(self.chunks),
+            'errors': list(self.errors),
+            'errors_truncated': self.errors_truncated,
+            'complete': complete
+        }
+
+    def read(self, offset, limit):
+        """Lines of the log so far, also while it is still being written"""
+        with self._lock:
+            index = self.index(complete=False)
+            pending = list(self._pending)
+
+            def fetch_range(start, end):
+                self.file.seek(start)
+                return self.file.read(end - start)
+
+            page = read_lines(fetch_range, index, offset, limit, tail=pending)
+        return page
+
+    def discard(self):
+        self.file.close()
+
+
+def read_lines(fetch_range, index, offset=0, limit=1000, tail=()):
+    """
+    Lines [offset, offset + limit) of an archived log.
+
+    fetch_range(start, end) returns bytes [start, end) of the .log.gz;
+    only the chunks holding the wanted lines are fetched, in one range.
+    tail: lines after the last chunk (a log that is still being written).
+    A negative offset counts from the end (-100 = the last 100 lines).
+    """
+    total = index['lines']
+    if offset < 0:
+        offset = max(total + offset, 0)
+    offset = min(offset, total)
+    end = min(offset + limit, total)
+
+    chunk_lines = index['chunk_lines']
+    chunked = len(index['chunks']) * chunk_lines
+    lines = []
+    if offset < min(end, chunked):
+        first = offset // chunk_lines
+        last = (min(end, chunked) - 1) // chunk_lines
+        start = index['chunks'][first][0]
+        stop = index['chunks'][last][0] + index['chunks'][last][1]
+        text = gzip.decompress(fetch_range(start, stop)).decode(errors='replace')
+        lines = text.split('\n')[:-1][offset - first * chunk_lines:end - first * chunk_lines]
+    if end > chunked:
+        lines += list(tail)[max(offset - chunked, 0):end - chunked]
+
+    return {
+        'offset': offset,
+        'lines': lines,
+        'next_offset': end if end < total else None,
+        'total_lines': total
+    }
+
+
+def store_archive(s3, bucket, deployment_id, build_id, archive):
+    """Upload a finished build's log + index. Returns the index."""
+    index = archive.close()
+    index['build_id'] = build_id
+    log_key, index_key = log_keys(deployment_id, build_id)
+    archive.file.seek(0)
+    s3.put_object(Bucket=bucket, Key=log_key, Body=archive.file.read(), ContentType='application/gzip')
+    s3.put_object(Bucket=bucket, Key=index_key, Body=json.dumps(index).encode(), ContentType='application/json')
+    archive.discard()
+    return index
+
+
+def s3_range_reader(s3, bucket, key):
+    """fetch_range for read_lines over an S3 object"""
+    def fetch_range(start, end):
+        response = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end - 1}")
+        return response['Body'].read()
+    return fetch_range
+
+
+# ----------------------------------------
+# Live tail
+# ----------------------------------------
+
+class BuildLogTailer:
+    """
+    One poller for the log streams of every in-flight build in this process.
+
+    Usage:
+        tailer.tail(key, group, stream, on_lines=callback)   # key: deployment ID
+        tailer.read(key, offset, limit)    # while the build runs
+        archive = tailer.finish(key)       # after it finished
+    """
+
+    def __init__(self, logs, interval=BUILD_LOG_POLL_INTERVAL, drain_timeout=BUILD_LOG_DRAIN_TIMEOUT):
+        self.logs = logs
+        self.interval = interval
+        self.drain_timeout = drain_timeout
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._streams = {}  # key → {'group', 'stream', 'token', 'archive', 'on_lines', 'lock'}
+        self.api_calls = 0
+
+    def tail(self, key, group, stream, on_lines=None):
+        """Start tailing a log stream (no-op if key is already tailed)"""
+        with self._lock:
+            if key in self._streams:
+                return
+            self._streams[key] = {
+                'group': group,
+                'stream': stream,
+                'token': None,
+                'archive': LogArchive(),
+                'on_lines': on_lines,
+                'lock': threading.Lock()
+            }
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='build-log-tailer', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def tailing(self, key):
+        with self._lock:
+            return key in self._streams
+
+    def read(self, key, offset, limit):
+        """Lines of a build that is still running, or None if key is not tailed"""
+        with self._lock:
+            entry = self._streams.get(key)
+        if entry is None:
+            return None
+        return entry['archive'].read(offset, limit)
+
+    def errors(self, key):
+        """Error index of a build that is still running, or None"""
+        with self._lock:
+            entry = self._streams.get(key)
+        if entry is None:
+            return None
+        return entry['archive'].index(complete=False)['errors']
+
+    def finish(self, key):
+        """
+        Fetch whatever is left of key's stream, stop tailing it and
+        return its LogArchive (None if key was not tailed).
+
+        CloudWatch may receive the last lines a few seconds after the
+        build is reported finished, so this keeps polling until a poll
+        brings nothing new after at least one line arrived (or drain_timeout).
+        """
+        with self._lock:
+            entry = self._streams.get(key)
+        if entry is None:
+            return None
+        deadline = time.monotonic() + self.drain_timeout
+        while True:
+            try:
+                got = self._fetch(key, entry)
+            except Exception as e:
+                print(f"[{key}] Could not read the build log: {str(e)}")
+                break
+            if (not got and entry['archive'].lines) or time.monotonic() > deadline:
+                break
+            if not got:
+                time.sleep(min(1, self.interval))
+        with self._lock:
+            self._streams.pop(key, None)
+        return entry['archive']
+
+    def discard(self, key):
+        """Stop tailing without keeping anything"""
+        with self._lock:
+            entry = self._streams.pop(key, None)
+        if entry:
+            entry['archive'].discard()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._streams)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                entries = list(self._streams.items())
+            if not entries:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            for key, entry in entries:
+                try:
+                    self._fetch(key, entry)
+                except Exception as e:
+                    print(f"[{key}] Build log tail failed: {str(e)}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def _fetch(self, key, entry):
+        """Read everything new on one stream. Returns the number of new lines."""
+        with entry['lock']:
+            got = 0
+            for _ in range(MAX_PAGES):
+                request = {
+                    'logGroupName': entry['group'],
+                    'logStreamName': entry['stream'],
+                    'startFromHead': True
+                }
+                if entry['token']:
+                    request['nextToken'] = entry['token']
+                try:
+                    response = self.logs.get_log_events(**request)
+                except ClientError as e:
+                    if e.response.get('Error', {}).get('Code') == 'ResourceNotFoundException':
+                        return got  # Stream not created yet
+                    raise
+                self.api_calls += 1
+
+                lines = [event['message'].rstrip('\n') for event in response.get('events', [])]
+                if lines:
+                    offset = entry['archive'].lines
+                    entry['archive'].add(lines)
+                    got += len(lines)
+                    if entry['on_lines']:
+                        entry['on_lines'](lines, offset)
+
+                # Same token back = end of the stream for now
+                token = response.get('nextForwardToken')
+                if not token or token == entry['token']:
+                    return got
+                entry['token'] = token
+                if not lines:
+                    return got
+            return got
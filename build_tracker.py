@@ -0,0 +1,259 @@
+"""
+CodeBuild status tracking for DeployFast.
+
+Instead of every deployment polling its own build every 15 seconds, one
+background thread tracks ALL in-flight builds:
+
+- Each tick makes ONE batch_get_builds call for up to 100 build IDs
+  (more builds = more chunks of 100, not more calls per build)
+- The tick interval adapts to the phases of the in-flight builds:
+  short near the end of a build, longer while it is queued/provisioning
+- Pushed completion events (EventBridge → SQS, or the webhook endpoint
+  in app.py) wake the tracker up right away via notify()
+
+Callers get a Future and wait on it; nobody sleeps in a loop.
+
+    future = build_tracker.track(build_id, label=deployment_id)
+    build = future.result(timeout=600)   # final batch_get_builds entry
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+# ========================================
+# CONFIGURATION
+# ========================================
+CODEBUILD_EVENTS_QUEUE_URL = os.environ.get('CODEBUILD_EVENTS_QUEUE_URL', '')  # EventBridge → SQS (optional)
+
+BATCH_SIZE = 100  # batch_get_builds accepts up to 100 IDs
+
+# Seconds between polls while a build is in this phase.
+# The tracker uses the shortest interval of all in-flight builds.
+PHASE_INTERVALS = {
+    'SUBMITTED': 5,
+    'QUEUED': 10,
+    'PROVISIONING': 10,
+    'DOWNLOAD_SOURCE': 5,
+    'INSTALL': 10,
+    'PRE_BUILD': 10,
+    'BUILD': 5,
+    'POST_BUILD': 3,
+    'UPLOAD_ARTIFACTS': 2,
+    'FINALIZING': 2,
+    'COMPLETED': 1
+}
+DEFAULT_INTERVAL = 5
+
+FINISHED_STATUSES = ['SUCCEEDED', 'FAILED', 'FAULT', 'STOPPED', 'TIMED_OUT']
+
+
+def build_id_from_arn(build_arn):
+    """
+    EventBridge events carry the build ARN, batch_get_builds uses the ID.
+
+    arn:aws:codebuild:us-east-1:123:build/Project:uuid → Project:uuid
+    """
+    if ':build/' in build_arn:
+        return build_arn.split(':build/', 1)[1]
+    return build_arn
+
+
+class BuildTracker:
+    """
+    One poller for every in-flight CodeBuild build in this process.
+    """
+
+    def __init__(self, codebuild, sleep_interval=None):
+        self.codebuild = codebuild
+        self.sleep_interval = sleep_interval  # fixed interval (for tests/benchmarks)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._builds = {}  # build_id → {'future', 'label', 'phase', 'listeners'}
+        self.api_calls = 0
+
+    def track(self, build_id, label=None, on_update=None):
+        """
+        Start tracking build_id. Returns a Future that resolves to the
+        final build (dict from batch_get_builds) once it has finished.
+
+        on_update(build) is called every time the build's phase changes.
+        """
+        with self._lock:
+            entry = self._builds.get(build_id)
+            if entry is None:
+                entry = {
+                    'future': Future(),
+                    'label': label or build_id,
+                    'phase': None,
+                    'listeners': []
+                }
+                self._builds[build_id] = entry
+            if on_update:
+                entry['listeners'].append(on_update)
+            self._ensure_thread()
+        self._wake.set()
+        return entry['future']
+
+    def untrack(self, build_id):
+        """Stop tracking a build (e.g. the caller gave up waiting)"""
+        with self._lock:
+            entry = self._builds.pop(build_id, None)
+        if entry and not entry['future'].done():
+            entry['future'].cancel()
+
+    def notify(self, build_id, status=None):
+        """
+        A completion/state-change event was pushed for build_id.
+
+        We do not trust the event payload blindly: the tracker re-reads
+        the build right away, so the Future always gets the full build.
+        """
+        with self._lock:
+            entry = self._builds.get(build_id)
+        if entry is not None:
+            print(f"[{entry['label']}] CodeBuild event received: {status or 'state change'}")
+            self._wake.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._builds)
+
+    # ----------------------------------------
+    # Background polling
+    # ----------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='build-tracker', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                build_ids = list(self._builds)
+
+            if not build_ids:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            try:
+                self.poll(build_ids)
+            except Exception as e:
+                print(f"[build-tracker] batch_get_builds failed: {str(e)}")
+
+            self._wake.wait(self._next_interval())
+            self._wake.clear()
+
+    def poll(self, build_ids):
+        """One tick: fetch every in-flight build with as few calls as possible"""
+        for i in range(0, len(build_ids), BATCH_SIZE):
+            chunk = build_ids[i:i + BATCH_SIZE]
+            response = self.codebuild.batch_get_builds(ids=chunk)
+            self.api_calls += 1
+            for build in response.get('builds', []):
+                self._update(build)
+
+    def _update(self, build):
+        build_id = build['id']
+        with self._lock:
+            entry = self._builds.get(build_id)
+        if entry is None:
+            return
+
+        status = build['buildStatus']
+        phase = build.get('currentPhase', 'UNKNOWN')
+
+        if phase != entry['phase']:
+            entry['phase'] = phase
+            print(f"[{entry['label']}] CodeBuild status: {status} (phase: {phase})")
+            for listener in entry['listeners']:
+                try:
+                    listener(build)
+                except Exception as e:
+                    print(f"[{entry['label']}] Build listener failed: {str(e)}")
+
+        if status in FINISHED_STATUSES:
+            with self._lock:
+                self._builds.pop(build_id, None)
+            if not entry['future'].done():
+                entry['future'].set_result(build)
+
+    def _next_interval(self):
+        if self.sleep_interval is not None:
+            return self.sleep_interval
+        with self._lock:
+            phases = [e['phase'] for e in self._builds.values()]
+        if not phases:
+            return DEFAULT_INTERVAL
+        return min(PHASE_INTERVALS.get(p, DEFAULT_INTERVAL) for p in phases)
+
+
+class SqsBuildEvents:
+    """
+    Long-polls an SQS queue fed by an EventBridge rule on
+    "CodeBuild Build State Change" and forwards events to the tracker.
+
+    Optional: only started when CODEBUILD_EVENTS_QUEUE_URL is set.
+    """
+
+    def __init__(self, sqs, queue_url, tracker):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.tracker = tracker
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not self.queue_url:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='codebuild-events', daemon=True
+            )
+            self._thread.start()
+        print(f"[build-tracker] Listening for CodeBuild events on {self.queue_url}")
+
+    def _run(self):
+        while True:
+            try:
+                response = self.sqs.receive_message(
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=10,
+                    WaitTimeSeconds=20
+                )
+            except Exception as e:
+                print(f"[build-tracker] SQS receive failed: {str(e)}")
+                time.sleep(5)
+                continue
+
+            for message in response.get('Messages', []):
+                try:
+                    handle_build_event(self.tracker, json.loads(message['Body']))
+                except (ValueError, KeyError) as e:
+                    print(f"[build-tracker] Ignoring bad CodeBuild event: {str(e)}")
+                self.sqs.delete_message(
+                    QueueUrl=self.queue_url,
+                    ReceiptHandle=message['ReceiptHandle']
+                )
+
+
+def handle_build_event(tracker, event):
+    """
+    Forward one EventBridge "CodeBuild Build State Change" event.
+
+    Used by both the SQS listener and the webhook endpoint.
+    """
+    detail = event['detail']
+    build_id = build_id_from_arn(detail['build-id'])
+    tracker.notify(build_id, detail.get('build-status'))
+    return build_id
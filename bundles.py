@@ -0,0 +1,421 @@
+"""
+Release manifests and delta bundles for incremental redeploys.
+
+Every site is served from a release directory behind a symlink:
+
+    /usr/share/nginx/html     → /opt/deployfast/releases/site/<release>      (dedicated)
+    /var/www/sites/{site}     → /opt/deployfast/releases/{site}/<release>    (shared)
+
+A full deploy (buildspec.yml) publishes the build output into a new
+release and swaps the symlink. A redeploy ships only what changed:
+
+1. manifest of the live release: {path: sha256}, stored next to the
+   deployment's artifacts at deployments/{id}/manifest.json (or computed
+   from the previously deployed artifact the first time)
+2. manifest of the new build output, diffed against it
+3. a small CodeDeploy bundle: the changed files, the list of deleted
+   files and scripts that
+   - hard-link the live release into a new one (unchanged files cost
+     no copy and no space)
+   - rename the changed files in (never writing through a shared link)
+     and remove the deleted ones
+   - swap the symlink atomically (ln -s + mv -T), reload nginx
+
+Nothing is ever modified in the live release, so visitors see the old
+site or the new one, never a mix. The last RELEASES_TO_KEEP releases
+stay on the instance.
+
+Static sites need no build (see project_analysis.py): their build
+output is written here too, by write_site_bundle, with the same appspec
+and scripts buildspec.yml adds in post_build.
+
+Usage:
+    old = read_manifest(s3, bucket, deployment_id) or artifact_manifest(old_zip)
+    new = artifact_manifest(new_zip)
+    changed, deleted = diff_manifests(old['files'], new['files'])
+    write_delta_bundle(bundle_path, new_zip, changed, deleted, site, live, release_id)
+"""
+
+import hashlib
+import json
+import os
+import zipfile
+
+from botocore.exceptions import ClientError
+
+# ========================================
+# CONFIGURATION
+# ========================================
+RELEASES_ROOT = '/opt/deployfast/releases'
+INCOMING_ROOT = '/opt/deployfast/incoming'
+RELEASES_TO_KEEP = int(os.environ.get('RELEASES_TO_KEEP', 3))
+
+DEDICATED_SITE_NAME = 'site'  # SITE_NAME of dedicated instances (one site each)
+DEDICATED_LIVE_PATH = '/usr/share/nginx/html'
+SHARED_SITES_ROOT = '/var/www/sites'
+
+MANIFEST_VERSION = 1
+OUTPUT_DIRS = ['dist/', 'build/']  # Published instead of the whole artifact, first match wins
+
+
+def manifest_key(deployment_id):
+    return f"deployments/{deployment_id}/manifest.json"
+
+
+def release_bundle_key(deployment_id, release_id):
+    return f"deployments/{deployment_id}/releases/{release_id}.zip"
+
+
+def site_paths(deployment):
+    """(SITE_NAME, live symlink) of a deployment, as used by buildspec.yml"""
+    if deployment.get('hosting_mode') == 'shared':
+        return deployment['subdomain'], f"{SHARED_SITES_ROOT}/{deployment['subdomain']}"
+    return DEDICATED_SITE_NAME, DEDICATED_LIVE_PATH
+
+
+# ----------------------------------------
+# Manifests
+# ----------------------------------------
+
+def published_files(artifact):
+    """
+    {site path: zip member} of what a full deploy publishes from a build
+    artifact: dist/ or build/ if the build made one, else everything
+    (same rule as after_install.sh in buildspec.yml).
+    """
+    names = [n for n in artifact.namelist() if not n.endswith('/')]
+    root = ''
+    for output_dir in OUTPUT_DIRS:
+        if any(n.startswith(output_dir) for n in names):
+            root = output_dir
+            break
+    files = {}
+    for name in names:
+        if name.startswith(root):
+            path = name[len(root):]
+            if _safe_path(path):
+                files[path] = name
+    return files
+
+
+def artifact_manifest(zip_path, release_id=None):
+    """Manifest of the site a build artifact publishes"""
+    files = {}
+    with zipfile.ZipFile(zip_path) as artifact:
+        for path, member in published_files(artifact).items():
+            digest = hashlib.sha256()
+            with artifact.open(member) as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+            files[path] = digest.hexdigest()
+    return {'version': MANIFEST_VERSION, 'release_id': release_id, 'files': files}
+
+
+def diff_manifests(old_files, new_files):
+    """(changed or added paths, deleted paths), both sorted"""
+    changed = sorted(p for p, digest in new_files.items() if old_files.get(p) != digest)
+    deleted = sorted(p for p in old_files if p not in new_files)
+    return changed, deleted
+
+
+def read_manifest(s3, bucket, deployment_id):
+    """The live release's manifest, or None if none was stored yet"""
+    try:
+        response = s3.get_object(Bucket=bucket, Key=manifest_key(deployment_id))
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    manifest = json.loads(response['Body'].read())
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def write_manifest(s3, bucket, deployment_id, manifest):
+    s3.put_object(
+        Bucket=bucket,
+        Key=manifest_key(deployment_id),
+        Body=json.dumps(manifest, sort_keys=True).encode(),
+        ContentType='application/json'
+    )
+
+
+# ----------------------------------------
+# Delta bundle
+# ----------------------------------------
+
+def write_delta_bundle(bundle_path, artifact_path, changed, deleted, site_name, live_path, release_id):
+    """Write the CodeDeploy bundle that turns the live release into the new one"""
+    incoming = f"{INCOMING_ROOT}/{site_name}-delta"
+    release_env = (
+        f"SITE_NAME={site_name}\n"
+        f"LIVE={live_path}\n"
+        f"RELEASE={release_id}\n"
+        f"INCOMING={incoming}\n"
+        f"RELEASES={RELEASES_ROOT}/{site_name}\n"
+        f"KEEP={RELEASES_TO_KEEP}\n"
+    )
+
+    with zipfile.ZipFile(artifact_path) as artifact, \
+            zipfile.ZipFile(bundle_path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        members = published_files(artifact)
+        for path in changed:
+            with artifact.open(members[path]) as src, bundle.open(f"delta/files/{path}", 'w') as dst:
+                for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                    dst.write(chunk)
+        bundle.writestr('delta/deleted.txt', ''.join(f"{p}\n" for p in deleted))
+        bundle.writestr('appspec.yml', APPSPEC.format(incoming=incoming))
+        bundle.writestr('scripts/release.env', release_env)
+        for name, script in SCRIPTS.items():
+            info = zipfile.ZipInfo(f"scripts/{name}")
+            info.external_attr = 0o755 << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            bundle.writestr(info, script)
+
+
+def write_site_bundle(bundle_path, source_path, variables=None):
+    """
+    Write the build output of a site that needs no build: the source zip
+    plus the appspec and scripts of a full deploy, exactly as buildspec.yml
+    would have (variables: the build variables, HOSTING_MODE / SITE_NAME).
+
+    Returns the number of files from the source.
+    """
+    variables = variables or {}
+    hosting_mode = variables.get('HOSTING_MODE') or 'dedicated'
+    site_name = variables.get('SITE_NAME') or DEDICATED_SITE_NAME
+    generated = {
+        'appspec.yml': (SITE_APPSPEC.format(incoming=f"{INCOMING_ROOT}/{site_name}"), 0o644),
+        'scripts/site.env': (f"HOSTING_MODE={hosting_mode}\nSITE_NAME={site_name}\n", 0o644)
+    }
+    for name, script in SITE_SCRIPTS.items():
+        generated[f"scripts/{name}"] = (script, 0o755)
+
+    count = 0
+    with zipfile.ZipFile(source_path) as source, \
+            zipfile.ZipFile(bundle_path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+        for member in source.infolist():
+            if member.is_dir() or member.filename in generated:
+                continue
+            info = zipfile.ZipInfo(member.filename, member.date_time)
+            info.external_attr = member.external_attr
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with source.open(member) as src, bundle.open(info, 'w') as dst:
+                for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                    dst.write(chunk)
+            count += 1
+        for name, (content, mode) in generated.items():
+            info = zipfile.ZipInfo(name)
+            info.external_attr = mode << 16
+            info.compress_type = zipfile.ZIP_DEFLATED
+            bundle.writestr(info, content)
+    return count
+
+
+def _safe_path(path):
+    """No absolute paths, no .., no newlines (deleted.txt is one path per line)"""
+    parts = path.split('/')
+    return bool(path) and not path.startswith('/') and '..' not in parts and '\n' not in path
+
+
+APPSPEC = """version: 0.0
+os: linux
+files:
+  - source: delta
+    destination: {incoming}
+file_exists_behavior: OVERWRITE
+hooks:
+  BeforeInstall:
+    - location: scripts/before_install.sh
+      timeout: 120
+      runas: root
+  AfterInstall:
+    - location: scripts/apply_delta.sh
+      timeout: 300
+      runas: root
+  ApplicationStart:
+    - location: scripts/start_application.sh
+      timeout: 120
+      runas: root
+  ValidateService:
+    - location: scripts/validate_service.sh
+      timeout: 120
+      runas: root
+"""
+
+SCRIPTS = {
+    'before_install.sh': """#!/bin/bash
+set -e
+. "$(dirname "$0")/release.env"
+rm -rf "$INCOMING"
+# Older sites: revisions installed before release directories wrote
+# straight into the live directory, and the agent deletes those files
+# during Install. Move the plain directory out of their way first.
+if [ -d "$LIVE" ] && [ ! -L "$LIVE" ]; then
+  mkdir -p "$RELEASES"
+  mv "$LIVE" "$RELEASES/initial"
+fi
+""",
+    'apply_delta.sh': """#!/bin/bash
+set -euo pipefail
+. "$(dirname "$0")/release.env"
+mkdir -p "$RELEASES"
+
+# Older sites: before_install.sh moved the plain live directory into a release
+if [ -d "$LIVE" ] && [ ! -L "$LIVE" ]; then
+  mv "$LIVE" "$RELEASES/initial"
+fi
+if [ ! -e "$LIVE" ]; then
+  ln -sfn "$RELEASES/initial" "$LIVE"
+fi
+
+# New release = hard links to the live one (no copy of unchanged files)
+NEW="$RELEASES/$RELEASE"
+rm -rf "$NEW"
+cp -al "$(readlink -f "$LIVE")" "$NEW"
+
+# Changed files are renamed in, so the live release's inodes stay untouched
+if [ -d "$INCOMING/files" ]; then
+  cd "$INCOMING/files"
+  find . -type f -print0 | while IFS= read -r -d '' f; do
+    mkdir -p "$NEW/$(dirname "$f")"
+    mv -f "$f" "$NEW/$f"
+  done
+  cd /
+fi
+if [ -f "$INCOMING/deleted.txt" ]; then
+  while IFS= read -r f; do
+    [ -n "$f" ] && rm -f "$NEW/$f"
+  done < "$INCOMING/deleted.txt"
+fi
+chown -R nginx:nginx "$NEW"
+chmod -R 755 "$NEW"
+
+# Atomic swap
+ln -sfn "$NEW" "$LIVE.next"
+mv -Tf "$LIVE.next" "$LIVE"
+rm -rf "$INCOMING"
+
+# Keep the newest releases
+ls -1dt "$RELEASES"/*/ | tail -n +$((KEEP + 1)) | xargs -r rm -rf
+""",
+    'start_application.sh': """#!/bin/bash
+systemctl enable nginx
+if systemctl is-active --quiet nginx; then
+  nginx -t && systemctl reload nginx
+else
+  systemctl start nginx
+fi
+""",
+    'validate_service.sh': """#!/bin/bash
+systemctl is-active --quiet nginx && exit 0 || exit 1
+"""
+}
+
+# ----------------------------------------
+# Full deploy (post_build of buildspec.yml, keep both in sync)
+# ----------------------------------------
+
+SITE_APPSPEC = """version: 0.0
+os: linux
+files:
+  - source: /
+    destination: {incoming}
+file_exists_behavior: OVERWRITE
+hooks:
+  BeforeInstall:
+    - location: scripts/before_install.sh
+      timeout: 300
+      runas: root
+  AfterInstall:
+    - location: scripts/after_install.sh
+      timeout: 300
+      runas: root
+  ApplicationStart:
+    - location: scripts/start_application.sh
+      timeout: 300
+      runas: root
+  ValidateService:
+    - location: scripts/validate_service.sh
+      timeout: 300
+      runas: root
+"""
+
+SITE_SCRIPTS = {
+    'before_install.sh': """#!/bin/bash
+. "$(dirname "$0")/site.env"
+yum install -y nginx
+# Other sites and the live release keep serving: only clear staging
+rm -rf "/opt/deployfast/incoming/$SITE_NAME"
+# Older sites: revisions installed before release directories wrote
+# straight into the live directory, and the agent deletes those files
+# during Install. Move the plain directory out of their way first.
+if [ "$HOSTING_MODE" = "shared" ]; then
+  LIVE="/var/www/sites/$SITE_NAME"
+else
+  LIVE="/usr/share/nginx/html"
+fi
+if [ -d "$LIVE" ] && [ ! -L "$LIVE" ]; then
+  mkdir -p "/opt/deployfast/releases/$SITE_NAME"
+  mv "$LIVE" "/opt/deployfast/releases/$SITE_NAME/initial"
+fi
+""",
+    'after_install.sh': """#!/bin/bash
+set -e
+. "$(dirname "$0")/site.env"
+SRC="/opt/deployfast/incoming/$SITE_NAME"
+RELEASES="/opt/deployfast/releases/$SITE_NAME"
+if [ "$HOSTING_MODE" = "shared" ]; then
+  LIVE="/var/www/sites/$SITE_NAME"
+else
+  LIVE="/usr/share/nginx/html"
+fi
+OUT="$SRC"
+if [ -d "$SRC/build" ]; then OUT="$SRC/build"; fi
+if [ -d "$SRC/dist" ]; then OUT="$SRC/dist"; fi
+
+# Publish into a new release, swap the live symlink atomically
+NEW="$RELEASES/full-$(date +%Y%m%d%H%M%S)"
+mkdir -p "$NEW"
+cp -r "$OUT"/. "$NEW"/
+chown -R nginx:nginx "$NEW"
+chmod -R 755 "$NEW"
+mkdir -p "$(dirname "$LIVE")"
+if [ -e "$LIVE" ] && [ ! -L "$LIVE" ]; then rm -rf "$LIVE"; fi
+ln -sfn "$NEW" "$LIVE.next"
+mv -Tf "$LIVE.next" "$LIVE"
+ls -1dt "$RELEASES"/*/ | tail -n +4 | xargs -r rm -rf  # keep 3 releases
+
+if [ "$HOSTING_MODE" = "shared" ]; then
+  # Own server block ({subdomain}.anything) ...
+  cat > "/etc/nginx/conf.d/site-$SITE_NAME.conf" << CONF
+server {
+    listen 80;
+    server_name $SITE_NAME.*;
+    root $LIVE;
+    index index.html;
+    location / { try_files \\$uri \\$uri/ /index.html; }
+}
+CONF
+  # ... and http://{host}/{subdomain}/ on the default server
+  mkdir -p /etc/nginx/default.d
+  cat > "/etc/nginx/default.d/site-$SITE_NAME.conf" << CONF
+location /$SITE_NAME/ {
+    alias $LIVE/;
+    try_files \\$uri \\$uri/ /$SITE_NAME/index.html;
+}
+CONF
+fi
+""",
+    'start_application.sh': """#!/bin/bash
+systemctl enable nginx
+if systemctl is-active --quiet nginx; then
+  # Shared host: pick up the new site without dropping the others
+  nginx -t && systemctl reload nginx
+else
+  systemctl start nginx
+fi
+""",
+    'validate_service.sh': """#!/bin/bash
+systemctl is-active --quiet nginx && exit 0 || exit 1
+"""
+}
@@ -0,0 +1,241 @@
+"""
+CodeDeploy completion tracking for DeployFast (asynchronous deploy step).
+
+DEPLOY_MODE picks how the deploy step runs:
+- sync:       invoke the Lambda with RequestResponse. The worker waits
+              while the Lambda waits on CodeDeploy (the original flow)
+- codedeploy: no Lambda. We call CodeDeploy create_deployment ourselves
+              and track the deployment it returns
+
+In codedeploy mode the deploy step holds no worker: the tracker
+resolves a Future and the pipeline finishes in its callback.
+
+One background thread polls every CodeDeploy deployment in flight with
+batch_get_deployments (25 IDs per call). EventBridge "CodeDeploy
+Deployment State-change Notification" events (POST /webhooks/codedeploy)
+wake it up right away.
+
+Each deployment gets a deployment group of its own: DELETE and the
+reaper remove it with the deployment (delete_deployment_group).
+
+    future = deploy_tracker.track(deployment_id, codedeploy_id)
+    future.add_done_callback(...)   # {'succeeded', 'status', 'error', 'codedeploy_id'}
+
+For local testing, point the clients at a stand-in with
+AWS_ENDPOINT_URL_LAMBDA / AWS_ENDPOINT_URL_CODEDEPLOY, or pass a fake
+codedeploy client to DeployTracker.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+# ========================================
+# CONFIGURATION
+# ========================================
+DEPLOY_MODE = os.environ.get('DEPLOY_MODE', 'sync')  # sync | codedeploy
+DEPLOY_MODES = ['sync', 'codedeploy']
+
+DEPLOY_TIMEOUT = float(os.environ.get('DEPLOY_TIMEOUT', 900))            # Give up on a deploy after this
+DEPLOY_POLL_INTERVAL = float(os.environ.get('DEPLOY_POLL_INTERVAL', 10))
+
+# DEPLOY_MODE=codedeploy
+CODEDEPLOY_APPLICATION = os.environ.get('CODEDEPLOY_APPLICATION', 'DeployFast')
+CODEDEPLOY_SERVICE_ROLE_ARN = os.environ.get('CODEDEPLOY_SERVICE_ROLE_ARN', '')
+CODEDEPLOY_CONFIG_NAME = os.environ.get('CODEDEPLOY_CONFIG_NAME', 'CodeDeployDefault.AllAtOnce')
+
+BATCH_SIZE = 25  # batch_get_deployments accepts up to 25 IDs
+
+SUCCEEDED = 'Succeeded'
+FAILED_STATUSES = ['Failed', 'Stopped']
+
+
+def check_deploy_mode(mode=DEPLOY_MODE, service_role_arn=CODEDEPLOY_SERVICE_ROLE_ARN):
+    """Fail at startup, not on every deployment, when the deploy config is unusable"""
+    if mode not in DEPLOY_MODES:
+        raise ValueError(f"Unknown DEPLOY_MODE: {mode} (one of: {', '.join(DEPLOY_MODES)})")
+    if mode == 'codedeploy' and not service_role_arn:
+        raise ValueError("DEPLOY_MODE=codedeploy needs CODEDEPLOY_SERVICE_ROLE_ARN (the role CodeDeploy assumes)")
+
+
+def deployment_group_name(deployment_id):
+    return f"DeployFast-{deployment_id}"
+
+
+def start_codedeploy(codedeploy, deployment_id, bucket, key):
+    """
+    Deploy s3://bucket/key to the instances tagged DeploymentId={deployment_id}.
+
+    Each deployment gets its own deployment group (filtering on that
+    tag), so deployments never change each other's targets.
+    Returns the CodeDeploy deployment ID.
+    """
+    group = deployment_group_name(deployment_id)
+    try:
+        codedeploy.create_deployment_group(
+            applicationName=CODEDEPLOY_APPLICATION,
+            deploymentGroupName=group,
+            serviceRoleArn=CODEDEPLOY_SERVICE_ROLE_ARN,
+            deploymentConfigName=CODEDEPLOY_CONFIG_NAME,
+            ec2TagFilters=[{'Key': 'DeploymentId', 'Value': deployment_id, 'Type': 'KEY_AND_VALUE'}]
+        )
+    except codedeploy.exceptions.DeploymentGroupAlreadyExistsException:
+        pass  # redeploy of the same deployment
+
+    response = codedeploy.create_deployment(
+        applicationName=CODEDEPLOY_APPLICATION,
+        deploymentGroupName=group,
+        revision={
+            'revisionType': 'S3',
+            's3Location': {'bucket': bucket, 'key': key, 'bundleType': 'zip'}
+        },
+        description=deployment_id
+    )
+    return response['deploymentId']
+
+
+def delete_deployment_group(codedeploy, deployment_id):
+    codedeploy.delete_deployment_group(
+        applicationName=CODEDEPLOY_APPLICATION,
+        deploymentGroupName=deployment_group_name(deployment_id)
+    )
+
+
+class DeployTracker:
+    """
+    One poller for every in-flight CodeDeploy deployment in this process.
+    Entries are keyed by OUR deployment ID.
+    """
+
+    def __init__(self, codedeploy, interval=DEPLOY_POLL_INTERVAL, timeout=DEPLOY_TIMEOUT,
+                 clock=time.monotonic):
+        self.codedeploy = codedeploy
+        self.interval = interval
+        self.timeout = timeout
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._deploys = {}  # deployment_id → {'future', 'codedeploy_id', 'deadline'}
+        self.api_calls = 0
+
+    def track(self, deployment_id, codedeploy_id=None, timeout=None):
+        """Returns a Future resolving to {'succeeded', 'status', 'error', 'codedeploy_id'}"""
+        with self._lock:
+            entry = self._deploys.get(deployment_id)
+            if entry is None:
+                entry = {
+                    'future': Future(),
+                    'codedeploy_id': codedeploy_id,
+                    'deadline': self.clock() + (timeout or self.timeout)
+                }
+                self._deploys[deployment_id] = entry
+            elif codedeploy_id:
+                entry['codedeploy_id'] = codedeploy_id
+            self._ensure_thread()
+        self._wake.set()
+        return entry['future']
+
+    def complete(self, deployment_id, succeeded, error=None, status=None):
+        """Final result of a deployment"""
+        with self._lock:
+            entry = self._deploys.pop(deployment_id, None)
+        if entry is None:
+            return False
+        self._resolve(entry, succeeded, status or (SUCCEEDED if succeeded else 'Failed'), error)
+        return True
+
+    def notify(self, codedeploy_id, status=None):
+        """A state-change event was pushed: re-read that deployment now"""
+        with self._lock:
+            known = any(e['codedeploy_id'] == codedeploy_id for e in self._deploys.values())
+        if known:
+            print(f"[deploy-tracker] CodeDeploy event for {codedeploy_id}: {status or 'state change'}")
+            self._wake.set()
+        return known
+
+    def untrack(self, deployment_id):
+        with self._lock:
+            entry = self._deploys.pop(deployment_id, None)
+        if entry and not entry['future'].done():
+            entry['future'].cancel()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._deploys)
+
+    # ----------------------------------------
+    # Background polling
+    # ----------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name='deploy-tracker', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                empty = not self._deploys
+
+            if empty:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[deploy-tracker] batch_get_deployments failed: {str(e)}")
+
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def poll(self):
+        """One tick: check every known CodeDeploy deployment, expire overdue ones"""
+        with self._lock:
+            by_codedeploy_id = {
+                e['codedeploy_id']: deployment_id
+                for deployment_id, e in self._deploys.items() if e['codedeploy_id']
+            }
+
+        codedeploy_ids = list(by_codedeploy_id)
+        for i in range(0, len(codedeploy_ids), BATCH_SIZE):
+            response = self.codedeploy.batch_get_deployments(deploymentIds=codedeploy_ids[i:i + BATCH_SIZE])
+            self.api_calls += 1
+            for info in response.get('deploymentsInfo', []):
+                status = info.get('status')
+                if status == SUCCEEDED or status in FAILED_STATUSES:
+                    error = info.get('errorInformation', {}).get('message')
+                    self.complete(by_codedeploy_id[info['deploymentId']], status == SUCCEEDED, error, status)
+
+        now = self.clock()
+        with self._lock:
+            overdue = [d for d, e in self._deploys.items() if now >= e['deadline']]
+        for deployment_id in overdue:
+            self.complete(deployment_id, False, f"No deploy result after {self.timeout:.0f}s", 'TimedOut')
+
+    @staticmethod
+    def _resolve(entry, succeeded, status, error):
+        if not entry['future'].done():
+            entry['future'].set_result({
+                'succeeded': succeeded,
+                'status': status,
+                'error': error,
+                'codedeploy_id': entry['codedeploy_id']
+            })
+
+
+def handle_deploy_event(tracker, event):
+    """
+    Forward an EventBridge "CodeDeploy Deployment State-change Notification":
+        {"detail": {"deploymentId": "d-...", "state": "SUCCESS"}}
+
+    Returns True if the event matched a deployment tracked here.
+    """
+    detail = event['detail']
+    return tracker.notify(detail['deploymentId'], detail.get('state'))
@@ -0,0 +1,122 @@
+"""
+In-process pub/sub for live deployment progress.
+
+The pipeline publishes events (step changes, status changes, CodeBuild
+phases, log lines) for a deployment. Every watcher of that deployment
+(one per open /deployments/<id>/events stream) gets its own small queue.
+
+- publish() is O(number of watchers of that deployment), no I/O
+- Recent events are kept per deployment, so a watcher that connects
+  late (or reconnects with Last-Event-ID) first gets what it missed
+- A slow watcher never blocks the pipeline: its queue is bounded and
+  events beyond that are dropped for it
+- A new run of a deployment (retry, redeploy) starts a new history:
+  reset() drops the old one, whose 'end' would close new streams
+
+Events live in memory of the process running the deployment. Under
+several gunicorn workers, a stream only sees deployments running in the
+worker that serves it; the snapshot sent at connect time comes from the
+shared store, so the stream still starts from the right state, and the
+stream re-reads the store every KEEPALIVE_SECONDS without events, so it
+still reports status changes and ends when the deployment finishes.
+"""
+
+import itertools
+import queue
+import threading
+from collections import OrderedDict, deque
+
+# ========================================
+# CONFIGURATION
+# ========================================
+HISTORY_PER_DEPLOYMENT = 500  # events kept for late/reconnecting watchers
+MAX_TRACKED_DEPLOYMENTS = 200  # deployments with history kept in memory
+WATCHER_QUEUE_SIZE = 1000
+KEEPALIVE_SECONDS = 15  # quiet stream: keep-alive comment + re-read of the store
+
+
+class Subscription:
+    """One watcher of one deployment"""
+
+    def __init__(self, deployment_id):
+        self.deployment_id = deployment_id
+        self.queue = queue.Queue(maxsize=WATCHER_QUEUE_SIZE)
+
+    def get(self, timeout=None):
+        """Next event, or None after timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """
+    Usage:
+        bus.publish(deployment_id, 'step', {'step': 'upload', 'status': 'done'})
+
+        sub = bus.subscribe(deployment_id, last_event_id=None)
+        bus.reset(deployment_id)      # before a retry / redeploy starts
+        event = sub.get(timeout=15)   # {'id': 12, 'type': 'step', 'data': {...}}
+        bus.unsubscribe(sub)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._history = OrderedDict()  # deployment_id → deque of events
+        self._watchers = {}  # deployment_id → set of Subscription
+
+    def publish(self, deployment_id, event_type, data):
+        with self._lock:
+            event = {'id': next(self._ids), 'type': event_type, 'data': data}
+
+            history = self._history.get(deployment_id)
+            if history is None:
+                history = deque(maxlen=HISTORY_PER_DEPLOYMENT)
+                self._history[deployment_id] = history
+                while len(self._history) > MAX_TRACKED_DEPLOYMENTS:
+                    self._history.popitem(last=False)
+            else:
+                self._history.move_to_end(deployment_id)
+            history.append(event)
+
+            watchers = list(self._watchers.get(deployment_id, ()))
+
+        for sub in watchers:
+            try:
+                sub.queue.put_nowait(event)
+            except queue.Full:
+                pass  # slow watcher, it will catch up from the snapshot on reconnect
+        return event
+
+    def subscribe(self, deployment_id, last_event_id=None):
+        """
+        Watch a deployment. Events after last_event_id that are still in
+        history are replayed first; without last_event_id, the whole
+        history is replayed.
+        """
+        sub = Subscription(deployment_id)
+        with self._lock:
+            for event in self._history.get(deployment_id, ()):
+                if last_event_id is None or event['id'] > last_event_id:
+                    sub.queue.put_nowait(event)
+            self._watchers.setdefault(deployment_id, set()).add(sub)
+        return sub
+
+    def reset(self, deployment_id):
+        """A new run of the deployment starts: forget the events of the previous one"""
+        with self._lock:
+            self._history.pop(deployment_id, None)
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            watchers = self._watchers.get(sub.deployment_id)
+            if watchers:
+                watchers.discard(sub)
+                if not watchers:
+                    del self._watchers[sub.deployment_id]
+
+    def watcher_count(self):
+        with self._lock:
+            return sum(len(w) for w in self._watchers.values())
@@ -0,0 +1,222 @@
+"""
+Background job engine for DeployFast.
+
+A deployment takes minutes (EC2 boot, CodeBuild, CodeDeploy), so it must
+never run inside a Flask request. Jobs are pushed onto a bounded queue and
+picked up by a fixed pool of worker threads.
+
+- max_workers: how many deployments run at the same time
+- max_queue:   how many deployments may wait for a free worker
+
+When the queue is full, submit() raises QueueFullError so the caller can
+reject the request right away instead of piling up work.
+
+Fair queueing: jobs submitted with a client key wait in one line per
+client, and workers take from the lines round robin. A client with 20
+deployments waiting delays everybody else by one job per round, not by
+20. max_per_client caps how many jobs a single client may have waiting.
+
+A batch (submit_batch) is admitted as one unit: all of its jobs or
+none. Every job of the batch counts against max_queue and
+max_per_client, so a /deploy/batch gets no more room than the same
+deployments sent one by one.
+"""
+
+import heapq
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+
+JOB_SECONDS_ESTIMATE = 180  # Expected time on a worker until real jobs have been timed
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue (or a client's share of it) has no room left."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobQueue:
+    """
+    Bounded queue + bounded worker pool.
+
+    Workers are started lazily on the first submit(). This matters under
+    gunicorn: threads started at import time in the master process do not
+    survive the fork into the worker processes.
+    """
+
+    def __init__(self, max_workers=4, max_queue=20, name='jobs', max_per_client=0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._lines = OrderedDict()  # client → deque of jobs, served round robin
+        self._queued = 0
+        self._workers = []
+        self._active = {}  # job ID → start time
+        self._job_seconds = JOB_SECONDS_ESTIMATE  # moving average of time on a worker
+
+    def submit(self, job_id, func, *args, client=None, **kwargs):
+        """
+        Queue func(*args, **kwargs) to run on a worker thread, in
+        client's line (jobs without a client share one line).
+
+        Raises QueueFullError if max_queue jobs are already waiting, or
+        client already has max_per_client waiting.
+        Returns the job's place: {'position', 'estimated_start_seconds'}.
+        """
+        return self.submit_batch([(job_id, func, args, kwargs)], client=client)[0]
+
+    def submit_batch(self, jobs, client=None):
+        """
+        Queue several (job_id, func, args, kwargs) at once, all or none.
+
+        The batch needs a free place for every job, in the queue and in
+        client's share. Raises QueueFullError otherwise, with nothing
+        queued. Returns one place per job.
+        """
+        self._ensure_workers()
+        with self._lock:
+            self._check_room(client, len(jobs))
+            line = self._lines.get(client)
+            if line is None:
+                line = self._lines[client] = deque()
+            for job in jobs:
+                line.append(tuple(job))
+            self._queued += len(jobs)
+            places = [self._place(job[0]) for job in jobs]
+            self._ready.notify(len(jobs))
+        for job, place in zip(jobs, places):
+            print(f"[{job[0]}] Queued ({place['position'] + 1} in line, ~{place['estimated_start_seconds']}s)")
+        return places
+
+    def check_room(self, client=None, n=1):
+        """Raise QueueFullError if n jobs of client would be rejected right now"""
+        with self._lock:
+            self._check_room(client, n)
+
+    def max_batch(self):
+        """Most jobs one client can ever have waiting at once"""
+        if self.max_per_client:
+            return min(self.max_queue, self.max_per_client)
+        return self.max_queue
+
+    def _check_room(self, client, n=1):
+        """(lock held)"""
+        if self._queued + n > self.max_queue:
+            raise QueueFullError(
+                f"Deployment queue is full ({self._queued} of {self.max_queue} waiting)",
+                retry_after=self._slot_seconds()
+            )
+        line = self._lines.get(client)
+        waiting = len(line) if line else 0
+        if self.max_per_client and waiting + n > self.max_per_client:
+            raise QueueFullError(
+                f"You already have {waiting} deployments waiting (max {self.max_per_client})",
+                retry_after=self._slot_seconds()
+            )
+
+    def estimate(self, job_id):
+        """{'position', 'estimated_start_seconds'} of a waiting job, or None"""
+        with self._lock:
+            return self._place(job_id)
+
+    def stats(self):
+        """Current queue depth and worker usage"""
+        with self._lock:
+            return {
+                'queued': self._queued,
+                'active': len(self._active),
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'max_per_client': self.max_per_client,
+                'clients_waiting': len(self._lines),
+                'job_seconds': round(self._job_seconds, 1)
+            }
+
+    def _place(self, job_id):
+        """Where job_id is in the round robin order (lock held)"""
+        order = 0
+        depth = 0
+        lines = list(self._lines.values())
+        while True:
+            more = False
+            for line in lines:
+                if depth < len(line):
+                    more = True
+                    if line[depth][0] == job_id:
+                        return {
+                            'position': order,
+                            'estimated_start_seconds': self._start_seconds(order)
+                        }
+                    order += 1
+            if not more:
+                return None
+            depth += 1
+
+    def _free_at(self):
+        """Seconds until each worker is free: running jobs take about _job_seconds (lock held)"""
+        now = time.monotonic()
+        busy = [max(self._job_seconds - (now - started), 0) for started in self._active.values()]
+        return sorted(busy + [0] * (self.max_workers - len(busy)))
+
+    def _start_seconds(self, position):
+        """Hand the jobs ahead to the first free worker, one by one"""
+        workers = self._free_at()
+        for _ in range(position):
+            heapq.heapreplace(workers, workers[0] + self._job_seconds)
+        return round(workers[0])
+
+    def _slot_seconds(self):
+        """Roughly how long until the next worker is free (lock held)"""
+        return max(round(self._free_at()[0]), 1)
+
+    def _next_job(self):
+        """Round robin: first job of the first line, that line goes to the back"""
+        with self._lock:
+            while not self._queued:
+                self._ready.wait()
+            client, line = next(iter(self._lines.items()))
+            job = line.popleft()
+            del self._lines[client]
+            if line:
+                self._lines[client] = line
+            self._queued -= 1
+            self._active[job[0]] = time.monotonic()
+            return job
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.max_workers):
+                worker = threading.Thread(
+                    target=self._run_worker,
+                    name=f"{self.name}-worker-{i}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+    def _run_worker(self):
+        while True:
+            job_id, func, args, kwargs = self._next_job()
+            started = time.monotonic()
+            try:
+                func(*args, **kwargs)
+            except Exception as e:
+                # The job is responsible for recording its own failure,
+                # this only keeps the worker alive.
+                print(f"[{job_id}] Job crashed: {str(e)}")
+                traceback.print_exc()
+            finally:
+                seconds = time.monotonic() - started
+                with self._lock:
+                    self._active.pop(job_id, None)
+                    self._job_seconds = 0.8 * self._job_seconds + 0.2 * seconds
@@ -0,0 +1,325 @@
+"""
+Pipeline metrics for DeployFast, served at /metrics (Prometheus text format).
+
+What is measured:
+- every pipeline function (create_ec2_instance, upload_to_s3, ...):
+  a duration histogram and a call counter by outcome
+  (ok / failed when it returned False / error when it raised)
+- finer spans inside a step (git checkout, zip + S3 upload, ...)
+- every AWS API call, by service and operation, plus errors by code
+  (a botocore "after-call" hook, see aws_clients.py)
+- CodeBuild phase durations (QUEUED, PROVISIONING, BUILD, ...) from
+  the build returned by batch_get_builds
+
+Anything timed for a deployment is also collected per deployment
+(take_timings), so the pipeline can store a timing breakdown on the
+deployment record.
+
+No client library needed: the few metric types we use are below.
+"""
+
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# ========================================
+# CONFIGURATION
+# ========================================
+STEP_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 900, 1800)
+API_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MAX_TRACKED_DEPLOYMENTS = 500  # deployments with timings not yet taken
+
+
+def _label_text(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for n, v in zip(names, values)
+    )
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, label_values)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=STEP_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._lock = threading.Lock()
+        self._series = {}  # label values → [bucket counts, sum, count]
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[label_values] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            return series[2] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _label_text(self.labels + ('le',), label_values + (_number(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _label_text(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {_number(round(total, 6))}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read at scrape time: func() returns a number or {label value: number}"""
+
+    def __init__(self, name, help_text, func, label=None):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        self.label = label
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.func()
+        except Exception:
+            return lines  # a broken gauge must not break the whole scrape
+        if isinstance(value, dict):
+            for label_value, v in sorted(value.items()):
+                lines.append(f"{self.name}{_label_text((self.label,), (label_value,))} {_number(v)}")
+        else:
+            lines.append(f"{self.name} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+
+    def add(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+step_seconds = registry.add(Histogram(
+    'deployfast_step_duration_seconds', 'Duration of pipeline functions',
+    labels=('step', 'outcome')
+))
+step_calls = registry.add(Counter(
+    'deployfast_step_calls_total', 'Pipeline function calls by outcome (ok, failed, error)',
+    labels=('step', 'outcome')
+))
+span_seconds = registry.add(Histogram(
+    'deployfast_span_duration_seconds', 'Duration of spans inside pipeline steps',
+    labels=('span',)
+))
+codebuild_phase_seconds = registry.add(Histogram(
+    'deployfast_codebuild_phase_duration_seconds', 'CodeBuild phase durations',
+    labels=('phase',)
+))
+aws_calls = registry.add(Counter(
+    'deployfast_aws_api_calls_total', 'AWS API calls',
+    labels=('service', 'operation')
+))
+aws_errors = registry.add(Counter(
+    'deployfast_aws_api_errors_total', 'AWS API calls that returned an error',
+    labels=('service', 'operation', 'code')
+))
+aws_call_seconds = registry.add(Histogram(
+    'deployfast_aws_api_call_duration_seconds', 'AWS API call latency (including retries)',
+    labels=('service', 'operation'), buckets=API_BUCKETS
+))
+deployments_finished = registry.add(Counter(
+    'deployfast_deployments_total', 'Finished deployments by final status',
+    labels=('status',)
+))
+redeploys_finished = registry.add(Counter(
+    'deployfast_redeploys_total', 'Finished incremental redeploys by outcome (live, unchanged, failed)',
+    labels=('outcome',)
+))
+
+# ----------------------------------------
+# Per-deployment timings
+# ----------------------------------------
+
+_timings_lock = threading.Lock()
+_timings = OrderedDict()  # deployment_id → {name: seconds}
+
+
+def add_timing(deployment_id, name, seconds):
+    with _timings_lock:
+        timings = _timings.get(deployment_id)
+        if timings is None:
+            timings = _timings[deployment_id] = {}
+            while len(_timings) > MAX_TRACKED_DEPLOYMENTS:
+                _timings.popitem(last=False)
+        timings[name] = round(timings.get(name, 0) + seconds, 3)
+
+
+def take_timings(deployment_id):
+    """Timings collected for a deployment (and forget them)"""
+    with _timings_lock:
+        return _timings.pop(deployment_id, {})
+
+
+def instrument(step):
+    """
+    Decorator for pipeline functions.
+
+    Records duration + outcome. If the function has a deployment_id
+    argument, the duration is also added to that deployment's timings.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                deployment_id = signature.bind(*args, **kwargs).arguments.get('deployment_id')
+            except TypeError:
+                deployment_id = None
+
+            outcome = 'error'
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'failed' if result is False else 'ok'
+                return result
+            finally:
+                seconds = time.perf_counter() - start
+                step_seconds.observe(seconds, step, outcome)
+                step_calls.inc(step, outcome)
+                if deployment_id:
+                    add_timing(deployment_id, step, seconds)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def span(deployment_id, name):
+    """Time a piece of a step: with span(deployment_id, 'checkout'): ..."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(deployment_id, name, time.perf_counter() - start)
+
+
+def record_span(deployment_id, name, seconds):
+    """Same as span(), for a duration measured by the caller"""
+    span_seconds.observe(seconds, name)
+    add_timing(deployment_id, name, seconds)
+
+
+def record_codebuild_phases(build):
+    """
+    Observe the phase durations of a finished build (from batch_get_builds).
+    Returns {phase: seconds} for the deployment record.
+    """
+    phases = {}
+    for phase in build.get('phases', []):
+        seconds = phase.get('durationInSeconds')
+        if seconds is None:
+            continue
+        phases[phase['phaseType']] = seconds
+        codebuild_phase_seconds.observe(seconds, phase['phaseType'])
+    return phases
+
+
+# ----------------------------------------
+# AWS API calls (botocore events)
+# ----------------------------------------
+
+_call_starts = threading.local()
+
+
+def _operation(event_name):
+    """('s3', 'PutObject') from 'after-call.s3.PutObject'"""
+    _, service, operation = event_name.split('.', 2)
+    return service, operation
+
+
+def _before_call(event_name, **kwargs):
+    _call_starts.__dict__[event_name.split('.', 1)[1]] = time.perf_counter()
+
+
+def _after_call(event_name, http_response, parsed, **kwargs):
+    service, operation = _operation(event_name)
+    aws_calls.inc(service, operation)
+    start = _call_starts.__dict__.pop(f"{service}.{operation}", None)
+    if start is not None:
+        aws_call_seconds.observe(time.perf_counter() - start, service, operation)
+    if http_response is not None and http_response.status_code >= 300:
+        code = (parsed or {}).get('Error', {}).get('Code') or str(http_response.status_code)
+        aws_errors.inc(service, operation, code)
+
+
+def _after_call_error(event_name, exception, **kwargs):
+    # Connection errors, timeouts... (no HTTP response at all)
+    service, operation = _operation(event_name)
+    aws_calls.inc(service, operation)
+    _call_starts.__dict__.pop(f"{service}.{operation}", None)
+    aws_errors.inc(service, operation, type(exception).__name__)
+
+
+# Registered on every boto3 session by aws_clients.py
+BOTOCORE_HANDLERS = [
+    ('before-call', _before_call),
+    ('after-call', _after_call),
+    ('after-call-error', _after_call_error)
+]
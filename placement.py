@@ -0,0 +1,328 @@
+"""
+Multi-tenant hosting for DeployFast: bin-packing sites onto shared hosts.
+
+In "dedicated" mode every deployment gets its own EC2 instance. In
+"shared" mode small sites are packed onto shared hosts instead. Each
+site lives in /var/www/sites/{subdomain} with its own nginx server block
+(and a /{subdomain}/ path on the host's default server).
+
+The scheduler decides where a site goes:
+- Every host has a capacity: site count, disk and memory
+- A new site goes to the host with the LEAST room left that still fits
+  (best fit), so hosts fill up before new ones are launched
+- If nothing fits, a new host is reserved. Other sites can be placed on
+  it while it is still booting; they wait for the same boot.
+
+Hosts are tagged DeploymentId=host-xxxx at launch. Before each CodeDeploy
+run we retag the host with the deployment's ID, because that is the tag
+the Lambda targets. That is why deploys to one host are serialized
+(deploy_lock).
+
+State is rebuilt from the deployment store on startup, because every
+site records its host_id, instance and IP. A host that was still booting
+at the restart has no instance recorded yet and nothing in this process
+will ever finish its boot, so it is dropped: its sites are placed again
+when their pipelines resume, and the reaper terminates the instance
+(tagged DeploymentId=host-xxxx, no record).
+
+Several processes share hosts safely through slot claims: a host has
+as many slots as sites fit on it, and a site takes one with a
+conditional write in the deployment store (claim_key on
+"host-slot:{host_id}:{n}", the same claim the warm pool uses). Another
+worker's scheduler may not know every site on a host, but it can never
+claim a slot that is taken, so no host is packed past its capacity. A
+host whose slots are all taken elsewhere is treated as full here.
+Hosts launched by another worker after startup are not placed on by
+this one (it launches its own): fewer sites per host, never too many.
+"""
+
+import os
+import secrets
+import threading
+from concurrent.futures import Future
+
+# ========================================
+# CONFIGURATION
+# ========================================
+HOSTING_MODE = os.environ.get('HOSTING_MODE', 'dedicated')  # dedicated | shared | s3 (see static_hosting.py)
+
+SHARED_HOST_MAX_SITES = int(os.environ.get('SHARED_HOST_MAX_SITES', 20))
+SHARED_HOST_DISK_MB = int(os.environ.get('SHARED_HOST_DISK_MB', 4096))
+SHARED_HOST_MEMORY_MB = int(os.environ.get('SHARED_HOST_MEMORY_MB', 768))
+
+SITE_DISK_MB = int(os.environ.get('SITE_DISK_MB', 50))       # Estimated per static site
+SITE_MEMORY_MB = int(os.environ.get('SITE_MEMORY_MB', 8))    # nginx server block + caches
+
+SITES_DOMAIN = os.environ.get('SITES_DOMAIN', '')  # e.g. apps.example.com → http://{subdomain}.apps.example.com
+
+HOSTING_MODES = ['dedicated', 'shared', 's3']
+
+SLOT_CLAIM = 'placement'         # fingerprint of slot claims in the store
+SLOT_TTL = 10 * 365 * 24 * 3600  # a slot is held until its site is released
+
+
+def slot_key(host_id, slot):
+    return f"host-slot:{host_id}:{slot}"
+
+
+class Host:
+    """One shared EC2 host and the sites placed on it"""
+
+    def __init__(self, host_id):
+        self.host_id = host_id
+        self.sites = {}  # deployment_id → {'disk_mb', 'memory_mb', 'slot'}
+        self.full = False  # every slot is taken (some by other workers)
+        self.ready = Future()  # resolves to {'instance_id', 'public_ip'}
+        self.deploy_lock = threading.Lock()
+
+    @property
+    def disk_mb(self):
+        return sum(s['disk_mb'] for s in self.sites.values())
+
+    @property
+    def memory_mb(self):
+        return sum(s['memory_mb'] for s in self.sites.values())
+
+    def to_dict(self):
+        info = self.ready.result() if self.ready.done() and not self.ready.exception() else {}
+        return {
+            'host_id': self.host_id,
+            'instance_id': info.get('instance_id'),
+            'booting': not self.ready.done(),
+            'sites': len(self.sites),
+            'disk_mb': self.disk_mb,
+            'memory_mb': self.memory_mb
+        }
+
+
+class HostScheduler:
+    """
+    Usage:
+        host, is_new = scheduler.place(deployment_id)
+        if is_new:
+            ... launch EC2 tagged host.host_id ...
+            scheduler.host_ready(host.host_id, {'instance_id': ..., 'public_ip': ...})
+        info = host.ready.result()
+
+        with scheduler.deploy_lock(host.host_id):
+            ... retag + CodeDeploy ...
+
+        scheduler.release(deployment_id)   # on delete / failure
+
+    With a store, every site holds a slot claim on its host (see above).
+    """
+
+    def __init__(self, max_sites=SHARED_HOST_MAX_SITES, disk_mb=SHARED_HOST_DISK_MB,
+                 memory_mb=SHARED_HOST_MEMORY_MB, store=None):
+        self.max_sites = max_sites
+        self.disk_mb = disk_mb
+        self.memory_mb = memory_mb
+        self.store = store  # slot claims shared with other workers (None: this process only)
+
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._site_hosts = {}  # deployment_id → host_id
+        self.loaded = False
+
+    def load(self, deployments):
+        """
+        Rebuild placement from stored shared-mode deployments.
+
+        Hosts without a recorded instance were booting when the previous
+        process stopped: they are failed right away (never placed on, and
+        nobody waits on their ready Future). Returns their host IDs.
+        """
+        with self._lock:
+            for d in deployments:
+                host_id = d.get('host_id')
+                if not host_id or d['deployment_id'] in self._site_hosts:
+                    continue
+                host = self._hosts.get(host_id)
+                if host is None:
+                    host = Host(host_id)
+                    self._hosts[host_id] = host
+                if d.get('ec2_instance_id') and not host.ready.done():
+                    host.ready.set_result({
+                        'instance_id': d['ec2_instance_id'],
+                        'public_ip': d.get('ec2_public_ip')
+                    })
+                host.sites[d['deployment_id']] = {
+                    'disk_mb': d.get('site_disk_mb', SITE_DISK_MB),
+                    'memory_mb': d.get('site_memory_mb', SITE_MEMORY_MB),
+                    'slot': d.get('host_slot')
+                }
+                self._site_hosts[d['deployment_id']] = host_id
+
+            lost = [h for h in self._hosts.values() if not h.ready.done()]
+            for host in lost:
+                del self._hosts[host.host_id]
+                for deployment_id in host.sites:
+                    self._site_hosts.pop(deployment_id, None)
+            self.loaded = True
+
+        for host in lost:
+            self._release_slots(host.host_id, host.sites)
+            host.ready.set_exception(Exception(f"Shared host {host.host_id} was still booting at restart"))
+        return [h.host_id for h in lost]
+
+    def place(self, deployment_id, disk_mb=SITE_DISK_MB, memory_mb=SITE_MEMORY_MB):
+        """
+        Pick a host for a site (best fit), or reserve a new one.
+
+        Returns (host, is_new). When is_new is True the caller must launch
+        the instance and call host_ready() / host_failed().
+        The site's slot on the host is in host.sites[deployment_id]['slot'].
+        """
+        with self._lock:
+            candidates = [
+                host for host in self._hosts.values()
+                if not (host.ready.done() and host.ready.exception())
+                and self._fits(host, disk_mb, memory_mb)
+            ]
+            candidates.sort(key=self._room)  # best fit first
+
+            best, slot = None, None
+            for host in candidates:
+                slot = self._claim_slot(host, deployment_id, disk_mb, memory_mb)
+                if slot is not None:
+                    best = host
+                    break
+
+            is_new = best is None
+            if is_new:
+                best = Host(f"host-{secrets.token_hex(4)}")
+                self._hosts[best.host_id] = best
+                slot = self._claim_slot(best, deployment_id, disk_mb, memory_mb)
+
+            best.sites[deployment_id] = {'disk_mb': disk_mb, 'memory_mb': memory_mb, 'slot': slot}
+            self._site_hosts[deployment_id] = best.host_id
+            return best, is_new
+
+    def host_ready(self, host_id, instance_info):
+        """
+        The host finished booting. Returns False if every site on it was
+        released in the meantime (the caller should terminate it).
+        """
+        with self._lock:
+            host = self._hosts.get(host_id)
+        if host is None:
+            return False
+        host.ready.set_result(instance_info)
+        return True
+
+    def host_failed(self, host_id, error):
+        """The host never came up: every site waiting on it fails too"""
+        with self._lock:
+            host = self._hosts.pop(host_id, None)
+            if host is None:
+                return
+            for deployment_id in host.sites:
+                self._site_hosts.pop(deployment_id, None)
+        self._release_slots(host.host_id, host.sites)
+        host.ready.set_exception(error)
+
+    def deploy_lock(self, host_id):
+        """Held while a CodeDeploy run targets this host"""
+        host = self._hosts.get(host_id)
+        return host.deploy_lock if host else threading.Lock()
+
+    def release(self, deployment_id, host_id=None, slot=None):
+        """
+        Remove a site from its host.
+
+        Returns (host, now_empty); host is None if the site was not placed.
+        An empty host is forgotten, the caller decides whether to terminate it.
+        host_id / slot: where the record says the site is, so a site placed
+        by another worker still gives its slot back.
+        """
+        with self._lock:
+            host = self._hosts.get(self._site_hosts.pop(deployment_id, None))
+            if host is not None:
+                site = host.sites.pop(deployment_id, None) or {}
+                host_id, slot = host.host_id, site.get('slot')
+                host.full = False
+                empty = not host.sites
+                if empty:
+                    del self._hosts[host_id]
+        if host_id and slot is not None:
+            self._release_slots(host_id, {deployment_id: {'slot': slot}})
+        if host is None:
+            return None, False
+        return host, empty
+
+    def stats(self):
+        with self._lock:
+            hosts = [h.to_dict() for h in self._hosts.values()]
+        return {
+            'hosts': hosts,
+            'sites': sum(h['sites'] for h in hosts),
+            'capacity': {
+                'max_sites': self.max_sites,
+                'disk_mb': self.disk_mb,
+                'memory_mb': self.memory_mb
+            }
+        }
+
+    def _claim_slot(self, host, deployment_id, disk_mb, memory_mb):
+        """
+        Take a free slot on host for deployment_id (lock held).
+        Returns the slot number, or None (and marks the host full) if
+        every slot is taken, here or by another worker.
+        """
+        capacity = min(self.max_sites, self.disk_mb // disk_mb, self.memory_mb // memory_mb)
+        taken = {site.get('slot') for site in host.sites.values()}
+        for slot in range(capacity):
+            if slot in taken:
+                continue
+            if self.store is None:
+                return slot
+            winner = self.store.claim_key(slot_key(host.host_id, slot), deployment_id, SLOT_CLAIM, SLOT_TTL)
+            if winner is None or winner['deployment_id'] == deployment_id:
+                return slot
+        host.full = True
+        return None
+
+    def _release_slots(self, host_id, sites):
+        """Give back the slot claims of sites (deployment_id → site) on host_id"""
+        if self.store is None:
+            return
+        for deployment_id, site in sites.items():
+            if site.get('slot') is None:
+                continue
+            try:
+                self.store.release_key(slot_key(host_id, site['slot']), deployment_id)
+            except Exception as e:
+                print(f"[{deployment_id}] Could not release slot {site['slot']} on {host_id}: {e}")
+
+    def _fits(self, host, disk_mb, memory_mb):
+        return (
+            not host.full
+            and len(host.sites) < self.max_sites
+            and host.disk_mb + disk_mb <= self.disk_mb
+            and host.memory_mb + memory_mb <= self.memory_mb
+        )
+
+    def _room(self, host):
+        """Smallest remaining share of any resource (0.0 = full)"""
+        return min(
+            1 - len(host.sites) / self.max_sites,
+            1 - host.disk_mb / self.disk_mb,
+            1 - host.memory_mb / self.memory_mb
+        )
+
+
+def site_url(subdomain, public_ip):
+    """Where a shared-host site is reachable"""
+    if SITES_DOMAIN:
+        return f"http://{subdomain}.{SITES_DOMAIN}"
+    return f"http://{public_ip}/{subdomain}/"
+
+
+def remove_site_commands(subdomain):
+    """Shell commands that take a site off a shared host"""
+    return [
+        f"rm -rf /var/www/sites/{subdomain} /opt/deployfast/incoming/{subdomain} "
+        f"/opt/deployfast/incoming/{subdomain}-delta /opt/deployfast/releases/{subdomain}",
+        f"rm -f /etc/nginx/conf.d/site-{subdomain}.conf /etc/nginx/default.d/site-{subdomain}.conf",
+        "systemctl reload nginx || true"
+    ]
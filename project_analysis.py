@@ -0,0 +1,83 @@
+"""
+Project analysis for DeployFast: what kind of site is this repo?
+
+Every deployment used to go through the same CodeBuild project, which
+installs Node.js and Python at the start of every build, even for a
+folder of HTML files with nothing to build.
+
+upload_to_s3 now classifies the repo from the clone it already has,
+with the rules buildspec.yml builds by:
+
+    package.json        → 'node'    (npm install, npm run build)
+    requirements.txt    → 'python'  (pip install)
+    anything else       → 'static'  (nothing to build)
+
+- static sites skip CodeBuild: the source plus the deploy scripts is the
+  build output (bundles.write_site_bundle), written straight to the
+  build output key
+- node / python sources build in the CodeBuild project of their stack
+  (CODEBUILD_PROJECTS), whose image has the runtime and the usual
+  dependencies preinstalled. A stack without a project uses the default.
+
+The stack is stored as S3 metadata on sources/{sha}.zip, so a source
+cache hit knows it without a clone. Sources uploaded before have no
+stack and build in the default project, as before.
+
+Usage:
+    stack = classify(repo_path)
+    project = codebuild_project(stack, default=CODEBUILD_PROJECT)
+"""
+
+import os
+
+# ========================================
+# CONFIGURATION
+# ========================================
+STACKS = ('static', 'node', 'python')
+STATIC_SITE_BYPASS = os.environ.get('STATIC_SITE_BYPASS', 'true').lower() == 'true'  # Static sites skip CodeBuild
+
+STACK_METADATA = 'deployfast-stack'  # S3 user metadata key on sources/{sha}.zip
+
+# First match wins, same order as pre_build in buildspec.yml
+STACK_MARKERS = [
+    ('node', 'package.json'),
+    ('python', 'requirements.txt')
+]
+
+
+def parse_projects(value):
+    """{'node': 'DeployFast-Node', ...} from 'node=DeployFast-Node,python=DeployFast-Python'"""
+    projects = {}
+    for pair in value.split(','):
+        if '=' in pair:
+            stack, project = pair.split('=', 1)
+            if stack.strip() in STACKS and project.strip():
+                projects[stack.strip()] = project.strip()
+    return projects
+
+
+# CodeBuild project per stack, e.g. CODEBUILD_PROJECTS=node=DeployFast-Node,python=DeployFast-Python
+CODEBUILD_PROJECTS = parse_projects(os.environ.get('CODEBUILD_PROJECTS', ''))
+
+
+def classify(repo_path):
+    """Stack of a checked-out repo: 'static', 'node' or 'python'"""
+    for stack, marker in STACK_MARKERS:
+        if os.path.isfile(os.path.join(repo_path, marker)):
+            return stack
+    return 'static'
+
+
+def stack_from_metadata(metadata):
+    """Stack stored on a source object, or None (uploaded before analysis)"""
+    stack = (metadata or {}).get(STACK_METADATA)
+    return stack if stack in STACKS else None
+
+
+def codebuild_project(stack, default):
+    """CodeBuild project that builds a stack"""
+    return CODEBUILD_PROJECTS.get(stack, default)
+
+
+def skips_codebuild(stack):
+    return stack == 'static' and STATIC_SITE_BYPASS
@@ -0,0 +1,256 @@
+"""
+EC2 readiness probing for DeployFast.
+
+A fresh instance from the Launch Template is only useful once its User
+Data script has installed nginx and the CodeDeploy agent. Instead of
+sleeping a fixed amount of time, we poll real signals until they pass:
+
+- running: instance state is "running" and it has a public IP
+- status:  EC2 instance + system status checks are "ok"
+           (describe_instance_status)
+- http:    nginx answers on http://{public_ip}/
+- ssm:     the SSM agent reports PingStatus "Online"
+           (needs the SSM agent + instance role)
+
+"running" is always checked first. The other checks are configurable;
+the instance is ready when ALL of them pass.
+
+Polling uses exponential backoff (with a little jitter) and a hard
+deadline. Everything AWS-related goes through the clients passed in, so
+the probe can run against a local stub of the EC2 API.
+"""
+
+import os
+import random
+import time
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+# ========================================
+# CONFIGURATION
+# ========================================
+EC2_READY_CHECKS = os.environ.get('EC2_READY_CHECKS', 'http')         # Comma separated: status,http,ssm
+EC2_READY_TIMEOUT = float(os.environ.get('EC2_READY_TIMEOUT', 600))    # Hard deadline (seconds)
+EC2_READY_INITIAL_DELAY = float(os.environ.get('EC2_READY_INITIAL_DELAY', 2))
+EC2_READY_MAX_DELAY = float(os.environ.get('EC2_READY_MAX_DELAY', 20))
+EC2_READY_HTTP_TIMEOUT = float(os.environ.get('EC2_READY_HTTP_TIMEOUT', 3))
+
+
+class ReadinessTimeout(Exception):
+    """Raised when an instance is not ready before the deadline."""
+
+
+def http_probe(public_ip, timeout=EC2_READY_HTTP_TIMEOUT):
+    """
+    Check if nginx answers on port 80.
+
+    Any HTTP response counts (even 403/404): it means nginx is up.
+    Connection errors and timeouts mean it is not up yet.
+    """
+    try:
+        urllib.request.urlopen(f"http://{public_ip}/", timeout=timeout)
+        return True
+    except urllib.error.HTTPError:
+        return True
+    except (urllib.error.URLError, OSError):
+        return False
+
+
+class ReadinessProbe:
+    """
+    Poll an instance until it is ready, or give up at the deadline.
+
+    Usage:
+        probe = ReadinessProbe(ec2, ssm=ssm)
+        result = probe.wait(deployment_id, instance_id)
+        # {'public_ip': '1.2.3.4', 'ready_seconds': 41.2, 'checks': [...]}
+    """
+
+    def __init__(self, ec2, ssm=None, checks=None, timeout=EC2_READY_TIMEOUT,
+                 initial_delay=EC2_READY_INITIAL_DELAY, max_delay=EC2_READY_MAX_DELAY,
+                 http_check=http_probe, sleep=time.sleep, clock=time.monotonic):
+        if checks is None:
+            checks = [c.strip() for c in EC2_READY_CHECKS.split(',') if c.strip()]
+        unknown = set(checks) - {'status', 'http', 'ssm'}
+        if unknown:
+            raise ValueError(f"Unknown readiness checks: {', '.join(sorted(unknown))}")
+        if 'ssm' in checks and ssm is None:
+            raise ValueError("The 'ssm' readiness check needs an SSM client")
+
+        self.ec2 = ec2
+        self.ssm = ssm
+        self.checks = checks
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.http_check = http_check
+        self.sleep = sleep
+        self.clock = clock
+
+    def wait(self, deployment_id, instance_id, public_ip=None):
+        """
+        Block until the instance passes every check.
+
+        Returns public_ip, ready_seconds (time from the call until ready)
+        and the list of checks that passed.
+        Raises ReadinessTimeout when the deadline passes first.
+        """
+        public_ips = {instance_id: public_ip} if public_ip else None
+        result = self.wait_many(deployment_id, [instance_id], public_ips)[instance_id]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def wait_many(self, label, instance_ids, public_ips=None, on_done=None):
+        """
+        Wait for several instances at once (e.g. a batch launch).
+
+        Each round makes ONE describe_instances call for every instance
+        that is not running yet, and one describe_instance_status /
+        describe_instance_information call for the status / ssm checks.
+        HTTP checks run in parallel.
+
+        on_done(instance_id, result) is called as soon as an instance is
+        ready (or has failed), so nobody waits for the slowest instance.
+
+        Returns {instance_id: result dict, or ReadinessTimeout}.
+        """
+        start = self.clock()
+        deadline = start + self.timeout
+        attempt = 0
+        public_ips = dict(public_ips or {})
+        passed = {instance_id: set() for instance_id in instance_ids}
+        pending = list(instance_ids)
+        results = {}
+
+        def finish(instance_id, result):
+            results[instance_id] = result
+            pending.remove(instance_id)
+            if on_done:
+                on_done(instance_id, result)
+
+        print(f"[{label}] Waiting for {len(instance_ids)} EC2 instance(s) to be ready "
+              f"(checks: running, {', '.join(self.checks)})...")
+
+        while True:
+            # running + public IP, one call for all of them
+            starting = [i for i in pending if not public_ips.get(i)]
+            if starting:
+                for instance_id, state in self._running_ips(starting).items():
+                    if isinstance(state, Exception):
+                        finish(instance_id, state)
+                    elif state:
+                        public_ips[instance_id] = state
+                        print(f"[{label}] EC2 {instance_id} is running! Public IP: {state}")
+
+            running = [i for i in pending if public_ips.get(i)]
+            for check in self.checks:
+                todo = [i for i in running if check not in passed[i]]
+                if not todo:
+                    continue
+                for instance_id in self._check(check, todo, public_ips):
+                    passed[instance_id].add(check)
+                    print(f"[{label}] Readiness check passed for {instance_id}: {check}")
+
+            for instance_id in running:
+                if passed[instance_id].issuperset(self.checks):
+                    ready_seconds = round(self.clock() - start, 1)
+                    print(f"[{label}] EC2 {instance_id} ready after {ready_seconds}s")
+                    finish(instance_id, {
+                        'public_ip': public_ips[instance_id],
+                        'ready_seconds': ready_seconds,
+                        'checks': ['running'] + list(self.checks)
+                    })
+
+            if not pending:
+                return results
+
+            now = self.clock()
+            if now >= deadline:
+                for instance_id in list(pending):
+                    waiting = [c for c in self.checks if c not in passed[instance_id]]
+                    if not public_ips.get(instance_id):
+                        waiting.insert(0, 'running')
+                    finish(instance_id, ReadinessTimeout(
+                        f"EC2 {instance_id} not ready after {self.timeout:.0f}s "
+                        f"(waiting on: {', '.join(waiting)})"
+                    ))
+                return results
+
+            delay = min(self.initial_delay * (2 ** attempt), self.max_delay)
+            delay = delay * random.uniform(0.8, 1.2)
+            self.sleep(min(delay, deadline - now))
+            attempt += 1
+
+    # ----------------------------------------
+    # Individual signals (each covers many instances)
+    # ----------------------------------------
+
+    def _running_ips(self, instance_ids):
+        """
+        {instance_id: public IP once running, else None}. Instances that
+        will never run map to a ReadinessTimeout.
+        """
+        try:
+            response = self.ec2.describe_instances(InstanceIds=instance_ids)
+        except ClientError as e:
+            # A just-launched instance may not be visible yet
+            if e.response.get('Error', {}).get('Code') == 'InvalidInstanceID.NotFound':
+                return {}
+            raise
+
+        states = {}
+        for reservation in response['Reservations']:
+            for instance in reservation['Instances']:
+                instance_id = instance['InstanceId']
+                state = instance['State']['Name']
+                if state in ('shutting-down', 'terminated', 'stopping', 'stopped'):
+                    states[instance_id] = ReadinessTimeout(
+                        f"EC2 {instance_id} is {state}, it will never be ready"
+                    )
+                elif state == 'running':
+                    states[instance_id] = instance.get('PublicIpAddress')
+        return states
+
+    def _check(self, check, instance_ids, public_ips):
+        """Instance IDs (of instance_ids) that pass check"""
+        if check == 'status':
+            return self._status_ok(instance_ids)
+        if check == 'http':
+            if len(instance_ids) == 1:
+                return [i for i in instance_ids if self.http_check(public_ips[i])]
+            with ThreadPoolExecutor(max_workers=min(len(instance_ids), 16)) as pool:
+                ok = list(pool.map(lambda i: self.http_check(public_ips[i]), instance_ids))
+            return [i for i, passed in zip(instance_ids, ok) if passed]
+        if check == 'ssm':
+            return self._ssm_online(instance_ids)
+        return []
+
+    def _status_ok(self, instance_ids):
+        response = self.ec2.describe_instance_status(
+            InstanceIds=instance_ids,
+            IncludeAllInstances=True
+        )
+        return [
+            status['InstanceId']
+            for status in response.get('InstanceStatuses', [])
+            if status.get('InstanceStatus', {}).get('Status') == 'ok'
+            and status.get('SystemStatus', {}).get('Status') == 'ok'
+        ]
+
+    def _ssm_online(self, instance_ids):
+        online = []
+        # The InstanceIds filter takes at most 50 values
+        for i in range(0, len(instance_ids), 50):
+            response = self.ssm.describe_instance_information(
+                Filters=[{'Key': 'InstanceIds', 'Values': instance_ids[i:i + 50]}]
+            )
+            online.extend(
+                info['InstanceId']
+                for info in response.get('InstanceInformationList', [])
+                if info.get('PingStatus') == 'Online'
+            )
+        return online
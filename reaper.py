@@ -0,0 +1,349 @@
+"""
+Lifecycle reaper for DeployFast: finds and removes what nobody owns anymore.
+
+EC2 instances were only terminated by DELETE /deployments/<id>. An
+instance whose deployment record is gone was left running (and billed)
+forever, together with its s3://{bucket}/deployments/{id}/ prefix. That
+happens after a crash between launch and record, a batch leftover, a
+record deleted while its instance was still booting, etc.
+
+Every REAPER_INTERVAL seconds the reaper reconciles AWS with the store:
+
+1. Page through describe_instances (ManagedBy=DeployFast, not terminated)
+   and the deployments/ prefixes in S3
+2. Read every deployment record (AFTER listing AWS: a record is always
+   written before its resources, so nothing listed can be newer than
+   the snapshot)
+3. Decide, per instance:
+   - warm pool instance (DeploymentId=warm-pool) → never touched here,
+     the warm pool reaps its own
+   - shared host (HostId tag) → terminated only when no active site
+     lives on it anymore
+   - no record, or the record points at another instance → orphan
+   - failed deployment, finished more than REAPER_FAILED_TTL ago → reaped
+   - live deployment older than DEPLOYMENT_TTL (if set) → expired
+   Instances younger than REAPER_ORPHAN_GRACE are skipped: they may
+   belong to a deployment that is being set up right now.
+4. Terminate everything in batched terminate_instances calls
+5. Delete the deployments/{id}/ prefixes of missing, reaped and expired
+   deployments with delete_objects (1000 keys per call)
+
+Expired shared-mode sites are taken off their host through the
+release_site callback (the host goes when its last site goes). Expired
+s3-hosted sites (no instance at all) are deleted from the site bucket
+through the delete_static_site callback. Failed and expired deployments
+made with DEPLOY_MODE=codedeploy lose their deployment group through the
+delete_deployment_group callback.
+
+Content-addressed objects (sources/, builds/) are shared between
+deployments and are not touched: use an S3 lifecycle rule for those.
+
+Every action is idempotent, so running the reaper in several processes
+at once only costs duplicate API calls. REAPER_DRY_RUN=true only reports.
+
+The reaper is off unless REAPER_INTERVAL is set: every DeployFast
+instance the store does not know is an orphan to it, so it must only run
+against the store that owns every DeployFast instance in the account
+(never a local or fresh store pointed at a shared account). Try
+REAPER_DRY_RUN=true first and check GET /reaper.
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+
+# ========================================
+# CONFIGURATION
+# ========================================
+REAPER_INTERVAL = int(os.environ.get('REAPER_INTERVAL', 0))                # Seconds between runs, 0 = disabled (opt-in)
+DEPLOYMENT_TTL = int(os.environ.get('DEPLOYMENT_TTL_HOURS', 0)) * 3600      # Live deployments expire after this, 0 = never
+REAPER_FAILED_TTL = int(os.environ.get('REAPER_FAILED_TTL', 3600))         # Keep failed instances around to debug
+REAPER_ORPHAN_GRACE = int(os.environ.get('REAPER_ORPHAN_GRACE', 900))      # Never reap instances younger than this
+REAPER_DRY_RUN = os.environ.get('REAPER_DRY_RUN', 'false').lower() == 'true'
+
+TERMINATE_BATCH_SIZE = 500  # Instances per terminate_instances call
+DELETE_BATCH_SIZE = 1000    # delete_objects accepts up to 1000 keys
+
+WARM_POOL_TAG = 'warm-pool'
+DEPLOYMENT_PREFIX = 'deployments/'
+
+FAILED_STATUSES = ['failed', 'build_failed', 'deploy_failed']
+FINAL_STATUSES = ['live', 'expired'] + FAILED_STATUSES
+EXPIRED_STATUS = 'expired'
+
+PAGE_SIZE = 500
+
+
+def _tags(instance):
+    return {t['Key']: t['Value'] for t in instance.get('Tags', [])}
+
+
+def _parse_time(value):
+    """Record timestamps are naive local time (datetime.now().isoformat())"""
+    return datetime.fromisoformat(value).astimezone(timezone.utc)
+
+
+def finished_at(record):
+    """When a deployment reached its final status (best guess)"""
+    times = [
+        step['finished_at'] for step in record.get('steps', {}).values()
+        if step.get('finished_at')
+    ]
+    return _parse_time(max(times) if times else record['created_at'])
+
+
+class Reaper:
+    """
+    Reconciles DeployFast's EC2 instances and S3 prefixes with the store.
+
+    Usage:
+        reaper = Reaper(ec2, s3, S3_BUCKET_NAME, store, release_site=release_site,
+                        delete_static_site=delete_static_site,
+                        delete_deployment_group=delete_deployment_group)
+        reaper.start()          # every REAPER_INTERVAL seconds
+        report = reaper.run()   # or one pass right now
+    """
+
+    def __init__(self, ec2, s3, bucket, store, release_site=None, delete_static_site=None,
+                 delete_deployment_group=None, interval=REAPER_INTERVAL, ttl=DEPLOYMENT_TTL, failed_ttl=REAPER_FAILED_TTL,
+                 orphan_grace=REAPER_ORPHAN_GRACE, dry_run=REAPER_DRY_RUN,
+                 now=lambda: datetime.now(timezone.utc)):
+        self.ec2 = ec2
+        self.s3 = s3
+        self.bucket = bucket
+        self.store = store
+        self.release_site = release_site
+        self.delete_static_site = delete_static_site
+        self.delete_deployment_group = delete_deployment_group
+        self.interval = interval
+        self.ttl = ttl
+        self.failed_ttl = failed_ttl
+        self.orphan_grace = orphan_grace
+        self.dry_run = dry_run
+        self.now = now
+
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.last_report = None
+
+    def start(self):
+        """Start the background loop (once per process)"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='reaper', daemon=True)
+            self._thread.start()
+        print(f"[reaper] Started (every {self.interval}s, ttl={self.ttl or 'none'}, dry_run={self.dry_run})")
+
+    def _loop(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            try:
+                self.run()
+            except Exception as e:
+                print(f"[reaper] Run failed: {str(e)}")
+
+    # ----------------------------------------
+    # One pass
+    # ----------------------------------------
+
+    def run(self):
+        """
+        One reconciliation pass. Returns a report:
+        {'orphaned', 'failed', 'expired', 'hosts', 'terminated',
+         'prefixes', 'objects_deleted', 'dry_run', 'finished_at'}
+        """
+        with self._run_lock:
+            now = self.now()
+            instances = self.list_instances()
+            prefixes = self.list_deployment_prefixes()
+            records = self.load_records()
+
+            report = {
+                'orphaned': [], 'failed': [], 'expired': [], 'hosts': [],
+                'terminated': [], 'prefixes': [], 'objects_deleted': 0,
+                'dry_run': self.dry_run
+            }
+            terminate = []
+
+            # Shared hosts still in use by at least one active site
+            active_hosts = {
+                r['host_id'] for r in records.values()
+                if r.get('host_id') and r['status'] not in FAILED_STATUSES + [EXPIRED_STATUS]
+            }
+
+            # Dedicated instances by the deployment they serve
+            owned = {}
+            for instance in instances:
+                instance_id = instance['InstanceId']
+                tags = _tags(instance)
+                age = (now - instance['LaunchTime']).total_seconds()
+
+                if tags.get('DeploymentId') == WARM_POOL_TAG:
+                    continue
+
+                if tags.get('HostId'):
+                    if tags['HostId'] not in active_hosts and age > self.orphan_grace:
+                        report['hosts'].append(instance_id)
+                        terminate.append(instance_id)
+                    continue
+
+                record = records.get(tags.get('DeploymentId'))
+                if record is None or (record['status'] in FINAL_STATUSES
+                                      and record.get('ec2_instance_id') != instance_id):
+                    if age > self.orphan_grace:
+                        report['orphaned'].append(instance_id)
+                        terminate.append(instance_id)
+                    continue
+                owned.setdefault(record['deployment_id'], []).append(instance_id)
+
+            # Failed / expired deployments (shared sites are released, not terminated)
+            for deployment_id, record in records.items():
+                reason = self._reason(record, now)
+                if reason:
+                    report[reason].append(deployment_id)
+                    terminate.extend(owned.get(deployment_id, []))
+
+            if not self.dry_run:
+                self.terminate(terminate)
+                self._mark(records, report, now)
+            report['terminated'] = terminate
+
+            # S3: prefixes of deployments that are gone or reaped
+            reaped = set(report['failed']) | set(report['expired'])
+            for deployment_id in prefixes:
+                record = records.get(deployment_id)
+                if record is None or record.get('reaped_at') or deployment_id in reaped:
+                    report['prefixes'].append(deployment_id)
+                    if not self.dry_run:
+                        report['objects_deleted'] += self.delete_prefix(f"{DEPLOYMENT_PREFIX}{deployment_id}/")
+
+            report['finished_at'] = self.now().isoformat()
+            self.last_report = report
+
+        if terminate or report['prefixes']:
+            print(
+                f"[reaper] {'Would reap' if self.dry_run else 'Reaped'}: "
+                f"{len(report['orphaned'])} orphaned, {len(report['failed'])} failed, "
+                f"{len(report['expired'])} expired, {len(report['hosts'])} idle shared host(s), "
+                f"{len(report['prefixes'])} S3 prefix(es) ({report['objects_deleted']} objects)"
+            )
+        return report
+
+    def _reason(self, record, now):
+        """'failed' / 'expired' if this deployment's resources should go, else None"""
+        if record.get('reaped_at'):
+            return None
+        if record['status'] in FAILED_STATUSES:
+            if (now - finished_at(record)).total_seconds() > self.failed_ttl:
+                return 'failed'
+        elif record['status'] == 'live' and self.ttl:
+            if (now - _parse_time(record['created_at'])).total_seconds() > self.ttl:
+                return 'expired'
+        return None
+
+    def _mark(self, records, report, now):
+        """
+        Record what was reaped, release expired shared sites, take down
+        expired s3 sites, delete CodeDeploy deployment groups
+        """
+        stamp = now.isoformat()
+        for deployment_id in report['failed']:
+            if not self._delete_group(records[deployment_id]):
+                continue  # try again next run
+            self.store.update(deployment_id, reaped_at=stamp, reaped_reason='failed')
+        for deployment_id in report['expired']:
+            record = records[deployment_id]
+            if not self._delete_group(record):
+                continue
+            if record.get('host_id') and self.release_site:
+                try:
+                    self.release_site(record)
+                except Exception as e:
+                    print(f"[reaper] Could not release shared site {deployment_id}: {e}")
+            if record.get('hosting_mode') == 's3' and self.delete_static_site:
+                try:
+                    self.delete_static_site(record)
+                except Exception as e:
+                    print(f"[reaper] Could not delete static site {deployment_id}: {e}")
+                    continue  # still live: try again next run
+            self.store.update(
+                deployment_id, status=EXPIRED_STATUS, reaped_at=stamp, reaped_reason='ttl'
+            )
+
+    def _delete_group(self, record):
+        """Delete the deployment's CodeDeploy deployment group, if it has one"""
+        if not record.get('codedeploy_group') or not self.delete_deployment_group:
+            return True
+        try:
+            self.delete_deployment_group(record['deployment_id'])
+            return True
+        except Exception as e:
+            print(f"[reaper] Could not delete deployment group of {record['deployment_id']}: {e}")
+            return False
+
+    # ----------------------------------------
+    # AWS + store
+    # ----------------------------------------
+
+    def list_instances(self):
+        """Every DeployFast instance that still costs money"""
+        paginator = self.ec2.get_paginator('describe_instances')
+        pages = paginator.paginate(Filters=[
+            {'Name': 'tag:ManagedBy', 'Values': ['DeployFast']},
+            {'Name': 'instance-state-name', 'Values': ['pending', 'running', 'stopping', 'stopped']}
+        ])
+        instances = []
+        for page in pages:
+            for reservation in page['Reservations']:
+                instances.extend(reservation['Instances'])
+        return instances
+
+    def list_deployment_prefixes(self):
+        """Deployment IDs with objects under deployments/"""
+        paginator = self.s3.get_paginator('list_objects_v2')
+        ids = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=DEPLOYMENT_PREFIX, Delimiter='/'):
+            for prefix in page.get('CommonPrefixes', []):
+                ids.append(prefix['Prefix'][len(DEPLOYMENT_PREFIX):].rstrip('/'))
+        return ids
+
+    def load_records(self):
+        records, cursor = {}, None
+        while True:
+            page, cursor = self.store.list(limit=PAGE_SIZE, cursor=cursor)
+            records.update((r['deployment_id'], r) for r in page)
+            if not cursor:
+                return records
+
+    def terminate(self, instance_ids):
+        for i in range(0, len(instance_ids), TERMINATE_BATCH_SIZE):
+            self.ec2.terminate_instances(InstanceIds=instance_ids[i:i + TERMINATE_BATCH_SIZE])
+
+    def delete_prefix(self, prefix):
+        """Delete every object under prefix, 1000 per call. Returns the count."""
+        paginator = self.s3.get_paginator('list_objects_v2')
+        deleted = 0
+        batch = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                batch.append({'Key': obj['Key']})
+                if len(batch) == DELETE_BATCH_SIZE:
+                    deleted += self._delete_objects(batch)
+                    batch = []
+        if batch:
+            deleted += self._delete_objects(batch)
+        return deleted
+
+    def _delete_objects(self, keys):
+        response = self.s3.delete_objects(
+            Bucket=self.bucket,
+            Delete={'Objects': keys, 'Quiet': True}
+        )
+        errors = response.get('Errors', [])
+        for error in errors[:5]:
+            print(f"[reaper] Could not delete s3://{self.bucket}/{error['Key']}: {error.get('Message')}")
+        return len(keys) - len(errors)
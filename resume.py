@@ -0,0 +1,204 @@
+"""
+Pipeline resume for DeployFast: picks up deployments whose worker died.
+
+A deployment runs on a deploy_queue thread of ONE process. When that
+process died mid-pipeline (deploy, crash, OOM kill), the record stayed
+'building' or 'deploying' forever, its instance kept running, and the
+only way out was a new deployment starting again from create_ec2_instance.
+
+Every process now has a worker ID and writes a heartbeat to the store
+every RESUME_INTERVAL seconds; every record it creates or runs carries
+its worker_id. At startup and on every heartbeat the resumer:
+
+1. Reads the heartbeats: a worker silent for WORKER_LEASE seconds is dead
+2. Lists in-flight deployments (queued ... deploying, redeploys too)
+3. Takes over each one owned by a dead worker (or by nobody): a
+   conditional write of worker_id, so only one process wins
+4. Hands it to the resume callback (app.py queues it again)
+
+The pipeline checkpoints every step on the record (instance, source
+key, build ID, CodeDeploy ID), so a resumed deployment skips what is
+done and re-attaches to a build or deploy that is still running.
+
+Usage:
+    resumer = PipelineResumer(store, resume=resume_pipeline, statuses=IN_FLIGHT)
+    resumer.start()           # heartbeat + scan every RESUME_INTERVAL seconds
+    report = resumer.run()    # or one scan right now
+
+    checkpoint = Checkpoint(record)           # in the pipeline
+    source = checkpoint.source()              # None: upload (again)
+"""
+
+import os
+import secrets
+import socket
+import threading
+import time
+
+from store import MAX_PAGE_SIZE
+
+# ========================================
+# CONFIGURATION
+# ========================================
+RESUME_INTERVAL = int(os.environ.get('RESUME_INTERVAL', 30))  # Seconds between heartbeats + scans, 0 = disabled
+WORKER_LEASE = int(os.environ.get('WORKER_LEASE', 120))       # A worker without a heartbeat this long is dead
+
+
+def new_worker_id():
+    """hostname:pid:random, unique per process (pids are reused across restarts)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+
+
+class PipelineResumer:
+    """
+    Heartbeat of this process + takeover of deployments of dead ones.
+
+    resume(record) is called with the taken-over record. If it raises,
+    the record is let go again (worker_id=None) and retried next scan.
+    """
+
+    def __init__(self, store, resume, statuses, worker_id=None,
+                 interval=RESUME_INTERVAL, lease=WORKER_LEASE, clock=time.time):
+        self.store = store
+        self.resume = resume
+        self.statuses = list(statuses)
+        self.worker_id = worker_id or new_worker_id()
+        self.interval = interval
+        self.lease = lease
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._thread = None
+        self.last_report = None
+
+    def start(self):
+        """First heartbeat + scan, then the background loop (once per process)"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='resumer', daemon=True)
+            self._thread.start()
+        print(f"[resumer] Started as {self.worker_id} (every {self.interval}s, lease {self.lease}s)")
+
+    def _loop(self):
+        stop = threading.Event()
+        while True:
+            try:
+                self.store.heartbeat(self.worker_id)
+                self.run()
+            except Exception as e:
+                print(f"[resumer] Run failed: {str(e)}")
+            if stop.wait(self.interval):
+                return
+
+    def alive_workers(self):
+        now = self.clock()
+        alive = {w for w, seen in self.store.heartbeats().items() if now - seen < self.lease}
+        alive.add(self.worker_id)
+        return alive
+
+    def run(self):
+        """
+        One scan. Returns {'resumed': [IDs], 'failed': [IDs], 'skipped': n}
+        (skipped: in flight on a live worker).
+        """
+        with self._run_lock:
+            alive = self.alive_workers()
+            report = {'resumed': [], 'failed': [], 'skipped': 0}
+
+            cursor = None
+            while True:
+                page, cursor = self.store.list(status=self.statuses, limit=MAX_PAGE_SIZE, cursor=cursor)
+                for record in page:
+                    if record.get('worker_id') in alive:
+                        report['skipped'] += 1
+                        continue
+                    self._take_over(record, report)
+                if not cursor:
+                    break
+
+            self.last_report = dict(report, ran_at=self.clock())
+            if report['resumed'] or report['failed']:
+                print(f"[resumer] Resumed {len(report['resumed'])} deployment(s), "
+                      f"{len(report['failed'])} could not be queued")
+            return report
+
+    def _take_over(self, record, report):
+        deployment_id = record['deployment_id']
+        owner = record.get('worker_id')
+
+        def take(current):
+            # Still in flight, still on the dead worker: otherwise someone beat us to it
+            if current.get('status') not in self.statuses or current.get('worker_id') != owner:
+                return False
+            current['worker_id'] = self.worker_id
+            current['resumes'] = current.get('resumes', 0) + 1
+
+        taken = self.store.mutate(deployment_id, take)
+        if not taken:
+            return
+
+        print(f"[{deployment_id}] Worker {owner or 'unknown'} is gone, resuming '{taken['status']}' here")
+        try:
+            self.resume(taken)
+            report['resumed'].append(deployment_id)
+        except Exception as e:
+            print(f"[{deployment_id}] Could not resume: {str(e)}")
+            self.store.update(deployment_id, worker_id=None)
+            report['failed'].append(deployment_id)
+
+
+class Checkpoint:
+    """
+    What a deployment record says is already done.
+
+    Each accessor returns what the step produced, or None when the step
+    has to run (again).
+    """
+
+    def __init__(self, record):
+        self.record = record
+        self.steps = record.get('steps', {})
+
+    def done(self, step):
+        return self.steps.get(step, {}).get('status') == 'done'
+
+    def done_steps(self):
+        return [name for name, step in self.steps.items() if step.get('status') == 'done']
+
+    def ec2_info(self):
+        """The ready instance, as provision_ec2 returned it"""
+        record = self.record
+        if not self.done('create_ec2') or not record.get('ec2_instance_id') or record.get('reaped_at'):
+            return None
+        return {
+            'instance_id': record['ec2_instance_id'],
+            'public_ip': record.get('ec2_public_ip'),
+            'ready_seconds': record.get('ec2_ready_seconds', 0),
+            'warm': record.get('ec2_warm', False),
+            'host_id': record.get('host_id')
+        }
+
+    def source(self):
+        """The uploaded source, as upload_to_s3 returned it"""
+        record = self.record
+        if not self.done('upload') or not record.get('s3_key'):
+            return None
+        return {
+            's3_key': record['s3_key'],
+            'commit_sha': record['commit_sha'],
+            'cache_hit': True,
+            'stack': record.get('stack')
+        }
+
+    def artifact_key(self):
+        return self.record.get('artifact_key') if self.done('build') else None
+
+    def running(self, step, field):
+        """ID of the AWS run (build_id, codedeploy_deployment_id) an interrupted step had started"""
+        if self.steps.get(step, {}).get('status') != 'running':
+            return None
+        return self.record.get(field)
@@ -0,0 +1,251 @@
+"""
+Content-addressed source cache for DeployFast.
+
+Redeploying the same commit used to re-clone, re-zip and re-upload
+identical content. Now sources are keyed by commit SHA:
+
+1. Resolve the remote HEAD cheaply:  git ls-remote <url> HEAD
+2. Look for s3://{bucket}/sources/{sha}.zip
+   - HIT:  skip clone + upload entirely
+   - MISS: check out the commit and upload it under that key
+
+Checkouts come from a local LRU of recent clones. A repo we have seen
+before only needs an incremental `git fetch` of the new commit instead of
+a full clone. The LRU is bounded by total size on disk
+(SOURCE_CACHE_MAX_MB); least recently used clones are evicted first.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from botocore.exceptions import ClientError
+
+# ========================================
+# CONFIGURATION
+# ========================================
+SOURCE_CACHE_DIR = os.environ.get(
+    'SOURCE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'deployfast-clones')
+)
+SOURCE_CACHE_MAX_MB = int(os.environ.get('SOURCE_CACHE_MAX_MB', 2048))  # 0 = no local clone cache
+
+GIT_TIMEOUT = 300
+
+
+def source_key(commit_sha):
+    """S3 key of the zipped source for a commit"""
+    return f"sources/{commit_sha}.zip"
+
+
+def run_git(args, cwd=None, timeout=GIT_TIMEOUT):
+    """Run git, raising CalledProcessError (with stderr) on failure"""
+    return subprocess.run(
+        ["git"] + args,
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        timeout=timeout
+    )
+
+
+class SourceCache:
+    """
+    S3 source objects keyed by commit + local LRU of clones.
+
+    Usage:
+        sha = cache.resolve_head(github_url)
+        if not cache.has_source(sha):
+            with cache.checkout(github_url, sha) as repo_path:
+                ...  # zip + upload repo_path
+    """
+
+    def __init__(self, s3, bucket, cache_dir=SOURCE_CACHE_DIR,
+                 max_bytes=SOURCE_CACHE_MAX_MB * 1024 * 1024):
+        self.s3 = s3
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._repo_locks = {}
+        self._sizes = None  # repo dir → bytes, loaded lazily from disk
+
+        self.hits = 0
+        self.misses = 0
+        self.local_hits = 0
+        self.local_misses = 0
+        self.evictions = 0
+
+    # ----------------------------------------
+    # S3 (content-addressed)
+    # ----------------------------------------
+
+    def resolve_head(self, github_url):
+        """Commit SHA of the remote HEAD, without cloning anything"""
+        result = run_git(["ls-remote", github_url, "HEAD"], timeout=60)
+        line = result.stdout.decode().strip()
+        if not line:
+            raise Exception(f"Repository has no HEAD commit: {github_url}")
+        return line.split()[0]
+
+    def has_source(self, commit_sha):
+        """True if sources/{sha}.zip is already in S3 (counts hit/miss)"""
+        return self.lookup(commit_sha) is not None
+
+    def lookup(self, commit_sha):
+        """S3 metadata of sources/{sha}.zip ({} if it has none), or None if it is not there"""
+        try:
+            response = self.s3.head_object(Bucket=self.bucket, Key=source_key(commit_sha))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                self.misses += 1
+                return None
+            raise
+        self.hits += 1
+        return response.get('Metadata', {})
+
+    # ----------------------------------------
+    # Local clones (LRU)
+    # ----------------------------------------
+
+    @contextmanager
+    def checkout(self, github_url, commit_sha):
+        """
+        Yield a working tree of github_url at commit_sha.
+
+        The repo stays locked while the caller uses it, so two deployments
+        of the same repo never fetch into the same clone at once.
+        """
+        if self.max_bytes <= 0:
+            # Local cache disabled: plain clone into a throwaway dir
+            temp_dir = tempfile.mkdtemp()
+            try:
+                repo_path = os.path.join(temp_dir, "repo")
+                run_git(["clone", "--depth", "1", github_url, repo_path])
+                yield repo_path
+            finally:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            return
+
+        repo_path = os.path.join(self.cache_dir, self._repo_dir_name(github_url))
+        with self._repo_lock(repo_path):
+            if os.path.isdir(os.path.join(repo_path, ".git")):
+                try:
+                    self._fetch(repo_path, commit_sha)
+                    self.local_hits += 1
+                except subprocess.CalledProcessError:
+                    # Broken or rewritten clone: start over
+                    shutil.rmtree(repo_path, ignore_errors=True)
+                    self._clone(github_url, repo_path, commit_sha)
+                    self.local_misses += 1
+            else:
+                self._clone(github_url, repo_path, commit_sha)
+                self.local_misses += 1
+
+            self._touch(repo_path)
+            yield repo_path
+
+        self._evict()
+
+    def stats(self):
+        """Hit/miss counters for monitoring"""
+        with self._lock:
+            sizes = dict(self._sizes or {})
+        return {
+            's3_hits': self.hits,
+            's3_misses': self.misses,
+            'clone_hits': self.local_hits,
+            'clone_misses': self.local_misses,
+            'evictions': self.evictions,
+            'cached_repos': len(sizes),
+            'cached_bytes': sum(sizes.values())
+        }
+
+    def _clone(self, github_url, repo_path, commit_sha):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        run_git(["clone", "--depth", "1", github_url, repo_path])
+        head = run_git(["rev-parse", "HEAD"], cwd=repo_path).stdout.decode().strip()
+        if head != commit_sha:
+            # HEAD moved between ls-remote and clone
+            self._fetch(repo_path, commit_sha)
+
+    def _fetch(self, repo_path, commit_sha):
+        run_git(["fetch", "--depth", "1", "origin", commit_sha], cwd=repo_path)
+        run_git(["checkout", "--force", "--detach", commit_sha], cwd=repo_path)
+        run_git(["clean", "-ffdx"], cwd=repo_path)
+
+    def _touch(self, repo_path):
+        size = 0
+        for root, _, files in os.walk(repo_path):
+            for name in files:
+                try:
+                    size += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        os.utime(repo_path)
+        with self._lock:
+            self._load_sizes()
+            self._sizes[repo_path] = size
+
+    def _evict(self):
+        """Remove least recently used clones until we are under max_bytes"""
+        with self._lock:
+            self._load_sizes()
+            total = sum(self._sizes.values())
+            if total <= self.max_bytes:
+                return
+            by_age = sorted(self._sizes, key=self._last_used)
+            for repo_path in by_age:
+                if total <= self.max_bytes:
+                    break
+                repo_lock = self._repo_locks.setdefault(repo_path, threading.Lock())
+                if not repo_lock.acquire(blocking=False):
+                    continue  # in use right now
+                try:
+                    shutil.rmtree(repo_path, ignore_errors=True)
+                finally:
+                    repo_lock.release()
+                total -= self._sizes.pop(repo_path)
+                self.evictions += 1
+                print(f"[source-cache] Evicted {os.path.basename(repo_path)}")
+
+    def _load_sizes(self):
+        # Caller holds self._lock
+        if self._sizes is not None:
+            return
+        self._sizes = {}
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path):
+                self._sizes[path] = sum(
+                    os.lstat(os.path.join(root, f)).st_size
+                    for root, _, files in os.walk(path) for f in files
+                )
+
+    @staticmethod
+    def _last_used(repo_path):
+        try:
+            return os.path.getmtime(repo_path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _repo_dir_name(github_url):
+        url = github_url.rstrip('/')
+        if url.endswith('.git'):
+            url = url[:-4]
+        name = url.split('/')[-1]
+        digest = hashlib.sha1(url.lower().encode()).hexdigest()[:12]
+        return f"{name}-{digest}"
+
+    def _repo_lock(self, repo_path):
+        with self._lock:
+            if repo_path not in self._repo_locks:
+                self._repo_locks[repo_path] = threading.Lock()
+            return self._repo_locks[repo_path]
@@ -0,0 +1,299 @@
+"""
+S3 static hosting for DeployFast (HOSTING_MODE=s3): sites without instances.
+
+In the other hosting modes every site is copied onto an nginx host by
+CodeDeploy: an instance per site (or room on a shared host), a deploy
+that takes minutes, and visitors limited by what a t2.micro can serve.
+
+In s3 mode the build output is published to
+
+    s3://{STATIC_SITE_BUCKET}/sites/{subdomain}/
+
+and served by the bucket's website endpoint, or a CDN in front of it
+for {subdomain}.{STATIC_SITE_DOMAIN}. There is no create_ec2_instance
+and no Lambda / CodeDeploy step: the deploy IS the upload.
+
+What is published: the files a full deploy would publish from the
+artifact (bundles.published_files: dist/ or build/, else everything),
+without the appspec and scripts that are only there for CodeDeploy.
+
+Caching:
+- HTML: short max-age (STATIC_HTML_MAX_AGE), so a deploy shows up fast
+- fingerprinted assets, with a content hash in the name (app.3f9a1c2e.js,
+  what bundlers emit): immutable, cached for a year
+- other assets referenced from HTML (src= / href=) get a fingerprinted
+  copy ({name}.{md5}.{ext}), and the HTML points at the copy. The
+  original name stays (scripts may load it by name) with the short max-age
+
+Only what changed is uploaded: objects are written with put_object, so
+their ETag is the MD5 of the content, and a file whose MD5 matches the
+ETag already there is skipped. Assets go up before the HTML pointing at
+them. Files gone from the site are deleted afterwards, except
+fingerprinted assets younger than STATIC_ASSET_GRACE: pages cached
+before the deploy still load them.
+
+Bucket setup (once): static website hosting with index document
+index.html, and public read on sites/* (or a CloudFront origin access).
+STATIC_SITE_ENDPOINT_URL points the publisher at a local S3 stand-in
+(MinIO, LocalStack, moto server) to try it without AWS.
+
+Usage:
+    result = publish_site(s3, bucket, site_prefix(subdomain), artifact_zip)
+    url = site_url(subdomain, bucket, region)
+    delete_site(s3, bucket, site_prefix(subdomain))
+"""
+
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from bundles import published_files, SITE_SCRIPTS
+
+# ========================================
+# CONFIGURATION
+# ========================================
+STATIC_SITE_BUCKET = os.environ.get('STATIC_SITE_BUCKET', '')  # '' = the artifacts bucket
+STATIC_SITE_ENDPOINT_URL = os.environ.get('STATIC_SITE_ENDPOINT_URL') or None  # e.g. a local S3 stand-in
+STATIC_SITE_DOMAIN = os.environ.get('STATIC_SITE_DOMAIN', '')  # e.g. sites.example.com → https://{subdomain}.sites.example.com
+
+STATIC_HTML_MAX_AGE = int(os.environ.get('STATIC_HTML_MAX_AGE', 60))          # Seconds browsers / CDN keep HTML
+STATIC_ASSET_GRACE = int(os.environ.get('STATIC_ASSET_GRACE', 24 * 3600))     # Keep replaced fingerprinted assets
+STATIC_PUBLISH_WORKERS = int(os.environ.get('STATIC_PUBLISH_WORKERS', 16))    # Parallel put_object calls
+
+SITE_PREFIX = 'sites/'
+FINGERPRINT_LENGTH = 10
+DELETE_BATCH_SIZE = 1000  # delete_objects accepts up to 1000 keys
+
+SHORT_CACHE_CONTROL = f"public, max-age={STATIC_HTML_MAX_AGE}, must-revalidate"
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+HTML_EXTENSIONS = ('.html', '.htm')
+
+# Written into every build artifact for CodeDeploy, not part of the site
+DEPLOY_FILES = {'appspec.yml', 'scripts/site.env'} | {f"scripts/{name}" for name in SITE_SCRIPTS}
+
+# name.<hash>.ext / name-<hash>.ext: hex (webpack) or mixed-case base64url (vite, esbuild)
+HASH_PATTERN = re.compile(r'[.-]([0-9A-Za-z_]{8,})\.[0-9A-Za-z]+$')
+
+# src="..." / href='...' in HTML
+URL_ATTRIBUTE = re.compile(rb'''(\s(?:src|href)\s*=\s*)(["'])([^"'<>]*)\2''', re.IGNORECASE)
+EXTERNAL_URL = re.compile(r'^([a-z][a-z0-9+.-]*:|//|#)', re.IGNORECASE)
+
+
+def site_prefix(subdomain):
+    return f"{SITE_PREFIX}{subdomain}/"
+
+
+def site_url(subdomain, bucket, region):
+    """Where an s3-hosted site is reachable"""
+    if STATIC_SITE_DOMAIN:
+        return f"https://{subdomain}.{STATIC_SITE_DOMAIN}"
+    if STATIC_SITE_ENDPOINT_URL:
+        return f"{STATIC_SITE_ENDPOINT_URL.rstrip('/')}/{bucket}/{site_prefix(subdomain)}index.html"
+    return f"http://{bucket}.s3-website-{region}.amazonaws.com/{site_prefix(subdomain)}"
+
+
+def is_fingerprinted(path):
+    """Does the file name carry a content hash?"""
+    match = HASH_PATTERN.search(path)
+    if not match:
+        return False
+    token = match.group(1)
+    if not (any(c.isdigit() for c in token) and any(c.isalpha() for c in token)):
+        return False  # "settings", "20240101"
+    if re.fullmatch(r'[0-9a-f]+', token):
+        return True
+    # base64url needs both cases too, so "component2" does not match
+    return any(c.islower() for c in token) and any(c.isupper() for c in token)
+
+
+def fingerprinted_path(path, md5):
+    stem, ext = posixpath.splitext(path)
+    return f"{stem}.{md5[:FINGERPRINT_LENGTH]}{ext}"
+
+
+def content_type(path):
+    guessed, _ = mimetypes.guess_type(path)
+    if guessed and guessed.startswith('text/'):
+        return f"{guessed}; charset=utf-8"
+    return guessed or 'application/octet-stream'
+
+
+# ----------------------------------------
+# What to publish
+# ----------------------------------------
+
+def rewrite_html(body, html_path, assets):
+    """
+    Point the src= / href= of an HTML page at fingerprinted copies.
+
+    assets: {site path: fingerprinted site path} of every asset that gets
+    a copy. Returns (new body, set of site paths that were referenced).
+    """
+    referenced = set()
+
+    def replace(match):
+        url = match.group(3).decode('utf-8', 'replace')
+        if not url or EXTERNAL_URL.match(url):
+            return match.group(0)
+        path_part = re.split(r'[?#]', url, 1)[0]
+        suffix = url[len(path_part):]
+        if path_part.startswith('/'):
+            target = posixpath.normpath(path_part.lstrip('/'))
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(html_path), path_part))
+        if target not in assets:
+            return match.group(0)
+        referenced.add(target)
+        directory = path_part[:path_part.rfind('/') + 1]
+        new_url = directory + posixpath.basename(assets[target]) + suffix
+        return match.group(1) + match.group(2) + new_url.encode() + match.group(2)
+
+    return URL_ATTRIBUTE.sub(replace, body), referenced
+
+
+def plan_site(artifact):
+    """
+    Everything to publish from an open build artifact (ZipFile):
+    {site path: {'member' or 'body', 'md5', 'cache_control', 'content_type'}}
+    """
+    files = {p: m for p, m in published_files(artifact).items() if p not in DEPLOY_FILES}
+
+    digests = {}
+    for path, member in files.items():
+        digest = hashlib.md5()
+        with artifact.open(member) as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digests[path] = digest.hexdigest()
+
+    # Assets that would benefit from a fingerprinted copy
+    candidates = {
+        path: fingerprinted_path(path, digests[path])
+        for path in files
+        if not path.lower().endswith(HTML_EXTENSIONS) and not is_fingerprinted(path)
+    }
+    candidates = {path: copy for path, copy in candidates.items() if copy not in files}
+
+    site = {}
+    copied = set()
+    for path, member in files.items():
+        if path.lower().endswith(HTML_EXTENSIONS):
+            body, referenced = rewrite_html(artifact.read(member), path, candidates)
+            copied |= referenced
+            site[path] = {
+                'body': body,
+                'md5': hashlib.md5(body).hexdigest(),
+                'cache_control': SHORT_CACHE_CONTROL,
+                'content_type': content_type(path)
+            }
+        else:
+            site[path] = {
+                'member': member,
+                'md5': digests[path],
+                'cache_control': IMMUTABLE_CACHE_CONTROL if is_fingerprinted(path) else SHORT_CACHE_CONTROL,
+                'content_type': content_type(path)
+            }
+
+    for path in copied:
+        site[candidates[path]] = dict(site[path], cache_control=IMMUTABLE_CACHE_CONTROL)
+    return site
+
+
+# ----------------------------------------
+# Publish
+# ----------------------------------------
+
+def list_site(s3, bucket, prefix):
+    """{key: {'etag', 'last_modified'}} of what is published now"""
+    paginator = s3.get_paginator('list_objects_v2')
+    objects = {}
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            objects[obj['Key']] = {
+                'etag': obj.get('ETag', '').strip('"'),
+                'last_modified': obj.get('LastModified')
+            }
+    return objects
+
+
+def publish_site(s3, bucket, prefix, artifact_path, workers=STATIC_PUBLISH_WORKERS,
+                 grace=STATIC_ASSET_GRACE, now=lambda: datetime.now(timezone.utc)):
+    """
+    Publish a build artifact (zip path) at s3://{bucket}/{prefix}.
+
+    Returns {'files', 'uploaded', 'skipped', 'deleted', 'kept', 'bytes'}
+    (kept: replaced fingerprinted assets still within the grace period).
+    """
+    existing = list_site(s3, bucket, prefix)
+
+    with zipfile.ZipFile(artifact_path) as artifact:
+        site = plan_site(artifact)
+        changed = [
+            path for path, obj in site.items()
+            if existing.get(prefix + path, {}).get('etag') != obj['md5']
+        ]
+
+        def upload(path):
+            obj = site[path]
+            body = obj['body'] if 'body' in obj else artifact.read(obj['member'])
+            s3.put_object(
+                Bucket=bucket,
+                Key=prefix + path,
+                Body=body,
+                ContentType=obj['content_type'],
+                CacheControl=obj['cache_control']
+            )
+            return len(body)
+
+        # Assets first, then the pages pointing at them
+        pages = [p for p in changed if p.lower().endswith(HTML_EXTENSIONS)]
+        assets = [p for p in changed if not p.lower().endswith(HTML_EXTENSIONS)]
+        uploaded_bytes = 0
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='publish') as pool:
+            for group in (assets, pages):
+                uploaded_bytes += sum(pool.map(upload, group))
+
+    stale, kept = [], 0
+    for key, obj in existing.items():
+        path = key[len(prefix):]
+        if path in site:
+            continue
+        modified = obj['last_modified']
+        if is_fingerprinted(path) and modified and (now() - modified).total_seconds() < grace:
+            kept += 1
+            continue
+        stale.append(key)
+    deleted = delete_keys(s3, bucket, stale)
+
+    return {
+        'files': len(site),
+        'uploaded': len(changed),
+        'skipped': len(site) - len(changed),
+        'deleted': deleted,
+        'kept': kept,
+        'bytes': uploaded_bytes
+    }
+
+
+def delete_keys(s3, bucket, keys):
+    """Delete keys, 1000 per call. Returns the count deleted."""
+    deleted = 0
+    for i in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[i:i + DELETE_BATCH_SIZE]
+        response = s3.delete_objects(
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+        )
+        deleted += len(batch) - len(response.get('Errors', []))
+    return deleted
+
+
+def delete_site(s3, bucket, prefix):
+    """Take a site down: delete everything under its prefix"""
+    return delete_keys(s3, bucket, list(list_site(s3, bucket, prefix)))
@@ -0,0 +1,811 @@
+"""
+Deployment storage for DeployFast.
+
+Replaces the in-process `deployments = {}` dict, which was lost on
+restart and not shared between gunicorn workers.
+
+Two backends with the same interface:
+- SQLiteStore   (default) one file shared by every worker on the host
+- DynamoDBStore shared by every host; works with DynamoDB Local by
+                setting DYNAMODB_ENDPOINT_URL=http://localhost:8000
+
+Each record is stored as a JSON document plus the indexed fields
+(status, created_at, github_url) and a version number. Every write is
+a read-modify-write guarded by that version (SQLite: a write
+transaction, DynamoDB: a conditional write). Two workers updating the
+same deployment never lose each other's changes. transition() only
+changes the status if it is still what the caller expects.
+
+Listing is newest first with cursor pagination:
+
+    items, cursor = store.list(status=['live'], limit=20)
+    more, cursor = store.list(status=['live'], limit=20, cursor=cursor)
+
+Change log: every write also bumps one store-wide version and stamps
+the record with it (change_seq); a delete leaves a tombstone with its
+version. A client that has seen version V only needs what changed since:
+
+    version = store.version()                 # cheap, for ETags / caches
+    delta = store.changes(since=V)            # changed records + deleted IDs
+
+SQLite keeps the newest TOMBSTONES_KEPT tombstones; a client older than
+that gets reset=True and must list everything again.
+
+Also kept here, outside the change log (they never bump the version):
+- worker heartbeats: which processes are alive, so a deployment owned
+  by a dead one can be resumed elsewhere (see resume.py)
+- idempotency keys: POST /deploy with the same Idempotency-Key gets the
+  deployment the first request created
+
+    store.heartbeat(worker_id)
+    seen = store.heartbeats()                 # worker_id → epoch seconds
+    existing = store.claim_key(key, deployment_id, fingerprint, ttl)
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# ========================================
+# CONFIGURATION
+# ========================================
+DEPLOYMENT_STORE = os.environ.get('DEPLOYMENT_STORE', 'sqlite')  # sqlite | dynamodb
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'deployments.db')
+DYNAMODB_TABLE = os.environ.get('DYNAMODB_TABLE', 'DeployFast-Deployments')
+DYNAMODB_ENDPOINT_URL = os.environ.get('DYNAMODB_ENDPOINT_URL') or None  # e.g. DynamoDB Local
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+TOMBSTONES_KEPT = int(os.environ.get('STORE_TOMBSTONES_KEPT', 10000))  # SQLite: deletes remembered for ?since=
+WORKERS_KEPT = 24 * 3600  # Heartbeats older than this are forgotten
+
+
+class ConflictError(Exception):
+    """Raised when a record kept changing under us (too many retries)."""
+
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+class DeploymentStore:
+    """
+    Interface every backend implements.
+
+    Records are plain dicts with at least deployment_id, status,
+    created_at and github_url.
+    """
+
+    def create(self, record):
+        """Insert a new record. Returns False if the ID already exists."""
+        raise NotImplementedError
+
+    def get(self, deployment_id):
+        """Record or None"""
+        raise NotImplementedError
+
+    def update(self, deployment_id, **fields):
+        """Set top-level fields. Returns the new record, or None if missing."""
+        return self.mutate(deployment_id, lambda record: record.update(fields))
+
+    def update_step(self, deployment_id, step, **fields):
+        """Merge fields into record['steps'][step]"""
+        def apply(record):
+            record.setdefault('steps', {}).setdefault(step, {}).update(fields)
+        return self.mutate(deployment_id, apply)
+
+    def transition(self, deployment_id, from_statuses, to_status, **fields):
+        """
+        Atomically move status from one of from_statuses to to_status.
+
+        Returns the new record, or None if the record is missing or its
+        status is not in from_statuses (someone else got there first).
+        """
+        def apply(record):
+            if record.get('status') not in from_statuses:
+                return False
+            record.update(fields)
+            record['status'] = to_status
+        return self.mutate(deployment_id, apply)
+
+    def mutate(self, deployment_id, func):
+        """
+        Atomic read-modify-write: func(record) edits the record in place.
+        If func returns False, nothing is written and None is returned.
+        """
+        raise NotImplementedError
+
+    def delete(self, deployment_id):
+        """Returns True if a record was deleted"""
+        raise NotImplementedError
+
+    def list(self, status=None, github_url=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        """
+        Newest first. status: list of statuses to include (or None).
+        Returns (records, next_cursor); next_cursor is None on the last page.
+        """
+        raise NotImplementedError
+
+    def count(self, status=None):
+        raise NotImplementedError
+
+    def version(self):
+        """Store-wide version: changes whenever any record is created, changed or deleted"""
+        raise NotImplementedError
+
+    def heartbeat(self, worker_id):
+        """worker_id is alive right now"""
+        raise NotImplementedError
+
+    def heartbeats(self):
+        """worker_id → time of its last heartbeat (epoch seconds)"""
+        raise NotImplementedError
+
+    def claim_key(self, key, deployment_id, fingerprint, ttl):
+        """
+        Claim an idempotency key for deployment_id, for ttl seconds.
+
+        Returns None if the key is ours now, or the claim that holds it:
+        {'deployment_id', 'fingerprint'} (fingerprint: what was requested).
+        """
+        raise NotImplementedError
+
+    def release_key(self, key, deployment_id):
+        """Drop a claim made for deployment_id (the request was turned away)"""
+        raise NotImplementedError
+
+    def changes(self, since, limit=MAX_PAGE_SIZE):
+        """
+        What changed after version since, oldest change first.
+
+        Returns {'version', 'changed': [records], 'deleted': [IDs],
+        'more', 'reset'}. Pass 'version' back as since for the next call
+        (more=True: call again right away). reset=True: since is too old
+        or unknown, list everything instead.
+        """
+        raise NotImplementedError
+
+
+def merge_changes(records, tombstones, since, current, limit):
+    """
+    changes() result from (change_seq, record) and (change_seq, ID)
+    pairs, both sorted by change_seq. Pairs at or below since (a re-read
+    overlap) are passed through and do not count against limit.
+    """
+    merged = sorted(
+        [(seq, 'changed', record) for seq, record in records] +
+        [(seq, 'deleted', deployment_id) for seq, deployment_id in tombstones],
+        key=lambda change: change[0]
+    )
+    fresh = [seq for seq, _, _ in merged if seq > since]
+    more = len(fresh) > limit
+    if more:
+        merged = [change for change in merged if change[0] <= fresh[limit - 1]]
+    return {
+        'version': fresh[limit - 1] if more else max(current, since),
+        'changed': [item for _, kind, item in merged if kind == 'changed'],
+        'deleted': [item for _, kind, item in merged if kind == 'deleted'],
+        'more': more,
+        'reset': False
+    }
+
+
+# ========================================
+# SQLITE (default)
+# ========================================
+
+class SQLiteStore(DeploymentStore):
+    """
+    One SQLite file, WAL mode, one connection per thread.
+
+    Writes use BEGIN IMMEDIATE, which takes the database write lock
+    up front. Read-modify-write is therefore atomic across threads AND
+    across processes (gunicorn workers) on the same host.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS deployments (
+            deployment_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            github_url TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_deployments_created ON deployments (created_at, deployment_id);
+        CREATE INDEX IF NOT EXISTS idx_deployments_status ON deployments (status, created_at, deployment_id);
+        CREATE INDEX IF NOT EXISTS idx_deployments_github_url ON deployments (github_url, created_at, deployment_id);
+        CREATE TABLE IF NOT EXISTS deployment_tombstones (
+            change_seq INTEGER PRIMARY KEY,
+            deployment_id TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS store_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            tombstones_pruned INTEGER NOT NULL DEFAULT 0
+        );
+        INSERT OR IGNORE INTO store_version (id, version) VALUES (1, 0);
+        CREATE TABLE IF NOT EXISTS workers (
+            worker_id TEXT PRIMARY KEY,
+            seen REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            deployment_id TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path=SQLITE_PATH, tombstones_kept=TOMBSTONES_KEPT):
+        self.path = path
+        self.tombstones_kept = tombstones_kept
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(self.SCHEMA)
+        # Databases created before the change log
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(deployments)')]
+        if 'change_seq' not in columns:
+            conn.execute('ALTER TABLE deployments ADD COLUMN change_seq INTEGER NOT NULL DEFAULT 0')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_deployments_change_seq ON deployments (change_seq)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _next_version(conn):
+        """Bump the store version (inside the caller's write transaction)"""
+        conn.execute('UPDATE store_version SET version = version + 1 WHERE id = 1')
+        return conn.execute('SELECT version FROM store_version WHERE id = 1').fetchone()[0]
+
+    def create(self, record):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT INTO deployments (deployment_id, status, created_at, github_url, change_seq, data) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (record['deployment_id'], record['status'], record['created_at'],
+                 record['github_url'], self._next_version(conn), json.dumps(record))
+            )
+            conn.execute('COMMIT')
+        except sqlite3.IntegrityError:
+            conn.execute('ROLLBACK')
+            return False
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def get(self, deployment_id):
+        row = self._connection().execute(
+            'SELECT data FROM deployments WHERE deployment_id = ?', (deployment_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def mutate(self, deployment_id, func):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT data FROM deployments WHERE deployment_id = ?', (deployment_id,)
+            ).fetchone()
+            if row is None:
+                conn.execute('ROLLBACK')
+                return None
+
+            record = json.loads(row[0])
+            if func(record) is False:
+                conn.execute('ROLLBACK')
+                return None
+
+            conn.execute(
+                'UPDATE deployments SET status = ?, github_url = ?, version = version + 1, '
+                'change_seq = ?, data = ? WHERE deployment_id = ?',
+                (record['status'], record['github_url'], self._next_version(conn),
+                 json.dumps(record), deployment_id)
+            )
+            conn.execute('COMMIT')
+            return record
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def delete(self, deployment_id):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute('DELETE FROM deployments WHERE deployment_id = ?', (deployment_id,))
+            deleted = cursor.rowcount > 0
+            if deleted:
+                conn.execute(
+                    'INSERT INTO deployment_tombstones (change_seq, deployment_id) VALUES (?, ?)',
+                    (self._next_version(conn), deployment_id)
+                )
+                self._prune_tombstones(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        return deleted
+
+    def _prune_tombstones(self, conn):
+        """Keep the newest tombstones_kept; remember up to which version they are gone"""
+        row = conn.execute(
+            'SELECT change_seq FROM deployment_tombstones ORDER BY change_seq DESC LIMIT 1 OFFSET ?',
+            (self.tombstones_kept,)
+        ).fetchone()
+        if row:
+            conn.execute('DELETE FROM deployment_tombstones WHERE change_seq <= ?', (row[0],))
+            conn.execute('UPDATE store_version SET tombstones_pruned = ? WHERE id = 1', (row[0],))
+
+    def list(self, status=None, github_url=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        where, params = [], []
+        if status:
+            where.append(f"status IN ({', '.join('?' for _ in status)})")
+            params.extend(status)
+        if github_url:
+            where.append('github_url = ?')
+            params.append(github_url)
+        if cursor:
+            created_at, deployment_id = decode_cursor(cursor)
+            where.append('(created_at, deployment_id) < (?, ?)')
+            params.extend([created_at, deployment_id])
+
+        sql = 'SELECT data FROM deployments'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY created_at DESC, deployment_id DESC LIMIT ?'
+        params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        records = [json.loads(row[0]) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = records[-1]
+            next_cursor = encode_cursor([last['created_at'], last['deployment_id']])
+        return records, next_cursor
+
+    def count(self, status=None):
+        if status:
+            row = self._connection().execute(
+                f"SELECT COUNT(*) FROM deployments WHERE status IN ({', '.join('?' for _ in status)})",
+                list(status)
+            ).fetchone()
+        else:
+            row = self._connection().execute('SELECT COUNT(*) FROM deployments').fetchone()
+        return row[0]
+
+    def version(self):
+        return self._connection().execute('SELECT version FROM store_version WHERE id = 1').fetchone()[0]
+
+    def heartbeat(self, worker_id):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('INSERT OR REPLACE INTO workers (worker_id, seen) VALUES (?, ?)', (worker_id, now))
+            conn.execute('DELETE FROM workers WHERE seen < ?', (now - WORKERS_KEPT,))
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def heartbeats(self):
+        return dict(self._connection().execute('SELECT worker_id, seen FROM workers').fetchall())
+
+    def claim_key(self, key, deployment_id, fingerprint, ttl):
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM idempotency_keys WHERE expires_at < ?', (now,))
+            row = conn.execute(
+                'SELECT deployment_id, fingerprint FROM idempotency_keys WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                conn.execute(
+                    'INSERT INTO idempotency_keys (key, deployment_id, fingerprint, expires_at) VALUES (?, ?, ?, ?)',
+                    (key, deployment_id, fingerprint, now + ttl)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        return {'deployment_id': row[0], 'fingerprint': row[1]} if row else None
+
+    def release_key(self, key, deployment_id):
+        self._connection().execute(
+            'DELETE FROM idempotency_keys WHERE key = ? AND deployment_id = ?', (key, deployment_id)
+        )
+
+    def changes(self, since, limit=MAX_PAGE_SIZE):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        conn = self._connection()
+        conn.execute('BEGIN')  # one snapshot for all three reads
+        try:
+            current, pruned = conn.execute(
+                'SELECT version, tombstones_pruned FROM store_version WHERE id = 1'
+            ).fetchone()
+            if since < pruned or since > current:
+                return {'version': current, 'changed': [], 'deleted': [], 'more': False, 'reset': True}
+            records = [
+                (seq, json.loads(data)) for seq, data in conn.execute(
+                    'SELECT change_seq, data FROM deployments WHERE change_seq > ? ORDER BY change_seq LIMIT ?',
+                    (since, limit + 1)
+                )
+            ]
+            tombstones = conn.execute(
+                'SELECT change_seq, deployment_id FROM deployment_tombstones '
+                'WHERE change_seq > ? ORDER BY change_seq LIMIT ?',
+                (since, limit + 1)
+            ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        return merge_changes(records, tombstones, since, current, limit)
+
+
+# ========================================
+# DYNAMODB
+# ========================================
+
+class DynamoDBStore(DeploymentStore):
+    """
+    DynamoDB table (create it with ensure_table()):
+
+    - Key:  deployment_id
+    - GSI status-created_at:     status + created_at     (status filter)
+    - GSI github_url-created_at: github_url + created_at (per-repo list)
+    - GSI kind-created_at:       kind ("deployment") + created_at
+                                 (newest-first list of everything)
+    - GSI kind-change_seq:       kind ("deployment" / "tombstone") + change_seq
+                                 (changes since a version; add it to
+                                 tables created before with update_table)
+
+    Writes are conditional on the record's version, retried on conflict.
+
+    The store version is a counter item (ADD, atomic). A writer takes its
+    change_seq just before its put, so a slower writer can land a lower
+    change_seq after a reader saw a higher one: changes() re-reads the
+    last VERSION_OVERLAP versions (clients apply changes idempotently).
+    Tombstones are tiny and deletes rare, so they are all kept.
+
+    Worker heartbeats ('#worker#{id}', kind "worker", in kind-created_at)
+    and idempotency keys ('#idempotency#{key}', in no index, removed by
+    the table's TTL on expires_at if enabled) live in the same table.
+    """
+
+    MAX_RETRIES = 10
+    VERSION_KEY = '#store-version'
+    TOMBSTONE_PREFIX = '#tombstone#'
+    WORKER_PREFIX = '#worker#'
+    KEY_PREFIX = '#idempotency#'
+    VERSION_OVERLAP = 50
+
+    def __init__(self, dynamodb, table_name=DYNAMODB_TABLE):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+
+    def ensure_table(self):
+        """Create the table + indexes if missing (handy with DynamoDB Local)"""
+        existing = self.dynamodb.list_tables().get('TableNames', [])
+        if self.table_name in existing:
+            return
+
+        def index(name, hash_key, range_key='created_at'):
+            return {
+                'IndexName': name,
+                'KeySchema': [
+                    {'AttributeName': hash_key, 'KeyType': 'HASH'},
+                    {'AttributeName': range_key, 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+
+        self.dynamodb.create_table(
+            TableName=self.table_name,
+            BillingMode='PAY_PER_REQUEST',
+            AttributeDefinitions=[
+                {'AttributeName': name, 'AttributeType': 'S'}
+                for name in ('deployment_id', 'status', 'created_at', 'github_url', 'kind')
+            ] + [{'AttributeName': 'change_seq', 'AttributeType': 'N'}],
+            KeySchema=[{'AttributeName': 'deployment_id', 'KeyType': 'HASH'}],
+            GlobalSecondaryIndexes=[
+                index('status-created_at', 'status'),
+                index('github_url-created_at', 'github_url'),
+                index('kind-created_at', 'kind'),
+                index('kind-change_seq', 'kind', 'change_seq')
+            ]
+        )
+        self.dynamodb.get_waiter('table_exists').wait(TableName=self.table_name)
+
+    def _item(self, record, version, change_seq):
+        return {
+            'deployment_id': {'S': record['deployment_id']},
+            'status': {'S': record['status']},
+            'created_at': {'S': record['created_at']},
+            'github_url': {'S': record['github_url']},
+            'kind': {'S': 'deployment'},
+            'version': {'N': str(version)},
+            'change_seq': {'N': str(change_seq)},
+            'data': {'S': json.dumps(record)}
+        }
+
+    def _next_version(self):
+        response = self.dynamodb.update_item(
+            TableName=self.table_name,
+            Key={'deployment_id': {'S': self.VERSION_KEY}},
+            UpdateExpression='ADD store_version :one',
+            ExpressionAttributeValues={':one': {'N': '1'}},
+            ReturnValues='UPDATED_NEW'
+        )
+        return int(response['Attributes']['store_version']['N'])
+
+    def create(self, record):
+        try:
+            self.dynamodb.put_item(
+                TableName=self.table_name,
+                Item=self._item(record, 1, self._next_version()),
+                ConditionExpression='attribute_not_exists(deployment_id)'
+            )
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def _get_item(self, deployment_id):
+        response = self.dynamodb.get_item(
+            TableName=self.table_name,
+            Key={'deployment_id': {'S': deployment_id}},
+            ConsistentRead=True
+        )
+        return response.get('Item')
+
+    def get(self, deployment_id):
+        item = self._get_item(deployment_id)
+        return json.loads(item['data']['S']) if item else None
+
+    def mutate(self, deployment_id, func):
+        for attempt in range(self.MAX_RETRIES):
+            item = self._get_item(deployment_id)
+            if item is None:
+                return None
+
+            version = int(item['version']['N'])
+            record = json.loads(item['data']['S'])
+            if func(record) is False:
+                return None
+
+            try:
+                self.dynamodb.put_item(
+                    TableName=self.table_name,
+                    Item=self._item(record, version + 1, self._next_version()),
+                    ConditionExpression='version = :version',
+                    ExpressionAttributeValues={':version': {'N': str(version)}}
+                )
+                return record
+            except self.dynamodb.exceptions.ConditionalCheckFailedException:
+                # Someone else wrote first: re-read and re-apply
+                time.sleep(0.05 * (attempt + 1))
+
+        raise ConflictError(f"Deployment {deployment_id} kept changing, gave up")
+
+    def delete(self, deployment_id):
+        response = self.dynamodb.delete_item(
+            TableName=self.table_name,
+            Key={'deployment_id': {'S': deployment_id}},
+            ReturnValues='ALL_OLD'
+        )
+        if 'Attributes' not in response:
+            return False
+        self.dynamodb.put_item(
+            TableName=self.table_name,
+            Item={
+                'deployment_id': {'S': self.TOMBSTONE_PREFIX + deployment_id},
+                'kind': {'S': 'tombstone'},
+                'change_seq': {'N': str(self._next_version())}
+            }
+        )
+        return True
+
+    def list(self, status=None, github_url=None, limit=DEFAULT_PAGE_SIZE, cursor=None):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        values = {}
+        filters = []
+
+        if status and len(status) == 1 and not github_url:
+            index, key_name = 'status-created_at', 'status'
+            values[':key'] = {'S': status[0]}
+        elif github_url:
+            index, key_name = 'github_url-created_at', 'github_url'
+            values[':key'] = {'S': github_url}
+        else:
+            index, key_name = 'kind-created_at', 'kind'
+            values[':key'] = {'S': 'deployment'}
+
+        if status and key_name != 'status':
+            names = []
+            for i, value in enumerate(status):
+                values[f':s{i}'] = {'S': value}
+                names.append(f':s{i}')
+            filters.append(f"#status IN ({', '.join(names)})")
+
+        query = {
+            'TableName': self.table_name,
+            'IndexName': index,
+            'KeyConditionExpression': '#key = :key',
+            'ExpressionAttributeNames': {'#key': key_name},
+            'ExpressionAttributeValues': values,
+            'ScanIndexForward': False,
+            'Limit': limit
+        }
+        if filters:
+            query['FilterExpression'] = ' AND '.join(filters)
+            query['ExpressionAttributeNames']['#status'] = 'status'
+        if cursor:
+            query['ExclusiveStartKey'] = decode_cursor(cursor)
+
+        response = self.dynamodb.query(**query)
+        records = [json.loads(item['data']['S']) for item in response.get('Items', [])]
+        last_key = response.get('LastEvaluatedKey')
+        return records, encode_cursor(last_key) if last_key else None
+
+    def count(self, status=None):
+        total = 0
+        for value in (status or [None]):
+            query = {'TableName': self.table_name, 'Select': 'COUNT'}
+            if value is None:
+                query.update({
+                    'IndexName': 'kind-created_at',
+                    'KeyConditionExpression': '#kind = :key',
+                    'ExpressionAttributeNames': {'#kind': 'kind'},
+                    'ExpressionAttributeValues': {':key': {'S': 'deployment'}}
+                })
+            else:
+                query.update({
+                    'IndexName': 'status-created_at',
+                    'KeyConditionExpression': '#status = :key',
+                    'ExpressionAttributeNames': {'#status': 'status'},
+                    'ExpressionAttributeValues': {':key': {'S': value}}
+                })
+            while True:
+                response = self.dynamodb.query(**query)
+                total += response['Count']
+                if 'LastEvaluatedKey' not in response:
+                    break
+                query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return total
+
+    def version(self):
+        item = self._get_item(self.VERSION_KEY)
+        return int(item['store_version']['N']) if item else 0
+
+    def heartbeat(self, worker_id):
+        now = time.time()
+        self.dynamodb.put_item(
+            TableName=self.table_name,
+            Item={
+                'deployment_id': {'S': self.WORKER_PREFIX + worker_id},
+                'kind': {'S': 'worker'},
+                'created_at': {'S': datetime.fromtimestamp(now).isoformat()},
+                'seen': {'N': str(now)},
+                'expires_at': {'N': str(int(now + WORKERS_KEPT))}
+            }
+        )
+
+    def heartbeats(self):
+        query = {
+            'TableName': self.table_name,
+            'IndexName': 'kind-created_at',
+            'KeyConditionExpression': '#kind = :kind AND created_at > :oldest',
+            'ExpressionAttributeNames': {'#kind': 'kind'},
+            'ExpressionAttributeValues': {
+                ':kind': {'S': 'worker'},
+                ':oldest': {'S': datetime.fromtimestamp(time.time() - WORKERS_KEPT).isoformat()}
+            }
+        }
+        seen = {}
+        while True:
+            response = self.dynamodb.query(**query)
+            for item in response.get('Items', []):
+                seen[item['deployment_id']['S'][len(self.WORKER_PREFIX):]] = float(item['seen']['N'])
+            if 'LastEvaluatedKey' not in response:
+                return seen
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def claim_key(self, key, deployment_id, fingerprint, ttl):
+        now = time.time()
+        for _ in range(self.MAX_RETRIES):
+            try:
+                self.dynamodb.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        'deployment_id': {'S': self.KEY_PREFIX + key},
+                        'claimed_for': {'S': deployment_id},
+                        'fingerprint': {'S': fingerprint},
+                        'expires_at': {'N': str(int(now + ttl))}
+                    },
+                    # Expired claims may still be in the table (TTL deletes lazily)
+                    ConditionExpression='attribute_not_exists(deployment_id) OR expires_at < :now',
+                    ExpressionAttributeValues={':now': {'N': str(int(now))}}
+                )
+                return None
+            except self.dynamodb.exceptions.ConditionalCheckFailedException:
+                item = self._get_item(self.KEY_PREFIX + key)
+                if item:  # else: released in between, claim again
+                    return {'deployment_id': item['claimed_for']['S'], 'fingerprint': item['fingerprint']['S']}
+        raise ConflictError(f"Idempotency key {key} kept changing, gave up")
+
+    def release_key(self, key, deployment_id):
+        try:
+            self.dynamodb.delete_item(
+                TableName=self.table_name,
+                Key={'deployment_id': {'S': self.KEY_PREFIX + key}},
+                ConditionExpression='claimed_for = :id',
+                ExpressionAttributeValues={':id': {'S': deployment_id}}
+            )
+        except self.dynamodb.exceptions.ConditionalCheckFailedException:
+            pass
+
+    def changes(self, since, limit=MAX_PAGE_SIZE):
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        current = self.version()
+        if since > current:
+            return {'version': current, 'changed': [], 'deleted': [], 'more': False, 'reset': True}
+
+        def since_seq(kind):
+            response = self.dynamodb.query(
+                TableName=self.table_name,
+                IndexName='kind-change_seq',
+                KeyConditionExpression='#kind = :kind AND change_seq > :since',
+                ExpressionAttributeNames={'#kind': 'kind'},
+                ExpressionAttributeValues={
+                    ':kind': {'S': kind},
+                    ':since': {'N': str(max(0, since - self.VERSION_OVERLAP))}
+                },
+                Limit=limit + self.VERSION_OVERLAP + 1
+            )
+            return [(int(item['change_seq']['N']), item) for item in response.get('Items', [])]
+
+        records = [(seq, json.loads(item['data']['S'])) for seq, item in since_seq('deployment')]
+        tombstones = [
+            (seq, item['deployment_id']['S'][len(self.TOMBSTONE_PREFIX):])
+            for seq, item in since_seq('tombstone')
+        ]
+        return merge_changes(records, tombstones, since, current, limit)
+
+
+def make_store(backend=DEPLOYMENT_STORE, region_name=None):
+    """Build the store selected by DEPLOYMENT_STORE"""
+    if backend == 'sqlite':
+        return SQLiteStore()
+    if backend == 'dynamodb':
+        from aws_clients import get_client
+        client = get_client('dynamodb', region_name=region_name, endpoint_url=DYNAMODB_ENDPOINT_URL)
+        store = DynamoDBStore(client)
+        if DYNAMODB_ENDPOINT_URL:
+            store.ensure_table()  # local testing: create the table on the fly
+        return store
+    raise ValueError(f"Unknown DEPLOYMENT_STORE: {backend}")
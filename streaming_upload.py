@@ -0,0 +1,220 @@
+"""
+Streaming zip → S3 multipart upload for DeployFast.
+
+The old upload path made three full passes over the repo:
+clone → zip to disk (shutil.make_archive) → read zip back (upload_fileobj),
+and needed twice the repo size in disk space.
+
+Here the zip is written straight into an S3 multipart upload:
+
+    repo files ──► zipfile ──► S3MultipartWriter ──► upload_part (N threads)
+
+- Memory is bounded: at most (max_concurrency + 1) parts are in memory
+- Parts upload while the next part is being zipped
+- Nothing but the clone itself touches the disk
+"""
+
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# ========================================
+# CONFIGURATION
+# ========================================
+S3_UPLOAD_PART_SIZE = int(os.environ.get('S3_UPLOAD_PART_SIZE_MB', 8)) * 1024 * 1024
+S3_UPLOAD_CONCURRENCY = int(os.environ.get('S3_UPLOAD_CONCURRENCY', 4))
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 minimum for every part but the last
+
+
+class S3MultipartWriter:
+    """
+    Write-only file object that uploads to S3 as data comes in.
+
+    Usage:
+        with S3MultipartWriter(s3, bucket, key) as f:
+            f.write(b'...')
+
+    Objects smaller than one part are sent with a single put_object.
+    On error the multipart upload is aborted, so no half-written object
+    (or billed orphan parts) is left behind.
+    """
+
+    def __init__(self, s3, bucket, key, part_size=S3_UPLOAD_PART_SIZE,
+                 max_concurrency=S3_UPLOAD_CONCURRENCY, content_type='application/zip', metadata=None):
+        if part_size < MIN_PART_SIZE:
+            raise ValueError(f"part_size must be at least {MIN_PART_SIZE} bytes")
+
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.max_concurrency = max_concurrency
+        self.content_type = content_type
+        self.metadata = metadata or {}
+
+        self._buffer = bytearray()
+        self._position = 0
+        self._upload_id = None
+        self._parts = []
+        self._futures = []
+        self._executor = None
+        # Bounds memory: a part waits here until an upload slot is free
+        self._slots = threading.Semaphore(max_concurrency)
+        self.closed = False
+
+    # file-object API used by zipfile
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._send_part(part)
+        return len(data)
+
+    def close(self):
+        """Upload what is left and complete the upload"""
+        if self.closed:
+            return
+        self.closed = True
+
+        if self._upload_id is None:
+            # Small object: one request, no multipart overhead
+            self.s3.put_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                ContentType=self.content_type,
+                Metadata=self.metadata
+            )
+            return
+
+        if self._buffer:
+            self._send_part(bytes(self._buffer))
+            self._buffer = bytearray()
+
+        for future in self._futures:
+            future.result()
+        self._executor.shutdown()
+
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={'Parts': sorted(self._parts, key=lambda p: p['PartNumber'])}
+        )
+
+    def abort(self):
+        """Throw away everything uploaded so far"""
+        self.closed = True
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        if self._upload_id:
+            self.s3.abort_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+            return False
+        try:
+            self.close()
+        except Exception:
+            self.abort()
+            raise
+        return False
+
+    @property
+    def size(self):
+        return self._position
+
+    # internals
+
+    def _send_part(self, data):
+        if self._upload_id is None:
+            response = self.s3.create_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type,
+                Metadata=self.metadata
+            )
+            self._upload_id = response['UploadId']
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency,
+                thread_name_prefix='s3-part'
+            )
+
+        # Surface a failed part early instead of zipping the rest for nothing
+        for future in self._futures:
+            if future.done() and future.exception():
+                raise future.exception()
+
+        part_number = len(self._futures) + 1
+        self._slots.acquire()
+        self._futures.append(
+            self._executor.submit(self._upload_part, part_number, data)
+        )
+
+    def _upload_part(self, part_number, data):
+        try:
+            response = self.s3.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            self._parts.append({'PartNumber': part_number, 'ETag': response['ETag']})
+        finally:
+            self._slots.release()
+
+
+def zip_directory(source_dir, fileobj, exclude=('.git',)):
+    """
+    Zip every file under source_dir into fileobj (paths relative to source_dir).
+
+    fileobj only needs write() and tell(), so it can be an
+    S3MultipartWriter. Returns the number of files written.
+    """
+    count = 0
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for root, dirs, files in os.walk(source_dir):
+            dirs[:] = sorted(d for d in dirs if d not in exclude)
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if os.path.islink(path) and not os.path.exists(path):
+                    continue  # broken symlink
+                archive.write(path, os.path.relpath(path, source_dir))
+                count += 1
+    return count
+
+
+def stream_directory_to_s3(s3, source_dir, bucket, key,
+                           part_size=S3_UPLOAD_PART_SIZE, max_concurrency=S3_UPLOAD_CONCURRENCY,
+                           metadata=None):
+    """
+    Zip source_dir straight into s3://bucket/key (metadata: S3 user metadata).
+
+    Returns {'files': ..., 'bytes': ...}
+    """
+    with S3MultipartWriter(s3, bucket, key, part_size, max_concurrency, metadata=metadata) as writer:
+        files = zip_directory(source_dir, writer)
+    return {'files': files, 'bytes': writer.size}
@@ -0,0 +1,71 @@
+"""
+Shared fixtures. AWS calls go to the in-process fakes of the benchmarks
+(benchmarks/fake_aws.py), so nothing here needs credentials or a network.
+"""
+
+import atexit
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_aws import FakeAWS  # noqa: E402
+
+# Set before any test module imports store / source_cache, which read
+# their paths at import time: app.py gets a throwaway store and clone dir
+_state = tempfile.mkdtemp(prefix='deployfast-tests-')
+atexit.register(shutil.rmtree, _state, ignore_errors=True)
+os.environ.update({
+    'SQLITE_PATH': os.path.join(_state, 'deployments.db'),
+    'SOURCE_CACHE_DIR': os.path.join(_state, 'clones'),
+    'WARM_POOL_SIZE': '0',
+    'REAPER_INTERVAL': '0',
+    'RESUME_INTERVAL': '0',
+    'CODEBUILD_EVENTS_QUEUE_URL': ''
+})
+
+
+@pytest.fixture
+def aws():
+    """Fake AWS with no simulated latency, installed into aws_clients"""
+    fake = FakeAWS(latency={'api': 0, 'ec2_boot': 0, 'build': 0, 'deploy': 0}, jitter=0)
+    fake.install()
+    return fake
+
+
+@pytest.fixture
+def s3(aws):
+    return aws.clients['s3']
+
+
+@pytest.fixture
+def store(tmp_path):
+    from store import SQLiteStore
+    return SQLiteStore(str(tmp_path / 'deployments.db'))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """app.py, imported once against the fakes with a throwaway SQLite store"""
+    FakeAWS(latency={'api': 0}, jitter=0).install()
+    import app
+    return app
+
+
+_addresses = itertools.count(1)
+
+
+@pytest.fixture
+def http(app_module):
+    """Flask test client with an address of its own (rate limits are per client)"""
+    client = app_module.app.test_client()
+    n = next(_addresses)
+    client.environ_base['REMOTE_ADDR'] = f"10.0.{n // 250}.{n % 250 + 1}"
+    return client
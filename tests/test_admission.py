@@ -0,0 +1,38 @@
+import pytest
+
+from admission import ClientLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_client_limiter_is_per_client():
+    clock = FakeClock()
+    limiter = ClientLimiter(rate_per_minute=60, burst=2, clock=clock)
+
+    assert limiter.check('a') == 0
+    assert limiter.check('a') == 0
+    assert limiter.check('a') == pytest.approx(1.0)
+    assert limiter.check('b') == 0
+
+
+def test_client_limiter_charges_one_token_per_deployment():
+    clock = FakeClock()
+    limiter = ClientLimiter(rate_per_minute=60, burst=5, clock=clock)
+    assert limiter.check('a', 4) == 0
+    assert limiter.check('a', 2) == pytest.approx(1.0)
+
+    limiter.refund('a', 4)
+    assert limiter.check('a', 5) == 0
+
+
+def test_client_limiter_rejects_more_than_a_full_bucket():
+    limiter = ClientLimiter(rate_per_minute=60, burst=5, clock=FakeClock())
+    with pytest.raises(ValueError, match='burst of 5'):
+        limiter.check('a', 6)
+    assert limiter.check('a', 5) == 0
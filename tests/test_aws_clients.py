@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+import aws_clients
+from aws_clients import LazyClient, client_config, get_client, register_event_handler  # before FakeAWS.install()
+
+
+class FakeSession:
+    """Stands in for boto3.session.Session: counts the clients it creates"""
+    created = []
+
+    def __init__(self):
+        self.events = self
+        self.handlers = []
+
+    def register(self, event_name, handler):
+        self.handlers.append((event_name, handler))
+
+    def client(self, service_name, region_name=None, config=None, **kwargs):
+        client = {'service': service_name, 'region': region_name, 'config': config, **kwargs}
+        FakeSession.created.append(client)
+        return client
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """Fresh aws_clients state on FakeSession; returns the list of created clients"""
+    FakeSession.created = []
+    monkeypatch.setattr(aws_clients.boto3.session, 'Session', FakeSession)
+    monkeypatch.setattr(aws_clients, 'get_client', get_client)
+    monkeypatch.setattr(aws_clients, '_pid', None)
+    monkeypatch.setattr(aws_clients, '_session', None)
+    monkeypatch.setattr(aws_clients, '_clients', {})
+    monkeypatch.setattr(aws_clients, '_event_handlers', [])
+    return FakeSession.created
+
+
+def test_client_is_created_on_first_use_only(sessions):
+    s3 = LazyClient('s3', region_name='us-east-1')
+    assert sessions == []
+    assert aws_clients.created_clients() == []
+
+    assert s3.get('service') == 's3'
+    s3.get('region')
+
+    assert len(sessions) == 1
+    assert aws_clients.created_clients() == ['s3']
+
+
+def test_threads_share_one_client(sessions):
+    s3 = LazyClient('s3', region_name='us-east-1')
+    threads = [threading.Thread(target=s3.get, args=('service',)) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(sessions) == 1
+
+
+def test_one_client_per_region_and_endpoint(sessions):
+    LazyClient('s3', region_name='us-east-1').get('service')
+    LazyClient('s3', region_name='eu-west-1').get('service')
+    LazyClient('s3', region_name='us-east-1', endpoint_url='http://localhost:9000').get('service')
+    LazyClient('s3', region_name='us-east-1').get('service')
+
+    assert len(sessions) == 3
+
+
+def test_forked_process_builds_its_own_clients(sessions, monkeypatch):
+    s3 = LazyClient('s3', region_name='us-east-1')
+    s3.get('service')
+
+    monkeypatch.setattr(aws_clients.os, 'getpid', lambda: -1)
+    s3.get('service')
+    s3.get('service')
+
+    assert len(sessions) == 2
+
+
+def test_event_handlers_reach_every_session(sessions, monkeypatch):
+    def handler(**kwargs):
+        pass
+
+    register_event_handler('after-call', handler)
+    LazyClient('s3').get('service')
+    assert aws_clients._session.handlers == [('after-call', handler)]
+
+    monkeypatch.setattr(aws_clients.os, 'getpid', lambda: -1)
+    LazyClient('s3').get('service')
+    assert aws_clients._session.handlers == [('after-call', handler)]
+
+
+def test_client_config():
+    assert client_config('lambda').read_timeout == 900
+    assert client_config('s3').read_timeout == aws_clients.AWS_READ_TIMEOUT
+    assert client_config('s3').max_pool_connections == aws_clients.AWS_MAX_POOL_CONNECTIONS
+    assert client_config('s3').retries['mode'] == aws_clients.AWS_RETRY_MODE
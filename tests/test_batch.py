@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from jobs import JobQueue
+
+
+@pytest.fixture
+def batch_app(app_module, monkeypatch):
+    """app with a stuck deploy queue (3 per client, 6 in total) and no real pipeline"""
+    release = threading.Event()
+    queue = JobQueue(max_workers=1, max_queue=6, name='test', max_per_client=3)
+    queue.submit('blocker', release.wait)
+    for _ in range(200):
+        if queue.stats()['active']:
+            break
+        threading.Event().wait(0.01)
+
+    monkeypatch.setattr(app_module, 'deploy_queue', queue)
+    monkeypatch.setattr(app_module, 'run_deployment', lambda *args: None)
+    monkeypatch.setattr(app_module, 'provision_batch', lambda *args: None)
+    yield app_module
+    release.set()
+
+
+def repos(n, name='repo'):
+    return [f"https://github.com/bench/{name}-{i}" for i in range(n)]
+
+
+def tokens(app, http):
+    bucket = app.client_limiter._buckets.get(http.environ_base['REMOTE_ADDR'])
+    return bucket.tokens if bucket else None
+
+
+def test_batch_within_the_client_share_is_accepted(batch_app, http):
+    response = http.post('/deploy/batch', json={'github_urls': repos(3)})
+
+    assert response.status_code == 202, response.json
+    assert response.json['accepted'] == 3
+    assert batch_app.deploy_queue.stats()['queued'] == 3
+
+
+def test_batch_larger_than_the_client_share_is_rejected(batch_app, http):
+    response = http.post('/deploy/batch', json={'github_urls': repos(4)})
+
+    assert response.status_code == 413
+    assert batch_app.deploy_queue.stats()['queued'] == 0
+    assert tokens(batch_app, http) is None
+
+
+def test_batch_over_the_remaining_client_share_queues_nothing(batch_app, http):
+    assert http.post('/deploy/batch', json={'github_urls': repos(2)}).status_code == 202
+    before = tokens(batch_app, http)
+
+    response = http.post('/deploy/batch', json={'github_urls': repos(2, 'more')})
+
+    assert response.status_code == 503
+    assert 'already have 2 deployments waiting' in response.json['error']
+    assert batch_app.deploy_queue.stats()['queued'] == 2
+    assert tokens(batch_app, http) == before
+
+
+def test_batch_over_the_remaining_queue_room_queues_nothing(batch_app, http):
+    for i in range(5):
+        batch_app.deploy_queue.submit(f"other-{i}", print, client=f"other-{i}")
+
+    response = http.post('/deploy/batch', json={'github_urls': repos(2)})
+
+    assert response.status_code == 503
+    assert 'queue is full' in response.json['error']
+    assert batch_app.deploy_queue.stats()['queued'] == 5
+
+
+def test_batch_larger_than_the_rate_burst_is_rejected(batch_app, http, monkeypatch):
+    monkeypatch.setattr(batch_app.client_limiter, 'burst', 2)
+
+    response = http.post('/deploy/batch', json={'github_urls': repos(3)})
+
+    assert response.status_code == 413
+    assert batch_app.deploy_queue.stats()['queued'] == 0
+
+
+def test_invalid_urls_cost_no_tokens(app_module, http):
+    response = http.post('/deploy/batch', json={'github_urls': ['not a url']})
+    assert response.status_code == 400
+    assert http.environ_base['REMOTE_ADDR'] not in app_module.client_limiter._buckets
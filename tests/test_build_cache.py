@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from build_cache import BuildCache
+
+BUILDSPEC = 'version: 0.2\nphases:\n  build:\n    commands:\n      - npm run build\n'
+
+
+@pytest.fixture
+def cache(s3):
+    return BuildCache(s3, 'artifacts', BUILDSPEC)
+
+
+def test_key_depends_on_commit_buildspec_and_variables(cache, s3):
+    key = cache.build_key('abc')
+
+    assert key.startswith('abc-')
+    assert cache.build_key('abc') == key
+    assert cache.build_key('def') != key
+    assert BuildCache(s3, 'artifacts', BUILDSPEC + '# changed\n').build_key('abc') != key
+    assert cache.build_key('abc', {'HOSTING_MODE': 'shared'}) != key
+    assert cache.build_key('abc', {'A': '1', 'B': '2'}) == cache.build_key('abc', {'B': '2', 'A': '1'})
+
+
+def test_recorded_build_is_a_hit(cache, s3):
+    key = cache.build_key('abc')
+    assert cache.lookup(key) is None
+
+    cache.record(key, 'deployfast-build:1', 'dep-1')
+
+    assert cache.lookup(key) == f"builds/{key}/output"
+    assert cache.lookup(cache.build_key('abc', {'SITE_NAME': 'other'})) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    marker = json.loads(s3.get_object(Bucket='artifacts', Key=f"builds/{key}/SUCCEEDED.json")['Body'].read())
+    assert marker['build_id'] == 'deployfast-build:1'
+    assert marker['buildspec_hash'] == cache.buildspec_hash
+
+
+def test_disabled_cache_never_hits(s3):
+    cache = BuildCache(s3, 'artifacts', BUILDSPEC, enabled=False)
+    key = cache.build_key('abc')
+    cache.record(key, 'deployfast-build:1', 'dep-1')
+
+    assert cache.lookup(key) is None
+    assert cache.stats()['hits'] == 0
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from build_logs import (
+    BuildLogTailer, LogArchive, is_error_line, log_keys, read_lines,
+    s3_range_reader, store_archive
+)
+from fake_aws import BUILD_LOG_GROUP, FakeAWS
+
+LINES = [f"line {i}" for i in range(25)]
+
+
+@pytest.fixture
+def archive():
+    archive = LogArchive(chunk_lines=10)
+    archive.add(LINES)
+    yield archive
+    archive.discard()
+
+
+def file_reader(archive, ranges):
+    def fetch_range(start, end):
+        ranges.append((start, end))
+        archive.file.seek(start)
+        return archive.file.read(end - start)
+    return fetch_range
+
+
+def test_read_fetches_only_the_chunks_it_needs(archive):
+    index = archive.close()
+    ranges = []
+
+    page = read_lines(file_reader(archive, ranges), index, offset=12, limit=5)
+
+    assert page == {'offset': 12, 'lines': LINES[12:17], 'next_offset': 17, 'total_lines': 25}
+    second = index['chunks'][1]
+    assert ranges == [(second[0], second[0] + second[1])]
+
+
+def test_read_across_chunks_and_from_the_end(archive):
+    index = archive.close()
+    fetch = file_reader(archive, [])
+
+    assert read_lines(fetch, index, offset=5, limit=100)['lines'] == LINES[5:]
+    page = read_lines(fetch, index, offset=-3)
+    assert page['lines'] == LINES[-3:]
+    assert page['next_offset'] is None
+
+
+def test_read_while_still_writing(archive):
+    page = archive.read(8, 100)  # 2 chunks compressed, 5 lines still pending
+    assert page['lines'] == LINES[8:]
+    assert archive.index(complete=False)['complete'] is False
+
+
+def test_error_index(archive):
+    archive.add(['npm ERR! missing script: build', 'Compiled with 0 errors', 'Traceback (most recent call last):'])
+    errors = archive.close()['errors']
+    assert errors == [[25, 'npm ERR! missing script: build'], [27, 'Traceback (most recent call last):']]
+
+
+@pytest.mark.parametrize('line,expected', [
+    ('npm ERR! code ELIFECYCLE', True),
+    ('sh: 1: vite: command not found', True),
+    ('ModuleNotFoundError: No module named flask', False),
+    ('Build failed with exit status 2', True),
+    ('Found 0 errors', False),
+    ('added 120 packages', False),
+])
+def test_is_error_line(line, expected):
+    assert is_error_line(line) is expected
+
+
+def test_store_archive_and_range_reads(aws, s3, archive):
+    index = store_archive(s3, 'artifacts', 'dep-1', 'deployfast-build:abc', archive)
+
+    log_key, index_key = log_keys('dep-1', 'deployfast-build:abc')
+    assert log_key == 'deployments/dep-1/logs/abc.log.gz'
+    stored = json.loads(s3.get_object(Bucket='artifacts', Key=index_key)['Body'].read())
+    assert stored == index and stored['build_id'] == 'deployfast-build:abc'
+    fetch = s3_range_reader(s3, 'artifacts', log_key)
+    assert read_lines(fetch, index, offset=18, limit=4)['lines'] == LINES[18:22]
+
+
+def test_tailer_reads_every_line_once():
+    aws = FakeAWS(latency={'api': 0, 'build': 0}, failure={'build': 0}, jitter=0)
+    build = aws.clients['codebuild'].start_build(projectName='deployfast-build')['build']
+    stream = build['id'].split(':')[1]
+    tailer = BuildLogTailer(aws.clients['logs'], interval=0.01, drain_timeout=1)
+    seen = []
+
+    tailer.tail('dep-1', BUILD_LOG_GROUP, stream, on_lines=lambda lines, offset: seen.extend(lines))
+    archive = tailer.finish('dep-1')
+
+    expected = aws.clients['codebuild'].log_lines(stream)
+    assert seen == expected
+    assert archive.read(0, len(expected) + 10)['lines'] == expected
+    assert not tailer.tailing('dep-1')
+    archive.discard()
@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+from build_tracker import BuildTracker, build_id_from_arn, handle_build_event
+from fake_aws import FakeAWS
+
+
+@pytest.fixture
+def codebuild():
+    fake = FakeAWS(latency={'api': 0, 'build': 0}, failure={'build': 0}, jitter=0)
+    return fake.clients['codebuild']
+
+
+def idle_tracker(codebuild):
+    """A tracker without its background thread, so tests drive poll() themselves"""
+    tracker = BuildTracker(codebuild)
+    tracker._ensure_thread = lambda: None
+    return tracker
+
+
+def test_future_resolves_with_final_build(codebuild):
+    tracker = BuildTracker(codebuild, sleep_interval=0.01)
+    build_id = codebuild.start_build(projectName='deployfast-build')['build']['id']
+    updates = []
+
+    build = tracker.track(build_id, label='dep-1', on_update=updates.append).result(timeout=5)
+
+    assert build['buildStatus'] == 'SUCCEEDED'
+    assert updates and updates[-1]['currentPhase'] == 'COMPLETED'
+    assert tracker.in_flight() == 0
+
+
+def test_poll_batches_up_to_100_ids_per_call(codebuild):
+    tracker = idle_tracker(codebuild)
+    build_ids = [codebuild.start_build(projectName='p')['build']['id'] for _ in range(150)]
+    futures = [tracker.track(b) for b in build_ids]
+
+    tracker.poll(build_ids)
+
+    assert tracker.api_calls == 2
+    assert all(f.done() for f in futures)
+
+
+def test_untrack_cancels_future(codebuild):
+    tracker = idle_tracker(codebuild)
+    future = tracker.track('p:missing')
+    tracker.untrack('p:missing')
+    assert future.cancelled()
+    assert tracker.in_flight() == 0
+
+
+def test_build_id_from_arn():
+    arn = 'arn:aws:codebuild:us-east-1:123456789012:build/deployfast-build:abc-123'
+    assert build_id_from_arn(arn) == 'deployfast-build:abc-123'
+    assert build_id_from_arn('deployfast-build:abc-123') == 'deployfast-build:abc-123'
+
+
+def test_build_event_wakes_tracker(codebuild):
+    tracker = idle_tracker(codebuild)
+    tracker.track('deployfast-build:abc-123')
+    tracker._wake.clear()
+
+    event = {'detail': {
+        'build-id': 'arn:aws:codebuild:us-east-1:123456789012:build/deployfast-build:abc-123',
+        'build-status': 'SUCCEEDED'
+    }}
+    assert handle_build_event(tracker, event) == 'deployfast-build:abc-123'
+    assert tracker._wake.is_set()
+
+
+def test_event_for_unknown_build_is_ignored(codebuild):
+    tracker = idle_tracker(codebuild)
+    tracker._wake.clear()
+    tracker.notify('p:unknown', 'SUCCEEDED')
+    assert not tracker._wake.is_set()
+
+
+def test_concurrent_track_shares_one_future(codebuild):
+    tracker = idle_tracker(codebuild)
+    futures = []
+    threads = [threading.Thread(target=lambda: futures.append(tracker.track('p:same'))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len({id(f) for f in futures}) == 1
@@ -0,0 +1,91 @@
+import os
+import subprocess
+import zipfile
+
+from bundles import SCRIPTS, artifact_manifest, diff_manifests, published_files, write_site_bundle
+
+
+def make_zip(path, files):
+    with zipfile.ZipFile(path, 'w') as z:
+        for name, body in files.items():
+            z.writestr(name, body)
+    return path
+
+
+def test_published_files_prefers_build_output_dir(tmp_path):
+    path = make_zip(tmp_path / 'a.zip', {
+        'package.json': '{}', 'src/app.js': '1', 'dist/index.html': '<html>', 'dist/js/app.js': '1'
+    })
+    with zipfile.ZipFile(path) as artifact:
+        assert published_files(artifact) == {'index.html': 'dist/index.html', 'js/app.js': 'dist/js/app.js'}
+
+
+def test_published_files_without_output_dir_is_everything(tmp_path):
+    path = make_zip(tmp_path / 'a.zip', {'index.html': '<html>', 'css/site.css': 'body{}'})
+    with zipfile.ZipFile(path) as artifact:
+        assert sorted(published_files(artifact)) == ['css/site.css', 'index.html']
+
+
+def test_published_files_skips_unsafe_paths(tmp_path):
+    path = make_zip(tmp_path / 'a.zip', {'index.html': '1', '../etc/passwd': 'x', 'a/../../b': 'x'})
+    with zipfile.ZipFile(path) as artifact:
+        assert list(published_files(artifact)) == ['index.html']
+
+
+def test_diff_manifests():
+    old = {'index.html': 'a', 'app.js': 'b', 'gone.css': 'c'}
+    new = {'index.html': 'a', 'app.js': 'B', 'new.css': 'd'}
+    assert diff_manifests(old, new) == (['app.js', 'new.css'], ['gone.css'])
+    assert diff_manifests(new, new) == ([], [])
+
+
+def test_manifest_of_unchanged_rebuild_has_no_diff(tmp_path):
+    files = {'dist/index.html': '<html>', 'dist/app.js': '1', 'README.md': 'x'}
+    first = artifact_manifest(make_zip(tmp_path / 'a.zip', files), release_id='r1')
+    second = artifact_manifest(make_zip(tmp_path / 'b.zip', files), release_id='r2')
+    assert sorted(first['files']) == ['app.js', 'index.html']
+    assert diff_manifests(first['files'], second['files']) == ([], [])
+
+
+def test_site_bundle_keeps_source_and_adds_deploy_files(tmp_path):
+    source = make_zip(tmp_path / 'src.zip', {'index.html': '<html>', 'appspec.yml': 'stale'})
+    count = write_site_bundle(str(tmp_path / 'out.zip'), source, {'HOSTING_MODE': 'shared', 'SITE_NAME': 'blog'})
+
+    assert count == 1
+    with zipfile.ZipFile(tmp_path / 'out.zip') as bundle:
+        assert 'index.html' in bundle.namelist()
+        assert bundle.read('scripts/site.env') == b'HOSTING_MODE=shared\nSITE_NAME=blog\n'
+        assert bundle.read('appspec.yml') != b'stale'
+
+
+def run_before_install(tmp_path, live):
+    scripts = tmp_path / 'scripts'
+    scripts.mkdir(exist_ok=True)
+    (scripts / 'release.env').write_text(
+        f"LIVE={live}\nINCOMING={tmp_path / 'incoming'}\nRELEASES={tmp_path / 'releases'}\n"
+    )
+    (scripts / 'before_install.sh').write_text(SCRIPTS['before_install.sh'])
+    subprocess.run(['bash', str(scripts / 'before_install.sh')], check=True)
+
+
+def test_before_install_moves_legacy_live_directory(tmp_path):
+    live = tmp_path / 'html'
+    live.mkdir()
+    (live / 'index.html').write_text('old')
+
+    run_before_install(tmp_path, live)
+
+    assert not live.exists()
+    assert (tmp_path / 'releases' / 'initial' / 'index.html').read_text() == 'old'
+
+
+def test_before_install_leaves_release_symlink_alone(tmp_path):
+    release = tmp_path / 'releases' / 'r1'
+    release.mkdir(parents=True)
+    live = tmp_path / 'html'
+    os.symlink(release, live)
+
+    run_before_install(tmp_path, live)
+
+    assert os.readlink(live) == str(release)
+    assert not (tmp_path / 'releases' / 'initial').exists()
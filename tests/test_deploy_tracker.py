@@ -0,0 +1,90 @@
+import pytest
+
+from deploy_tracker import (
+    DeployTracker, check_deploy_mode, deployment_group_name, handle_deploy_event, start_codedeploy
+)
+from fake_aws import FakeAWS
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def codedeploy():
+    fake = FakeAWS(latency={'api': 0, 'deploy': 0}, jitter=0)
+    return fake.clients['codedeploy']
+
+
+def idle_tracker(codedeploy, **kwargs):
+    """A tracker without its background thread, so tests drive poll() themselves"""
+    tracker = DeployTracker(codedeploy, **kwargs)
+    tracker._ensure_thread = lambda: None
+    return tracker
+
+
+def test_codedeploy_deployment_resolves(codedeploy):
+    tracker = DeployTracker(codedeploy, interval=0.01)
+    codedeploy_id = start_codedeploy(codedeploy, 'dep-1', 'bucket', 'bundles/dep-1.zip')
+
+    result = tracker.track('dep-1', codedeploy_id).result(timeout=5)
+
+    assert result == {'succeeded': True, 'status': 'Succeeded', 'error': None, 'codedeploy_id': codedeploy_id}
+    assert deployment_group_name('dep-1') in codedeploy.groups
+
+
+def test_redeploy_reuses_deployment_group(codedeploy):
+    first = start_codedeploy(codedeploy, 'dep-1', 'bucket', 'a.zip')
+    second = start_codedeploy(codedeploy, 'dep-1', 'bucket', 'b.zip')
+    assert first != second
+    assert codedeploy.groups == {deployment_group_name('dep-1')}
+
+
+def test_poll_batches_up_to_25_ids_per_call(codedeploy):
+    tracker = idle_tracker(codedeploy)
+    futures = [
+        tracker.track(f"dep-{i}", start_codedeploy(codedeploy, f"dep-{i}", 'bucket', 'k.zip'))
+        for i in range(30)
+    ]
+
+    tracker.poll()
+
+    assert tracker.api_calls == 2
+    assert all(f.result(timeout=0)['succeeded'] for f in futures)
+
+
+def test_overdue_deploy_times_out(codedeploy):
+    clock = FakeClock()
+    tracker = idle_tracker(codedeploy, timeout=60, clock=clock)
+    future = tracker.track('dep-1', 'd-unknown')  # CodeDeploy never lists it
+
+    tracker.poll()
+    assert not future.done()
+
+    clock.now = 61
+    tracker.poll()
+    assert future.result(timeout=0)['status'] == 'TimedOut'
+    assert tracker.in_flight() == 0
+
+
+def test_eventbridge_event_wakes_tracker(codedeploy):
+    tracker = idle_tracker(codedeploy)
+    tracker.track('dep-1', 'd-123')
+    tracker._wake.clear()
+
+    assert handle_deploy_event(tracker, {'detail': {'deploymentId': 'd-123', 'state': 'SUCCESS'}})
+    assert tracker._wake.is_set()
+    assert not handle_deploy_event(tracker, {'detail': {'deploymentId': 'd-other', 'state': 'SUCCESS'}})
+
+
+def test_deploy_mode_is_checked_at_startup():
+    check_deploy_mode('sync', '')
+    check_deploy_mode('codedeploy', 'arn:aws:iam::123456789012:role/codedeploy')
+    with pytest.raises(ValueError, match='Unknown DEPLOY_MODE: codedepoly'):
+        check_deploy_mode('codedepoly', '')
+    with pytest.raises(ValueError, match='CODEDEPLOY_SERVICE_ROLE_ARN'):
+        check_deploy_mode('codedeploy', '')
@@ -0,0 +1,65 @@
+from events import EventBus
+
+
+def drain(sub):
+    events = []
+    while True:
+        event = sub.get(timeout=0)
+        if event is None:
+            return events
+        events.append(event)
+
+
+def test_late_watcher_gets_history():
+    bus = EventBus()
+    bus.publish('d1', 'status', {'status': 'building'})
+    first = bus.publish('d1', 'step', {'step': 'build', 'status': 'done'})
+
+    assert [e['type'] for e in drain(bus.subscribe('d1'))] == ['status', 'step']
+    assert drain(bus.subscribe('d1', last_event_id=first['id'])) == []
+
+
+def test_subscribe_after_second_run_skips_old_end():
+    bus = EventBus()
+    bus.publish('d1', 'status', {'status': 'failed'})
+    bus.publish('d1', 'end', {'deployment': {'status': 'failed'}})
+
+    bus.reset('d1')  # retry / redeploy
+    bus.publish('d1', 'status', {'status': 'queued'})
+
+    assert [e['type'] for e in drain(bus.subscribe('d1'))] == ['status']
+
+
+def test_retry_route_resets_history(app_module, http, monkeypatch):
+    app = app_module
+    monkeypatch.setattr(app.deploy_queue, 'submit', lambda *args, **kwargs: None)
+    app.store.create({
+        'deployment_id': 'events-retry', 'subdomain': 'events', 'github_url': 'https://github.com/a/b',
+        'hosting_mode': 'shared', 'status': 'build_failed', 'created_at': '2026-10-17T10:00:00',
+        'steps': {name: {'status': 'pending'} for name in app.PIPELINE_STEPS}
+    })
+    app.event_bus.publish('events-retry', 'end', {'deployment': {'status': 'build_failed'}})
+
+    response = http.post('/deployments/events-retry/retry')
+
+    assert response.status_code == 202, response.json
+    assert [e['type'] for e in drain(app.event_bus.subscribe('events-retry'))] == ['status']
+
+
+def test_stream_ends_from_the_store_when_another_worker_finishes(app_module, http, monkeypatch):
+    app = app_module
+    monkeypatch.setattr(app, 'KEEPALIVE_SECONDS', 0.01)
+    app.store.create({
+        'deployment_id': 'events-elsewhere', 'subdomain': 'elsewhere', 'github_url': 'https://github.com/a/b',
+        'status': 'building', 'created_at': '2026-10-17T10:00:00',
+        'steps': {name: {'status': 'pending'} for name in app.PIPELINE_STEPS}
+    })
+
+    response = http.get('/deployments/events-elsewhere/events')
+    app.store.update('events-elsewhere', status='live')  # no event in this process
+    body = response.get_data(as_text=True)
+
+    assert [line for line in body.splitlines() if line.startswith('event:')] == [
+        'event: snapshot', 'event: status', 'event: end'
+    ]
+    assert '"status": "live"' in body.split('event: end')[1]
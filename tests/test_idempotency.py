@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from jobs import JobQueue
+
+URL = 'https://github.com/bench/idempotent'
+
+
+@pytest.fixture
+def queued_app(app_module, monkeypatch):
+    """app with a stuck deploy queue and no real pipeline"""
+    release = threading.Event()
+    queue = JobQueue(max_workers=1, max_queue=10, name='test')
+    queue.submit('blocker', release.wait)
+    for _ in range(200):
+        if queue.stats()['active']:
+            break
+        threading.Event().wait(0.01)
+
+    monkeypatch.setattr(app_module, 'deploy_queue', queue)
+    monkeypatch.setattr(app_module, 'run_deployment', lambda *args, **kwargs: None)
+    yield app_module
+    release.set()
+
+
+def deploy(http, key, url=URL):
+    return http.post('/deploy', json={'github_url': url}, headers={'Idempotency-Key': key})
+
+
+def test_retry_with_the_same_key_returns_the_original_deployment(queued_app, http):
+    first = deploy(http, 'retry-1')
+    assert first.status_code == 202, first.json
+
+    retry = deploy(http, 'retry-1')
+
+    assert retry.status_code == 200
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.json['deployment_id'] == first.json['deployment_id']
+    assert retry.json['status'] == 'queued'
+    assert queued_app.deploy_queue.stats()['queued'] == 1
+
+
+def test_same_key_for_another_repo_is_rejected(queued_app, http):
+    assert deploy(http, 'retry-2').status_code == 202
+
+    response = deploy(http, 'retry-2', url='https://github.com/bench/other')
+
+    assert response.status_code == 422
+    assert queued_app.deploy_queue.stats()['queued'] == 1
+
+
+def test_keys_are_per_client(queued_app, http, app_module):
+    other = app_module.app.test_client()
+    other.environ_base['REMOTE_ADDR'] = '10.9.9.9'
+
+    first = deploy(http, 'shared-key')
+    second = deploy(other, 'shared-key')
+
+    assert second.status_code == 202
+    assert second.json['deployment_id'] != first.json['deployment_id']
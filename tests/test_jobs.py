@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from jobs import JobQueue, QueueFullError
+
+
+@pytest.fixture
+def blocked_queue():
+    """A queue whose only worker is stuck, so everything submitted stays waiting"""
+    release = threading.Event()
+    queue = JobQueue(max_workers=1, max_queue=3, name='test', max_per_client=2)
+    queue.submit('blocker', release.wait)
+    yield queue
+    release.set()
+
+
+def wait_until_running(queue):
+    for _ in range(200):
+        if queue.stats()['active']:
+            return
+        threading.Event().wait(0.01)
+
+
+def test_max_per_client(blocked_queue):
+    wait_until_running(blocked_queue)
+    blocked_queue.submit('a1', print, client='a')
+    blocked_queue.submit('a2', print, client='a')
+    with pytest.raises(QueueFullError, match='2 deployments waiting'):
+        blocked_queue.submit('a3', print, client='a')
+    blocked_queue.submit('b1', print, client='b')
+
+
+def test_every_job_of_a_batch_counts(blocked_queue):
+    wait_until_running(blocked_queue)
+    with pytest.raises(QueueFullError, match='max 2'):
+        blocked_queue.submit_batch([(f"a{i}", print, (), {}) for i in range(3)], client='a')
+    assert blocked_queue.stats()['queued'] == 0
+
+    places = blocked_queue.submit_batch([('a0', print, (), {}), ('a1', print, (), {})], client='a')
+    assert [p['position'] for p in places] == [0, 1]
+    with pytest.raises(QueueFullError):
+        blocked_queue.submit('a2', print, client='a')
+
+
+def test_batch_needs_room_for_every_job(blocked_queue):
+    wait_until_running(blocked_queue)
+    blocked_queue.submit('b0', print, client='b')
+    blocked_queue.submit('c0', print, client='c')
+    with pytest.raises(QueueFullError, match='queue is full'):
+        blocked_queue.submit_batch([('a0', print, (), {}), ('a1', print, (), {})], client='a')
+    assert blocked_queue.stats()['queued'] == 2
+    assert blocked_queue.max_batch() == 2
+
+
+def test_rejected_batch_queues_nothing(blocked_queue):
+    wait_until_running(blocked_queue)
+    for i in range(3):
+        blocked_queue.submit(f"b{i}", print, client=f"b{i}")
+    with pytest.raises(QueueFullError, match='queue is full'):
+        blocked_queue.submit_batch([('a0', print, (), {}), ('a1', print, (), {})], client='a')
+    assert blocked_queue.stats()['queued'] == 3
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import pytest
+
+
+@pytest.fixture
+def repo(app_module, request):
+    """A repo of this test only, with two deployments; returns its URL"""
+    url = f"https://github.com/bench/{request.node.name.replace('_', '-')}"
+    for n in (1, 2):
+        app_module.store.create({
+            'deployment_id': f"{request.node.name}-{n}",
+            'github_url': url,
+            'status': 'live',
+            'created_at': datetime.now().isoformat()
+        })
+    return url
+
+
+def test_unchanged_listing_is_304(repo, http):
+    first = http.get('/deployments', query_string={'github_url': repo})
+    assert first.status_code == 200
+    assert first.headers['ETag']
+
+    again = http.get('/deployments', query_string={'github_url': repo},
+                     headers={'If-None-Match': first.headers['ETag']})
+
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+    assert again.data == b''
+
+
+def test_etag_is_per_query(repo, http):
+    all_fields = http.get('/deployments', query_string={'github_url': repo})
+    ids_only = http.get('/deployments', query_string={'github_url': repo, 'fields': 'id'},
+                        headers={'If-None-Match': all_fields.headers['ETag']})
+
+    assert ids_only.status_code == 200
+    assert [set(d) for d in ids_only.json['deployments']] == [{'id'}, {'id'}]
+
+
+def test_write_invalidates_the_cached_listing(repo, http, app_module, request):
+    first = http.get('/deployments', query_string={'github_url': repo})
+    assert {d['status'] for d in first.json['deployments']} == {'live'}
+
+    app_module.store.update(f"{request.node.name}-1", status='deleting')
+
+    stale = http.get('/deployments', query_string={'github_url': repo},
+                     headers={'If-None-Match': first.headers['ETag']})
+    assert stale.status_code == 200
+    assert stale.headers['ETag'] != first.headers['ETag']
+    assert stale.json['version'] > first.json['version']
+    assert {d['status'] for d in stale.json['deployments']} == {'live', 'deleting'}
+
+
+def test_since_returns_changes_and_tombstones(repo, http, app_module, request):
+    one, two = f"{request.node.name}-1", f"{request.node.name}-2"
+    version = http.get('/deployments', query_string={'github_url': repo}).json['version']
+
+    app_module.store.update(one, status='failed')
+    app_module.store.delete(two)
+    delta = http.get('/deployments', query_string={'github_url': repo, 'since': version}).json
+
+    assert delta['since'] == version
+    assert [(d['deployment_id'], d['status']) for d in delta['deployments']] == [(one, 'failed')]
+    assert delta['deleted'] == [two]
+    assert not delta['more'] and not delta['reset']
+
+    after = http.get('/deployments', query_string={'github_url': repo, 'since': delta['version']}).json
+    assert after['deployments'] == [] and after['deleted'] == []
+
+
+def test_since_drops_records_that_leave_the_filter(repo, http, app_module, request):
+    query = {'github_url': repo, 'status': 'live'}
+    version = http.get('/deployments', query_string=query).json['version']
+
+    app_module.store.update(f"{request.node.name}-1", status='failed')
+    delta = http.get('/deployments', query_string=dict(query, since=version)).json
+
+    assert delta['deployments'] == []
+    assert delta['deleted'] == [f"{request.node.name}-1"]
+
+
+def test_bad_since_is_400(http):
+    assert http.get('/deployments', query_string={'since': 'yesterday'}).status_code == 400
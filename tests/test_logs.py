@@ -0,0 +1,11 @@
+def test_reaped_log_archive_is_gone_not_an_error(app_module, http):
+    app_module.store.create({
+        'deployment_id': 'logs-reaped', 'subdomain': 'logs', 'github_url': 'https://github.com/a/b',
+        'status': 'build_failed', 'created_at': '2026-10-17T10:00:00', 'steps': {},
+        'build_log': {'build_id': 'DeployFast:0123'}, 'reaped_at': '2026-10-17T12:00:00'
+    })
+
+    response = http.get('/deployments/logs-reaped/logs')
+
+    assert response.status_code == 410
+    assert response.json['reaped_at'] == '2026-10-17T12:00:00'
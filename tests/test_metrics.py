@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+from metrics import (
+    Histogram, add_timing, aws_calls, aws_errors, instrument, record_codebuild_phases,
+    registry, span, span_seconds, step_calls, step_seconds, take_timings
+)
+
+
+def test_step_is_counted_and_timed_by_outcome():
+    @instrument('test_step')
+    def step(deployment_id, outcome):
+        if outcome == 'error':
+            raise RuntimeError('boom')
+        return outcome != 'failed'
+
+    step('dep-m1', 'ok')
+    step('dep-m1', 'failed')
+    with pytest.raises(RuntimeError):
+        step(deployment_id='dep-m1', outcome='error')
+
+    for outcome in ('ok', 'failed', 'error'):
+        assert step_calls.value('test_step', outcome) == 1
+        assert step_seconds.count('test_step', outcome) == 1
+    assert set(take_timings('dep-m1')) == {'test_step'}
+    assert take_timings('dep-m1') == {}
+
+
+def test_spans_add_up_per_deployment():
+    with span('dep-m2', 'test_checkout'):
+        pass
+    add_timing('dep-m2', 'test_upload', 1.25)
+    add_timing('dep-m2', 'test_upload', 0.5)
+
+    timings = take_timings('dep-m2')
+    assert timings['test_upload'] == 1.75
+    assert 'test_checkout' in timings
+    assert span_seconds.count('test_checkout') == 1
+
+
+def test_oldest_timings_are_dropped(monkeypatch):
+    monkeypatch.setattr(metrics, 'MAX_TRACKED_DEPLOYMENTS', 2)
+    for n in range(3):
+        add_timing(f"dep-m3-{n}", 'step', 1)
+
+    assert take_timings('dep-m3-0') == {}
+    assert take_timings('dep-m3-2') == {'step': 1}
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('test_seconds', 'Test', labels=('step',), buckets=(1, 5))
+    histogram.observe(0.5, 'a')
+    histogram.observe(3, 'a')
+
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{step="a",le="1"} 1',
+        'test_seconds_bucket{step="a",le="5"} 2',
+        'test_seconds_bucket{step="a",le="+Inf"} 2',
+        'test_seconds_sum{step="a"} 3.5',
+        'test_seconds_count{step="a"} 2',
+    ]
+
+
+def test_codebuild_phases_are_observed():
+    phases = record_codebuild_phases({'phases': [
+        {'phaseType': 'TEST_PHASE', 'durationInSeconds': 12},
+        {'phaseType': 'COMPLETED'}
+    ]})
+
+    assert phases == {'TEST_PHASE': 12}
+    assert 'deployfast_codebuild_phase_duration_seconds_count{phase="TEST_PHASE"} 1' in registry.render()
+
+
+def test_aws_calls_and_errors_are_counted():
+    metrics._before_call('before-call.testsvc.GetThing')
+    metrics._after_call('after-call.testsvc.GetThing', http_response=SimpleNamespace(status_code=200), parsed={})
+    metrics._after_call('after-call.testsvc.GetThing', http_response=SimpleNamespace(status_code=400),
+                        parsed={'Error': {'Code': 'ThrottlingException'}})
+    metrics._after_call_error('after-call-error.testsvc.GetThing', exception=TimeoutError())
+
+    assert aws_calls.value('testsvc', 'GetThing') == 3
+    assert aws_errors.value('testsvc', 'GetThing', 'ThrottlingException') == 1
+    assert aws_errors.value('testsvc', 'GetThing', 'TimeoutError') == 1
+
+
+def test_metrics_endpoint_serves_the_registry(http):
+    instrument('test_scraped_step')(lambda: None)()
+
+    response = http.get('/metrics')
+
+    assert response.status_code == 200
+    assert 'deployfast_step_calls_total{step="test_scraped_step",outcome="ok"} 1' in response.get_data(as_text=True)
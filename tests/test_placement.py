@@ -0,0 +1,79 @@
+import pytest
+
+from placement import SLOT_CLAIM, SLOT_TTL, HostScheduler, slot_key
+
+
+def site(deployment_id, host_id, instance_id=None):
+    return {'deployment_id': deployment_id, 'host_id': host_id,
+            'ec2_instance_id': instance_id, 'ec2_public_ip': '10.0.0.1' if instance_id else None}
+
+
+def test_best_fit_fills_hosts_before_launching():
+    scheduler = HostScheduler(max_sites=2)
+    first, is_new = scheduler.place('a')
+    assert is_new
+    assert scheduler.place('b') == (first, False)
+    assert scheduler.place('c')[1]
+
+
+def test_load_restores_ready_hosts():
+    scheduler = HostScheduler(max_sites=3)
+    assert scheduler.load([site('a', 'host-1', 'i-1'), site('b', 'host-1')]) == []
+
+    host, is_new = scheduler.place('c')
+    assert not is_new and host.host_id == 'host-1'
+    assert host.ready.result(timeout=0)['instance_id'] == 'i-1'
+
+
+def test_load_drops_hosts_that_were_booting():
+    scheduler = HostScheduler(max_sites=3)
+    assert scheduler.load([site('a', 'host-1'), site('b', 'host-1')]) == ['host-1']
+
+    assert scheduler.release('a') == (None, False)
+    host, is_new = scheduler.place('a')
+    assert is_new and host.host_id != 'host-1'
+    assert scheduler.stats()['sites'] == 1
+
+
+def test_failed_host_is_not_placed_on():
+    scheduler = HostScheduler(max_sites=3)
+    host, _ = scheduler.place('a')
+    scheduler.host_failed(host.host_id, Exception('boom'))
+    with pytest.raises(Exception, match='boom'):
+        host.ready.result(timeout=0)
+    assert scheduler.place('b')[1]
+
+
+def test_two_workers_never_overpack_a_host(store):
+    existing = [dict(site('a', 'host-1', 'i-1'), host_slot=0)]
+    store.claim_key(slot_key('host-1', 0), 'a', SLOT_CLAIM, SLOT_TTL)
+    first, second = HostScheduler(max_sites=3, store=store), HostScheduler(max_sites=3, store=store)
+    first.load(existing)
+    second.load(existing)
+
+    placed = [first.place('b'), first.place('c'), second.place('d')]
+
+    assert [host.host_id for host, _ in placed[:2]] == ['host-1', 'host-1']
+    host, is_new = placed[2]
+    assert is_new and host.host_id != 'host-1'
+    assert second.place('e')[0] is host  # host-1 stays full for the second worker
+
+
+def test_site_placed_elsewhere_gives_its_slot_back(store):
+    placing = HostScheduler(max_sites=1, store=store)
+    host, _ = placing.place('a')
+    assert store.claim_key(slot_key(host.host_id, 0), 'b', SLOT_CLAIM, SLOT_TTL)['deployment_id'] == 'a'
+
+    # Another worker deletes 'a': it only knows the record (host_id, host_slot)
+    assert HostScheduler(store=store).release('a', host.host_id, 0) == (None, False)
+
+    assert store.claim_key(slot_key(host.host_id, 0), 'b', SLOT_CLAIM, SLOT_TTL) is None
+
+
+def test_slot_is_recorded_on_the_site():
+    scheduler = HostScheduler(max_sites=2)
+    host, _ = scheduler.place('a')
+    scheduler.place('b')
+    assert [s['slot'] for s in host.sites.values()] == [0, 1]
+    scheduler.release('a')
+    assert scheduler.place('c')[0].sites['c']['slot'] == 0
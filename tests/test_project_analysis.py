@@ -0,0 +1,44 @@
+import pytest
+
+import project_analysis
+from project_analysis import classify, codebuild_project, parse_projects, stack_from_metadata, STACK_METADATA
+
+
+def make_tree(root, files):
+    for name, body in files.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(body)
+    return str(root)
+
+
+@pytest.mark.parametrize('files, stack', [
+    ({'index.html': '<html>', 'css/site.css': 'body{}'}, 'static'),
+    ({'package.json': '{}', 'src/index.js': ''}, 'node'),
+    ({'requirements.txt': 'flask', 'app.py': ''}, 'python'),
+    ({'package.json': '{}', 'requirements.txt': 'flask'}, 'node'),  # buildspec.yml order
+    ({'frontend/package.json': '{}', 'index.html': ''}, 'static'),  # only the repo root counts
+    ({}, 'static'),
+])
+def test_classify(tmp_path, files, stack):
+    assert classify(make_tree(tmp_path, files)) == stack
+
+
+def test_a_directory_named_like_a_marker_is_not_one(tmp_path):
+    (tmp_path / 'package.json').mkdir()
+    assert classify(str(tmp_path)) == 'static'
+
+
+def test_stack_from_metadata():
+    assert stack_from_metadata({STACK_METADATA: 'node'}) == 'node'
+    assert stack_from_metadata({STACK_METADATA: 'cobol'}) is None
+    assert stack_from_metadata(None) is None
+
+
+def test_codebuild_project_per_stack(monkeypatch):
+    projects = parse_projects('node=DeployFast-Node, python = DeployFast-Python,ruby=X,broken')
+    assert projects == {'node': 'DeployFast-Node', 'python': 'DeployFast-Python'}
+
+    monkeypatch.setattr(project_analysis, 'CODEBUILD_PROJECTS', projects)
+    assert codebuild_project('node', default='DeployFast') == 'DeployFast-Node'
+    assert codebuild_project('static', default='DeployFast') == 'DeployFast'
@@ -0,0 +1,43 @@
+import pytest
+
+from batch import RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_rate_limiter_allows_a_burst_then_paces():
+    clock = FakeClock()
+    limiter = RateLimiter(2, burst=3, sleep=clock.sleep, clock=clock)
+
+    for _ in range(3):
+        limiter.acquire()
+    assert clock.now == 0
+
+    limiter.acquire()
+    assert clock.now == pytest.approx(0.5)
+    limiter.acquire()
+    assert clock.now == pytest.approx(1.0)
+    assert limiter.waited_seconds == pytest.approx(1.0)
+
+
+def test_rate_limiter_refills_while_idle():
+    clock = FakeClock()
+    limiter = RateLimiter(1, sleep=clock.sleep, clock=clock)
+    limiter.acquire()
+    clock.now += 10
+    limiter.acquire()
+    assert limiter.waited_seconds == 0
+
+
+def test_rate_limiter_rejects_zero_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
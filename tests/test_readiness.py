@@ -0,0 +1,83 @@
+import pytest
+
+from readiness import ReadinessProbe, ReadinessTimeout
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def ec2(aws):
+    return aws.clients['ec2']
+
+
+def launch(ec2, count=1):
+    return [i['InstanceId'] for i in ec2.run_instances(MinCount=1, MaxCount=count)['Instances']]
+
+
+def probe(ec2, clock, http_check=lambda ip: True, **kwargs):
+    return ReadinessProbe(ec2, checks=['status', 'http'], http_check=http_check, timeout=60,
+                          initial_delay=1, max_delay=8, sleep=clock.sleep, clock=clock, **kwargs)
+
+
+def test_ready_when_every_check_passes(ec2):
+    clock = FakeClock()
+    answers = iter([False, False, True])
+    [instance_id] = launch(ec2)
+
+    result = probe(ec2, clock, http_check=lambda ip: next(answers)).wait('d1', instance_id)
+
+    assert result['checks'] == ['running', 'status', 'http']
+    assert result['public_ip'] == ec2.instances[instance_id]['ip']
+    assert len(clock.sleeps) == 2
+    assert clock.sleeps[1] > clock.sleeps[0]  # backoff
+
+
+def test_terminated_instance_fails_right_away(ec2):
+    clock = FakeClock()
+    [instance_id] = launch(ec2)
+    ec2.terminate_instances(InstanceIds=[instance_id])
+
+    with pytest.raises(ReadinessTimeout, match='terminated'):
+        probe(ec2, clock).wait('d1', instance_id)
+    assert clock.sleeps == []
+
+
+def test_deadline_names_the_checks_still_waiting(ec2):
+    clock = FakeClock()
+    [instance_id] = launch(ec2)
+
+    with pytest.raises(ReadinessTimeout, match='waiting on: http'):
+        probe(ec2, clock, http_check=lambda ip: False).wait('d1', instance_id)
+    assert clock.now == pytest.approx(60)
+    assert max(clock.sleeps) <= 8 * 1.2
+
+
+def test_wait_many_polls_all_instances_together(aws, ec2):
+    clock = FakeClock()
+    instance_ids = launch(ec2, 5)
+    done = []
+
+    results = probe(ec2, clock).wait_many('batch', instance_ids, on_done=lambda i, r: done.append(i))
+
+    assert sorted(results) == sorted(instance_ids) == sorted(done)
+    counts = aws.call_counts()
+    assert counts['ec2.DescribeInstances'] == 1
+    assert counts['ec2.DescribeInstanceStatus'] == 1
+
+
+def test_unknown_check_is_rejected(ec2):
+    with pytest.raises(ValueError):
+        ReadinessProbe(ec2, checks=['ping'])
+    with pytest.raises(ValueError):
+        ReadinessProbe(ec2, checks=['ssm'])
@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta, timezone
+
+from deploy_tracker import delete_deployment_group, deployment_group_name, start_codedeploy
+from reaper import Reaper
+from static_hosting import delete_site, site_prefix
+
+
+def test_expired_s3_site_is_taken_down(aws, s3, store):
+    created = (datetime.now() - timedelta(hours=3)).isoformat()
+    store.create({'deployment_id': 'd1', 'subdomain': 'old', 'hosting_mode': 's3', 'status': 'live', 'github_url': 'https://github.com/a/b',
+                  'created_at': created, 'steps': {}})
+    store.create({'deployment_id': 'd2', 'subdomain': 'new', 'hosting_mode': 's3', 'status': 'live', 'github_url': 'https://github.com/a/b',
+                  'created_at': datetime.now().isoformat(), 'steps': {}})
+    for subdomain in ('old', 'new'):
+        s3.put_object(Bucket='sites', Key=f"{site_prefix(subdomain)}index.html", Body=b'<html></html>')
+
+    reaper = Reaper(
+        aws.clients['ec2'], s3, 'artifacts', store, ttl=3600,
+        delete_static_site=lambda d: delete_site(s3, 'sites', site_prefix(d['subdomain'])),
+        now=lambda: datetime.now(timezone.utc)
+    )
+    report = reaper.run()
+
+    assert report['expired'] == ['d1']
+    assert store.get('d1')['status'] == 'expired'
+    assert store.get('d2')['status'] == 'live'
+    assert [key for _, key in s3.objects] == ['sites/new/index.html']
+
+
+def test_reaped_deployments_lose_their_deployment_group(aws, store):
+    codedeploy = aws.clients['codedeploy']
+    old = (datetime.now() - timedelta(hours=3)).isoformat()
+    for deployment_id, status in (('d1', 'live'), ('d2', 'failed'), ('d3', 'live')):
+        store.create({'deployment_id': deployment_id, 'subdomain': deployment_id, 'status': status,
+                      'github_url': 'https://github.com/a/b', 'created_at': old, 'steps': {},
+                      'codedeploy_group': True})
+        start_codedeploy(codedeploy, deployment_id, 'artifacts', f"{deployment_id}.zip")
+    store.update('d3', created_at=datetime.now().isoformat())
+
+    reaper = Reaper(
+        aws.clients['ec2'], aws.clients['s3'], 'artifacts', store, ttl=3600, failed_ttl=60,
+        delete_deployment_group=lambda d: delete_deployment_group(codedeploy, d)
+    )
+    report = reaper.run()
+
+    assert report['expired'] == ['d1'] and report['failed'] == ['d2']
+    assert codedeploy.groups == {deployment_group_name('d3')}
+    assert store.get('d2')['reaped_at']
+
+
+def test_reaper_is_opt_in(aws, store):
+    reaper = Reaper(aws.clients['ec2'], aws.clients['s3'], 'artifacts', store)
+    reaper.start()
+    assert reaper.interval == 0
+    assert reaper._thread is None
@@ -0,0 +1,99 @@
+from datetime import datetime
+
+import pytest
+
+from fake_aws import FakeAWS
+from resume import Checkpoint, PipelineResumer
+
+
+class InlineQueue:
+    """deploy_queue stand-in that runs the job right away, on this thread"""
+
+    def submit(self, job_id, fn, *args, client=None, **kwargs):
+        fn(*args, **kwargs)
+
+
+@pytest.fixture
+def fake(app_module, monkeypatch):
+    aws = FakeAWS(latency={'api': 0, 'ec2_boot': 0, 'build': 0, 'deploy': 0},
+                  failure={'ec2_boot': 0, 'build': 0, 'deploy': 0}, jitter=0)
+    aws.install()
+    monkeypatch.setattr(app_module, 'deploy_queue', InlineQueue())
+    return aws
+
+
+def interrupted(app, deployment_id, worker_id):
+    """A deployment its worker left mid-pipeline: instance ready, built, not deployed"""
+    done = {'status': 'done'}
+    return app.store.create({
+        'deployment_id': deployment_id,
+        'subdomain': 'resumed-site',
+        'github_url': 'https://github.com/bench/resumed',
+        'hosting_mode': 'dedicated',
+        'status': 'waiting_for_ec2',
+        'worker_id': worker_id,
+        'created_at': datetime.now().isoformat(),
+        'ec2_instance_id': 'i-0123456789abcdef0',
+        'ec2_public_ip': '203.0.113.7',
+        's3_key': 'sources/abc.zip',
+        'commit_sha': 'abc',
+        'artifact_key': 'builds/abc/output',
+        'steps': {'create_ec2': done, 'upload': done, 'build': done, 'deploy': {'status': 'pending'}}
+    })
+
+
+def test_deployment_of_a_dead_worker_resumes_from_its_checkpoint(app_module, fake):
+    interrupted(app_module, 'dep-resume-1', 'dead-worker:1:abc')
+
+    report = app_module.resumer.run()
+
+    assert 'dep-resume-1' in report['resumed']
+    record = app_module.store.get('dep-resume-1')
+    assert record['status'] == 'live'
+    assert record['url'] == 'http://203.0.113.7'
+    assert record['worker_id'] == app_module.WORKER_ID
+    assert record['resumes'] == 1
+    calls = fake.call_counts()
+    assert 'ec2.RunInstances' not in calls
+    assert 'codebuild.StartBuild' not in calls
+    assert calls['lambda.Invoke'] == 1
+
+
+def test_deployment_of_a_live_worker_is_left_alone(app_module, fake, store):
+    store.heartbeat('busy-worker')
+    store.create({
+        'deployment_id': 'dep-busy', 'github_url': 'https://github.com/bench/busy',
+        'status': 'building', 'worker_id': 'busy-worker', 'created_at': datetime.now().isoformat()
+    })
+    resumed = []
+    resumer = PipelineResumer(store, resume=resumed.append, statuses=['building'], worker_id='me')
+
+    assert resumer.run() == {'resumed': [], 'failed': [], 'skipped': 1}
+    assert resumed == []
+
+
+def test_failed_resume_lets_go_of_the_deployment(store):
+    store.create({
+        'deployment_id': 'dep-1', 'github_url': 'https://github.com/bench/one',
+        'status': 'building', 'worker_id': 'gone', 'created_at': datetime.now().isoformat()
+    })
+
+    def queue_full(record):
+        raise RuntimeError('queue is full')
+
+    report = PipelineResumer(store, resume=queue_full, statuses=['building'], worker_id='me').run()
+
+    assert report['failed'] == ['dep-1']
+    assert store.get('dep-1')['worker_id'] is None
+
+
+def test_checkpoint_skips_only_finished_steps():
+    checkpoint = Checkpoint({
+        'ec2_instance_id': 'i-1', 'build_id': 'deployfast-build:1',
+        'steps': {'create_ec2': {'status': 'done'}, 'build': {'status': 'running'}}
+    })
+
+    assert checkpoint.ec2_info()['instance_id'] == 'i-1'
+    assert checkpoint.source() is None
+    assert checkpoint.artifact_key() is None
+    assert checkpoint.running('build', 'build_id') == 'deployfast-build:1'
@@ -0,0 +1,90 @@
+import os
+import subprocess
+
+import pytest
+
+from source_cache import SourceCache, source_key
+
+
+def git(*args, cwd):
+    return subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True).stdout.decode().strip()
+
+
+def commit(repo, name, content):
+    with open(os.path.join(repo, name), 'w') as f:
+        f.write(content)
+    git('add', name, cwd=repo)
+    git('-c', 'user.name=test', '-c', 'user.email=test@example.com', 'commit', '-qm', name, cwd=repo)
+    return git('rev-parse', 'HEAD', cwd=repo)
+
+
+@pytest.fixture
+def make_repo(tmp_path):
+    """make_repo(name) -> (file:// URL, path): a repo with one commit that can be fetched by SHA"""
+    def make(name):
+        path = tmp_path / 'remotes' / name
+        path.mkdir(parents=True)
+        git('init', '-q', cwd=path)
+        git('config', 'uploadpack.allowAnySHA1InWant', 'true', cwd=path)
+        commit(path, 'index.html', f"<h1>{name}</h1>")
+        return f"file://{path}", str(path)
+    return make
+
+
+@pytest.fixture
+def cache(s3, tmp_path):
+    return SourceCache(s3, 'sources-bucket', cache_dir=str(tmp_path / 'clones'), max_bytes=1024 * 1024 * 1024)
+
+
+def test_source_is_looked_up_by_commit(cache, s3):
+    assert not cache.has_source('abc123')
+
+    s3.put_object(Bucket='sources-bucket', Key=source_key('abc123'), Body=b'zip', Metadata={'stack': 'static'})
+
+    assert cache.lookup('abc123') == {'stack': 'static'}
+    assert not cache.has_source('def456')
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_known_repo_fetches_the_new_commit_into_its_clone(cache, make_repo):
+    url, remote = make_repo('site')
+    first = cache.resolve_head(url)
+    with cache.checkout(url, first) as repo_path:
+        assert git('rev-parse', 'HEAD', cwd=repo_path) == first
+
+    second = commit(remote, 'about.html', 'about')
+    assert cache.resolve_head(url) == second
+    with cache.checkout(url, second) as again:
+        assert again == repo_path
+        assert os.path.exists(os.path.join(again, 'about.html'))
+
+    assert (cache.local_misses, cache.local_hits) == (1, 1)
+
+
+def test_least_recently_used_clone_is_evicted(cache, make_repo):
+    old_url, _ = make_repo('old')
+    new_url, _ = make_repo('new')
+    with cache.checkout(old_url, cache.resolve_head(old_url)) as old_path:
+        pass
+    os.utime(old_path, (1, 1))  # long unused
+    cache.max_bytes = cache.stats()['cached_bytes'] * 3 // 2  # room for one clone only
+
+    with cache.checkout(new_url, cache.resolve_head(new_url)) as new_path:
+        pass
+
+    assert not os.path.exists(old_path)
+    assert os.path.isdir(new_path)
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['cached_repos'] == 1
+
+
+def test_evicted_repo_is_cloned_again(cache, make_repo):
+    url, _ = make_repo('site')
+    sha = cache.resolve_head(url)
+    cache.max_bytes = 1  # nothing stays
+    with cache.checkout(url, sha):
+        pass
+    with cache.checkout(url, sha) as repo_path:
+        assert git('rev-parse', 'HEAD', cwd=repo_path) == sha
+
+    assert (cache.local_misses, cache.local_hits, cache.evictions) == (2, 0, 2)
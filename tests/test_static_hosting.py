@@ -0,0 +1,101 @@
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from static_hosting import (
+    delete_site, is_fingerprinted, plan_site, publish_site, site_prefix,
+    IMMUTABLE_CACHE_CONTROL, SHORT_CACHE_CONTROL
+)
+
+PREFIX = site_prefix('demo')
+
+SITE = {
+    'index.html': b'<html><script src="app.js"></script>'
+                  b'<link href="/css/site.css?v=1" rel=stylesheet>'
+                  b'<a href="https://example.com/a.js">x</a><img src="logo.png"></html>',
+    'app.js': b'console.log(1)',
+    'css/site.css': b'body{}',
+    'main.3f9a1c2e7b.js': b'x',
+    'logo.png': b'PNG',
+    'appspec.yml': b'version: 0.0',
+    'scripts/site.env': b'SITE_NAME=site'
+}
+
+
+def make_zip(path, files):
+    with zipfile.ZipFile(path, 'w') as z:
+        for name, body in files.items():
+            z.writestr(name, body)
+    return str(path)
+
+
+def keys(s3):
+    return sorted(key[len(PREFIX):] for _, key in s3.objects)
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('app.3f9a1c2e.js', True),           # webpack
+    ('assets/index-BkF3aZ9q.js', True),  # vite
+    ('chunk-a1b2c3d4.css', True),
+    ('settings.js', False),
+    ('component2.js', False),
+    ('20240101.css', False),
+])
+def test_is_fingerprinted(path, expected):
+    assert is_fingerprinted(path) is expected
+
+
+def test_plan_fingerprints_assets_referenced_from_html(tmp_path):
+    with zipfile.ZipFile(make_zip(tmp_path / 'v1.zip', SITE)) as artifact:
+        site = plan_site(artifact)
+
+    assert 'appspec.yml' not in site and 'scripts/site.env' not in site
+    html = site['index.html']['body']
+    assert b'src="app.js"' not in html and b'https://example.com/a.js' in html
+
+    copies = [path for path in site if path.startswith('app.') and path != 'app.js']
+    assert len(copies) == 1 and copies[0].encode() in html
+    assert site[copies[0]]['cache_control'] == IMMUTABLE_CACHE_CONTROL
+    assert b'?v=1' in html and b'/css/site.' in html
+
+    assert site['index.html']['cache_control'] == SHORT_CACHE_CONTROL
+    assert site['app.js']['cache_control'] == SHORT_CACHE_CONTROL
+    assert site['main.3f9a1c2e7b.js']['cache_control'] == IMMUTABLE_CACHE_CONTROL
+    assert site['index.html']['content_type'].startswith('text/html')
+
+
+def test_publish_skips_unchanged_files(tmp_path, s3):
+    artifact = make_zip(tmp_path / 'v1.zip', SITE)
+    first = publish_site(s3, 'sites', PREFIX, artifact)
+    second = publish_site(s3, 'sites', PREFIX, artifact)
+
+    assert first['uploaded'] == first['files'] == 8
+    assert second['uploaded'] == 0 and second['skipped'] == 8
+    head = s3.head_object(Bucket='sites', Key=f"{PREFIX}main.3f9a1c2e7b.js")
+    assert head['CacheControl'] == IMMUTABLE_CACHE_CONTROL
+
+
+def test_stale_files_go_fingerprinted_ones_after_grace(tmp_path, s3):
+    publish_site(s3, 'sites', PREFIX, make_zip(tmp_path / 'v1.zip', SITE))
+    v2 = {k: v for k, v in SITE.items() if k not in ('main.3f9a1c2e7b.js', 'logo.png')}
+    v2['app.js'] = b'console.log(2)'
+    artifact = make_zip(tmp_path / 'v2.zip', v2)
+
+    result = publish_site(s3, 'sites', PREFIX, artifact)
+    # app.js, its new copy and index.html; logo.png goes, the old fingerprinted files stay
+    assert (result['uploaded'], result['deleted'], result['kept']) == (3, 1, 3)
+    assert 'logo.png' not in keys(s3) and 'main.3f9a1c2e7b.js' in keys(s3)
+
+    later = publish_site(s3, 'sites', PREFIX, artifact,
+                         now=lambda: datetime.now(timezone.utc) + timedelta(days=2))
+    assert (later['uploaded'], later['deleted'], later['kept']) == (0, 3, 0)
+    assert len(keys(s3)) == result['files']
+
+
+def test_delete_site(tmp_path, s3):
+    publish_site(s3, 'sites', PREFIX, make_zip(tmp_path / 'v1.zip', SITE))
+    s3.put_object(Bucket='sites', Key=f"{site_prefix('other')}index.html", Body=b'')
+
+    assert delete_site(s3, 'sites', PREFIX) == 8
+    assert [key for _, key in s3.objects] == ['sites/other/index.html']
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+
+def record(deployment_id, status='queued', created_at='2026-10-17T10:00:00', **fields):
+    return dict({
+        'deployment_id': deployment_id, 'status': status, 'created_at': created_at,
+        'github_url': 'https://github.com/a/b', 'steps': {}
+    }, **fields)
+
+
+def test_mutate_is_atomic(store):
+    store.create(record('d1', counter=0))
+
+    def bump():
+        for _ in range(50):
+            store.mutate('d1', lambda r: r.update(counter=r['counter'] + 1))
+
+    threads = [threading.Thread(target=bump) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert store.get('d1')['counter'] == 200
+
+
+def test_mutate_returning_false_writes_nothing(store):
+    store.create(record('d1'))
+    version = store.version()
+    assert store.mutate('d1', lambda r: False) is None
+    assert store.mutate('missing', lambda r: None) is None
+    assert store.version() == version
+
+
+def test_transition_only_from_expected_status(store):
+    store.create(record('d1', status='failed'))
+    assert store.transition('d1', ['failed'], 'queued', retries=1)['status'] == 'queued'
+    assert store.transition('d1', ['failed'], 'queued') is None
+    assert store.get('d1')['retries'] == 1
+
+
+def test_list_filters_and_pages_newest_first(store):
+    for i in range(5):
+        store.create(record(f"d{i}", status='live' if i % 2 else 'failed', created_at=f"2026-10-17T10:00:0{i}"))
+
+    page, cursor = store.list(limit=2)
+    assert [r['deployment_id'] for r in page] == ['d4', 'd3']
+    page, cursor = store.list(limit=2, cursor=cursor)
+    assert [r['deployment_id'] for r in page] == ['d2', 'd1']
+    assert [r['deployment_id'] for r in store.list(status=['live'])[0]] == ['d3', 'd1']
+    assert store.count(status=['failed']) == 3
+
+
+def test_idempotency_keys(store):
+    assert store.claim_key('k', 'd1', 'fp', 60) is None
+    assert store.claim_key('k', 'd2', 'fp', 60) == {'deployment_id': 'd1', 'fingerprint': 'fp'}
+
+    store.release_key('k', 'd2')  # not the holder: no effect
+    assert store.claim_key('k', 'd3', 'fp', 60)['deployment_id'] == 'd1'
+
+    store.release_key('k', 'd1')
+    assert store.claim_key('k', 'd3', 'fp', 60) is None
+
+
+def test_expired_idempotency_key_can_be_claimed_again(store):
+    assert store.claim_key('k', 'd1', 'fp', -1) is None
+    assert store.claim_key('k', 'd2', 'fp', 60) is None
+
+
+def test_change_log(store):
+    start = store.version()
+    store.create(record('d1'))
+    store.create(record('d2'))
+    store.update('d1', status='live')
+    store.delete('d2')
+
+    changes = store.changes(start)
+    assert [r['deployment_id'] for r in changes['changed']] == ['d1']
+    assert changes['changed'][0]['status'] == 'live'
+    assert changes['deleted'] == ['d2']
+    assert not changes['more'] and not changes['reset']
+
+    assert store.changes(changes['version'])['changed'] == []
+
+
+def test_change_log_pages(store):
+    start = store.version()
+    for i in range(5):
+        store.create(record(f"d{i}"))
+
+    first = store.changes(start, limit=2)
+    assert first['more'] and len(first['changed']) == 2
+    rest = store.changes(first['version'], limit=10)
+    assert [r['deployment_id'] for r in rest['changed']] == ['d2', 'd3', 'd4']
+
+
+def test_heartbeats_do_not_change_the_version(store):
+    version = store.version()
+    store.heartbeat('w1')
+    assert 'w1' in store.heartbeats()
+    assert store.version() == version
+
+
+@pytest.mark.parametrize('since', [-5, 10 ** 9])
+def test_unknown_version_resets(store, since):
+    store.create(record('d1'))
+    assert store.changes(since)['reset']
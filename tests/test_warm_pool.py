@@ -0,0 +1,75 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from readiness import ReadinessTimeout
+from warm_pool import WarmPool
+
+
+class InstantProbe:
+    """Every instance is ready at once (or times out at once)"""
+
+    def __init__(self, ready=True):
+        self.ready = ready
+        self.calls = []
+
+    def wait_many(self, label, instance_ids, on_done=None, **kwargs):
+        self.calls.append(list(instance_ids))
+        results = {}
+        for instance_id in instance_ids:
+            results[instance_id] = {'public_ip': '10.0.0.1'} if self.ready else ReadinessTimeout(instance_id)
+            on_done(instance_id, results[instance_id])
+        return results
+
+
+@pytest.fixture
+def ec2(aws):
+    return aws.clients['ec2']
+
+
+def test_refill_waits_for_all_instances_at_once(ec2, store):
+    probe = InstantProbe()
+    pool = WarmPool(ec2, 'lt-1', probe, store, size=3)
+    pool.refill()
+
+    assert len(probe.calls) == 1 and len(probe.calls[0]) == 3
+    assert all(i['tags']['WarmPool'] == 'ready' for i in ec2.instances.values())
+
+
+def test_one_instance_one_winner(ec2, store):
+    WarmPool(ec2, 'lt-1', InstantProbe(), store, size=1).refill()
+    # Two "processes": same EC2, same store, separate pools
+    pools = [WarmPool(ec2, 'lt-1', InstantProbe(), store, size=1) for _ in range(2)]
+    start = threading.Barrier(8)
+    claims = []
+
+    def claim(n):
+        start.wait()
+        claims.append(pools[n % 2].claim(f"deploy-{n}"))
+
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len([c for c in claims if c]) == 1
+
+
+def test_reap_counts_idle_time_from_ready(ec2, store):
+    pool = WarmPool(ec2, 'lt-1', InstantProbe(), store, size=1, max_idle=600)
+    pool.refill()
+    instance = next(iter(ec2.instances.values()))
+    instance['launched'] = datetime.now(timezone.utc) - timedelta(hours=2)  # booted long ago, ready just now
+
+    assert pool.reap() == []
+
+    instance['tags']['WarmPoolReadyAt'] = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()
+    assert len(pool.reap()) == 1
+
+
+def test_instance_that_never_gets_ready_is_terminated(ec2, store):
+    WarmPool(ec2, 'lt-1', InstantProbe(ready=False), store, size=1).refill()
+
+    assert [i['state'] for i in ec2.instances.values()] == ['terminated']
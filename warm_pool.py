@@ -0,0 +1,248 @@
+"""
+Warm pool of pre-booted EC2 instances for DeployFast.
+
+A cold deployment pays for run_instances + boot + User Data (nginx +
+CodeDeploy agent). The warm pool keeps N instances from the Launch
+Template already booted and ready, but not assigned to any deployment.
+
+Pool instances are tagged:
+- ManagedBy=DeployFast
+- DeploymentId=warm-pool   (unassigned marker)
+- WarmPool=booting | ready
+- WarmPoolReadyAt=<ISO time> once ready (idle since)
+
+Claiming an instance retags it with the real DeploymentId (CodeDeploy
+targets this tag), so a claimed instance looks exactly like a cold one.
+If the pool is empty, claim() returns None and the caller falls back to
+a cold launch.
+
+A background thread refills the pool and reaps instances that sat idle
+(ready, unclaimed) longer than WARM_POOL_MAX_IDLE, so the pool never
+holds stale AMIs or Launch Template versions for long.
+
+A claim is a conditional write in the deployment store (claim_key on
+"warm-pool:{instance_id}"): exactly one deployment wins an instance,
+across threads and processes, before anything is retagged. Losers move
+on to the next instance.
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+
+# ========================================
+# CONFIGURATION
+# ========================================
+WARM_POOL_SIZE = int(os.environ.get('WARM_POOL_SIZE', 0))                     # 0 = disabled
+WARM_POOL_MAX_IDLE = int(os.environ.get('WARM_POOL_MAX_IDLE', 3600))          # Seconds before an idle instance is reaped
+WARM_POOL_REFILL_INTERVAL = int(os.environ.get('WARM_POOL_REFILL_INTERVAL', 30))
+
+WARM_POOL_TAG = 'warm-pool'  # DeploymentId value of unassigned instances
+CLAIM_TTL = 24 * 3600        # Claim keys outlive any describe_instances lag by far
+
+
+class WarmPool:
+    """
+    Keeps `size` booted, unassigned instances around.
+
+    Usage:
+        pool = WarmPool(ec2, LAUNCH_TEMPLATE_ID, readiness_probe, store, size=2)
+        pool.start()
+        instance = pool.claim(deployment_id)   # or None when empty
+    """
+
+    def __init__(self, ec2, launch_template_id, readiness_probe, store,
+                 size=WARM_POOL_SIZE, max_idle=WARM_POOL_MAX_IDLE,
+                 refill_interval=WARM_POOL_REFILL_INTERVAL):
+        self.ec2 = ec2
+        self.launch_template_id = launch_template_id
+        self.readiness_probe = readiness_probe
+        self.store = store
+        self.size = size
+        self.max_idle = max_idle
+        self.refill_interval = refill_interval
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.claims = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    def start(self):
+        """Start the refill thread (once per process)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='warm-pool', daemon=True
+            )
+            self._thread.start()
+        print(f"[warm-pool] Started (size={self.size}, max_idle={self.max_idle}s)")
+
+    # ----------------------------------------
+    # Claiming
+    # ----------------------------------------
+
+    def claim(self, deployment_id):
+        """
+        Take a ready instance out of the pool for deployment_id.
+
+        Returns {'instance_id', 'public_ip'} or None if the pool is empty.
+        """
+        if not self.enabled:
+            return None
+
+        for instance in self._list_instances(states=['running']):
+            if self._tag(instance, 'WarmPool') != 'ready':
+                continue
+            instance_id = instance['InstanceId']
+
+            # Conditional write: another thread or process may be after the same instance
+            winner = self.store.claim_key(f"warm-pool:{instance_id}", deployment_id, WARM_POOL_TAG, CLAIM_TTL)
+            if winner and winner['deployment_id'] != deployment_id:
+                print(f"[{deployment_id}] Lost warm instance {instance_id} to {winner['deployment_id']}")
+                continue
+
+            self.ec2.create_tags(
+                Resources=[instance_id],
+                Tags=[
+                    {'Key': 'Name', 'Value': f'DeployFast-{deployment_id}'},
+                    {'Key': 'DeploymentId', 'Value': deployment_id},  # CodeDeploy targets this!
+                    {'Key': 'WarmPool', 'Value': 'claimed'}
+                ]
+            )
+
+            with self._lock:
+                self.claims += 1
+            print(f"[{deployment_id}] Claimed warm EC2 instance: {instance_id}")
+            self._wake.set()  # refill right away
+            return {
+                'instance_id': instance_id,
+                'public_ip': instance.get('PublicIpAddress')
+            }
+
+        with self._lock:
+            self.misses += 1
+        print(f"[{deployment_id}] Warm pool empty, falling back to a cold launch")
+        self._wake.set()
+        return None
+
+    def stats(self):
+        """Pool counters for monitoring"""
+        return {
+            'size': self.size,
+            'claims': self.claims,
+            'misses': self.misses
+        }
+
+    # ----------------------------------------
+    # Refill + reap (background)
+    # ----------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                self.reap()
+                self.refill()
+            except Exception as e:
+                print(f"[warm-pool] Refill failed: {str(e)}")
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+
+    def reap(self):
+        """Terminate ready pool instances idle longer than max_idle"""
+        now = datetime.now(timezone.utc)
+        stale = [
+            i['InstanceId'] for i in self._list_instances()
+            if self._tag(i, 'WarmPool') == 'ready' and (now - self._idle_since(i)).total_seconds() > self.max_idle
+        ]
+        if stale:
+            print(f"[warm-pool] Reaping {len(stale)} idle instance(s): {', '.join(stale)}")
+            self.ec2.terminate_instances(InstanceIds=stale)
+        return stale
+
+    def refill(self):
+        """Launch instances until the pool is back to `size`, then wait for them"""
+        current = self._list_instances()
+        missing = self.size - len(current)
+        booting = [
+            i['InstanceId'] for i in current
+            if self._tag(i, 'WarmPool') == 'booting'
+        ]
+
+        if missing > 0:
+            print(f"[warm-pool] Launching {missing} instance(s)")
+            response = self.ec2.run_instances(
+                LaunchTemplate={
+                    'LaunchTemplateId': self.launch_template_id,
+                    'Version': '$Latest'
+                },
+                MinCount=1,
+                MaxCount=missing,
+                TagSpecifications=[{
+                    'ResourceType': 'instance',
+                    'Tags': [
+                        {'Key': 'Name', 'Value': 'DeployFast-warm'},
+                        {'Key': 'DeploymentId', 'Value': WARM_POOL_TAG},
+                        {'Key': 'ManagedBy', 'Value': 'DeployFast'},
+                        {'Key': 'WarmPool', 'Value': 'booting'}
+                    ]
+                }]
+            )
+            booting += [i['InstanceId'] for i in response['Instances']]
+
+        if not booting:
+            return
+
+        # One poll for all of them; each goes into the pool as soon as it is ready
+        def on_done(instance_id, result):
+            if isinstance(result, Exception):
+                print(f"[warm-pool] {instance_id} never became ready, terminating: {str(result)}")
+                self.ec2.terminate_instances(InstanceIds=[instance_id])
+                return
+            self.ec2.create_tags(
+                Resources=[instance_id],
+                Tags=[
+                    {'Key': 'WarmPool', 'Value': 'ready'},
+                    {'Key': 'WarmPoolReadyAt', 'Value': datetime.now(timezone.utc).isoformat()}
+                ]
+            )
+            print(f"[warm-pool] {instance_id} is ready")
+
+        self.readiness_probe.wait_many('warm-pool', booting, on_done=on_done)
+
+    # ----------------------------------------
+    # Helpers
+    # ----------------------------------------
+
+    def _list_instances(self, states=('pending', 'running')):
+        """Unassigned pool instances, straight from EC2"""
+        paginator = self.ec2.get_paginator('describe_instances')
+        pages = paginator.paginate(Filters=[
+            {'Name': 'tag:ManagedBy', 'Values': ['DeployFast']},
+            {'Name': 'tag:DeploymentId', 'Values': [WARM_POOL_TAG]},
+            {'Name': 'instance-state-name', 'Values': list(states)}
+        ])
+        instances = []
+        for page in pages:
+            for reservation in page['Reservations']:
+                instances.extend(reservation['Instances'])
+        return instances
+
+    def _idle_since(self, instance):
+        """When the instance joined the pool as ready (LaunchTime for instances tagged before)"""
+        ready_at = self._tag(instance, 'WarmPoolReadyAt')
+        return datetime.fromisoformat(ready_at) if ready_at else instance['LaunchTime']
+
+    @staticmethod
+    def _tag(instance, key):
+        for tag in instance.get('Tags', []):
+            if tag['Key'] == key:
+                return tag['Value']
+        return None